@@ -270,6 +270,163 @@ CACHES = {
     "default": env.cache(),
 }
 
+
+def env_config(prefix, **casts):
+    """
+    读取同一前缀的环境变量组成字典配置，环境变量名为 前缀_配置项大写
+    只包含已设置的项，默认值和各项的说明在使用配置的模块中定义
+    """
+    return {
+        key: cast(f"{prefix}_{key.upper()}")
+        for key, cast in casts.items()
+        if f"{prefix}_{key.upper()}" in os.environ
+    }
+
+
+# 数据库引擎连接池，启用后同一进程内复用到目标实例的连接，默认值见 sql/utils/connection_pool.py
+ENGINE_CONNECTION_POOL = env_config(
+    "ENGINE_POOL", enabled=env.bool, max_size=env.int, idle_timeout=env.int
+)
+
+# 数据脱敏时goInception解析的select list缓存时间，秒，0为不缓存，DDL工单执行结束后按实例失效
+DATA_MASKING_CACHE_TTL = env.int("DATA_MASKING_CACHE_TTL", default=600)
+
+# 实例库、表、字段等元数据缓存时间，秒，0为不缓存，DDL工单执行结束后按库失效
+INSTANCE_METADATA_CACHE_TTL = env.int("INSTANCE_METADATA_CACHE_TTL", default=300)
+
+# 用户查询权限快照缓存时间，秒，0为不缓存，授权、回收、变更权限时立即失效
+QUERY_PRIV_CACHE_TTL = env.int("QUERY_PRIV_CACHE_TTL", default=60)
+
+# 系统配置进程内缓存检查版本号的间隔，秒，其他进程修改配置后最多延迟该时间生效
+SYS_CONFIG_CACHE_CHECK_INTERVAL = env.int("SYS_CONFIG_CACHE_CHECK_INTERVAL", default=5)
+
+# MySQL查询前的语法校验模式，strict：先执行explain校验语法，fast：跳过explain，语法错误由实际执行返回
+MYSQL_QUERY_CHECK_MODE = env.str("MYSQL_QUERY_CHECK_MODE", default="strict")
+
+# 在线查询日志写入方式，sync：同步写入；buffer：进程内缓冲批量写入；async：django-q异步写入，默认值见 sql/utils/query_log.py
+QUERY_LOG = env_config(
+    "QUERY_LOG",
+    mode=env.str,
+    batch_size=env.int,
+    flush_interval=env.int,
+    max_pending=env.int,
+    late_threshold=env.int,
+)
+
+# 流式查询每批返回的行数
+QUERY_STREAM_CHUNK_SIZE = env.int("QUERY_STREAM_CHUNK_SIZE", default=1000)
+
+# 离线导出从服务端游标每批读取的行数
+OFFLINE_EXPORT_CHUNK_SIZE = env.int("OFFLINE_EXPORT_CHUNK_SIZE", default=5000)
+
+# 导出提交前行数探测的超时时间，秒，执行计划预估的行数超过阈值时只统计到阈值+1行
+OFFLINE_EXPORT_PROBE_TIMEOUT = env.int("OFFLINE_EXPORT_PROBE_TIMEOUT", default=10)
+
+# 离线导出并行分片，单表查询按整数主键范围拆分后由多个连接并发读取，各分片不是同一个一致性快照，默认值见 sql/utils/parallel_export.py
+OFFLINE_EXPORT_PARALLEL = env_config(
+    "OFFLINE_EXPORT_PARALLEL",
+    enabled=env.bool,
+    workers=env.int,
+    instance_limit=env.int,
+    chunk_size=env.int,
+    max_chunks=env.int,
+    slot_wait_timeout=env.int,
+)
+
+# 数据归档方式，pt-archiver 调用pt-archiver命令，native 使用进程内的归档，支持按从库延迟调整批次和断点续传
+ARCHIVER_ENGINE = env("ARCHIVER_ENGINE", default="pt-archiver")
+# 进程内归档的配置，默认值见 sql/utils/native_archiver.py
+ARCHIVER_NATIVE = env_config(
+    "ARCHIVER_NATIVE",
+    batch_size=env.int,
+    min_batch_size=env.int,
+    max_batch_size=env.int,
+    max_lag=env.int,
+    lag_instances=env.list,
+)
+
+# 数据归档调度，限制同一源实例和全局同时运行的归档任务数，并为SQL工单执行等任务保留worker，默认值见 sql/utils/archive_scheduler.py
+ARCHIVE_SCHEDULER = env_config(
+    "ARCHIVE_SCHEDULER",
+    instance_limit=env.int,
+    max_running=env.int,
+    reserved_workers=env.int,
+)
+
+# binlog解析结果存储，按binlog文件解析一次后建立位点、时间、库表、语句类型索引，预览、分页和下载都从存储读取，默认值见 sql/utils/binlog_store.py
+BINLOG_STORE = env_config("BINLOG_STORE", enabled=env.bool, path=env.str)
+
+# 慢日志汇总，慢日志明细按小时和天增量汇总，慢日志统计和趋势图从汇总表读取，默认值见 sql/utils/slow_query_rollup.py
+SLOW_QUERY_ROLLUP = env_config(
+    "SLOW_QUERY_ROLLUP", enabled=env.bool, batch_size=env.int, interval=env.int
+)
+
+# 全文检索索引，SQL查询日志和慢日志的搜索使用分词索引，不再对SQL文本做全表模糊匹配，默认值见 sql/utils/search_index.py
+SEARCH_INDEX = env_config(
+    "SEARCH_INDEX", enabled=env.bool, batch_size=env.int, interval=env.int
+)
+
+# goInception分批审核，语句较多且全部为DML的工单拆分为多批，使用多个goInception连接并行审核，默认值见 sql/engines/goinception.py
+GOINCEPTION_CHUNK_CHECK = env_config(
+    "GOINCEPTION_CHUNK_CHECK",
+    enabled=env.bool,
+    min_statements=env.int,
+    chunk_size=env.int,
+    workers=env.int,
+)
+
+# 工单审核内容和执行结果压缩存储，只影响新写入的数据，历史数据读取时自动兼容，默认值见 common/utils/compressed_field.py
+WORKFLOW_CONTENT_COMPRESSION = env_config(
+    "WORKFLOW_CONTENT_COMPRESSION", enabled=env.bool, min_size=env.int, level=env.int
+)
+
+# SQL工单执行进度，引擎执行时写入缓存，详情页长轮询获取，默认值见 sql/utils/execute_progress.py
+EXECUTE_PROGRESS = env_config(
+    "EXECUTE_PROGRESS",
+    enabled=env.bool,
+    batch_size=env.int,
+    publish_interval=env.int,
+    poll_timeout=env.int,
+    max_waiting=env.int,
+)
+
+# MySQL工单原生执行，开启后不需要备份的DML工单不经过goInception，按批次在事务中提交，默认值见 sql/utils/native_executor.py
+MYSQL_NATIVE_EXECUTE = env_config(
+    "MYSQL_NATIVE_EXECUTE",
+    enabled=env.bool,
+    commit_size=env.int,
+    min_commit_size=env.int,
+    max_commit_size=env.int,
+    max_lag=env.int,
+    max_threads_running=env.int,
+    lag_instances=env.list,
+)
+
+# SQL工单执行调度，开启后工单执行按实例、资源组并发上限排队，排队中的工单展示队列位置，默认值见 sql/utils/workflow_scheduler.py
+WORKFLOW_SCHEDULER = env_config(
+    "WORKFLOW_SCHEDULER",
+    enabled=env.bool,
+    instance_limit=env.int,
+    group_limit=env.int,
+    max_running=env.int,
+    reserved_workers=env.int,
+    ordering=env.str,
+    cluster=env.str,
+    dispatch_interval=env.int,
+)
+
+# 配置执行集群后工单执行使用独立的worker，终止连接、消息通知等短任务留在默认集群
+# 执行集群通过 Q_CLUSTER_NAME=<集群名> python manage.py qcluster 启动
+if WORKFLOW_SCHEDULER.get("cluster"):
+    Q_CLUSTER["ALT_CLUSTERS"] = {
+        WORKFLOW_SCHEDULER["cluster"]: {
+            "workers": env.int("WORKFLOW_SCHEDULER_CLUSTER_WORKERS", default=2),
+        }
+    }
+
+# ssh隧道在进程内共享，无引用的隧道空闲超过该时间后关闭，秒
+SSH_TUNNEL_IDLE_TIMEOUT = env.int("SSH_TUNNEL_IDLE_TIMEOUT", default=300)
+
 # https://docs.djangoproject.com/en/3.2/ref/settings/#std-setting-DEFAULT_AUTO_FIELD
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
@@ -1,17 +1,104 @@
 # -*- coding: UTF-8 -*-
 import logging
+import threading
+import time
 import traceback
 
 import simplejson as json
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.http import HttpResponse
 
 from common.utils.permission import superuser_required
 from sql.models import Config
-from django.db import transaction
+from django.db import connection, transaction
 
 logger = logging.getLogger("default")
 
 
+class ConfigCache(object):
+    """
+    进程内共享的系统配置快照, 一次加载全部配置项
+    配置变更时递增缓存中的版本号, 各进程最多每 SYS_CONFIG_CACHE_CHECK_INTERVAL 秒检查一次版本号, 变化后重新加载
+    """
+
+    version_key = "sys_config_version"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._checked_at = 0
+
+    def _remote_version(self):
+        try:
+            return cache.get(self.version_key, 0)
+        except Exception as e:
+            logger.warning(f"获取系统配置版本号失败:{e}")
+            return None
+
+    @staticmethod
+    def _load():
+        data = {}
+        # 同名配置项以最后一条为准, 与 filter().last() 一致
+        for item, value in Config.objects.order_by("id").values_list("item", "value"):
+            data[item] = SysConfig.filter_bool(value)
+        return data
+
+    def get_all(self):
+        """
+        返回配置快照, 事务内不读取也不填充快照, 返回None由调用方直接查库,
+        避免未提交或被回滚的配置进入进程级缓存
+        """
+        if connection.in_atomic_block:
+            return None
+        now = time.monotonic()
+        interval = getattr(settings, "SYS_CONFIG_CACHE_CHECK_INTERVAL", 5)
+        data = self._data
+        if data is not None and now - self._checked_at < interval:
+            return data
+        version = self._remote_version()
+        with self._lock:
+            if version is not None and self._data is not None:
+                if version == self._version:
+                    self._checked_at = now
+                    return self._data
+            data = self._load()
+            # 版本号获取失败时不缓存, 下次继续查库
+            if version is not None:
+                self._data, self._version, self._checked_at = data, version, now
+        return data
+
+    def invalidate(self):
+        """配置变更后调用, 清空本进程快照并递增版本号通知其他进程"""
+        with self._lock:
+            self._data = None
+        try:
+            try:
+                cache.incr(self.version_key)
+            except ValueError:
+                cache.set(self.version_key, 1, None)
+        except Exception as e:
+            logger.warning(f"更新系统配置版本号失败:{e}")
+
+
+config_cache = ConfigCache()
+
+
+def invalidate_config_cache():
+    """立即失效, 并在事务提交后再失效一次, 避免其他进程在提交前重新加载到旧配置"""
+    config_cache.invalidate()
+    transaction.on_commit(config_cache.invalidate)
+
+
+@receiver(post_save, sender=Config)
+@receiver(post_delete, sender=Config)
+def invalidate_config_cache_on_change(sender, **kwargs):
+    invalidate_config_cache()
+
+
 class SysConfig(object):
     def __init__(self):
         self.sys_config = {}
@@ -36,11 +123,15 @@ class SysConfig(object):
         value = self.sys_config.get(key)
         if value:
             return value
-        # 尝试去数据库里取
-        config_entry = Config.objects.filter(item=key).last()
-        if config_entry:
-            # 清洗成 python 的 bool
-            value = self.filter_bool(config_entry.value)
+        shared_config = config_cache.get_all()
+        if shared_config is not None:
+            value = shared_config.get(key)
+        else:
+            # 尝试去数据库里取
+            config_entry = Config.objects.filter(item=key).last()
+            if config_entry:
+                # 清洗成 python 的 bool
+                value = self.filter_bool(config_entry.value)
         # 是字符串的话, 如果是空, 或者全是空格, 返回默认值
         if isinstance(value, str) and value.strip() == "":
             return default_value
@@ -88,6 +179,8 @@ class SysConfig(object):
             result["status"] = 1
             result["msg"] = str(e)
         finally:
+            # bulk_create 不触发信号, 需主动失效
+            invalidate_config_cache()
             self.get_all_config()
         return result
 
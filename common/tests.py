@@ -5,10 +5,14 @@ from unittest.mock import patch, ANY
 import datetime
 from dateutil.relativedelta import relativedelta
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
 
-from common.config import SysConfig
+from common.config import SysConfig, config_cache
+from common.utils.cache_lock import cache_lock
 from common.utils.sendmsg import MsgSender
+from common.utils.settings_config import get_settings_config
+from common.utils.testing import LOCMEM_CACHES
 from sql.engines import EngineBase, ResultSet
 from sql.models import (
     Instance,
@@ -76,6 +80,30 @@ class ConfigOpsTests(TestCase):
         archer_config.set("other_config", "testvalue3")
         self.assertEqual(archer_config.sys_config["other_config"], "testvalue3")
 
+    @override_settings(
+        CACHES=LOCMEM_CACHES,
+        SYS_CONFIG_CACHE_CHECK_INTERVAL=60,
+    )
+    def test_shared_config_cache(self):
+        """进程内配置快照一次加载，配置变更后失效"""
+        SysConfig().set("cached_config", "v1")
+        self.addCleanup(config_cache.invalidate)
+        # 测试用例运行在事务内，模拟事务外的读取
+        with patch.object(connection, "in_atomic_block", False):
+            with self.assertNumQueries(1):
+                self.assertEqual(SysConfig().get("cached_config"), "v1")
+                self.assertEqual(SysConfig().get("cached_config"), "v1")
+                self.assertIsNone(SysConfig().get("not_exist_config"))
+        SysConfig().set("cached_config", "v2")
+        with patch.object(connection, "in_atomic_block", False):
+            self.assertEqual(SysConfig().get("cached_config"), "v2")
+
+    def test_shared_config_cache_in_transaction(self):
+        """事务内直接查库，不填充进程内配置快照"""
+        SysConfig().set("cached_config", "v1")
+        self.assertEqual(SysConfig().get("cached_config"), "v1")
+        self.assertIsNone(config_cache._data)
+
 
 class SendMessageTest(TestCase):
     """发送消息测试"""
@@ -600,3 +628,91 @@ class ExtendJSONEncoderFTimeTest(TestCase):
         # 测试datetime
         result = ExtendJSONEncoderFTime().default(self.date_time)
         assert self.datetime1.strftime("%Y-%m-%d") in result
+
+
+class CompressedTextFieldTest(TestCase):
+    def setUp(self):
+        self.ins = Instance.objects.create(
+            instance_name="some_ins",
+            type="slave",
+            db_type="mysql",
+            host="some_host",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+        self.wf = SqlWorkflow.objects.create(
+            instance=self.ins,
+            workflow_name="some_name",
+            group_id=1,
+            group_name="g1",
+            engineer_display="",
+            audit_auth_groups="some_audit_group",
+            create_time=datetime.datetime.now(),
+            status="workflow_finish",
+            is_backup=True,
+            db_name="some_db",
+            syntax_type=1,
+        )
+        self.review_content = json.dumps(
+            [{"id": i, "sql": "select 1", "errlevel": 0} for i in range(100)]
+        )
+
+    def tearDown(self):
+        SqlWorkflowContent.objects.all().delete()
+        SqlWorkflow.objects.all().delete()
+        Instance.objects.all().delete()
+
+    def _raw_review_content(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "select review_content from sql_workflow_content where workflow_id=%s",
+                [self.wf.id],
+            )
+            return cursor.fetchone()[0]
+
+    @override_settings(WORKFLOW_CONTENT_COMPRESSION={"enabled": True, "min_size": 10})
+    def test_compressed(self):
+        SqlWorkflowContent.objects.create(
+            workflow=self.wf, sql_content="select 1", review_content=self.review_content
+        )
+        raw = self._raw_review_content()
+        self.assertTrue(raw.startswith("zlib:"))
+        self.assertLess(len(raw), len(self.review_content))
+        content = SqlWorkflowContent.objects.get(workflow=self.wf)
+        self.assertEqual(content.review_content, self.review_content)
+        # 关闭压缩后已压缩的数据仍可读取
+        with self.settings(WORKFLOW_CONTENT_COMPRESSION={"enabled": False}):
+            content = SqlWorkflowContent.objects.get(workflow=self.wf)
+            self.assertEqual(content.review_content, self.review_content)
+
+    def test_not_compressed(self):
+        SqlWorkflowContent.objects.create(
+            workflow=self.wf, sql_content="select 1", review_content=self.review_content
+        )
+        self.assertEqual(self._raw_review_content(), self.review_content)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheLockTest(TestCase):
+    def test_cache_lock(self):
+        with cache_lock("test_lock", 10):
+            with self.assertRaisesMessage(Exception, "任务正在运行"):
+                with cache_lock("test_lock", 10, message="任务正在运行"):
+                    pass
+            # 等待超时后报错
+            with self.assertRaisesMessage(Exception, "获取锁test_lock超时"):
+                with cache_lock("test_lock", 10, wait=0.2, interval=0.1):
+                    pass
+        # 退出后释放
+        with cache_lock("test_lock", 10):
+            pass
+
+
+class SettingsConfigTest(TestCase):
+    @override_settings(SOME_CONFIG={"b": 3})
+    def test_get_settings_config(self):
+        defaults = {"a": 1, "b": 2}
+        self.assertEqual(get_settings_config("SOME_CONFIG", defaults), {"a": 1, "b": 3})
+        self.assertEqual(get_settings_config("NOT_EXISTS_CONFIG", defaults), defaults)
+        self.assertEqual(defaults, {"a": 1, "b": 2})
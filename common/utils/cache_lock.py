@@ -0,0 +1,31 @@
+# -*- coding: UTF-8 -*-
+"""
+基于缓存的互斥锁
+通过cache.add在多个进程之间互斥, 缓存需使用redis等进程间共享的后端
+"""
+
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+
+@contextmanager
+def cache_lock(key, timeout, wait=0, interval=0.5, message=""):
+    """
+    获取锁后执行, 退出时释放
+    :param key: 锁的缓存key
+    :param timeout: 锁的过期时间，秒，持有锁的进程异常退出后到期自动释放
+    :param wait: 锁被占用时等待的最长时间，秒，为0时不等待
+    :param interval: 等待时重试的间隔，秒
+    :param message: 未获取到锁时抛出异常的信息
+    """
+    deadline = time.time() + wait
+    while not cache.add(key, 1, timeout):
+        if time.time() >= deadline:
+            raise Exception(message or f"获取锁{key}超时")
+        time.sleep(interval)
+    try:
+        yield
+    finally:
+        cache.delete(key)
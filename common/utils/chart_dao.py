@@ -3,6 +3,8 @@
 from datetime import timedelta
 from django.db import connection
 
+from sql.utils.slow_query_rollup import get_slow_query_rollup_config
+
 
 class ChartDao(object):
     # 直接在Archery数据库查询数据，用于报表
@@ -133,6 +135,12 @@ class ChartDao(object):
 
     # 慢日志历史趋势图(按次数)
     def slow_query_review_history_by_cnt(self, checksum):
+        if get_slow_query_rollup_config()["enabled"]:
+            sql = f"""select sum(ts_cnt),date(date_add(ts, interval 8 HOUR))
+from mysql_slow_query_rollup_hourly
+where checksum = '{checksum}'
+group by date(date_add(ts, interval 8 HOUR));"""
+            return self.__query(sql)
         sql = f"""select sum(ts_cnt),date(date_add(ts_min, interval 8 HOUR))
 from mysql_slow_query_review_history
 where checksum = '{checksum}'
@@ -141,6 +149,12 @@ group by date(date_add(ts_min, interval 8 HOUR));"""
 
     # 慢日志历史趋势图(按时长)
     def slow_query_review_history_by_pct_95_time(self, checksum):
+        if get_slow_query_rollup_config()["enabled"]:
+            sql = f"""select truncate(MAX(query_time_pct_95),6),date(date_add(ts, interval 8 HOUR))
+from mysql_slow_query_rollup_hourly
+where checksum = '{checksum}'
+group by date(date_add(ts, interval 8 HOUR));"""
+            return self.__query(sql)
         sql = f"""select truncate(MAX(Query_time_pct_95),6),date(date_add(ts_min, interval 8 HOUR))
 from mysql_slow_query_review_history
 where checksum = '{checksum}'
@@ -169,6 +183,17 @@ group by date(ts_min);"""
 
     # 慢日志db/user维度统计
     def slow_query_count_by_db_by_user(self):
+        if get_slow_query_rollup_config()["enabled"]:
+            sql = """
+            select
+                concat(db_name,' user: ' ,user_name),
+                sum(ts_cnt)
+            from mysql_slow_query_rollup_hourly
+            where ts >= date_sub(now(),INTERVAL 24 hour)
+            and db_name != ''
+            group by db_name,user_name order by sum(ts_cnt) desc limit 50;
+            """
+            return self.__query(sql)
         sql = """
         select
             concat(db_max,' user: ' ,user_max),
@@ -182,6 +207,17 @@ group by date(ts_min);"""
 
     # 慢日志db维度统计
     def slow_query_count_by_db(self):
+        if get_slow_query_rollup_config()["enabled"]:
+            sql = """
+            select
+                db_name,
+                sum(ts_cnt)
+            from mysql_slow_query_rollup_hourly
+            where ts >= date_sub(now(),INTERVAL 24 hour)
+            and db_name != ''
+            group by db_name order by sum(ts_cnt) desc limit 50;
+            """
+            return self.__query(sql)
         sql = """
         select
             db_max,
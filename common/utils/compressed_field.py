@@ -0,0 +1,64 @@
+# -*- coding: UTF-8 -*-
+"""
+压缩存储的文本字段
+开启压缩后超过指定长度的文本使用zlib压缩并base64编码后存储, 带有前缀标识,
+读取时自动解压, 未压缩的历史数据原样返回, 开启和关闭压缩都不需要迁移历史数据
+"""
+
+import base64
+import zlib
+
+from django.db import models
+
+from common.utils.settings_config import get_settings_config
+
+COMPRESSED_PREFIX = "zlib:"
+
+DEFAULT_COMPRESSION_CONFIG = {
+    # 开启后新写入的内容压缩存储
+    "enabled": False,
+    # 超过该长度的文本才压缩，字符数
+    "min_size": 4096,
+    # zlib压缩级别
+    "level": 6,
+}
+
+
+def get_compression_config():
+    """读取工单内容压缩配置, 未配置的项使用默认值"""
+    return get_settings_config("WORKFLOW_CONTENT_COMPRESSION", DEFAULT_COMPRESSION_CONFIG)
+
+
+def compress_text(value):
+    """按配置压缩文本, 不满足压缩条件时原样返回"""
+    config = get_compression_config()
+    if (
+        not config["enabled"]
+        or not value
+        or len(value) < int(config["min_size"])
+        or value.startswith(COMPRESSED_PREFIX)
+    ):
+        return value
+    data = zlib.compress(value.encode("utf-8"), int(config["level"]))
+    return COMPRESSED_PREFIX + base64.b64encode(data).decode("ascii")
+
+
+def decompress_text(value):
+    """解压文本, 未压缩的文本原样返回"""
+    if not isinstance(value, str) or not value.startswith(COMPRESSED_PREFIX):
+        return value
+    data = base64.b64decode(value[len(COMPRESSED_PREFIX) :])
+    return zlib.decompress(data).decode("utf-8")
+
+
+class CompressedTextField(models.TextField):
+    """压缩存储的TextField, 对模型使用者透明, 不支持按内容过滤"""
+
+    def from_db_value(self, value, expression, connection):
+        return decompress_text(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if isinstance(value, str):
+            return compress_text(value)
+        return value
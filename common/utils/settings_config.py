@@ -0,0 +1,18 @@
+# -*- coding: UTF-8 -*-
+"""
+读取settings中的字典配置
+默认值在使用配置的模块中定义, settings中只包含通过环境变量设置的项
+"""
+
+from django.conf import settings
+
+
+def get_settings_config(name, defaults):
+    """
+    读取字典配置, 未配置的项使用默认值
+    :param name: settings中的配置名
+    :param defaults: 默认配置
+    """
+    config = dict(defaults)
+    config.update(getattr(settings, name, {}) or {})
+    return config
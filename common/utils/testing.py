@@ -0,0 +1,9 @@
+# -*- coding: UTF-8 -*-
+"""
+测试使用的公共配置
+"""
+
+# 进程内缓存，缓存锁、计数等依赖缓存的测试不需要redis
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
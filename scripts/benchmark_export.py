@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+离线导出各格式的写入耗时和文件大小对比：csv、xlsx 与 parquet、arrow
+用法: python scripts/benchmark_export.py --rows 1000000 --formats csv,xlsx,parquet,arrow
+"""
+
+import argparse
+import datetime
+import decimal
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "archery.settings")
+
+import django
+
+django.setup()
+
+from sql.offlinedownload import write_export_file  # noqa: E402
+
+COLUMNS = [
+    "id",
+    "user_id",
+    "name",
+    "email",
+    "amount",
+    "score",
+    "created_at",
+    "birthday",
+]
+COLUMN_TYPES = [
+    "LONGLONG",
+    "LONG",
+    "VAR_STRING",
+    "VAR_STRING",
+    "NEWDECIMAL",
+    "DOUBLE",
+    "DATETIME",
+    "DATE",
+]
+
+
+def generate_rows(count):
+    """按批生成模拟的查询结果, 与服务端游标逐批返回的行结构一致"""
+    random.seed(0)
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        name = "".join(random.choices(string.ascii_lowercase, k=10))
+        yield (
+            i,
+            random.randint(1, 10**6),
+            name,
+            f"{name}@example.com" if random.random() > 0.1 else None,
+            decimal.Decimal(random.randint(0, 10**8)) / 100,
+            random.random() * 100,
+            start + datetime.timedelta(seconds=i),
+            datetime.date(1970, 1, 1) + datetime.timedelta(days=i % 20000),
+        )
+
+
+class CountingWriter:
+    """只统计写入字节数, 排除磁盘IO对结果的影响"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def run(format_type, rows, trace_memory):
+    writer = CountingWriter()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    write_export_file(
+        writer, "benchmark", format_type, generate_rows(rows), COLUMNS, COLUMN_TYPES
+    )
+    cost = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return cost, writer.size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--formats", default="csv,xlsx,parquet,arrow")
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="统计Python内存分配峰值，开启后耗时会明显增加",
+    )
+    args = parser.parse_args()
+
+    print(f"rows={args.rows} columns={len(COLUMNS)}")
+    for format_type in args.formats.split(","):
+        cost, size, peak = run(format_type, args.rows, args.memory)
+        line = (
+            f"{format_type:<8} {cost:8.2f} s"
+            f"  {args.rows / cost:10.0f} rows/s"
+            f"  {size / 1024 / 1024:8.2f} MB"
+        )
+        if peak is not None:
+            line += f"  peak {peak / 1024 / 1024:8.2f} MB"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
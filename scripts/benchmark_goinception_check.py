@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+goInception审核吞吐量对比：整批审核与分批并行审核
+需要可用的goInception和目标实例，表需要在目标库中存在, 例如:
+  create table benchmark_check(id bigint primary key, name varchar(64), amount int);
+用法: python scripts/benchmark_goinception_check.py --instance mysql-1 --db test
+      --table benchmark_check --statements 50000 --chunk-size 2000 --workers 1,4,8
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "archery.settings")
+
+import django
+
+django.setup()
+
+from django.test.utils import override_settings  # noqa: E402
+
+from sql.engines.goinception import GoInceptionEngine  # noqa: E402
+from sql.models import Instance  # noqa: E402
+
+
+def generate_sql(table, count):
+    """生成INSERT、UPDATE、DELETE混合的数据修复脚本"""
+    random.seed(0)
+    statements = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            statements.append(
+                f"insert into {table} (id, name, amount) "
+                f"values ({i}, 'name_{i}', {random.randint(0, 10000)});"
+            )
+        elif kind == 1:
+            statements.append(
+                f"update {table} set amount = {random.randint(0, 10000)} where id = {i};"
+            )
+        else:
+            statements.append(f"delete from {table} where id = {i};")
+    return "\n".join(statements)
+
+
+def run(instance, db_name, sql, chunk_config):
+    progress = []
+    with override_settings(GOINCEPTION_CHUNK_CHECK=chunk_config):
+        start = time.perf_counter()
+        check_result = GoInceptionEngine().execute_check(
+            instance=instance,
+            db_name=db_name,
+            sql=sql,
+            progress_callback=lambda done, total: progress.append(done),
+        )
+        cost = time.perf_counter() - start
+    return cost, check_result, progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instance", required=True, help="实例名称")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--table", default="benchmark_check")
+    parser.add_argument("--statements", type=int, default=50000)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", default="1,4,8")
+    args = parser.parse_args()
+
+    instance = Instance.objects.get(instance_name=args.instance)
+    sql = generate_sql(args.table, args.statements)
+    print(f"statements={args.statements} chunk_size={args.chunk_size}")
+
+    modes = [("single", {"enabled": False})]
+    for workers in args.workers.split(","):
+        modes.append(
+            (
+                f"chunk x{workers}",
+                {
+                    "enabled": True,
+                    "min_statements": 1,
+                    "chunk_size": args.chunk_size,
+                    "workers": int(workers),
+                },
+            )
+        )
+    for name, chunk_config in modes:
+        cost, check_result, progress = run(instance, args.db, sql, chunk_config)
+        line = (
+            f"{name:<12} {cost:8.2f} s"
+            f"  {args.statements / cost:10.0f} statements/s"
+            f"  rows {len(check_result.rows)}"
+            f"  errors {check_result.error_count}"
+            f"  warnings {check_result.warning_count}"
+        )
+        if progress:
+            line += f"  progress callbacks {len(progress)}"
+        if check_result.error:
+            line += f"  error: {check_result.error}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+数据脱敏性能对比：逐行逐列的原实现 vs 预编译规则、按列处理的实现
+用法: python scripts/benchmark_masking.py --rows 5000 --columns 10 --masked 4
+"""
+
+import argparse
+import math
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "archery.settings")
+
+import django
+
+django.setup()
+
+from sql.utils.data_masking import (  # noqa: E402
+    compile_regex_masker,
+    compile_sub_masker,
+    mask_columns,
+)
+
+RULES = [
+    {"rule_type": 1, "rule_regex": "(.{3})(.*)(.{4})", "hide_group": 2},
+    {"rule_type": 4, "rule_regex": "(.{1})(.*)(@.*)", "hide_group": 2},
+    {
+        "rule_type": 100,
+        "rule_regex": "^([\\s\\S]{0,}?)([\\s\\S]{0,}?)([\\s\\S]{0,}?)$",
+        "hide_group": 2,
+    },
+]
+
+
+def legacy_regex(masking_rule, value):
+    """原 regex 实现，每个值重新编译正则"""
+    if not value:
+        return value
+    rule_regex = masking_rule["rule_regex"]
+    rule_type = masking_rule["rule_type"]
+    if rule_type == 100 and isinstance(value, str):
+        value_average = math.floor(len(value) / 3)
+        value_remainder = len(value) % 3
+        value_average_1 = str(value_average)
+        value_average_2 = str(value_average + (1 if value_remainder > 0 else 0))
+        value_average_3 = str(value_average + (1 if value_remainder > 1 else 0))
+        rule_regex = (
+            "^([\\s\\S]{"
+            + value_average_1
+            + ",}?)([\\s\\S]{"
+            + value_average_2
+            + ",}?)([\\s\\S]{"
+            + value_average_3
+            + ",}?)$"
+        )
+    hide_group = masking_rule["hide_group"]
+    p = re.compile(rule_regex, re.I)
+    m = p.search(str(value))
+    masking_str = ""
+    if m is None:
+        return value
+    for i in range(m.lastindex):
+        if i == hide_group - 1:
+            group = "*" * len(m.group(i + 1))
+        else:
+            group = m.group(i + 1)
+        masking_str = masking_str + group
+    return masking_str
+
+
+def legacy_data_masking(rows, hit_columns):
+    """原 data_masking 的脱敏循环，每个命中列重建一遍所有行"""
+    rows = list(rows)
+    for index, masking_rule in hit_columns:
+        for idx, item in enumerate(rows):
+            rows[idx] = list(item)
+            rows[idx][index] = legacy_regex(masking_rule, rows[idx][index])
+    return rows
+
+
+def legacy_simple_column_mask(rows, hit_columns):
+    """原 simple_column_mask 的脱敏循环，每个命中列编译一次规则并重建所有行"""
+    for masking_column_index, masking_rule in hit_columns:
+        compiled_r = re.compile(masking_rule["rule_regex"], re.I | re.S)
+        replace_pattern = r""
+        for i in range(1, compiled_r.groups + 1):
+            if i == int(masking_rule["hide_group"]):
+                replace_pattern += r"****"
+            else:
+                replace_pattern += r"\{}".format(i)
+        new_rows = list(rows)
+        for i in range(len(rows)):
+            temp_value_list = []
+            for j in range(len(rows[i])):
+                column_data = rows[i][j]
+                if j == masking_column_index:
+                    column_data = compiled_r.sub(replace_pattern, str(rows[i][j]))
+                temp_value_list += [column_data]
+            new_rows[i] = tuple(temp_value_list)
+        rows = new_rows
+    return rows
+
+
+def random_value():
+    kind = random.random()
+    if kind < 0.05:
+        return None
+    if kind < 0.15:
+        return random.randint(0, 10**9)
+    if kind < 0.3:
+        return "".join(random.choices(string.ascii_lowercase, k=8)) + "@example.com"
+    return "1" + "".join(random.choices(string.digits, k=10))
+
+
+def timeit(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        cost = time.perf_counter() - start
+        best = cost if best is None else min(best, cost)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--masked", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    rows = tuple(
+        tuple(random_value() for _ in range(args.columns)) for _ in range(args.rows)
+    )
+    hit_columns = [
+        (index, RULES[index % len(RULES)])
+        for index in random.sample(range(args.columns), args.masked)
+    ]
+
+    cases = [
+        (
+            "data_masking",
+            lambda: legacy_data_masking(rows, hit_columns),
+            lambda: mask_columns(
+                rows,
+                {index: [compile_regex_masker(rule)] for index, rule in hit_columns},
+                list,
+            ),
+        ),
+        (
+            "simple_column_mask",
+            lambda: legacy_simple_column_mask(rows, hit_columns),
+            lambda: mask_columns(
+                rows,
+                {
+                    index: [
+                        compile_sub_masker(
+                            rule["rule_regex"], rule["hide_group"], re.I | re.S
+                        )
+                    ]
+                    for index, rule in hit_columns
+                },
+            ),
+        ),
+    ]
+    print(
+        f"rows={args.rows} columns={args.columns} masked={args.masked} repeat={args.repeat}"
+    )
+    for name, legacy, current in cases:
+        legacy_cost, legacy_result = timeit(legacy, args.repeat)
+        current_cost, current_result = timeit(current, args.repeat)
+        if legacy_result != current_result:
+            raise SystemExit(f"{name}: 脱敏结果与原实现不一致")
+        print(
+            f"{name:<20} legacy {legacy_cost * 1000:9.2f} ms"
+            f"  current {current_cost * 1000:9.2f} ms"
+            f"  speedup {legacy_cost / current_cost:6.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+MySQL工单执行吞吐量对比：goInception执行与原生按批次执行
+需要可用的goInception和目标实例，每轮执行前会清空测试表, 例如:
+  create table benchmark_execute(id bigint primary key, name varchar(64), amount int);
+用法: python scripts/benchmark_native_execute.py --instance mysql-1 --db test
+      --table benchmark_execute --statements 30000 --commit-size 100,500,2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "archery.settings")
+
+import django
+
+django.setup()
+
+from sql.engines import get_engine  # noqa: E402
+from sql.engines.goinception import GoInceptionEngine  # noqa: E402
+from sql.models import Instance  # noqa: E402
+from sql.utils.native_executor import (  # noqa: E402
+    NativeExecutor,
+    get_native_execute_config,
+    native_statements,
+)
+
+
+def generate_sql(table, count):
+    """生成INSERT、UPDATE、DELETE混合的数据修复脚本, 修改和删除前面插入的行"""
+    random.seed(0)
+    statements = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            statements.append(
+                f"insert into {table} (id, name, amount) "
+                f"values ({i}, 'name_{i}', {random.randint(0, 10000)});"
+            )
+        elif kind == 1:
+            statements.append(
+                f"update {table} set amount = {random.randint(0, 10000)} "
+                f"where id = {i - 1};"
+            )
+        else:
+            statements.append(f"delete from {table} where id = {i - 2};")
+    return "\n".join(statements)
+
+
+def truncate(instance, db_name, table):
+    engine = get_engine(instance=instance)
+    result = engine.execute(db_name=db_name, sql=f"truncate table {table}")
+    if result.error:
+        raise Exception(f"清空测试表失败: {result.error}")
+
+
+def run_goinception(workflow):
+    start = time.perf_counter()
+    execute_result = GoInceptionEngine().execute(workflow)
+    return time.perf_counter() - start, execute_result, ""
+
+
+def run_native(workflow, config):
+    statements = native_statements(workflow, config)
+    start = time.perf_counter()
+    executor = NativeExecutor(workflow, statements, config)
+    execute_result = executor.execute()
+    cost = time.perf_counter() - start
+    return (
+        cost,
+        execute_result,
+        f"  batches {executor.batch_cnt}  throttle waits {executor.throttle_wait}",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instance", required=True, help="实例名称")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--table", default="benchmark_execute")
+    parser.add_argument("--statements", type=int, default=30000)
+    parser.add_argument("--commit-size", default="100,500,2000")
+    parser.add_argument(
+        "--skip-goinception", action="store_true", help="只测试原生执行"
+    )
+    args = parser.parse_args()
+
+    instance = Instance.objects.get(instance_name=args.instance)
+    sql = generate_sql(args.table, args.statements)
+    workflow = SimpleNamespace(
+        id=0,
+        instance=instance,
+        db_name=args.db,
+        is_backup=False,
+        sqlworkflowcontent=SimpleNamespace(sql_content=sql),
+    )
+    print(f"statements={args.statements}")
+
+    modes = []
+    if not args.skip_goinception:
+        modes.append(("goInception", lambda: run_goinception(workflow)))
+    for commit_size in args.commit_size.split(","):
+        # 固定批次大小, 对比不同批次的吞吐量
+        config = dict(
+            get_native_execute_config(),
+            enabled=True,
+            commit_size=int(commit_size),
+            min_commit_size=int(commit_size),
+            max_commit_size=int(commit_size),
+        )
+        modes.append(
+            (
+                f"native x{commit_size}",
+                lambda config=config: run_native(workflow, config),
+            )
+        )
+    for name, func in modes:
+        truncate(instance, args.db, args.table)
+        cost, execute_result, extra = func()
+        affected_rows = sum(int(r.affected_rows or 0) for r in execute_result.rows)
+        line = (
+            f"{name:<14} {cost:8.2f} s"
+            f"  {args.statements / cost:10.0f} statements/s"
+            f"  rows {len(execute_result.rows)}"
+            f"  affected {affected_rows}"
+            f"{extra}"
+        )
+        if execute_result.error:
+            line += f"  error: {execute_result.error}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,6 @@ import logging
 import os
 import re
 import traceback
-import time
 
 import simplejson as json
 from django.conf import settings
@@ -29,6 +28,8 @@ from common.utils.timer import FuncTimer
 from sql.engines import get_engine
 from sql.notify import notify_for_audit
 from sql.plugins.pt_archiver import PtArchiver
+from sql.utils.archive_scheduler import submit_archive_tasks
+from sql.utils.native_archiver import NativeArchiver
 from sql.utils.resource_group import user_instances, user_groups
 from sql.models import ArchiveConfig, ArchiveLog, Instance, ResourceGroup
 from sql.utils.workflow_audit import get_auditor, AuditException, Audit
@@ -94,6 +95,7 @@ def archive_list(request):
         "dest_db_name",
         "dest_table_name",
         "sleep",
+        "priority",
         "mode",
         "no_delete",
         "status",
@@ -130,6 +132,7 @@ def archive_apply(request):
     condition = request.POST.get("condition")
     no_delete = True if request.POST.get("no_delete") == "true" else False
     sleep = request.POST.get("sleep") or 0
+    priority = request.POST.get("priority") or 0
     result = {"status": 0, "msg": "ok", "data": {}}
 
     # 参数校验
@@ -152,6 +155,10 @@ def archive_apply(request):
         return JsonResponse(
             {"status": 1, "msg": "归档到实例时目标实例信息必选！", "data": {}}
         )
+    try:
+        priority = int(priority)
+    except ValueError:
+        return JsonResponse({"status": 1, "msg": "优先级必须为整数！", "data": {}})
 
     # 获取源实例信息
     try:
@@ -193,6 +200,7 @@ def archive_apply(request):
             mode=mode,
             no_delete=no_delete,
             sleep=sleep,
+            priority=priority,
             status=WorkflowStatus.WAITING,
             state=False,
             user_name=user.username,
@@ -307,16 +315,83 @@ def add_archive_task(archive_ids=None):
             state=True, status=WorkflowStatus.PASSED
         )
 
-    # 添加task任务
-    for archive_info in archive_cnf_list:
-        archive_id = archive_info.id
-        async_task(
-            "sql.archiver.archive",
-            archive_id,
-            group=f'archive-{time.strftime("%Y-%m-%d %H:%M:%S ")}',
-            timeout=-1,
-            task_name=f"archive-{archive_id}",
+    # 加入归档调度队列，按并发上限提交task任务
+    submit_archive_tasks([archive_info.id for archive_info in archive_cnf_list])
+
+
+def archive_count_check(mode, no_delete, select_cnt, insert_cnt, delete_cnt):
+    """
+    检查归档的查询、写入、删除数量是否一致
+    :return: 不一致时返回错误信息，否则返回空字符串
+    """
+    if mode == "dest":
+        # 删除源数据，判断删除数量和写入数量
+        if not no_delete and (insert_cnt != delete_cnt):
+            return f"删除和写入数量不一致:{insert_cnt}!={delete_cnt}"
+    elif mode == "file":
+        # 删除源数据，判断查询数量和删除数量
+        if not no_delete and (select_cnt != delete_cnt):
+            return f"查询和删除数量不一致:{select_cnt}!={delete_cnt}"
+    elif mode == "purge":
+        # 直接删除。判断查询数量和删除数量
+        if select_cnt != delete_cnt:
+            return f"查询和删除数量不一致:{select_cnt}!={delete_cnt}"
+    return ""
+
+
+def native_archive(archive_info):
+    """
+    使用进程内的归档执行, 每批提交后记录断点, 失败后下次归档从断点继续
+    :param archive_info: 归档配置
+    :return:
+    """
+    archiver = NativeArchiver(archive_info)
+    error_info = ""
+    with FuncTimer() as t:
+        try:
+            archiver.run()
+        except Exception as e:
+            logger.error(
+                f"归档{archive_info.id}执行报错，错误信息：{traceback.format_exc()}"
+            )
+            error_info = f"归档执行报错:{e}"
+    if not error_info:
+        error_info = archive_count_check(
+            archive_info.mode,
+            archive_info.no_delete,
+            archiver.select_cnt,
+            archiver.insert_cnt,
+            archiver.delete_cnt,
         )
+    success = not error_info
+    statistics = archiver.statistics
+
+    # 执行信息保存到数据库
+    if connection.connection and not connection.is_usable():
+        close_old_connections()
+    # 更新最后归档时间
+    ArchiveConfig(id=archive_info.id, last_archive_time=t.end).save(
+        update_fields=["last_archive_time"]
+    )
+    ArchiveLog.objects.create(
+        archive=archive_info,
+        cmd=archiver.command,
+        condition=archive_info.condition,
+        mode=archive_info.mode,
+        no_delete=archive_info.no_delete,
+        sleep=archive_info.sleep,
+        select_cnt=archiver.select_cnt,
+        insert_cnt=archiver.insert_cnt,
+        delete_cnt=archiver.delete_cnt,
+        statistics=statistics,
+        success=success,
+        error_info=error_info,
+        checkpoint=archive_info.checkpoint,
+        start_time=t.start,
+        end_time=t.end,
+    )
+    if not success:
+        raise Exception(f"{error_info}\n{statistics}")
 
 
 def archive(archive_id):
@@ -325,6 +400,8 @@ def archive(archive_id):
     :return:
     """
     archive_info = ArchiveConfig.objects.get(id=archive_id)
+    if getattr(settings, "ARCHIVER_ENGINE", "pt-archiver") == "native":
+        return native_archive(archive_info)
     s_ins = archive_info.src_instance
     src_db_name = archive_info.src_db_name
     src_table_name = archive_info.src_table_name
@@ -427,21 +504,12 @@ def archive(archive_id):
     if stderr:
         error_info = f"命令执行报错:{stderr}"
         success = False
-    if mode == "dest":
-        # 删除源数据，判断删除数量和写入数量
-        if not no_delete and (insert_cnt != delete_cnt):
-            error_info = f"删除和写入数量不一致:{insert_cnt}!={delete_cnt}"
-            success = False
-    elif mode == "file":
-        # 删除源数据，判断查询数量和删除数量
-        if not no_delete and (select_cnt != delete_cnt):
-            error_info = f"查询和删除数量不一致:{select_cnt}!={delete_cnt}"
-            success = False
-    elif mode == "purge":
-        # 直接删除。判断查询数量和删除数量
-        if select_cnt != delete_cnt:
-            error_info = f"查询和删除数量不一致:{select_cnt}!={delete_cnt}"
-            success = False
+    count_error = archive_count_check(
+        mode, no_delete, select_cnt, insert_cnt, delete_cnt
+    )
+    if count_error:
+        error_info = count_error
+        success = False
 
     # 执行信息保存到数据库
     if connection.connection and not connection.is_usable():
@@ -529,10 +597,9 @@ def archive_switch(request):
 def archive_once(request):
     """单次立即调用归档任务"""
     archive_id = request.GET.get("archive_id")
-    async_task(
-        "sql.archiver.archive",
-        archive_id,
-        timeout=-1,
-        task_name=f"archive-{archive_id}",
-    )
+    if not str(archive_id or "").isdigit():
+        return JsonResponse({"status": 1, "msg": "归档任务id不正确！", "data": {}})
+    if not ArchiveConfig.objects.filter(id=archive_id).exists():
+        return JsonResponse({"status": 1, "msg": "归档任务不存在！", "data": {}})
+    submit_archive_tasks([archive_id])
     return JsonResponse({"status": 0, "msg": "ok", "data": {}})
@@ -19,6 +19,13 @@ from sql.engines import get_engine
 
 from sql.plugins.my2sql import My2SQL
 from sql.notify import notify_for_my2sql
+from sql.utils.binlog_store import (
+    BinlogStore,
+    get_binlog_store_config,
+    submit_binlog_store_sync,
+)
+from sql.utils.my2sql_reader import My2sqlOutputReader
+from sql.utils.resource_group import user_instances
 from .models import Instance
 
 logger = logging.getLogger("default")
@@ -39,23 +46,12 @@ def parse_my2sql_output_line(line, current_extra_info):
 
 
 def read_my2sql_output_files(output_dir, num):
-    rows = []
-    current_extra_info = ""
-    for root, _, files in os.walk(output_dir):
-        for file_name in sorted(files):
-            if not file_name.endswith(".sql") or file_name.startswith("."):
-                continue
-            file_path = os.path.join(root, file_name)
-            with open(file_path, encoding="utf-8") as sql_file:
-                for line in sql_file:
-                    row_info, current_extra_info = parse_my2sql_output_line(
-                        line, current_extra_info
-                    )
-                    if row_info:
-                        rows.append(row_info)
-                        if len(rows) >= num:
-                            return rows
-    return rows
+    return My2sqlOutputReader(output_dir).read(0, num)
+
+
+def my2sql_output_dir(instance):
+    """保存解析结果文件的目录，每个实例一个子目录"""
+    return os.path.join(settings.BASE_DIR, "downloads/my2sql/", str(instance.id))
 
 
 @permission_required("sql.menu_my2sql", raise_exception=True)
@@ -168,6 +164,63 @@ def my2sql(request):
 
     result = {"status": 0, "msg": "ok", "data": []}
 
+    # 从binlog解析结果存储中读取，已解析的binlog文件不再重复解析，未解析的在后台解析
+    if get_binlog_store_config()["enabled"]:
+        options = {
+            "work_type": work_type,
+            "full_columns": full_columns,
+            "ignore_primary_key": ignore_primary_key,
+            "no_db_prefix": no_db_prefix,
+            "threads": threads,
+        }
+        filters = {
+            "start_file": start_file,
+            "start_pos": start_pos or None,
+            "stop_file": end_file,
+            "stop_pos": end_pos or None,
+            "start_time": start_time,
+            "stop_time": stop_time,
+            "schemas": [s for i in only_schemas for s in i.split()],
+            "tables": only_tables,
+            "sql_types": sql_type,
+        }
+        offset = int(request.POST.get("offset") or 0)
+        try:
+            store = BinlogStore(instance, **options)
+            pending = store.pending_files(start_file, end_file)
+            if pending:
+                submit_binlog_store_sync(instance, options, start_file, end_file)
+                result["parsing"] = pending
+                result["msg"] = (
+                    f"binlog文件{', '.join(pending)}正在后台解析，"
+                    f"当前只返回已解析的结果，请稍后重新获取"
+                )
+            rows, total = store.query(
+                offset=offset, limit=num, extra_info=extra_info, **filters
+            )
+            result["data"] = rows
+            result["total"] = total
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            result["status"] = 1
+            result["msg"] = str(e)
+        if save_sql and result["status"] == 0:
+            async_task(
+                my2sql_store_file,
+                instance=instance,
+                options=options,
+                filters=filters,
+                extra_info=extra_info,
+                user=request.user,
+                hook=notify_for_my2sql,
+                timeout=-1,
+                task_name=f"my2sql-{time.time()}",
+            )
+        return HttpResponse(
+            json.dumps(result, cls=ExtendJSONEncoder, bigint_as_string=True),
+            content_type="application/json",
+        )
+
     # 提交给my2sql进行解析
     my2sql = My2SQL()
     username, password = instance.get_username_password()
@@ -218,7 +271,9 @@ def my2sql(request):
         p = my2sql.execute_cmd(cmd_args)
         if extra_info:
             _, stderr = p.communicate()
-            rows = read_my2sql_output_files(temp_output_dir, num)
+            reader = My2sqlOutputReader(temp_output_dir)
+            rows = reader.read(int(request.POST.get("offset") or 0), num)
+            result["total"] = reader.total
         else:
             # 读取前num行后结束
             n = 1
@@ -281,6 +336,42 @@ def my2sql(request):
     )
 
 
+@permission_required("sql.menu_my2sql", raise_exception=True)
+def my2sql_output(request):
+    """
+    分页浏览my2sql保存到文件的解析结果，只能浏览有权限的实例的文件
+    :param request:
+    :return:
+    """
+    instance_name = request.POST.get("instance_name")
+    try:
+        instance = user_instances(request.user, db_type=["mysql"]).get(
+            instance_name=instance_name
+        )
+    except Instance.DoesNotExist:
+        return JsonResponse({"status": 1, "msg": "你所在组未关联该实例！", "data": []})
+    offset = int(request.POST.get("offset") or 0)
+    limit = int(request.POST.get("limit") or 30)
+    tables = request.POST.getlist("only_tables[]")
+    sql_types = request.POST.getlist("sql_type[]")
+    path = my2sql_output_dir(instance)
+    result = {"status": 0, "msg": "ok", "data": [], "total": 0}
+    if not os.path.isdir(path):
+        return JsonResponse(result)
+    try:
+        reader = My2sqlOutputReader(path, tables=tables, sql_types=sql_types)
+        result["data"] = reader.read(offset, limit)
+        result["total"] = reader.total
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        result["status"] = 1
+        result["msg"] = str(e)
+    return HttpResponse(
+        json.dumps(result, cls=ExtendJSONEncoder, bigint_as_string=True),
+        content_type="application/json",
+    )
+
+
 def my2sql_file(args, user):
     """
     用于异步保存binlog解析的文件
@@ -298,7 +389,7 @@ def my2sql_file(args, user):
             "port": instance.port,
         }
     )
-    path = os.path.join(settings.BASE_DIR, "downloads/my2sql/")
+    path = my2sql_output_dir(instance)
     os.makedirs(path, exist_ok=True)
 
     # 参数转换
@@ -307,3 +398,25 @@ def my2sql_file(args, user):
     # 使用output-dir参数执行命令保存sql
     my2sql.execute_cmd(cmd_args)
     return user, path
+
+
+def my2sql_store_file(instance, options, filters, extra_info, user):
+    """
+    从binlog解析结果存储中导出文件
+    :param instance: 实例
+    :param options: my2sql解析选项
+    :param filters: 位点、时间、库表、语句类型过滤条件
+    :param extra_info: 是否输出extraInfo注释
+    :param user: 操作用户对象，用户消息推送
+    :return:
+    """
+    store = BinlogStore(instance, **options)
+    store.sync(filters["start_file"], filters["stop_file"])
+    path = my2sql_output_dir(instance)
+    os.makedirs(path, exist_ok=True)
+    file_name = (
+        f"{instance.instance_name}-{options['work_type']}-"
+        f"{time.strftime('%Y%m%d%H%M%S')}.sql"
+    )
+    store.export(os.path.join(path, file_name), extra_info=extra_info, **filters)
+    return user, path
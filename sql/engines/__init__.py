@@ -4,7 +4,8 @@ import importlib
 import re
 from sql.engines.models import ResultSet, ReviewSet
 from sql.models import Instance
-from sql.utils.ssh_tunnel import SSHConnection
+from sql.utils.connection_pool import get_pool_config, pool_registry
+from sql.utils.ssh_tunnel import tunnel_manager
 from django.conf import settings
 
 
@@ -16,9 +17,13 @@ class EngineBase:
     name = "Base"
     info = "base engine"
 
+    # 是否支持连接池, 支持的engine需在get_connection/close中使用acquire_connection/release_connection
+    pool_enabled = False
+
     def __init__(self, instance: Instance = None):
         self.conn = None
         self.thread_id = None
+        self._pool = None
         if instance:
             self.instance = instance  # type: Instance
             self.instance_name = instance.instance_name
@@ -28,42 +33,25 @@ class EngineBase:
             self.db_name = instance.db_name
             self.mode = instance.mode
 
-            # 判断如果配置了隧道则连接隧道，只测试了MySQL
+            # 判断如果配置了隧道则连接隧道，只测试了MySQL，隧道在进程内共享
             if self.instance.tunnel:
-                self.ssh = SSHConnection(
-                    self.host,
-                    self.port,
-                    instance.tunnel.host,
-                    instance.tunnel.port,
-                    instance.tunnel.user,
-                    instance.tunnel.password,
-                    instance.tunnel.pkey,
-                    instance.tunnel.pkey_password,
-                )
+                self.ssh = tunnel_manager.acquire(instance.tunnel, self.host, self.port)
                 self.host, self.port = self.ssh.get_ssh()
 
     def __del__(self):
         if hasattr(self, "ssh"):
-            del self.ssh
+            self.ssh.release()
         if hasattr(self, "remotessh"):
-            del self.remotessh
+            self.remotessh.release()
 
     def remote_instance_conn(self, instance=None):
         user, password = instance.get_username_password()
         # 判断如果配置了隧道则连接隧道
         if not hasattr(self, "remotessh") and instance.tunnel:
-            self.remotessh = SSHConnection(
-                instance.host,
-                instance.port,
-                instance.tunnel.host,
-                instance.tunnel.port,
-                instance.tunnel.user,
-                instance.tunnel.password,
-                instance.tunnel.pkey,
-                instance.tunnel.pkey_password,
+            self.remotessh = tunnel_manager.acquire(
+                instance.tunnel, instance.host, instance.port
             )
             self.remote_host, self.remote_port = self.remotessh.get_ssh()
-            user, password = instance.get_username_password()
             self.remote_user = user
             self.remote_password = password
         elif not instance.tunnel:
@@ -81,6 +69,50 @@ class EngineBase:
     def get_connection(self, db_name=None):
         """返回一个conn实例"""
 
+    @property
+    def use_pool(self):
+        """是否从连接池获取连接"""
+        return bool(
+            self.pool_enabled
+            and getattr(self, "instance", None)
+            and get_pool_config()["enabled"]
+        )
+
+    def ping_connection(self, conn):
+        """连接池借出连接时的健康检查"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute(self.test_query)
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        return True
+
+    def acquire_connection(self, connect, db_name=None):
+        """获取连接, 启用连接池时从连接池借出, 否则直接调用connect新建"""
+        if not self.use_pool:
+            return connect()
+        self._pool = pool_registry.get_pool(self.name, self.instance, db_name)
+        return self._pool.acquire(connect, self.ping_connection)
+
+    def release_connection(self, conn):
+        """释放连接, 启用连接池时归还连接池, 否则直接关闭"""
+        if getattr(self, "_pool", None):
+            self._pool.release(conn)
+            self._pool = None
+        else:
+            conn.close()
+
+    def discard_connection(self):
+        """直接关闭当前连接, 不归还连接池, 用于连接上仍有未读完结果等无法复用的情况"""
+        if self.conn:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+        self._pool = None
+
     def test_connection(self):
         """测试实例链接是否正常"""
         return self.query(sql=self.test_query)
@@ -226,11 +258,65 @@ class EngineBase:
         """实际查询 返回一个ResultSet"""
         return ResultSet()
 
+    def query_stream(
+        self, db_name=None, sql="", limit_num=0, chunk_size=1000, **kwargs
+    ):
+        """
+        流式查询, 返回 (ResultSet, 行批次迭代器), ResultSet中不含行数据, 行按chunk_size分批产出
+        默认实现执行query后再分批, 支持服务端游标的engine应重写以降低内存占用
+        迭代结束或关闭时释放连接
+        """
+        result_set = self.query(db_name=db_name, sql=sql, limit_num=limit_num, **kwargs)
+        rows, result_set.rows = result_set.rows, []
+
+        def chunks():
+            for i in range(0, len(rows), chunk_size):
+                yield list(rows[i : i + chunk_size])
+
+        return result_set, chunks()
+
     def query_masking(self, db_name=None, sql="", resultset=None):
         """传入 sql语句, db名, 结果集,
         返回一个脱敏后的结果集"""
         return resultset
 
+    def get_split_key(self, db_name=None, tb_name=None):
+        """
+        获取可用于按范围拆分查询的整数主键列名, 用于并行分片导出
+        不支持拆分时返回None
+        """
+        return None
+
+    def estimate_rows(self, db_name=None, sql=""):
+        """
+        根据执行计划预估查询返回的行数, 不实际执行查询
+        不支持预估时返回None
+        """
+        return None
+
+    def stream_masker(self, db_name=None, sql="", resultset=None):
+        """
+        流式查询的脱敏, 返回对每批行脱敏的函数
+        默认对每批行构造结果集调用query_masking, 能够预先确定脱敏列的engine应重写, 避免每批重复解析
+        :param resultset: query_stream返回的结果集, 用于提供列信息和记录脱敏状态
+        """
+
+        def masker(rows):
+            chunk = ResultSet(
+                full_sql=resultset.full_sql,
+                rows=rows,
+                column_list=resultset.column_list,
+                column_type=resultset.column_type,
+            )
+            masked = self.query_masking(db_name, sql, chunk)
+            if masked.error:
+                raise RuntimeError(masked.error)
+            resultset.is_masked = resultset.is_masked or masked.is_masked
+            resultset.mask_rule_hit = resultset.mask_rule_hit or masked.mask_rule_hit
+            return masked.rows
+
+        return masker
+
     def execute_check(self, db_name=None, sql=""):
         """执行语句的检查 返回一个ReviewSet"""
         return ReviewSet()
@@ -216,6 +216,22 @@ class ClickHouseEngine(EngineBase):
             sql = f"{sql};"
         return sql
 
+    def estimate_rows(self, db_name=None, sql=""):
+        """
+        使用explain estimate根据数据分区(system.parts)的元数据预估需要读取的行数
+        按分区和索引粒度裁剪, 不计算where中非索引条件的过滤, 通常不小于实际返回的行数
+        """
+        explain_result = self.query(
+            db_name=db_name, sql=f"explain estimate {sql.rstrip(';')}"
+        )
+        if explain_result.error or not explain_result.column_list:
+            return None
+        try:
+            rows_index = explain_result.column_list.index("rows")
+        except ValueError:
+            return None
+        return sum(int(row[rows_index]) for row in explain_result.rows)
+
     def explain_check(self, check_result, db_name=None, line=0, statement=""):
         """使用explain ast检查sql语法, 返回Review set"""
         result = ReviewResult(
@@ -1,19 +1,72 @@
 # -*- coding: UTF-8 -*-
 import logging
+import queue
 import re
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+
 import MySQLdb
 import pymysql
 import simplejson as json
 
 from common.config import SysConfig
+from common.utils.settings_config import get_settings_config
 from sql.models import AliyunRdsConfig
-from sql.utils.sql_utils import get_syntax_type
+from sql.utils.execute_progress import ExecuteProgress, get_execute_progress_config
+from sql.utils.sql_utils import get_syntax_type, split_mysql_statements
 from . import EngineBase
 from .models import ResultSet, ReviewSet, ReviewResult
 
 logger = logging.getLogger("default")
 
+DEFAULT_CHUNK_CHECK_CONFIG = {
+    # 开启后语句数较多且全部为DML的工单拆分为多批并行审核
+    "enabled": False,
+    # 语句数达到该值才拆分
+    "min_statements": 5000,
+    # 每批语句数
+    "chunk_size": 2000,
+    # 并行审核使用的goInception连接数
+    "workers": 4,
+}
+
+# 拆分后各批之间没有依赖的语句类型
+CHUNK_SAFE_RE = re.compile(r"^(insert|replace|update|delete)\b", re.I)
+LEADING_COMMENTS_RE = re.compile(r"^(?:\s+|/\*.*?\*/|(?:--\s|#)[^\n]*)*", re.DOTALL)
+# 每批都会返回的会话设置语句结果，合并时只保留第一批的
+SESSION_ROW_RE = re.compile(r"^\s*(?:use\s|inception\s+set\s)", re.I)
+
+
+def get_chunk_check_config():
+    """读取goInception分批审核配置, 未配置的项使用默认值"""
+    return get_settings_config("GOINCEPTION_CHUNK_CHECK", DEFAULT_CHUNK_CHECK_CONFIG)
+
+
+def chunk_statements(sql, config):
+    """
+    判断能否分批审核并拆分
+    只有DML语句时各语句的审核结果互不影响, 包含DDL、use、set等会改变后续语句审核上下文的语句时不拆分
+    :return: 语句批次列表, 不能拆分时返回None
+    """
+    if not config["enabled"] or sql.count(";") + 1 < int(config["min_statements"]):
+        return None
+    statements = []
+    for statement in split_mysql_statements(sql):
+        body = LEADING_COMMENTS_RE.sub("", statement, count=1)
+        if not body:
+            continue
+        if not CHUNK_SAFE_RE.match(body):
+            return None
+        statements.append(statement)
+    if len(statements) < int(config["min_statements"]):
+        return None
+    chunk_size = max(1, int(config["chunk_size"]))
+    return [
+        statements[i : i + chunk_size] for i in range(0, len(statements), chunk_size)
+    ]
+
 
 class GoInceptionEngine(EngineBase):
     test_query = "INCEPTION GET VARIABLES"
@@ -68,8 +121,18 @@ class GoInceptionEngine(EngineBase):
         """字符串参数转义"""
         return pymysql.escape_string(value)
 
-    def execute_check(self, instance=None, db_name=None, sql=""):
-        """inception check"""
+    def execute_check(
+        self, instance=None, db_name=None, sql="", progress_callback=None
+    ):
+        """
+        inception check
+        :param progress_callback: 分批审核时每完成一批调用一次, 参数为(已完成语句数, 总语句数)
+        """
+        chunks = chunk_statements(sql, get_chunk_check_config())
+        if chunks and len(chunks) > 1:
+            return self.execute_check_chunked(
+                instance, db_name, sql, chunks, progress_callback
+            )
         # 判断如果配置了隧道则连接隧道
         host, port, user, password = self.remote_instance_conn(instance)
         check_result = ReviewSet(full_sql=sql)
@@ -105,43 +168,171 @@ class GoInceptionEngine(EngineBase):
         check_result.warning = inception_result.warning
         return check_result
 
-    def execute(self, workflow=None):
-        """执行上线单"""
-        instance = workflow.instance
-        # 判断如果配置了隧道则连接隧道
+    def execute_check_chunked(
+        self, instance, db_name, sql, chunks, progress_callback=None
+    ):
+        """
+        分批并行审核, 各批使用独立的goInception连接, 结果按批次顺序合并
+        :param chunks: 语句批次列表, 只包含DML语句
+        """
+        config = get_chunk_check_config()
         host, port, user, password = self.remote_instance_conn(instance)
-        execute_result = ReviewSet(full_sql=workflow.sqlworkflowcontent.sql_content)
-        if workflow.is_backup:
-            str_backup = "--backup=1"
-        else:
-            str_backup = "--backup=0"
-
-        # 提交inception执行
         variables, set_session_sql = get_session_variables(instance)
-        sql_execute = f"""/*--user='{user}';--password='{password}';--host='{host}';--port={port};--execute=1;--ignore-warnings=1;{str_backup};--sleep=200;--sleep_rows=100*/
+        real_row_count = SysConfig().get("real_row_count", False)
+        real_row_count_option = "--real_row_count=true;" if real_row_count else ""
+        total = sum(len(chunk) for chunk in chunks)
+        workers = max(1, min(int(config["workers"]), len(chunks)))
+        engines = queue.Queue()
+        finished = {"statements": 0}
+        lock = threading.Lock()
+        start = time.time()
+
+        def check_chunk(chunk):
+            # 换行分隔，避免语句结尾的单行注释注释掉后面的语句
+            statements = ";\n".join(chunk) + "\n"
+            inception_sql = f"""/*--user='{user}';--password='{password}';--host='{host}';--port={port};--check=1;{real_row_count_option}*/
                             inception_magic_start;
                             {set_session_sql}
-                            use `{workflow.db_name}`;
-                            {workflow.sqlworkflowcontent.sql_content.rstrip(';')};
+                            use `{db_name}`;
+                            {statements};
                             inception_magic_commit;"""
-        inception_result = self.query(sql=sql_execute)
-        # 执行报错，inception crash或者执行中连接异常的场景
-        if inception_result.error and not execute_result.rows:
-            execute_result.error = inception_result.error
-            execute_result.rows = [
-                ReviewResult(
-                    stage="Execute failed",
-                    errlevel=2,
-                    stagestatus="异常终止",
-                    errormessage=f"goInception Error: {inception_result.error}",
-                    sql=workflow.sqlworkflowcontent.sql_content,
+            engine = engines.get()
+            try:
+                result = engine.query(sql=inception_sql, close_conn=False)
+            finally:
+                engines.put(engine)
+            with lock:
+                finished["statements"] += len(chunk)
+                logger.debug(
+                    f"goInception分批审核进度：{finished['statements']}/{total}，"
+                    f"耗时{time.time() - start:.2f}秒"
                 )
-            ]
-            return execute_result
+                if progress_callback:
+                    progress_callback(finished["statements"], total)
+            return result
 
-        # 把结果转换为ReviewSet
-        for r in inception_result.rows:
-            execute_result.rows += [ReviewResult(inception_result=r)]
+        try:
+            # 连接在当前线程中建立, 避免在工作线程中读取系统配置
+            for _ in range(workers):
+                engine = GoInceptionEngine(instance=getattr(self, "instance", None))
+                engines.put(engine)
+                engine.get_connection()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                inception_results = list(executor.map(check_chunk, chunks))
+        finally:
+            while not engines.empty():
+                engines.get().close()
+
+        check_result = ReviewSet(full_sql=sql)
+        check_result.rows = []
+        # 只包含DML语句
+        check_result.syntax_type = 2
+        for index, inception_result in enumerate(inception_results):
+            if inception_result.error and not check_result.error:
+                check_result.error = inception_result.error
+            if inception_result.warning and not check_result.warning:
+                check_result.warning = inception_result.warning
+            check_result.column_list = (
+                check_result.column_list or inception_result.column_list
+            )
+            for r in inception_result.rows:
+                if index > 0 and SESSION_ROW_RE.match(r[5] or ""):
+                    continue
+                row = ReviewResult(inception_result=r)
+                row.id = len(check_result.rows) + 1
+                check_result.rows.append(row)
+                if row.errlevel == 1:  # 警告
+                    check_result.warning_count += 1
+                elif row.errlevel == 2:  # 错误
+                    check_result.error_count += 1
+        check_result.checked = True
+        logger.debug(
+            f"goInception分批审核完成，语句{total}条，{len(chunks)}批，"
+            f"{workers}个连接，耗时{time.time() - start:.2f}秒"
+        )
+        return check_result
+
+    def execute(self, workflow=None):
+        """
+        执行上线单
+        开启执行进度时只包含DML的工单按批提交goInception执行, 每批执行完成后上报进度,
+        前一批有语句执行失败时不再执行后续批次
+        """
+        sql = workflow.sqlworkflowcontent.sql_content
+        execute_result = ReviewSet(full_sql=sql)
+        batches = [sql]
+        progress = None
+        config = get_execute_progress_config()
+        if config["enabled"]:
+            chunks = chunk_statements(
+                sql,
+                {
+                    "enabled": True,
+                    "min_statements": 1,
+                    "chunk_size": config["batch_size"],
+                },
+            )
+            if chunks:
+                batches = [";\n".join(chunk) for chunk in chunks]
+                total = sum(len(chunk) for chunk in chunks)
+            else:
+                chunks = [split_mysql_statements(sql)]
+                total = len(chunks[0])
+            progress = ExecuteProgress(workflow.id, total)
+            progress.start()
+
+        for index, batch in enumerate(batches):
+            inception_result = self.query(sql=self._execute_sql(workflow, batch))
+            # 执行报错，inception crash或者执行中连接异常的场景
+            if inception_result.error and not (index and inception_result.rows):
+                execute_result.error = inception_result.error
+                execute_result.rows.append(
+                    ReviewResult(
+                        stage="Execute failed",
+                        errlevel=2,
+                        stagestatus="异常终止",
+                        errormessage=f"goInception Error: {inception_result.error}",
+                        sql=batch,
+                    )
+                )
+                return execute_result
+
+            # 把结果转换为ReviewSet
+            failed, affected_rows = False, 0
+            for r in inception_result.rows:
+                row = ReviewResult(inception_result=r)
+                # 每批都会返回会话设置语句的结果，只保留第一批的
+                if index > 0 and SESSION_ROW_RE.match(row.sql):
+                    continue
+                if len(batches) > 1:
+                    row.id = len(execute_result.rows) + 1
+                execute_result.rows.append(row)
+                affected_rows += int(row.affected_rows or 0)
+                if row.errlevel in (1, 2) and not re.search(
+                    r"Execute Successfully", row.stagestatus
+                ):
+                    failed = True
+            if progress:
+                progress.advance(
+                    count=len(chunks[index]),
+                    affected_rows=affected_rows,
+                    current_sql=chunks[index][-1] if chunks[index] else "",
+                )
+            if failed and index < len(batches) - 1:
+                # 后续批次不再执行
+                for statement in [s for chunk in chunks[index + 1 :] for s in chunk]:
+                    execute_result.rows.append(
+                        ReviewResult(
+                            id=len(execute_result.rows) + 1,
+                            stage="CHECKED",
+                            stagestatus="未执行",
+                            errormessage="前序语句执行失败，未执行",
+                            sql=statement,
+                        )
+                    )
+                break
+        if progress:
+            progress.publish()
 
         # 如果发现任何一个行执行结果里有errLevel为1或2，并且状态列没有包含Execute Successfully，则最终执行结果为有异常.
         for r in execute_result.rows:
@@ -154,6 +345,23 @@ class GoInceptionEngine(EngineBase):
                 break
         return execute_result
 
+    def _execute_sql(self, workflow, sql):
+        """拼接提交goInception执行的语句"""
+        instance = workflow.instance
+        # 判断如果配置了隧道则连接隧道
+        host, port, user, password = self.remote_instance_conn(instance)
+        if workflow.is_backup:
+            str_backup = "--backup=1"
+        else:
+            str_backup = "--backup=0"
+        variables, set_session_sql = get_session_variables(instance)
+        return f"""/*--user='{user}';--password='{password}';--host='{host}';--port={port};--execute=1;--ignore-warnings=1;{str_backup};--sleep=200;--sleep_rows=100*/
+                            inception_magic_start;
+                            {set_session_sql}
+                            use `{workflow.db_name}`;
+                            {sql.rstrip(';')};
+                            inception_magic_commit;"""
+
     def query(self, db_name=None, sql="", limit_num=0, close_conn=True, **kwargs):
         """返回 ResultSet"""
         result_set = ResultSet(full_sql=sql)
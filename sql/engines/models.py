@@ -1,6 +1,7 @@
 # -*- coding: UTF-8 -*-
 """engine 结果集定义"""
 
+import inspect
 import json
 
 
@@ -120,6 +121,23 @@ class ReviewSet:
             tmp_list += [r.__dict__]
         return tmp_list
 
+    def summary(self):
+        """按行统计审核结果的警告数、错误数、影响行数, rows可以是ReviewResult或字典"""
+        warning_count, error_count, affected_rows = 0, 0, 0
+        for r in self.rows:
+            r = r if isinstance(r, dict) else r.__dict__
+            err_level = r.get("errlevel") or 0
+            if err_level == 1:
+                warning_count += 1
+            elif err_level == 2:
+                error_count += 1
+            affected_rows += int(r.get("affected_rows") or 0)
+        return {
+            "warning_count": warning_count,
+            "error_count": error_count,
+            "affected_rows": affected_rows,
+        }
+
 
 class ResultSet:
     """查询的结果集, rows 内只有值, column_list 中的是key"""
@@ -168,3 +186,26 @@ class ResultSet:
 
     def to_sep_dict(self):
         return {"column_list": self.column_list, "rows": self.rows}
+
+
+class RowStream:
+    """
+    流式查询的行批次迭代器, 包装从游标读取行的生成器
+    生成器的finally负责释放连接, 但未开始迭代就关闭时finally不会执行, 此时由release释放连接
+    """
+
+    def __init__(self, chunks, release):
+        self._chunks = chunks
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        started = inspect.getgeneratorstate(self._chunks) != inspect.GEN_CREATED
+        self._chunks.close()
+        if not started:
+            self._release()
@@ -11,6 +11,7 @@ from enum import Enum
 
 import schemaobject
 import sqlparse
+from django.conf import settings
 from MySQLdb.constants import FIELD_TYPE
 from schemaobject.connection import build_database_url
 
@@ -18,8 +19,13 @@ from sql.engines.goinception import GoInceptionEngine
 from sql.utils.extract_tables import extract_tables
 from sql.utils.sql_utils import get_syntax_type, remove_comments
 from . import EngineBase
-from .models import ResultSet, ReviewResult, ReviewSet
-from sql.utils.data_masking import data_masking
+from .models import ResultSet, ReviewResult, ReviewSet, RowStream
+from sql.utils.data_masking import (
+    compile_column_maskers,
+    data_masking,
+    mask_columns,
+    masking_hit_columns,
+)
 from common.config import SysConfig
 
 logger = logging.getLogger("default")
@@ -95,6 +101,7 @@ class MysqlEngine(EngineBase):
     name = "MySQL"
     info = "MySQL engine"
     test_query = "SELECT 1"
+    pool_enabled = True
     _server_version = None
     _server_fork_type = None
     _server_info = None
@@ -335,27 +342,20 @@ class MysqlEngine(EngineBase):
         if self.conn:
             self.thread_id = self.conn.thread_id()
             return self.conn
+        params = dict(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            passwd=self.password,
+            charset=self.instance.charset or "utf8mb4",
+            conv=conversions,
+            connect_timeout=10,
+        )
         if db_name:
-            self.conn = MySQLdb.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                passwd=self.password,
-                db=db_name,
-                charset=self.instance.charset or "utf8mb4",
-                conv=conversions,
-                connect_timeout=10,
-            )
-        else:
-            self.conn = MySQLdb.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                passwd=self.password,
-                charset=self.instance.charset or "utf8mb4",
-                conv=conversions,
-                connect_timeout=10,
-            )
+            params["db"] = db_name
+        self.conn = self.acquire_connection(
+            lambda: MySQLdb.connect(**params), db_name=db_name
+        )
         self.thread_id = self.conn.thread_id()
         return self.conn
 
@@ -1137,17 +1137,7 @@ class MysqlEngine(EngineBase):
             conn = self.get_connection(db_name=db_name)
             conn.autocommit(True)
             cursor = conn.cursor(cursorclass)
-            try:
-                if self.server_fork_type == MysqlForkType.MARIADB:
-                    cursor.execute(
-                        f"set session max_statement_time={max_execution_time / 1000};"
-                    )
-                else:
-                    cursor.execute(
-                        f"set session max_execution_time={max_execution_time};"
-                    )
-            except MySQLdb.OperationalError:
-                pass
+            self._set_max_execution_time(cursor, max_execution_time)
             effect_row = cursor.execute(sql, parameters)
             if int(limit_num) > 0:
                 rows = cursor.fetchmany(size=int(limit_num))
@@ -1173,6 +1163,132 @@ class MysqlEngine(EngineBase):
                 self.close()
         return result_set
 
+    def _set_max_execution_time(self, cursor, max_execution_time):
+        """设置会话级查询超时时间，单位毫秒"""
+        try:
+            if self.server_fork_type == MysqlForkType.MARIADB:
+                cursor.execute(
+                    f"set session max_statement_time={max_execution_time / 1000};"
+                )
+            else:
+                cursor.execute(f"set session max_execution_time={max_execution_time};")
+        except MySQLdb.OperationalError:
+            pass
+
+    def get_split_key(self, db_name=None, tb_name=None):
+        """获取单列整数主键的列名, 联合主键或非整数主键返回None"""
+        sql = """SELECT COLUMN_NAME, DATA_TYPE
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = %(db_name)s
+          AND TABLE_NAME = %(tb_name)s
+          AND COLUMN_KEY = 'PRI';"""
+        result = self.query(
+            "information_schema",
+            sql,
+            parameters={"db_name": db_name, "tb_name": tb_name},
+        )
+        if result.error or len(result.rows) != 1:
+            return None
+        column_name, data_type = result.rows[0]
+        if data_type.lower() not in (
+            "tinyint",
+            "smallint",
+            "mediumint",
+            "int",
+            "bigint",
+        ):
+            return None
+        return column_name
+
+    def get_primary_key(self, db_name=None, tb_name=None):
+        """获取主键列名列表, 按主键中的顺序排列, 没有主键返回空列表"""
+        sql = """SELECT COLUMN_NAME
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = %(db_name)s
+          AND TABLE_NAME = %(tb_name)s
+          AND INDEX_NAME = 'PRIMARY'
+        ORDER BY SEQ_IN_INDEX;"""
+        result = self.query(
+            "information_schema",
+            sql,
+            parameters={"db_name": db_name, "tb_name": tb_name},
+            close_conn=False,
+        )
+        if result.error:
+            raise Exception(result.error)
+        return [row[0] for row in result.rows]
+
+    def query_stream(
+        self, db_name=None, sql="", limit_num=0, chunk_size=1000, **kwargs
+    ):
+        """使用SSCursor流式查询，结果不在客户端整体缓存，返回 (ResultSet, 行批次迭代器)"""
+        result_set = ResultSet(full_sql=sql)
+        max_execution_time = kwargs.get("max_execution_time", 0)
+        try:
+            conn = self.get_connection(db_name=db_name)
+            conn.autocommit(True)
+            cursor = conn.cursor(MySQLdb.cursors.SSCursor)
+            self._set_max_execution_time(cursor, max_execution_time)
+            cursor.execute(sql, kwargs.get("parameters"))
+            fields = cursor.description
+            result_set.column_list = [i[0] for i in fields] if fields else []
+            result_set.column_type = (
+                [column_types_map.get(i[1], "") for i in fields] if fields else []
+            )
+        except Exception as e:
+            logger.warning(
+                f"{self.name}语句执行报错，语句：{sql}，错误信息{traceback.format_exc()}"
+            )
+            result_set.error = str(e)
+            self.close()
+            return result_set, iter(())
+        # 未开始读取就关闭时连接上仍有未读取的结果, 直接关闭连接
+        return result_set, RowStream(
+            self._stream_rows(cursor, int(limit_num), chunk_size),
+            self.discard_connection,
+        )
+
+    def _stream_rows(self, cursor, limit_num, chunk_size):
+        """
+        从服务端游标分批读取行
+        读取完毕后归还连接，中途停止时连接上仍有未读取的结果，直接关闭连接而不是读完剩余数据
+        """
+        fetched = 0
+        drained = False
+        try:
+            while True:
+                size = chunk_size
+                if limit_num > 0:
+                    size = min(chunk_size, limit_num - fetched)
+                    if size <= 0:
+                        break
+                rows = cursor.fetchmany(size=size)
+                if not rows:
+                    drained = True
+                    break
+                fetched += len(rows)
+                yield list(rows)
+        finally:
+            if drained:
+                cursor.close()
+                self.close()
+            else:
+                self.discard_connection()
+
+    def stream_masker(self, db_name=None, sql="", resultset=None):
+        """流式查询脱敏，命中列和规则只解析一次，之后每批行按列脱敏"""
+        if not re.match(r"^select", sql, re.I):
+            return lambda rows: rows
+        hit_columns = masking_hit_columns(
+            self.instance, db_name, sql, resultset.column_list
+        )
+        resultset.mask_rule_hit = True if hit_columns else False
+        column_maskers = compile_column_maskers(hit_columns, {})
+        if not hit_columns:
+            return lambda rows: rows
+        resultset.is_masked = True
+        return lambda rows: mask_columns(rows, column_maskers, list)
+
     @staticmethod
     def _normalize_identifier(value):
         if value is None:
@@ -1259,15 +1375,54 @@ class MysqlEngine(EngineBase):
             result["bad_query"] = True
             result["msg"] = "您无权查看该表"
             return result
-        # select语句先使用Explain判断语法是否正确
-        if re.match(r"^select", sql, re.I):
-            explain_result = self.query(db_name=db_name, sql=f"explain {sql}")
-            if explain_result.error:
+        # select语句先使用Explain判断语法是否正确, fast模式跳过, 语法错误由实际执行返回
+        if re.match(r"^select", sql, re.I) and self.strict_query_check:
+            # 校验通过时保留连接, 供随后的实际查询复用
+            explain_error = self.explain_check(db_name, sql, close_conn=False)
+            if explain_error:
                 result["bad_query"] = True
-                result["msg"] = explain_result.error
+                result["msg"] = explain_error
 
         return result
 
+    @property
+    def strict_query_check(self):
+        """查询前是否使用explain预先校验语法, MYSQL_QUERY_CHECK_MODE=fast时跳过"""
+        return getattr(settings, "MYSQL_QUERY_CHECK_MODE", "strict") != "fast"
+
+    def explain_check(self, db_name=None, sql="", close_conn=True):
+        """使用explain校验select语句, 返回错误信息, 校验通过返回None"""
+        explain_result = self.query(
+            db_name=db_name, sql=f"explain {sql}", close_conn=close_conn
+        )
+        if explain_result.error:
+            if not close_conn:
+                self.close()
+            return explain_result.error
+        return None
+
+    def estimate_rows(self, db_name=None, sql=""):
+        """
+        根据explain预估行数, 取最外层查询各表扫描行数的乘积
+        扫描行数不计入where过滤比例, 通常不小于实际返回的行数
+        包含UNION、子查询或派生表时无法从执行计划推算结果行数, 返回None
+        """
+        explain_result = self.query(
+            db_name=db_name,
+            sql=f"explain {sql.rstrip(';')}",
+            cursorclass=MySQLdb.cursors.DictCursor,
+        )
+        if explain_result.error or not explain_result.rows:
+            return None
+        if len({row.get("id") for row in explain_result.rows}) > 1:
+            return None
+        estimate = None
+        for row in explain_result.rows:
+            if row.get("rows") is None:
+                continue
+            estimate = (estimate or 1) * int(row["rows"])
+        return estimate
+
     def filter_sql(self, sql="", limit_num=0):
         # 对查询sql增加limit限制,limit n 或 limit n,n 或 limit n offset n统一改写成limit n
         sql = sql.rstrip(";").strip()
@@ -1436,9 +1591,12 @@ class MysqlEngine(EngineBase):
             )
             result.error = ("实例read_only=1，禁止执行变更语句!",)
             return result
-        # TODO 原生执行
-        # if workflow.is_manual == 1:
-        #     return self.execute(db_name=workflow.db_name, sql=workflow.sqlworkflowcontent.sql_content)
+        # 开启原生执行时，不需要备份的DML工单直接按批次执行
+        from sql.utils.native_executor import NativeExecutor, native_statements
+
+        statements = native_statements(workflow)
+        if statements:
+            return NativeExecutor(workflow, statements).execute()
         # inception执行
         return self.inc_engine.execute(workflow)
 
@@ -1703,7 +1861,31 @@ class MysqlEngine(EngineBase):
 
         return self.query("information_schema", sql)
 
+    def ping_connection(self, conn):
+        """
+        连接池健康检查, 并重置上次使用遗留的用户变量、临时表、sql_mode等会话状态
+        驱动支持时使用COM_RESET_CONNECTION, 否则使用COM_CHANGE_USER重新认证到原来的库,
+        都不支持时不复用该连接
+        """
+        conn.ping()
+        if hasattr(conn, "reset_connection"):
+            conn.reset_connection()
+        elif hasattr(conn, "change_user"):
+            cursor = conn.cursor()
+            try:
+                cursor.execute("select database()")
+                db_name = cursor.fetchone()[0]
+            finally:
+                cursor.close()
+            conn.change_user(self.user, self.password, db_name)
+        else:
+            return False
+        # 重置会话后字符集恢复为服务端默认值, 重新设置为新建连接时的字符集
+        conn.set_character_set(self.instance.charset or "utf8mb4")
+        conn.autocommit(False)
+        return True
+
     def close(self):
         if self.conn:
-            self.conn.close()
+            self.release_connection(self.conn)
             self.conn = None
@@ -617,7 +617,15 @@ class OracleEngine(EngineBase):
 
     def explain_check(self, db_name=None, sql="", close_conn=False):
         # 使用explain进行支持的SQL语法审核，连接需不中断，防止数据库不断fork进程的大批量消耗
-        result = {"msg": "", "rows": 0}
+        result = self._explain_plan(db_name=db_name, sql=sql, close_conn=close_conn)
+        # 执行计划中未取到CARDINALITY时影响行数按0处理
+        if result["rows"] is None:
+            result["rows"] = 0
+        return result
+
+    def _explain_plan(self, db_name=None, sql="", close_conn=False):
+        """执行explain plan并取顶层节点的CARDINALITY, 未取到时rows为None"""
+        result = {"msg": "", "rows": None}
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
@@ -635,9 +643,7 @@ class OracleEngine(EngineBase):
             )
             rows = cursor.fetchone()
             conn.rollback()
-            if not rows:
-                result["rows"] = 0
-            else:
+            if rows:
                 result["rows"] = rows[0]
         except Exception as e:
             logger.warning(
@@ -724,6 +730,13 @@ class OracleEngine(EngineBase):
                 self.close()
         return result_set
 
+    def estimate_rows(self, db_name=None, sql=""):
+        """根据explain plan预估行数, 取执行计划顶层节点的CARDINALITY"""
+        result = self._explain_plan(db_name=db_name, sql=sql, close_conn=True)
+        if result["msg"] or result["rows"] is None:
+            return None
+        return int(result["rows"])
+
     def query_masking(self, db_name=None, sql="", resultset=None):
         """简单字段脱敏规则, 仅对select有效"""
         if re.match(r"^select", sql, re.I):
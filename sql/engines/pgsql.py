@@ -11,13 +11,15 @@ import re
 import psycopg2
 import logging
 import traceback
+import uuid
+
 import sqlparse
 
 from common.config import SysConfig
 from common.utils.timer import FuncTimer
 from sql.utils.sql_utils import get_syntax_type
 from . import EngineBase
-from .models import ResultSet, ReviewSet, ReviewResult
+from .models import ResultSet, ReviewSet, ReviewResult, RowStream
 from sql.utils.data_masking import simple_column_mask
 
 __author__ = "hhyo、yyukai"
@@ -27,19 +29,23 @@ logger = logging.getLogger("default")
 
 class PgSQLEngine(EngineBase):
     test_query = "SELECT 1"
+    pool_enabled = True
 
     def get_connection(self, db_name=None):
         db_name = db_name or self.db_name or "postgres"
         if self.conn:
             return self.conn
-        self.conn = psycopg2.connect(
-            host=self.host,
-            port=self.port,
-            user=self.user,
-            password=self.password,
-            client_encoding=self.instance.charset,
-            dbname=db_name,
-            connect_timeout=10,
+        self.conn = self.acquire_connection(
+            lambda: psycopg2.connect(
+                host=self.host,
+                port=self.port,
+                user=self.user,
+                password=self.password,
+                client_encoding=self.instance.charset,
+                dbname=db_name,
+                connect_timeout=10,
+            ),
+            db_name=db_name,
         )
         return self.conn
 
@@ -189,23 +195,10 @@ class PgSQLEngine(EngineBase):
         try:
             conn = self.get_connection(db_name=db_name)
             conn.autocommit = False
-            max_execution_time = kwargs.get("max_execution_time", 0)
             cursor = conn.cursor()
-            try:
-                cursor.execute(
-                    "SET statement_timeout TO %s;", (int(max_execution_time),)
-                )
-            except:
-                pass
-            cursor.execute("SET transaction ISOLATION LEVEL READ COMMITTED READ ONLY;")
-            if schema_name:
-                from psycopg2 import sql as pg_sql
-
-                cursor.execute(
-                    pg_sql.SQL("SET search_path TO {};").format(
-                        pg_sql.Identifier(schema_name)
-                    )
-                )
+            self._prepare_query_session(
+                cursor, kwargs.get("max_execution_time", 0), schema_name
+            )
             cursor.execute(sql, parameters)
             # effect_row = cursor.rowcount
             if int(limit_num) > 0:
@@ -214,30 +207,7 @@ class PgSQLEngine(EngineBase):
                 rows = cursor.fetchall()
             conn.commit()
             fields = cursor.description
-            column_type_codes = [i[1] for i in fields] if fields else []
-            # 定义 JSON 和 JSONB 的 type_code,# 114 是 json，3802 是 jsonb
-            JSON_TYPE_CODE = 114
-            JSONB_TYPE_CODE = 3802
-            # 对 rows 进行循环处理，判断是否是 jsonb 或 json 类型
-            converted_rows = []
-            for row in rows:
-                new_row = []
-                for idx, col_value in enumerate(row):
-                    # 理论上, 下标不会越界的
-                    column_type_code = (
-                        column_type_codes[idx] if idx < len(column_type_codes) else None
-                    )
-                    # 只在列类型为 json 或 jsonb 时转换
-                    if column_type_code in [JSON_TYPE_CODE, JSONB_TYPE_CODE]:
-                        if isinstance(col_value, (dict, list)):
-                            new_row.append(
-                                json.dumps(col_value, ensure_ascii=False)
-                            )  # 转为 JSON 字符串
-                        else:
-                            new_row.append(col_value)
-                    else:
-                        new_row.append(col_value)
-                converted_rows.append(tuple(new_row))
+            converted_rows = self._convert_json_rows(rows, fields)
 
             result_set.column_list = [i[0] for i in fields] if fields else []
             result_set.rows = converted_rows
@@ -253,6 +223,142 @@ class PgSQLEngine(EngineBase):
                 self.close()
         return result_set
 
+    @staticmethod
+    def _prepare_query_session(cursor, max_execution_time, schema_name=None):
+        """查询前设置超时时间、只读事务和search_path"""
+        try:
+            cursor.execute("SET statement_timeout TO %s;", (int(max_execution_time),))
+        except:
+            pass
+        cursor.execute("SET transaction ISOLATION LEVEL READ COMMITTED READ ONLY;")
+        if schema_name:
+            from psycopg2 import sql as pg_sql
+
+            cursor.execute(
+                pg_sql.SQL("SET search_path TO {};").format(
+                    pg_sql.Identifier(schema_name)
+                )
+            )
+
+    @staticmethod
+    def _convert_json_rows(rows, fields):
+        """将 json/jsonb 类型列转换为 JSON 字符串"""
+        column_type_codes = [i[1] for i in fields] if fields else []
+        # 定义 JSON 和 JSONB 的 type_code,# 114 是 json，3802 是 jsonb
+        JSON_TYPE_CODE = 114
+        JSONB_TYPE_CODE = 3802
+        # 对 rows 进行循环处理，判断是否是 jsonb 或 json 类型
+        converted_rows = []
+        for row in rows:
+            new_row = []
+            for idx, col_value in enumerate(row):
+                # 理论上, 下标不会越界的
+                column_type_code = (
+                    column_type_codes[idx] if idx < len(column_type_codes) else None
+                )
+                # 只在列类型为 json 或 jsonb 时转换
+                if column_type_code in [JSON_TYPE_CODE, JSONB_TYPE_CODE]:
+                    if isinstance(col_value, (dict, list)):
+                        new_row.append(
+                            json.dumps(col_value, ensure_ascii=False)
+                        )  # 转为 JSON 字符串
+                    else:
+                        new_row.append(col_value)
+                else:
+                    new_row.append(col_value)
+            converted_rows.append(tuple(new_row))
+        return converted_rows
+
+    def query_stream(
+        self, db_name=None, sql="", limit_num=0, chunk_size=1000, **kwargs
+    ):
+        """
+        使用服务端命名游标流式查询，返回 (ResultSet, 行批次迭代器)
+        命名游标仅支持select语句，其他语句按普通查询分批返回
+        """
+        if not re.match(r"^\s*(select|with)\b", sql, re.I):
+            return super().query_stream(
+                db_name=db_name,
+                sql=sql,
+                limit_num=limit_num,
+                chunk_size=chunk_size,
+                **kwargs,
+            )
+        limit_num = int(limit_num)
+        result_set = ResultSet(full_sql=sql)
+        try:
+            conn = self.get_connection(db_name=db_name)
+            conn.autocommit = False
+            cursor = conn.cursor()
+            self._prepare_query_session(
+                cursor, kwargs.get("max_execution_time", 0), kwargs.get("schema_name")
+            )
+            cursor = conn.cursor(name=f"archery_stream_{uuid.uuid4().hex}")
+            cursor.itersize = chunk_size
+            cursor.execute(sql.strip().rstrip(";"), kwargs.get("parameters"))
+            # 命名游标在首次读取后才有列信息
+            size = min(chunk_size, limit_num) if limit_num > 0 else chunk_size
+            first_rows = cursor.fetchmany(size=size)
+            fields = cursor.description
+            result_set.column_list = [i[0] for i in fields] if fields else []
+        except Exception as e:
+            logger.warning(
+                f"PgSQL命令执行报错，语句：{sql}， 错误信息：{traceback.format_exc()}"
+            )
+            result_set.error = str(e)
+            if self.conn:
+                try:
+                    self.conn.rollback()
+                except Exception:
+                    pass
+            self.close()
+            return result_set, iter(())
+        return result_set, RowStream(
+            self._stream_rows(cursor, first_rows, fields, limit_num, chunk_size),
+            lambda: self._close_stream(cursor),
+        )
+
+    def _stream_rows(self, cursor, first_rows, fields, limit_num, chunk_size):
+        """从命名游标分批读取行，结束或中途停止时关闭游标并释放连接"""
+        rows, fetched = first_rows, 0
+        try:
+            while rows:
+                fetched += len(rows)
+                yield self._convert_json_rows(rows, fields)
+                size = chunk_size
+                if limit_num > 0:
+                    size = min(chunk_size, limit_num - fetched)
+                    if size <= 0:
+                        break
+                rows = cursor.fetchmany(size=size)
+        finally:
+            self._close_stream(cursor)
+
+    def _close_stream(self, cursor):
+        """关闭命名游标并结束事务后释放连接, 失败时直接关闭连接"""
+        try:
+            cursor.close()
+            self.conn.commit()
+        except Exception as e:
+            logger.warning(f"PgSQL流式查询关闭游标失败，错误信息：{e}")
+            self.discard_connection()
+        self.close()
+
+    def estimate_rows(self, db_name=None, sql=""):
+        """根据explain预估行数, 取执行计划顶层节点的Plan Rows"""
+        explain_result = self.query(
+            db_name=db_name, sql=f"explain (format json) {sql.rstrip(';')}"
+        )
+        if explain_result.error or not explain_result.rows:
+            return None
+        plan = explain_result.rows[0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        try:
+            return int(plan[0]["Plan"]["Plan Rows"])
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+
     def filter_sql(self, sql="", limit_num=0):
         # 对查询sql增加limit限制，# TODO limit改写待优化
         sql_lower = sql.lower().rstrip(";").strip()
@@ -396,9 +502,22 @@ class PgSQLEngine(EngineBase):
                 self.close()
         return execute_result
 
+    def ping_connection(self, conn):
+        """连接池健康检查, 并重置上次使用遗留的search_path、statement_timeout等会话参数"""
+        if conn.closed:
+            return False
+        conn.autocommit = True
+        cursor = conn.cursor()
+        try:
+            cursor.execute("RESET ALL;")
+        finally:
+            cursor.close()
+        conn.autocommit = False
+        return True
+
     def close(self):
         if self.conn:
-            self.conn.close()
+            self.release_connection(self.conn)
             self.conn = None
 
     def processlist(self, command_type, **kwargs):
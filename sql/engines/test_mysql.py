@@ -4,7 +4,7 @@ from types import SimpleNamespace
 from unittest.mock import patch, Mock, ANY
 
 import MySQLdb
-from django.test import RequestFactory, SimpleTestCase
+from django.test import RequestFactory, SimpleTestCase, override_settings
 
 from common.config import SysConfig
 from sql import instance_account
@@ -627,6 +627,21 @@ class TestMysql(SimpleTestCase):
         execute_result = new_engine.execute_workflow(self.wf)
         self.assertIsInstance(execute_result, ReviewSet)
 
+    @patch("sql.utils.native_executor.NativeExecutor.execute")
+    @patch.object(MysqlEngine, "query")
+    @patch("sql.engines.mysql.GoInceptionEngine")
+    def test_execute_workflow_native(self, _inception_engine, _query, _execute):
+        _execute.return_value = ReviewSet(full_sql="update user set id=1")
+        _query.return_value.error = None
+        _query.return_value.rows = (("0",),)
+        self.wf.is_backup = False
+        new_engine = MysqlEngine(instance=self.ins1)
+        with self.settings(MYSQL_NATIVE_EXECUTE={"enabled": True}):
+            execute_result = new_engine.execute_workflow(self.wf)
+        _execute.assert_called_once()
+        self.assertIs(execute_result, _execute.return_value)
+        _inception_engine.return_value.execute.assert_not_called()
+
     @patch("MySQLdb.connect.cursor.execute")
     @patch("MySQLdb.connect.cursor")
     @patch("MySQLdb.connect")
@@ -991,6 +1006,126 @@ class TestMysql(SimpleTestCase):
 
         self.assertEqual(result.error, "boom")
 
+    @patch.object(MysqlEngine, "query")
+    def test_get_split_key(self, _query):
+        _query.return_value = ResultSet(rows=[("id", "bigint")])
+        engine = MysqlEngine(instance=self.ins1)
+        self.assertEqual(engine.get_split_key("db1", "t"), "id")
+        _query.return_value = ResultSet(rows=[("id", "varchar")])
+        self.assertIsNone(engine.get_split_key("db1", "t"))
+        _query.return_value = ResultSet(rows=[("a", "int"), ("b", "int")])
+        self.assertIsNone(engine.get_split_key("db1", "t"))
+
+    @patch.object(MysqlEngine, "query")
+    def test_get_primary_key(self, _query):
+        _query.return_value = ResultSet(rows=[("a",), ("b",)])
+        engine = MysqlEngine(instance=self.ins1)
+        self.assertEqual(engine.get_primary_key("db1", "t"), ["a", "b"])
+        _query.return_value = ResultSet(rows=[])
+        self.assertEqual(engine.get_primary_key("db1", "t"), [])
+
+    @patch.object(MysqlEngine, "query")
+    def test_estimate_rows(self, _query):
+        _query.return_value = ResultSet(
+            rows=[
+                {"id": 1, "rows": 100},
+                {"id": 1, "rows": 3},
+            ]
+        )
+        engine = MysqlEngine(instance=self.ins1)
+        self.assertEqual(engine.estimate_rows("db1", "select * from t;"), 300)
+        self.assertEqual(_query.call_args.kwargs["sql"], "explain select * from t")
+        # UNION等包含多个查询的执行计划无法预估
+        _query.return_value = ResultSet(
+            rows=[
+                {"id": 1, "rows": 100},
+                {"id": 2, "rows": 1000},
+                {"id": None, "rows": None},
+            ]
+        )
+        self.assertIsNone(engine.estimate_rows("db1", "select 1 union select 2"))
+        _query.return_value = ResultSet(rows=[])
+        self.assertIsNone(engine.estimate_rows("db1", "select * from t"))
+
+    @patch("MySQLdb.connect")
+    def test_query_stream(self, connect):
+        cursor = Mock()
+        cursor.fetchmany.side_effect = [[(1,), (2,)], [(3,)], []]
+        cursor.description = (("id", 3),)
+        connect.return_value.cursor.return_value = cursor
+        connect.return_value.get_server_info.return_value = "8.0.30"
+        engine = MysqlEngine(instance=self.ins1)
+
+        result, chunks = engine.query_stream(sql="select id from t", chunk_size=2)
+
+        self.assertEqual(result.column_list, ["id"])
+        self.assertEqual(result.column_type, ["LONG"])
+        self.assertEqual(list(chunks), [[(1,), (2,)], [(3,)]])
+        connect.return_value.cursor.assert_called_with(MySQLdb.cursors.SSCursor)
+        cursor.close.assert_called_once()
+        connect.return_value.close.assert_called_once()
+
+    @patch("MySQLdb.connect")
+    def test_query_stream_limit_discard_connection(self, connect):
+        cursor = Mock()
+        cursor.fetchmany.return_value = [(1,), (2,)]
+        cursor.description = (("id", 3),)
+        connect.return_value.cursor.return_value = cursor
+        connect.return_value.get_server_info.return_value = "8.0.30"
+        engine = MysqlEngine(instance=self.ins1)
+
+        _, chunks = engine.query_stream(sql="select id from t", limit_num=2)
+
+        self.assertEqual(list(chunks), [[(1,), (2,)]])
+        cursor.fetchmany.assert_called_once_with(size=2)
+        # 结果未读完时不读取剩余数据，直接关闭连接
+        cursor.close.assert_not_called()
+        connect.return_value.close.assert_called_once()
+        self.assertIsNone(engine.conn)
+
+    @patch("MySQLdb.connect")
+    def test_query_stream_close_before_iteration(self, connect):
+        cursor = Mock()
+        cursor.description = (("id", 3),)
+        connect.return_value.cursor.return_value = cursor
+        connect.return_value.get_server_info.return_value = "8.0.30"
+        engine = MysqlEngine(instance=self.ins1)
+
+        _, chunks = engine.query_stream(sql="select id from t")
+        chunks.close()
+
+        # 未读取任何行就关闭时同样释放连接
+        cursor.fetchmany.assert_not_called()
+        connect.return_value.close.assert_called_once()
+        self.assertIsNone(engine.conn)
+        chunks.close()
+        connect.return_value.close.assert_called_once()
+
+    @patch.object(MysqlEngine, "get_connection", side_effect=RuntimeError("boom"))
+    def test_query_stream_connection_error(self, _get_connection):
+        engine = MysqlEngine(instance=self.ins1)
+
+        result, chunks = engine.query_stream(sql="select 1")
+
+        self.assertEqual(result.error, "boom")
+        self.assertEqual(list(chunks), [])
+
+    @patch("sql.engines.mysql.compile_column_maskers")
+    @patch("sql.engines.mysql.masking_hit_columns")
+    def test_stream_masker(self, _hit_columns, _compile_column_maskers):
+        _hit_columns.return_value = [{"index": 1, "rule_type": 1}]
+        _compile_column_maskers.return_value = {1: [lambda v: "***"]}
+        result = ResultSet(column_list=["id", "phone"])
+        engine = MysqlEngine(instance=self.ins1)
+
+        masker = engine.stream_masker(db_name="db", sql="select 1", resultset=result)
+
+        self.assertEqual(masker([(1, "13800000000")]), [[1, "***"]])
+        self.assertEqual(masker([(2, "13900000000")]), [[2, "***"]])
+        self.assertTrue(result.is_masked)
+        self.assertTrue(result.mask_rule_hit)
+        _hit_columns.assert_called_once()
+
     @patch.object(MysqlEngine, "query")
     def test_query_check_empty_star_explain_and_forbidden_user(self, query):
         engine = MysqlEngine(instance=self.ins1)
@@ -1019,6 +1154,28 @@ class TestMysql(SimpleTestCase):
         self.assertTrue(forbidden["bad_query"])
         self.assertEqual(forbidden["msg"], "您无权查看该表")
 
+    @patch.object(MysqlEngine, "query")
+    def test_query_check_strict_reuse_connection(self, query):
+        query.return_value = ResultSet()
+        engine = MysqlEngine(instance=self.ins1)
+
+        result = engine.query_check(db_name="some_db", sql="select id from t")
+
+        self.assertFalse(result["bad_query"])
+        query.assert_called_once_with(
+            db_name="some_db", sql="explain select id from t", close_conn=False
+        )
+
+    @override_settings(MYSQL_QUERY_CHECK_MODE="fast")
+    @patch.object(MysqlEngine, "query")
+    def test_query_check_fast_skip_explain(self, query):
+        engine = MysqlEngine(instance=self.ins1)
+
+        result = engine.query_check(db_name="some_db", sql="select id from t")
+
+        self.assertFalse(result["bad_query"])
+        query.assert_not_called()
+
     @patch("sql.engines.mysql.GoInceptionEngine")
     def test_execute_check_inception_error_and_ddl_dml_separation(self, inception):
         check_error = ReviewSet()
@@ -100,6 +100,21 @@ class TestOracle(TestCase):
         self.assertIsInstance(query_result, ResultSet)
         self.assertListEqual(query_result.rows, [(1,)])
 
+    @patch("oracledb.connect")
+    def test_estimate_rows(self, _conn):
+        _conn.return_value.cursor.return_value.fetchone.return_value = (300,)
+        new_engine = OracleEngine(instance=self.ins)
+        self.assertEqual(new_engine.estimate_rows("archery", "select 1"), 300)
+        _conn.return_value.close.assert_called_once()
+
+    @patch("oracledb.connect")
+    def test_estimate_rows_without_cardinality(self, _conn):
+        """PLAN_TABLE中未取到CARDINALITY时不做预估, 审核仍按0行处理"""
+        _conn.return_value.cursor.return_value.fetchone.return_value = None
+        new_engine = OracleEngine(instance=self.ins)
+        self.assertIsNone(new_engine.estimate_rows("archery", "select 1"))
+        self.assertEqual(new_engine.explain_check("archery", "select 1")["rows"], 0)
+
     @patch(
         "sql.engines.oracle.OracleEngine.query",
         return_value=ResultSet(rows=[("AUD_SYS",), ("archery",), ("ANONYMOUS",)]),
@@ -8,7 +8,10 @@ from django.contrib.auth import get_user_model
 from django.test import TestCase
 
 from common.config import SysConfig
+from common.utils.testing import LOCMEM_CACHES
 from sql.engines import EngineBase
+from sql.utils.execute_progress import get_progress
+from sql.utils.ssh_tunnel import tunnel_manager
 from sql.engines.goinception import GoInceptionEngine
 from sql.engines.models import ResultSet, ReviewSet, ReviewResult
 from sql.engines.redis import RedisEngine
@@ -421,6 +424,23 @@ class TestPgSQL(TestCase):
         new_engine.get_connection("some_dbname")
         _conn.assert_called_once()
 
+    @patch("psycopg2.connect")
+    def test_query_stream_close_before_iteration(self, _conn):
+        cursor = _conn.return_value.cursor.return_value
+        cursor.fetchmany.return_value = [(1,)]
+        cursor.description = (("id", 23),)
+        new_engine = PgSQLEngine(instance=self.ins)
+        result, chunks = new_engine.query_stream(
+            db_name="some_dbname", sql="select id from t"
+        )
+        self.assertListEqual(result.column_list, ["id"])
+        chunks.close()
+        # 未读取任何行就关闭时同样关闭命名游标并释放连接
+        cursor.close.assert_called_once()
+        _conn.return_value.commit.assert_called_once()
+        _conn.return_value.close.assert_called_once()
+        self.assertIsNone(new_engine.conn)
+
     @patch("psycopg2.connect.cursor.execute")
     @patch("psycopg2.connect.cursor")
     @patch("psycopg2.connect")
@@ -845,6 +865,104 @@ class TestGoInception(TestCase):
         check_result = new_engine.execute_check(instance=self.ins, db_name=0, sql=sql)
         self.assertIsInstance(check_result, ReviewSet)
 
+    @patch("sql.engines.goinception.GoInceptionEngine.get_connection")
+    @patch("sql.engines.goinception.GoInceptionEngine.query")
+    def test_execute_check_chunked(self, _query, _get_connection):
+        """只包含DML的语句分批并行审核，结果按顺序合并"""
+
+        def query(sql, close_conn=True):
+            rows = [(0, "CHECKED", 0, "Audit completed", "None", "use some_db")]
+            statements = sql.split("use `some_db`;")[1].split("inception_magic_commit")
+            for statement in statements[0].split(";")[:-1]:
+                statement = statement.strip()
+                errlevel = 2 if "values(3)" in statement else 0
+                rows.append((0, "CHECKED", errlevel, "", "None", statement))
+            return ResultSet(full_sql=sql, rows=[r + (0,) * 6 for r in rows])
+
+        _query.side_effect = query
+        sql = "\n".join(f"insert into t values({i});" for i in range(5))
+        progress = []
+        with self.settings(
+            GOINCEPTION_CHUNK_CHECK={
+                "enabled": True,
+                "min_statements": 5,
+                "chunk_size": 2,
+                "workers": 2,
+            }
+        ):
+            check_result = GoInceptionEngine().execute_check(
+                instance=self.ins,
+                db_name="some_db",
+                sql=sql,
+                progress_callback=lambda done, total: progress.append((done, total)),
+            )
+        self.assertEqual(_query.call_count, 3)
+        self.assertEqual(_get_connection.call_count, 2)
+        self.assertEqual(
+            [(r.id, r.sql) for r in check_result.rows],
+            [(1, "use some_db")]
+            + [(i + 2, f"insert into t values({i})") for i in range(5)],
+        )
+        self.assertEqual(check_result.error_count, 1)
+        self.assertEqual(check_result.syntax_type, 2)
+        self.assertEqual(sorted(progress)[-1], (5, 5))
+
+    @patch("sql.engines.goinception.GoInceptionEngine.query")
+    def test_execute_check_not_chunked_with_ddl(self, _query):
+        """包含DDL时整批审核"""
+        _query.return_value = ResultSet(rows=[])
+        sql = "create table t(id int);\n" + "insert into t values(1);\n" * 5
+        with self.settings(
+            GOINCEPTION_CHUNK_CHECK={
+                "enabled": True,
+                "min_statements": 2,
+                "chunk_size": 2,
+            }
+        ):
+            GoInceptionEngine().execute_check(instance=self.ins, db_name="db", sql=sql)
+        _query.assert_called_once()
+
+    @patch("sql.engines.goinception.GoInceptionEngine.query")
+    def test_execute_batched(self, _query):
+        """只包含DML的工单按批执行并上报进度，有语句执行失败时不再执行后续批次"""
+
+        def query(sql, close_conn=True):
+            rows = [(0, "EXECUTED", 0, "Execute Successfully", "None", "use some_db")]
+            statements = sql.split("use `some_db`;")[1].split("inception_magic_commit")
+            for statement in statements[0].split(";")[:-1]:
+                statement = statement.strip()
+                if "values(3)" in statement:
+                    rows.append((0, "EXECUTED", 2, "Execute failed", "err", statement))
+                else:
+                    rows.append(
+                        (0, "EXECUTED", 0, "Execute Successfully", "None", statement)
+                    )
+            return ResultSet(full_sql=sql, rows=[r + (1,) + ("",) * 5 for r in rows])
+
+        _query.side_effect = query
+        SqlWorkflowContent.objects.filter(workflow=self.wf).update(
+            sql_content="\n".join(f"insert into t values({i});" for i in range(7))
+        )
+        self.wf.refresh_from_db()
+        with self.settings(
+            CACHES=LOCMEM_CACHES,
+            EXECUTE_PROGRESS={"enabled": True, "batch_size": 2},
+        ):
+            execute_result = GoInceptionEngine().execute(workflow=self.wf)
+            progress = get_progress(self.wf.id)
+        self.assertEqual(_query.call_count, 2)
+        self.assertEqual(
+            [(r.id, r.sql) for r in execute_result.rows],
+            [(1, "use some_db")]
+            + [(i + 2, f"insert into t values({i})") for i in range(7)],
+        )
+        self.assertEqual(
+            [r.stagestatus for r in execute_result.rows[5:]], ["未执行"] * 3
+        )
+        self.assertIn("Line 5", execute_result.error)
+        self.assertEqual((progress["done"], progress["total"]), (4, 7))
+        self.assertEqual(progress["affected_rows"], 5)
+
     @patch("sql.engines.goinception.GoInceptionEngine.query")
     def test_execute_exception(self, _query):
         sql = "update user set id=100"
@@ -1823,10 +1941,15 @@ def test_ssh(db_instance, mocker: MockerFixture):
     db_instance.save()
 
     class FakeTunnel:
+        is_active = True
+
         def get_ssh(self):
             return "remote_host", "remote_password"
 
-    mocker.patch("sql.engines.SSHConnection", return_value=FakeTunnel())
+        def close(self):
+            pass
+
+    mocker.patch("sql.utils.ssh_tunnel.SSHConnection", return_value=FakeTunnel())
     from sql.engines import EngineBase
 
     engine = EngineBase(instance=db_instance)
@@ -1834,3 +1957,4 @@ def test_ssh(db_instance, mocker: MockerFixture):
         instance=engine.instance
     )
     assert (remote_host, remote_password) == ("remote_host", "remote_password")
+    tunnel_manager.close_all()
@@ -8,7 +8,6 @@ import simplejson as json
 from django.conf import settings
 from django.contrib.auth.decorators import permission_required
 from django.http import HttpResponse
-from django.views.decorators.cache import cache_page
 
 from common.utils.extend_json_encoder import ExtendJSONEncoder
 from common.utils.convert import Convert
@@ -554,7 +553,6 @@ def schemasync(request):
     return HttpResponse(json.dumps(result), content_type="application/json")
 
 
-@cache_page(60 * 5, key_prefix="insRes")
 def instance_resource(request):
     """
     获取实例内的资源信息，database、schema、table、column
@@ -9,11 +9,11 @@
 import simplejson as json
 from django.contrib.auth.decorators import permission_required
 from django.http import JsonResponse, HttpResponse
-from django_redis import get_redis_connection
 
 from common.utils.extend_json_encoder import ExtendJSONEncoder
 from sql.engines import get_engine, ResultSet
 from sql.models import Instance, InstanceDatabase, Users
+from sql.utils.metadata_cache import invalidate_instance_metadata
 from sql.utils.resource_group import user_instances
 
 __author__ = "hhyo"
@@ -128,9 +128,7 @@ def create(request):
             remark=remark,
         )
         # 清空实例资源缓存
-        r = get_redis_connection("default")
-        for key in r.scan_iter(match="*insRes*", count=2000):
-            r.delete(key)
+        invalidate_instance_metadata(instance.id, db_name)
 
     return JsonResponse({"status": 0, "msg": "", "data": []})
 
@@ -10,6 +10,7 @@ from django.utils.translation import gettext as _
 from django.conf import settings
 from mirage.crypto import Crypto
 
+from common.utils.compressed_field import CompressedTextField
 from common.utils.const import WorkflowStatus, WorkflowType, WorkflowAction
 
 logger = logging.getLogger("default")
@@ -371,6 +372,8 @@ class SqlWorkflow(models.Model, WorkflowAuditMixin):
             ("sql", "SQL"),
             ("json", "JSON"),
             ("xml", "XML"),
+            ("parquet", "Parquet"),
+            ("arrow", "Arrow IPC"),
         ),
         # default="csv",
         null=True,
@@ -398,12 +401,18 @@ class SqlWorkflowContent(models.Model):
     """
     存放各个SQL上线工单的SQL|审核|执行内容
     可定期归档或清理历史数据，也可通过``alter table sql_workflow_content row_format=compressed; ``来进行压缩
+    开启WORKFLOW_CONTENT_COMPRESSION后审核内容和执行结果压缩存储,
+    审核结果的警告数、错误数、影响行数在提交时写入汇总字段, 审批判断无需解析审核内容
     """
 
     workflow = models.OneToOneField(SqlWorkflow, on_delete=models.CASCADE)
     sql_content = models.TextField("具体sql内容")
-    review_content = models.TextField("自动审核内容的JSON格式")
-    execute_result = models.TextField("执行结果的JSON格式", blank=True)
+    review_content = CompressedTextField("自动审核内容的JSON格式")
+    execute_result = CompressedTextField("执行结果的JSON格式", blank=True)
+    # 审核结果汇总，为空表示历史数据未汇总，需要解析审核内容
+    warning_count = models.IntegerField("审核警告数", null=True, blank=True)
+    error_count = models.IntegerField("审核错误数", null=True, blank=True)
+    affected_rows = models.BigIntegerField("审核预计影响行数", null=True, blank=True)
 
     def __str__(self):
         return self.workflow.workflow_name
@@ -667,6 +676,26 @@ class QueryLog(models.Model):
         verbose_name_plural = "查询日志"
 
 
+class QueryLogToken(models.Model):
+    """
+    查询日志搜索索引, 由查询语句、操作人、语句标识分词后增量写入
+    """
+
+    token = models.CharField("分词", max_length=32)
+    query_log = models.ForeignKey(
+        QueryLog,
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name="+",
+    )
+
+    class Meta:
+        db_table = "query_log_token"
+        unique_together = ("token", "query_log")
+        verbose_name = "查询日志搜索索引"
+        verbose_name_plural = "查询日志搜索索引"
+
+
 rule_type_choices = (
     (1, "手机号"),
     (2, "证件号码"),
@@ -855,6 +884,7 @@ class ArchiveConfig(models.Model, WorkflowAuditMixin):
     )
     no_delete = models.BooleanField("是否保留源数据")
     sleep = models.IntegerField("归档limit行后的休眠秒数", default=1)
+    priority = models.IntegerField("调度优先级，数值越大越先执行", default=0)
     status = models.IntegerField(
         "审核状态", choices=WorkflowStatus.choices, blank=True, default=1
     )
@@ -865,6 +895,7 @@ class ArchiveConfig(models.Model, WorkflowAuditMixin):
     )
     create_time = models.DateTimeField("创建时间", auto_now_add=True)
     last_archive_time = models.DateTimeField("最近归档时间", blank=True, null=True)
+    checkpoint = models.TextField("原生归档中断时的断点", blank=True, default="")
     sys_time = models.DateTimeField("系统时间修改", auto_now=True)
 
     class Meta:
@@ -895,6 +926,7 @@ class ArchiveLog(models.Model):
     statistics = models.TextField("归档统计日志")
     success = models.BooleanField("是否归档成功")
     error_info = models.TextField("错误信息")
+    checkpoint = models.TextField("原生归档结束时的断点", blank=True, default="")
     start_time = models.DateTimeField("开始时间")
     end_time = models.DateTimeField("结束时间")
     sys_time = models.DateTimeField("系统时间修改", auto_now=True)
@@ -1323,6 +1355,90 @@ class SlowQueryHistory(models.Model):
         verbose_name_plural = "慢日志明细"
 
 
+class SlowQueryToken(models.Model):
+    """
+    慢日志搜索索引, 由SQL指纹分词后增量写入
+    """
+
+    token = models.CharField("分词", max_length=32)
+    checksum = models.ForeignKey(
+        SlowQuery,
+        db_constraint=False,
+        to_field="checksum",
+        db_column="checksum",
+        on_delete=models.DO_NOTHING,
+        related_name="+",
+    )
+
+    class Meta:
+        db_table = "mysql_slow_query_token"
+        unique_together = ("token", "checksum")
+        verbose_name = "慢日志搜索索引"
+        verbose_name_plural = "慢日志搜索索引"
+
+
+class SlowQueryRollup(models.Model):
+    """
+    慢日志汇总, 由慢日志明细按时间段增量汇总
+    """
+
+    hostname = models.CharField("实例地址", max_length=64)
+    checksum = models.ForeignKey(
+        SlowQuery,
+        db_constraint=False,
+        to_field="checksum",
+        db_column="checksum",
+        on_delete=models.DO_NOTHING,
+        related_name="+",
+    )
+    db_name = models.CharField("数据库", max_length=64, default="", blank=True)
+    user_name = models.CharField("用户", max_length=64, default="", blank=True)
+    ts = models.DateTimeField("时间段")
+    ts_max = models.DateTimeField("最后出现时间")
+    ts_cnt = models.FloatField("执行次数", default=0)
+    query_time_sum = models.FloatField("执行总时长", default=0)
+    query_time_max = models.FloatField("最大执行时长", default=0)
+    query_time_pct_95 = models.FloatField("95%执行时长", default=0)
+    rows_examined_sum = models.FloatField("扫描总行数", default=0)
+    rows_sent_sum = models.FloatField("返回总行数", default=0)
+
+    class Meta:
+        abstract = True
+
+
+class SlowQueryHourlyRollup(SlowQueryRollup):
+    """
+    慢日志小时汇总
+    """
+
+    last_history_id = models.IntegerField("已汇总的明细id", default=0, db_index=True)
+
+    class Meta:
+        db_table = "mysql_slow_query_rollup_hourly"
+        unique_together = ("hostname", "checksum", "db_name", "user_name", "ts")
+        indexes = [
+            models.Index(fields=["hostname", "ts"]),
+            models.Index(fields=["checksum", "ts"]),
+        ]
+        verbose_name = "慢日志小时汇总"
+        verbose_name_plural = "慢日志小时汇总"
+
+
+class SlowQueryDailyRollup(SlowQueryRollup):
+    """
+    慢日志天汇总
+    """
+
+    class Meta:
+        db_table = "mysql_slow_query_rollup_daily"
+        unique_together = ("hostname", "checksum", "db_name", "user_name", "ts")
+        indexes = [
+            models.Index(fields=["hostname", "ts"]),
+        ]
+        verbose_name = "慢日志天汇总"
+        verbose_name_plural = "慢日志天汇总"
+
+
 class RedisSlowQuery(models.Model):
     """
     Redis慢日志统计
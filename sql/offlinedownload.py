@@ -1,29 +1,42 @@
 # -*- coding: UTF-8 -*-
+import io
 import logging
 import os
+import shutil
 import tempfile
 import csv
 import hashlib
-import shutil
 import datetime
+import itertools
 import xml.etree.ElementTree as ET
+from contextlib import contextmanager
 from xml.sax.saxutils import escape
 import zipfile
 import sqlparse
 import time
 import traceback
-import gc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import simplejson as json
-import pandas as pd
+from django.conf import settings
+from django.db import connection as db_connection
 from django.http import JsonResponse, FileResponse
+from openpyxl import Workbook
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 
 from sql.models import SqlWorkflow, AuditEntry
 from sql.engines import EngineBase
-from sql.engines.models import ReviewSet, ReviewResult
+from sql.engines.models import ReviewSet, ReviewResult, ResultSet
 from sql.storage import DynamicStorage
 from sql.engines import get_engine
+from sql.utils.parallel_export import (
+    get_parallel_export_config,
+    instance_slot,
+    plan_parallel_export,
+)
 from common.config import SysConfig
 
 logger = logging.getLogger("default")
@@ -43,6 +56,9 @@ SQL_COUNT_ENGINES = {
 
 LINE_BASED_COMMAND_ENGINES = {"redis", "memcached"}
 
+# Excel单个工作表最大行数，包含表头
+EXCEL_MAX_ROWS = 1048576
+
 
 def get_single_export_statement(raw_sql, db_type):
     """Return one export statement while preserving non-SQL native commands."""
@@ -69,98 +85,143 @@ class OffLineDownLoad(EngineBase):
 
     def execute_offline_download(self, workflow):
         """
-        执行离线下载操作
+        执行离线下载操作, 从服务端游标分批读取结果, 边读取边写入压缩文件并上传到存储,
+        内存占用与导出行数无关
         :param workflow: 工单实例
         :return: 下载结果
         """
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 获取系统配置
-            config = SysConfig()
-            # 先进行 max_execution_time 变量的判断是否存在以及是否为空,默认值60
-            max_execution_time_str = config.get("max_export_rows", "60")
-            max_execution_time = (
-                int(max_execution_time_str) if max_execution_time_str else 60
-            )
-            # 获取前端提交的 SQL 和其他工单信息
-            full_sql = workflow.sqlworkflowcontent.sql_content
-            full_sql = sqlparse.format(full_sql, strip_comments=True)
-            full_sql = sqlparse.split(full_sql)[0]
-            sql = full_sql.strip()
-            instance = workflow.instance
-            execute_result = ReviewSet(full_sql=sql)
-            check_engine = get_engine(instance=instance)
-
-            start_time = time.time()
+        # 获取系统配置
+        config = SysConfig()
+        # 先进行 max_execution_time 变量的判断是否存在以及是否为空,默认值60
+        max_execution_time_str = config.get("max_export_rows", "60")
+        max_execution_time = (
+            int(max_execution_time_str) if max_execution_time_str else 60
+        )
+        # 提交后数据可能增长，执行时同样按阈值限制导出行数
+        max_export_rows_str = config.get("max_export_rows", "10000")
+        max_export_rows = int(max_export_rows_str) if max_export_rows_str else 10000
+        chunk_size = getattr(settings, "OFFLINE_EXPORT_CHUNK_SIZE", 5000)
+        # 获取前端提交的 SQL 和其他工单信息
+        full_sql = workflow.sqlworkflowcontent.sql_content
+        full_sql = sqlparse.format(full_sql, strip_comments=True)
+        full_sql = sqlparse.split(full_sql)[0]
+        sql = full_sql.strip()
+        instance = workflow.instance
+        execute_result = ReviewSet(full_sql=sql)
+        check_engine = get_engine(instance=instance)
 
-            try:
+        start_time = time.time()
+        storage = None
+        chunks = iter(())
+        try:
+            storage = DynamicStorage()
+            # 单表的大查询按主键范围拆分后并行导出
+            chunk_sqls = plan_parallel_export(
+                check_engine,
+                workflow.db_name,
+                sql,
+                max_execution_time=max_execution_time * 1000,
+            )
+            if chunk_sqls:
+                file_name, actual_rows = parallel_export_to_storage(
+                    instance,
+                    workflow,
+                    chunk_sqls,
+                    storage,
+                    max_execution_time=max_execution_time * 1000,
+                    max_rows=max_export_rows,
+                )
+            else:
                 # 执行 SQL 查询
-                storage = DynamicStorage()
-                results = check_engine.query(
+                results, chunks = check_engine.query_stream(
                     db_name=workflow.db_name,
                     sql=sql,
+                    chunk_size=chunk_size,
                     max_execution_time=max_execution_time * 1000,
                 )
                 if results.error:
                     raise Exception(results.error)
-                if results:
-                    columns = results.column_list
-                    result = results.rows
-                    actual_rows = results.affected_rows
+                counter = {"rows": 0}
+
+                def rows():
+                    for chunk in chunks:
+                        counter["rows"] += len(chunk)
+                        check_export_rows(counter["rows"], max_export_rows)
+                        yield from chunk
 
                 # 保存查询结果为 CSV or JSON or XML or XLSX or SQL 文件
-                get_format_type = workflow.export_format
-                file_name = save_to_format_file(
-                    get_format_type, result, workflow, columns, temp_dir
+                file_name = stream_to_format_file(
+                    workflow.export_format,
+                    rows(),
+                    workflow,
+                    results.column_list,
+                    storage,
+                    column_types=results.column_type,
                 )
+                actual_rows = counter["rows"]
 
-                # 将导出的文件保存到存储
-                tmp_file = os.path.join(temp_dir, file_name)
-                with open(tmp_file, "rb") as f:
-                    storage.save(file_name, f)
-
-                end_time = time.time()  # 记录结束时间
-                elapsed_time = round(end_time - start_time, 3)
-                execute_result.rows = [
-                    ReviewResult(
-                        stage="Executed",
-                        errlevel=0,
-                        stagestatus="执行正常",
-                        errormessage=f"保存文件: {file_name}",
-                        sql=full_sql,
-                        execute_time=elapsed_time,
-                        affected_rows=actual_rows,
-                    )
-                ]
+            end_time = time.time()  # 记录结束时间
+            elapsed_time = round(end_time - start_time, 3)
+            execute_result.rows = [
+                ReviewResult(
+                    stage="Executed",
+                    errlevel=0,
+                    stagestatus="执行正常",
+                    errormessage=f"保存文件: {file_name}",
+                    sql=full_sql,
+                    execute_time=elapsed_time,
+                    affected_rows=actual_rows,
+                )
+            ]
 
-                change_workflow = SqlWorkflow.objects.get(id=workflow.id)
-                change_workflow.file_name = file_name
-                change_workflow.save()
-
-                return execute_result
-            except Exception as e:
-                # 返回工单执行失败的状态和错误信息
-                execute_result.rows = [
-                    ReviewResult(
-                        stage="Execute failed",
-                        error=1,
-                        errlevel=2,
-                        stagestatus="异常终止",
-                        errormessage=f"{e}",
-                        sql=full_sql,
-                    )
-                ]
-                execute_result.error = e
-                return execute_result
-            finally:
-                # 关闭存储连接（主要是sftp情况save后需要关闭连接）
+            change_workflow = SqlWorkflow.objects.get(id=workflow.id)
+            change_workflow.file_name = file_name
+            change_workflow.save()
+
+            return execute_result
+        except Exception as e:
+            # 返回工单执行失败的状态和错误信息
+            execute_result.rows = [
+                ReviewResult(
+                    stage="Execute failed",
+                    error=1,
+                    errlevel=2,
+                    stagestatus="异常终止",
+                    errormessage=f"{e}",
+                    sql=full_sql,
+                )
+            ]
+            execute_result.error = e
+            return execute_result
+        finally:
+            # 中途失败时关闭游标迭代器，释放数据库连接
+            if hasattr(chunks, "close"):
+                chunks.close()
+            # 关闭存储连接（主要是sftp情况save后需要关闭连接）
+            if storage:
                 storage.close()
-                # 清理本地文件和临时目录
-                shutil.rmtree(temp_dir)
 
-    def pre_count_check(self, workflow):
+    @staticmethod
+    def estimate_export_rows(check_engine, db_name, sql):
+        """根据执行计划预估行数, 预估失败或engine不支持时返回None"""
+        try:
+            estimate = check_engine.estimate_rows(db_name=db_name, sql=sql)
+        except Exception:
+            logger.warning(
+                f"导出行数预估报错，语句：{sql}，错误信息：{traceback.format_exc()}"
+            )
+            return None
+        if isinstance(estimate, bool) or not isinstance(estimate, int):
+            return None
+        return estimate
+
+    def pre_count_check(self, workflow, exact_count=False):
         """
         提交工单时进行后端检查，检查行数是否符合阈值 以及 是否允许的查询语句
+        SQL类引擎先使用执行计划预估行数，预估超过阈值或无法预估时，
+        统计到阈值+1行即停止，exact_count为True时才执行完整的COUNT
         :param workflow: 工单实例
+        :param exact_count: 是否执行完整的COUNT统计准确行数
         :return: 检查结果字典
         """
         # 获取系统配置
@@ -248,27 +309,56 @@ class OffLineDownLoad(EngineBase):
         sql = sql.strip()
         limit_num = max_export_rows + 1
 
+        estimate = None
+        stagestatus = "行数统计完成"
         try:
-            if instance.db_type in SQL_COUNT_ENGINES:
-                check_sql = f"SELECT COUNT(*) FROM ({sql.rstrip(';')}) t"
+            if instance.db_type in SQL_COUNT_ENGINES and not exact_count:
+                estimate = self.estimate_export_rows(check_engine, db_name, sql)
+            if estimate is not None and estimate <= max_export_rows:
+                # 执行计划预估的行数未超过阈值时不再查询
+                result_set = ResultSet()
+                actual_rows_check = estimate
+                stagestatus = "行数预估完成"
+            elif instance.db_type in SQL_COUNT_ENGINES:
+                limited_sql = None
+                if exact_count:
+                    check_sql = f"SELECT COUNT(*) FROM ({sql.rstrip(';')}) t"
+                    timeout = max_execution_time
+                else:
+                    # 只统计到阈值+1行即停止，避免全表扫描
+                    limited_sql = check_engine.filter_sql(sql=sql, limit_num=limit_num)
+                    check_sql = (
+                        f"SELECT COUNT(*) FROM ({limited_sql.strip().rstrip(';')}) t"
+                    )
+                    timeout = min(
+                        max_execution_time,
+                        getattr(settings, "OFFLINE_EXPORT_PROBE_TIMEOUT", 10),
+                    )
                 result_set = check_engine.query(
                     db_name=db_name,
                     sql=check_sql,
-                    max_execution_time=max_execution_time * 1000,
+                    max_execution_time=timeout * 1000,
                 )
                 if result_set.error:
-                    check_sql = check_engine.filter_sql(sql=sql, limit_num=limit_num)
+                    check_sql = limited_sql or check_engine.filter_sql(
+                        sql=sql, limit_num=limit_num
+                    )
                     result_set = check_engine.query(
                         db_name=db_name,
                         sql=check_sql,
                         limit_num=limit_num,
-                        max_execution_time=max_execution_time * 1000,
+                        max_execution_time=timeout * 1000,
                     )
                     actual_rows_check = getattr(result_set, "affected_rows", 0) or len(
                         getattr(result_set, "rows", []) or []
                     )
                 else:
                     actual_rows_check = result_set.rows[0][0]
+                if result_set.error and estimate is not None:
+                    # 行数探测失败时使用执行计划预估的行数
+                    result_set = ResultSet()
+                    actual_rows_check = estimate
+                    stagestatus = "行数预估完成"
             else:
                 check_sql = check_engine.filter_sql(sql=sql, limit_num=limit_num)
                 result_set = check_engine.query(
@@ -316,7 +406,7 @@ class OffLineDownLoad(EngineBase):
         else:
             result = ReviewResult(
                 errlevel=0,
-                stagestatus="行数统计完成",
+                stagestatus=stagestatus,
                 errormessage="None",
                 sql=sql,
                 affected_rows=actual_rows_check,
@@ -332,53 +422,274 @@ class OffLineDownLoad(EngineBase):
         return check_result
 
 
-def save_to_format_file(
-    format_type=None, result=None, workflow=None, columns=None, temp_dir=None
-):
+def check_export_rows(rows, max_rows):
+    """导出行数超过阈值时停止导出, 已写入的文件由存储在写入异常时删除"""
+    if max_rows and rows > max_rows:
+        raise Exception(f"导出数据行数超过阈值({max_rows})，已停止导出。")
+
+
+def _export_base_name(workflow):
+    """生成唯一的文件名（包含库名、日期和随机哈希值）"""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    hash_value = hashlib.sha256(os.urandom(32)).hexdigest()[:8]  # 使用前8位作为哈希值
+    return f"{workflow.db_name}_{timestamp}_{hash_value}"
+
+
+class _StreamWriter(io.RawIOBase):
     """
-    保存查询结果为指定格式的文件。
+    只写的流, 记录已写入的字节数以支持tell, 不支持seek
+    zipfile和pyarrow按不可seek的流顺序写入, 适配各存储后端的写入对象
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._fileobj.write(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        if hasattr(self._fileobj, "flush"):
+            self._fileobj.flush()
+
+
+def write_zip(fileobj, base_name, format_type, result, columns):
+    """
+    将查询结果按指定格式写入压缩包, 压缩包内只有一个文件
+    结果逐行写入压缩流, 不生成中间文件
+    :param fileobj: 压缩包写入的二进制文件对象
+    :param base_name: 不含扩展名的文件名
     :param format_type: 文件格式类型（csv、json、xml、xlsx、sql）
-    :param result: 查询结果
-    :param workflow: 工单实例
+    :param result: 可迭代的查询结果
     :param columns: 列名
-    :param temp_dir: 临时目录路径
-    :return: 压缩后的文件名
     """
-    # 生成唯一的文件名（包含工单ID、日期和随机哈希值）
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    hash_value = hashlib.sha256(os.urandom(32)).hexdigest()[:8]  # 使用前8位作为哈希值
-    base_name = f"{workflow.db_name}_{timestamp}_{hash_value}"
-    file_name = f"{base_name}.{format_type}"
-    file_path = os.path.join(temp_dir, file_name)
-    # 将查询结果写入 CSV 文件
-    if format_type == "csv":
-        save_csv(file_path, result, columns)
-    elif format_type == "json":
-        save_json(file_path, result, columns)
-    elif format_type == "xml":
-        save_xml(file_path, result, columns)
-    elif format_type == "xlsx":
-        save_xlsx(file_path, result, columns)
-    elif format_type == "sql":
-        save_sql(file_path, result, columns)
-    else:
+    writer = EXPORT_WRITERS.get(format_type)
+    if writer is None:
         raise ValueError(f"Unsupported format type: {format_type}")
+    with zipfile.ZipFile(_StreamWriter(fileobj), "w", zipfile.ZIP_DEFLATED) as zipf:
+        # 写入前无法确定文件大小，强制使用zip64以支持超过4G的文件
+        with zipf.open(f"{base_name}.{format_type}", "w", force_zip64=True) as f:
+            writer(f, result, columns)
+
+
+def export_file_name(base_name, format_type):
+    """导出文件名, 列式格式自带压缩, 不再打包为zip"""
+    if format_type in COLUMNAR_WRITERS:
+        return f"{base_name}.{format_type}"
+    if format_type in EXPORT_WRITERS:
+        return f"{base_name}.zip"
+    raise ValueError(f"Unsupported format type: {format_type}")
+
+
+def _write_part(f, format_type, result, columns, column_types):
+    if format_type in COLUMNAR_WRITERS:
+        COLUMNAR_WRITERS[format_type](_StreamWriter(f), result, columns, column_types)
+    else:
+        EXPORT_WRITERS[format_type](f, result, columns)
+
+
+def _export_part(instance, db_name, sql, format_type, max_execution_time=0, max_rows=0):
+    """
+    在独立的连接上执行一个分片查询, 结果写入临时文件
+    :param max_rows: 导出行数阈值, 单个分片超过阈值时停止读取
+    :return: (临时文件, 行数)
+    """
+    config = get_parallel_export_config()
+    part = tempfile.TemporaryFile()
+    counter = {"rows": 0}
+    try:
+        with instance_slot(
+            instance.id,
+            int(config["instance_limit"]),
+            int(config["slot_timeout"]),
+            int(config["slot_wait_timeout"]),
+        ):
+            engine = get_engine(instance=instance)
+            results, chunks = engine.query_stream(
+                db_name=db_name,
+                sql=sql,
+                chunk_size=getattr(settings, "OFFLINE_EXPORT_CHUNK_SIZE", 5000),
+                max_execution_time=max_execution_time,
+            )
+            try:
+                if results.error:
+                    raise Exception(results.error)
+
+                def rows():
+                    for chunk in chunks:
+                        counter["rows"] += len(chunk)
+                        check_export_rows(counter["rows"], max_rows)
+                        yield from chunk
+
+                _write_part(
+                    part, format_type, rows(), results.column_list, results.column_type
+                )
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+    except Exception:
+        part.close()
+        raise
+    finally:
+        # 工作线程中获取实例信息时可能使用了Django的数据库连接
+        db_connection.close()
+    part.seek(0)
+    return part, counter["rows"]
 
+
+def parallel_export_to_storage(
+    instance, workflow, chunk_sqls, storage, max_execution_time=0, max_rows=0
+):
+    """
+    并行执行分片查询, 各分片按主键顺序作为压缩包中的分卷文件写入存储
+    预先提交的分片数不超过并发数的两倍, 限制临时文件占用的磁盘空间
+    :param chunk_sqls: 按主键顺序排列的分片查询
+    :param max_rows: 导出行数阈值, 累计行数超过阈值时停止导出, 0表示不限制
+    :return: (文件名, 导出行数)
+    """
+    format_type = workflow.export_format
+    if format_type not in EXPORT_WRITERS and format_type not in COLUMNAR_WRITERS:
+        raise ValueError(f"Unsupported format type: {format_type}")
+    workers = int(get_parallel_export_config()["workers"])
+    base_name = _export_base_name(workflow)
     zip_file_name = f"{base_name}.zip"
-    zip_file_path = os.path.join(temp_dir, zip_file_name)
-    with zipfile.ZipFile(zip_file_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(file_path, os.path.basename(file_path))
-    return zip_file_name
+    # 列式格式自带压缩，不再重复压缩
+    compression = (
+        zipfile.ZIP_STORED if format_type in COLUMNAR_WRITERS else zipfile.ZIP_DEFLATED
+    )
+    sqls = iter(chunk_sqls)
+    pending = deque()
+    total_rows = 0
+    written = 0
+    executor = ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="offline-export"
+    )
 
+    def submit():
+        for chunk_sql in itertools.islice(sqls, 1):
+            pending.append(
+                executor.submit(
+                    _export_part,
+                    instance,
+                    workflow.db_name,
+                    chunk_sql,
+                    format_type,
+                    max_execution_time,
+                    max_rows,
+                )
+            )
 
-def save_csv(file_path, result, columns):
+    try:
+        with storage.open_writer(zip_file_name) as f:
+            with zipfile.ZipFile(_StreamWriter(f), "w", compression) as zipf:
+                for _ in range(workers * 2):
+                    submit()
+                while pending:
+                    part, rows = pending.popleft().result()
+                    with part:
+                        check_export_rows(total_rows + rows, max_rows)
+                        submit()
+                        # 跳过空分片，全部为空时保留最后一个分片，使文件中包含表头
+                        if rows == 0 and (written or pending):
+                            continue
+                        written += 1
+                        with zipf.open(
+                            f"{base_name}.part{written:05d}.{format_type}",
+                            "w",
+                            force_zip64=True,
+                        ) as entry:
+                            shutil.copyfileobj(part, entry, 1024 * 1024)
+                    total_rows += rows
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in pending:
+            if future.done() and not future.cancelled() and not future.exception():
+                future.result()[0].close()
+    return zip_file_name, total_rows
+
+
+def write_export_file(
+    fileobj, base_name, format_type, result, columns, column_types=None
+):
     """
-    保存CSV文件，将查询结果写入CSV文件。
-    :param file_path: CSV文件路径
+    将查询结果按指定格式写入文件对象
+    :param column_types: 列类型, 列式格式据此确定各列的数据类型
+    """
+    if format_type in COLUMNAR_WRITERS:
+        COLUMNAR_WRITERS[format_type](
+            _StreamWriter(fileobj), result, columns, column_types
+        )
+    else:
+        write_zip(fileobj, base_name, format_type, result, columns)
+
+
+def stream_to_format_file(
+    format_type, result, workflow, columns, storage, column_types=None
+):
+    """
+    将查询结果按指定格式直接写入存储
+    :param format_type: 文件格式类型（csv、json、xml、xlsx、sql、parquet、arrow）
+    :param result: 可迭代的查询结果
+    :param workflow: 工单实例
+    :param columns: 列名
+    :param storage: DynamicStorage实例
+    :param column_types: 列类型
+    :return: 文件名
+    """
+    base_name = _export_base_name(workflow)
+    file_name = export_file_name(base_name, format_type)
+    with storage.open_writer(file_name) as f:
+        write_export_file(f, base_name, format_type, result, columns, column_types)
+    return file_name
+
+
+def save_to_format_file(
+    format_type=None,
+    result=None,
+    workflow=None,
+    columns=None,
+    temp_dir=None,
+    column_types=None,
+):
+    """
+    保存查询结果为指定格式的文件。
+    :param format_type: 文件格式类型（csv、json、xml、xlsx、sql、parquet、arrow）
     :param result: 查询结果
+    :param workflow: 工单实例
     :param columns: 列名
+    :param temp_dir: 临时目录路径
+    :param column_types: 列类型
+    :return: 文件名，文本和Excel格式为压缩后的文件名
     """
-    with open(file_path, "w", newline="", encoding="utf-8") as csv_file:
+    base_name = _export_base_name(workflow)
+    file_name = export_file_name(base_name, format_type)
+    with open(os.path.join(temp_dir, file_name), "wb") as f:
+        write_export_file(f, base_name, format_type, result, columns, column_types)
+    return file_name
+
+
+@contextmanager
+def _text_stream(f):
+    """将二进制流包装为utf-8文本流, 结束时不关闭底层的流"""
+    text_file = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    try:
+        yield text_file
+    finally:
+        text_file.flush()
+        text_file.detach()
+
+
+def write_csv(f, result, columns):
+    """将查询结果以CSV格式写入二进制流"""
+    with _text_stream(f) as csv_file:
         csv_writer = csv.writer(csv_file, quoting=csv.QUOTE_ALL)
 
         if columns:
@@ -389,14 +700,9 @@ def save_csv(file_path, result, columns):
             csv_writer.writerow(csv_row)
 
 
-def save_json(file_path, result, columns):
-    """
-    保存JSON文件，将查询结果写入JSON文件。
-    :param file_path: JSON文件路径
-    :param result: 查询结果
-    :param columns: 列名
-    """
-    with open(file_path, "w", encoding="utf-8") as json_file:
+def write_json(f, result, columns):
+    """将查询结果以JSON格式写入二进制流"""
+    with _text_stream(f) as json_file:
         json_file.write("[\n")
         for i, row in enumerate(result):
             if i > 0:
@@ -406,23 +712,18 @@ def save_json(file_path, result, columns):
         json_file.write("\n]")
 
 
-def save_xml(file_path, result, columns):
-    """
-    保存XML文件，将查询结果写入XML文件。
-    :param file_path: XML文件路径
-    :param result: 查询结果
-    :param columns: 列名
-    """
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
-        f.write("<tabledata>\n")
-        f.write("  <fields>\n")
+def write_xml(f, result, columns):
+    """将查询结果以XML格式写入二进制流"""
+    with _text_stream(f) as xml_file:
+        xml_file.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        xml_file.write("<tabledata>\n")
+        xml_file.write("  <fields>\n")
         for column in columns:
-            f.write(f"    <field>{escape(str(column))}</field>\n")
-        f.write("  </fields>\n")
-        f.write("  <data>\n")
+            xml_file.write(f"    <field>{escape(str(column))}</field>\n")
+        xml_file.write("  </fields>\n")
+        xml_file.write("  <data>\n")
         for row_id, row in enumerate(result, start=1):
-            f.write(f'    <row id="{row_id}">\n')
+            xml_file.write(f'    <row id="{row_id}">\n')
             for col_idx, value in enumerate(row, start=1):
                 if value is None:
                     text = "(null)"
@@ -430,46 +731,35 @@ def save_xml(file_path, result, columns):
                     text = value.isoformat()
                 else:
                     text = escape(str(value))
-                f.write(f"      <column-{col_idx}>{text}</column-{col_idx}>\n")
-            f.write("    </row>\n")
-        f.write("  </data>\n")
-        f.write("</tabledata>\n")
+                xml_file.write(f"      <column-{col_idx}>{text}</column-{col_idx}>\n")
+            xml_file.write("    </row>\n")
+        xml_file.write("  </data>\n")
+        xml_file.write("</tabledata>\n")
 
 
-def save_xlsx(file_path, result, columns):
+def write_xlsx(f, result, columns):
     """
-    保存Excel文件，将查询结果写入Excel文件。
-    :param file_path: Excel文件路径
-    :param result: 查询结果
-    :param columns: 列名
+    将查询结果以Excel格式写入二进制流
+    使用openpyxl的只写模式逐行写入，不在内存中保留整个工作表
     """
-    try:
-
-        def generate_rows():
-            for row in result:
-                yield [
-                    str(value) if value is not None and value != "NULL" else ""
-                    for value in row
-                ]
-
-        df = pd.DataFrame(generate_rows(), columns=columns)
-        df.to_excel(file_path, index=False, header=True)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(list(columns))
+    for row_count, row in enumerate(result, start=2):
+        if row_count > EXCEL_MAX_ROWS:
+            raise ValueError(f"Excel最大支持行数为1048576,已超出!")
+        ws.append(
+            [
+                str(value) if value is not None and value != "NULL" else ""
+                for value in row
+            ]
+        )
+    wb.save(f)
 
-        # 显式删除大对象并强制垃圾回收
-        del df
-        gc.collect()
-    except ValueError as e:
-        raise ValueError(f"Excel最大支持行数为1048576,已超出!")
 
-
-def save_sql(file_path, result, columns):
-    """
-    保存SQL文件，将查询结果写入SQL文件。
-    :param file_path: SQL文件路径
-    :param result: 查询结果
-    :param columns: 列名
-    """
-    with open(file_path, "w") as sql_file:
+def write_sql(f, result, columns):
+    """将查询结果以INSERT语句写入二进制流"""
+    with _text_stream(f) as sql_file:
         for row in result:
             table_name = "your_table_name"
             if columns:
@@ -492,6 +782,206 @@ def save_sql(file_path, result, columns):
             sql_file.write(f"({values});\n")
 
 
+EXPORT_WRITERS = {
+    "csv": write_csv,
+    "json": write_json,
+    "xml": write_xml,
+    "xlsx": write_xlsx,
+    "sql": write_sql,
+}
+
+
+# 已知列类型对应的Arrow类型, 其他类型根据第一批数据推断
+ARROW_COLUMN_TYPES = {
+    "TINY": pa.int64(),
+    "SHORT": pa.int64(),
+    "LONG": pa.int64(),
+    "LONGLONG": pa.int64(),
+    "INT24": pa.int64(),
+    "YEAR": pa.int64(),
+    "FLOAT": pa.float64(),
+    "DOUBLE": pa.float64(),
+    "DATE": pa.date32(),
+    "NEWDATE": pa.date32(),
+    "DATETIME": pa.timestamp("us"),
+    "TIMESTAMP": pa.timestamp("us"),
+    "TIME": pa.duration("us"),
+}
+
+# Parquet每个row group的行数，过小会降低压缩率和读取性能
+PARQUET_ROW_GROUP_ROWS = 100000
+
+
+def _arrow_field_names(columns):
+    """Arrow和Parquet的列名需要唯一, 重复的列名添加序号"""
+    names = []
+    seen = {}
+    for column in columns:
+        name = str(column)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _to_arrow_array(values, arrow_type):
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+        if arrow_type != pa.string():
+            raise
+        return pa.array(
+            [None if value is None else str(value) for value in values],
+            type=pa.string(),
+        )
+
+
+def _infer_arrow_type(values, column_type):
+    """根据列类型和第一批数据确定Arrow类型, 无法确定的按字符串处理"""
+    arrow_type = ARROW_COLUMN_TYPES.get(str(column_type or "").upper())
+    if arrow_type is not None:
+        try:
+            pa.array(values, type=arrow_type)
+            return arrow_type
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+            pass
+    try:
+        arrow_type = pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+        return pa.string()
+    if pa.types.is_null(arrow_type):
+        return pa.string()
+    if pa.types.is_decimal(arrow_type) and arrow_type.precision <= 38:
+        # 第一批数据的精度不代表整列, 使用最大精度
+        return pa.decimal128(38, arrow_type.scale)
+    return arrow_type
+
+
+def iter_record_batches(result, columns, column_types=None, batch_size=None):
+    """
+    将查询结果转换为Arrow RecordBatch
+    :return: (schema, RecordBatch迭代器)
+    """
+    batch_size = batch_size or getattr(settings, "OFFLINE_EXPORT_CHUNK_SIZE", 5000)
+    column_types = list(column_types or [])
+    column_types += [""] * (len(columns) - len(column_types))
+    rows = iter(result)
+    first_batch = list(itertools.islice(rows, batch_size))
+    column_values = list(zip(*first_batch)) or [[] for _ in columns]
+    schema = pa.schema(
+        [
+            (name, _infer_arrow_type(list(values), column_type))
+            for name, values, column_type in zip(
+                _arrow_field_names(columns), column_values, column_types
+            )
+        ]
+    )
+
+    def batches():
+        batch = first_batch
+        while batch:
+            arrays = [
+                _to_arrow_array(list(values), field.type)
+                for values, field in zip(zip(*batch), schema)
+            ]
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+            batch = list(itertools.islice(rows, batch_size))
+
+    return schema, batches()
+
+
+def write_parquet(f, result, columns, column_types=None):
+    """将查询结果以Parquet格式写入二进制流, 使用zstd压缩"""
+    schema, batches = iter_record_batches(result, columns, column_types)
+    with pq.ParquetWriter(
+        pa.PythonFile(f, mode="w"), schema, compression="zstd"
+    ) as writer:
+        pending = []
+        pending_rows = 0
+        for batch in batches:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= PARQUET_ROW_GROUP_ROWS:
+                writer.write_table(pa.Table.from_batches(pending, schema=schema))
+                pending = []
+                pending_rows = 0
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema=schema))
+
+
+def write_arrow(f, result, columns, column_types=None):
+    """将查询结果以Arrow IPC文件格式写入二进制流, 使用zstd压缩"""
+    schema, batches = iter_record_batches(result, columns, column_types)
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_file(pa.PythonFile(f, mode="w"), schema, options=options) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+
+
+COLUMNAR_WRITERS = {
+    "parquet": write_parquet,
+    "arrow": write_arrow,
+}
+
+
+def save_csv(file_path, result, columns):
+    """
+    保存CSV文件，将查询结果写入CSV文件。
+    :param file_path: CSV文件路径
+    :param result: 查询结果
+    :param columns: 列名
+    """
+    with open(file_path, "wb") as f:
+        write_csv(f, result, columns)
+
+
+def save_json(file_path, result, columns):
+    """
+    保存JSON文件，将查询结果写入JSON文件。
+    :param file_path: JSON文件路径
+    :param result: 查询结果
+    :param columns: 列名
+    """
+    with open(file_path, "wb") as f:
+        write_json(f, result, columns)
+
+
+def save_xml(file_path, result, columns):
+    """
+    保存XML文件，将查询结果写入XML文件。
+    :param file_path: XML文件路径
+    :param result: 查询结果
+    :param columns: 列名
+    """
+    with open(file_path, "wb") as f:
+        write_xml(f, result, columns)
+
+
+def save_xlsx(file_path, result, columns):
+    """
+    保存Excel文件，将查询结果写入Excel文件。
+    :param file_path: Excel文件路径
+    :param result: 查询结果
+    :param columns: 列名
+    """
+    with open(file_path, "wb") as f:
+        write_xlsx(f, result, columns)
+
+
+def save_sql(file_path, result, columns):
+    """
+    保存SQL文件，将查询结果写入SQL文件。
+    :param file_path: SQL文件路径
+    :param result: 查询结果
+    :param columns: 列名
+    """
+    with open(file_path, "wb") as f:
+        write_sql(f, result, columns)
+
+
 class StorageFileResponse(FileResponse):
     """
     自定义文件响应类，用于处理文件下载，主要用于处理storages.backends.sftpstorage下载后无法关闭后台连接的问题。
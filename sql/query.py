@@ -9,18 +9,30 @@ import simplejson as json
 from django.contrib.auth.decorators import permission_required
 from django.db import connection, close_old_connections
 from django.db.models import Q
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django_q.tasks import async_task
 from common.config import SysConfig
 from common.utils.extend_json_encoder import ExtendJSONEncoder, ExtendJSONEncoderFTime
 from common.utils.openai import OpenaiClient, check_openai_config
+from common.utils.permission import superuser_required
 from common.utils.timer import FuncTimer
 from sql.query_privileges import query_priv_check
 from sql.utils.resource_group import user_instances
-from sql.utils.tasks import add_kill_conn_schedule, del_schedule
+from sql.utils.search_index import get_search_index_config
+from sql.utils.tasks import (
+    add_kill_conn_schedule,
+    add_search_index_schedule,
+    del_schedule,
+)
 from .models import QueryLog, Instance
 from sql.engines import get_engine
 from sql.services.querylog_service import list_query_logs, update_favorite
-from sql.services.sqlquery_service import execute_sql_query
+from sql.services.resource_service import describe_table_cached
+from sql.services.sqlquery_service import (
+    encode_ndjson_events,
+    execute_sql_query,
+    stream_sql_query,
+)
 
 logger = logging.getLogger("default")
 
@@ -32,7 +44,7 @@ def query(request):
     :param request:
     :return:
     """
-    result = execute_sql_query(
+    params = dict(
         user=request.user,
         instance_name=request.POST.get("instance_name"),
         db_name=request.POST.get("db_name"),
@@ -41,6 +53,15 @@ def query(request):
         schema_name=request.POST.get("schema_name", None),
         tb_name=request.POST.get("tb_name"),
     )
+    # stream=true时以NDJSON分批返回结果, 校验失败时仍返回普通JSON
+    if request.POST.get("stream", "false").lower() in ("true", "1"):
+        result, events = stream_sql_query(**params)
+        if events is not None:
+            return StreamingHttpResponse(
+                encode_ndjson_events(events), content_type="application/x-ndjson"
+            )
+    else:
+        result = execute_sql_query(**params)
     # 返回查询结果
     try:
         return HttpResponse(
@@ -93,6 +114,24 @@ def _querylog(request):
     )
 
 
+@superuser_required
+def search_index(request):
+    """主动触发查询日志和慢日志的搜索索引更新，同时写入schedule定期更新"""
+    config = get_search_index_config()
+    if not config["enabled"]:
+        return JsonResponse({"status": 1, "msg": "未开启搜索索引"})
+    try:
+        add_search_index_schedule(int(config["interval"]))
+        async_task(
+            "sql.utils.search_index.build_search_index",
+            task_name=f"search-index-{time.time()}",
+            timeout=-1,
+        )
+        return JsonResponse({"status": 0, "msg": "触发索引更新成功"})
+    except Exception as e:
+        return JsonResponse({"status": 1, "msg": f"触发索引更新异常:{e}"})
+
+
 @permission_required("sql.menu_sqlquery", raise_exception=True)
 def favorite(request):
     """
@@ -153,8 +192,8 @@ def generate_sql(request):
         # 循环获取表列表的表结构
         table_structures = []
         for tb_name in tb_name_list:
-            query_result = query_engine.describe_table(
-                db_name, tb_name, schema_name=schema_name
+            query_result = describe_table_cached(
+                instance, query_engine, db_name, tb_name, schema_name=schema_name
             )
             # 有些不存在表结构, 例如 redis
             if len(query_result.rows) != 0:
@@ -12,9 +12,13 @@ import re
 import traceback
 
 import simplejson as json
+from django.conf import settings
 from django.contrib.auth.decorators import permission_required
+from django.core.cache import cache
 from django.db import transaction
 from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
@@ -69,13 +73,17 @@ def query_priv_check(user, instance, db_name, sql_content, limit_num):
             # explain和show create跳过权限校验
             if re.match(r"^explain|^show\s+create", sql_content, re.I):
                 return result
+            # 一次性加载用户在该实例上的有效权限, 后续校验均为内存查找
+            snapshot = _priv_snapshot(user, instance)
             # 其他权限校验
             table_ref = _table_ref(sql_content, instance, db_name)
             # 循环验证权限，可能存在性能问题，但一次查询涉及的库表数量有限
             for table in table_ref:
                 # 既无库权限也无表权限则鉴权失败
-                if not _db_priv(user, instance, table["schema"]) and not _tb_priv(
-                    user, instance, table["schema"], table["name"]
+                if not _db_priv(
+                    user, instance, table["schema"], snapshot=snapshot
+                ) and not _tb_priv(
+                    user, instance, table["schema"], table["name"], snapshot=snapshot
                 ):
                     # 没有库表查询权限时的staus为2
                     result["status"] = 2
@@ -86,7 +94,11 @@ def query_priv_check(user, instance, db_name, sql_content, limit_num):
             # 获取查询涉及库/表权限的最小limit限制，和前端传参作对比，取最小值
             for table in table_ref:
                 priv_limit = _priv_limit(
-                    user, instance, db_name=table["schema"], tb_name=table["name"]
+                    user,
+                    instance,
+                    db_name=table["schema"],
+                    tb_name=table["name"],
+                    snapshot=snapshot,
                 )
                 limit_num = min(priv_limit, limit_num) if limit_num else priv_limit
             result["data"]["limit_num"] = limit_num
@@ -96,6 +108,10 @@ def query_priv_check(user, instance, db_name, sql_content, limit_num):
             )
             result["status"] = 1
             result["msg"] = f"无法校验查询语句权限，请联系管理员，错误信息：{msg}"
+            # fast模式未预先explain, 语句无法解析时返回与strict模式一致的语法错误信息
+            explain_error = _explain_error(instance, db_name, sql_content)
+            if explain_error:
+                result["msg"] = explain_error
     # 其他类型实例仅校验库权限
     else:
         # 先获取查询语句涉及的库，redis、mssql、pgsql/gaussdb特殊处理，仅校验当前选择的库
@@ -423,16 +439,19 @@ def query_priv_modify(request):
         result["status"] = 1
         return HttpResponse(json.dumps(result), content_type="application/json")
 
+    user_names = list(privileges.values_list("user_name", flat=True).distinct())
     # type=1删除权限,type=2变更权限
     if int(type) == 1:
         # 批量删除权限
         privileges.update(is_deleted=1)
+        invalidate_priv_snapshot(*user_names)
         return HttpResponse(json.dumps(result), content_type="application/json")
     elif int(type) == 2:
         # 批量变更权限
         valid_date = request.POST.get("valid_date")
         limit_num = request.POST.get("limit_num")
         privileges.update(valid_date=valid_date, limit_num=limit_num)
+        invalidate_priv_snapshot(*user_names)
         return HttpResponse(json.dumps(result), content_type="application/json")
 
 
@@ -486,6 +505,20 @@ def query_priv_audit(request):
     return HttpResponseRedirect(reverse("sql:queryapplydetail", args=(apply_id,)))
 
 
+def _explain_error(instance, db_name, sql_content):
+    """MySQL查询校验为fast模式时, 通过explain获取select语句的语法错误信息"""
+    from sql.engines import get_engine
+
+    engine = get_engine(instance=instance)
+    if engine.strict_query_check or not re.match(r"^select", sql_content, re.I):
+        return None
+    try:
+        return engine.explain_check(db_name, sql_content)
+    except Exception:
+        logger.warning(f"获取语法错误信息失败，{traceback.format_exc()}")
+        return None
+
+
 def _table_ref(sql_content, instance, db_name):
     """
     解析语法树，获取语句涉及的表，用于查询权限限制
@@ -503,69 +536,136 @@ def _table_ref(sql_content, instance, db_name):
     return engine.get_table_ref(json.loads(query_tree), db_name=db_name)
 
 
-def _db_priv(user, instance, db_name):
+def _priv_snapshot_version(username):
+    """用户权限快照的版本号, 权限变更时递增, 旧快照随之失效"""
+    return cache.get(f"query_priv_version:{username}", 0)
+
+
+def invalidate_priv_snapshot(*usernames):
+    """
+    使用户的查询权限快照失效, 授权、回收、变更权限后调用
+    :param usernames: 用户名
+    :return:
+    """
+    for username in set(usernames):
+        key = f"query_priv_version:{username}"
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, None)
+        except Exception as e:
+            logger.warning(f"查询权限快照失效失败，{username}，{e}")
+
+
+def _priv_snapshot(user, instance):
+    """
+    获取用户在实例上的有效查询权限快照, 一次查询加载全部库表权限并短时间缓存
+    :param user: 用户对象
+    :param instance: 实例对象
+    :return: [(priv_type, db_name, table_name, limit_num, valid_date)], 按权限id排序
+    """
+    ttl = int(getattr(settings, "QUERY_PRIV_CACHE_TTL", 60) or 0)
+    cache_key = None
+    if ttl > 0:
+        try:
+            version = _priv_snapshot_version(user.username)
+            cache_key = f"query_priv_snapshot:{user.username}:{instance.id}:{version}"
+            snapshot = cache.get(cache_key)
+            if snapshot is not None:
+                return snapshot
+        except Exception as e:
+            logger.warning(f"读取查询权限快照失败，{e}")
+            cache_key = None
+    snapshot = list(
+        QueryPrivileges.objects.filter(
+            user_name=user.username,
+            instance=instance,
+            valid_date__gte=datetime.datetime.now(),
+            is_deleted=0,
+        )
+        .order_by("privilege_id")
+        .values_list("priv_type", "db_name", "table_name", "limit_num", "valid_date")
+    )
+    if cache_key:
+        try:
+            cache.set(cache_key, snapshot, ttl)
+        except Exception as e:
+            logger.warning(f"缓存查询权限快照失败，{e}")
+    return snapshot
+
+
+def _snapshot_limit(snapshot, priv_type, db_names, tb_name=None):
+    """
+    在权限快照中查找第一条匹配的有效权限, 过期判断在查找时进行, 缓存期间到期的权限同样失效
+    库表名不区分大小写, 与权限表在不区分大小写的排序规则下按库表名过滤的结果一致
+    :return: 权限存在则返回对应权限的limit_num，否则返回False
+    """
+    today = datetime.date.today()
+    db_names = {str(i).lower() for i in db_names}
+    if tb_name is not None:
+        tb_name = str(tb_name).lower()
+    for p_type, p_db_name, p_table_name, limit_num, valid_date in snapshot:
+        if (
+            p_type != priv_type
+            or str(p_db_name).lower() not in db_names
+            or valid_date < today
+        ):
+            continue
+        if tb_name is not None and str(p_table_name).lower() != tb_name:
+            continue
+        return limit_num
+    return False
+
+
+def _db_priv(user, instance, db_name, snapshot=None):
     """
     检测用户是否拥有指定库权限
     :param user: 用户对象
     :param instance: 实例对象
     :param db_name: 库名
+    :param snapshot: 权限快照，为空时自动获取
     :return: 权限存在则返回对应权限的limit_num，否则返回False
     TODO 返回统一为 int 类型, 不存在返回0 (虽然其实在python中 0==False)
     """
     if user.is_superuser:
         return int(SysConfig().get("admin_query_limit", 5000))
     # 获取用户库权限
-    user_privileges = QueryPrivileges.objects.filter(
-        user_name=user.username,
-        instance=instance,
-        db_name__in=[str(db_name), str("*")],
-        valid_date__gte=datetime.datetime.now(),
-        is_deleted=0,
-        priv_type=1,
-    )
-    if user_privileges.exists():
-        return user_privileges.first().limit_num
-    return False
+    if snapshot is None:
+        snapshot = _priv_snapshot(user, instance)
+    return _snapshot_limit(snapshot, 1, [str(db_name), str("*")])
 
 
-def _tb_priv(user, instance, db_name, tb_name):
+def _tb_priv(user, instance, db_name, tb_name, snapshot=None):
     """
     检测用户是否拥有指定表权限
     :param user: 用户对象
     :param instance: 实例对象
     :param db_name: 库名
     :param tb_name: 表名
+    :param snapshot: 权限快照，为空时自动获取
     :return: 权限存在则返回对应权限的limit_num，否则返回False
     """
-    # 获取用户表权限
-    user_privileges = QueryPrivileges.objects.filter(
-        user_name=user.username,
-        instance=instance,
-        db_name=str(db_name),
-        table_name=str(tb_name),
-        valid_date__gte=datetime.datetime.now(),
-        is_deleted=0,
-        priv_type=2,
-    )
     if user.is_superuser:
         return int(SysConfig().get("admin_query_limit", 5000))
-    else:
-        if user_privileges.exists():
-            return user_privileges.first().limit_num
-    return False
+    # 获取用户表权限
+    if snapshot is None:
+        snapshot = _priv_snapshot(user, instance)
+    return _snapshot_limit(snapshot, 2, [str(db_name)], str(tb_name))
 
 
-def _priv_limit(user, instance, db_name, tb_name=None):
+def _priv_limit(user, instance, db_name, tb_name=None, snapshot=None):
     """
     获取用户拥有的查询权限的最小limit限制，用于返回结果集限制
     :param db_name:
     :param tb_name: 可为空，为空时返回库权限
+    :param snapshot: 权限快照，为空时由_db_priv、_tb_priv获取
     :return:
     """
     # 获取库表权限limit值
-    db_limit_num = _db_priv(user, instance, db_name)
+    db_limit_num = _db_priv(user, instance, db_name, snapshot=snapshot)
     if tb_name:
-        tb_limit_num = _tb_priv(user, instance, db_name, tb_name)
+        tb_limit_num = _tb_priv(user, instance, db_name, tb_name, snapshot=snapshot)
     else:
         tb_limit_num = None
     # 返回最小值
@@ -625,3 +725,11 @@ def _query_apply_audit_call_back(apply_id, workflow_status):
                 for table_name in apply_queryset.table_list.split(",")
             ]
         QueryPrivileges.objects.bulk_create(insert_list)
+        # 新授权立即生效
+        invalidate_priv_snapshot(apply_queryset.user_name)
+
+
+@receiver(post_save, sender=QueryPrivileges)
+@receiver(post_delete, sender=QueryPrivileges)
+def invalidate_priv_snapshot_on_change(sender, instance, **kwargs):
+    invalidate_priv_snapshot(instance.user_name)
@@ -2,9 +2,8 @@
 
 import datetime
 
-from django.db.models import Q
-
 from sql.models import QueryLog
+from sql.utils.search_index import query_log_search, reindex_query_log
 
 
 def list_query_logs(
@@ -37,11 +36,7 @@ def list_query_logs(
         filter_dict["create_time__range"] = (start_date, end_date)
 
     sql_log = QueryLog.objects.filter(**filter_dict)
-    sql_log = sql_log.filter(
-        Q(sqllog__icontains=search)
-        | Q(user_display__icontains=search)
-        | Q(alias__icontains=search)
-    )
+    sql_log = sql_log.filter(query_log_search(search))
     rows = [
         row
         for row in sql_log.order_by("-id")[offset:limit].values(
@@ -70,4 +65,5 @@ def update_favorite(user, query_log_id, star, alias):
         return {"status": 1, "msg": "查询记录不存在或无权限"}
 
     query_set.update(favorite=star, alias=alias)
+    reindex_query_log(query_log_id)
     return {"status": 0, "msg": "ok"}
@@ -5,6 +5,7 @@ import logging
 from common.utils.convert import Convert
 from sql.engines import get_engine
 from sql.models import Instance
+from sql.utils.metadata_cache import get_instance_metadata
 from sql.utils.resource_group import user_instances
 from sql.utils.sql_utils import filter_db_list
 
@@ -56,8 +57,14 @@ def list_instance_resources(
         schema_name = query_engine.escape_string(schema_name)
         tb_name = query_engine.escape_string(tb_name)
 
+        is_superuser = query_engine.is_superuser
         if resource_type == "database":
-            resource = query_engine.get_all_databases()
+            resource = get_instance_metadata(
+                instance,
+                resource_type,
+                query_engine.get_all_databases,
+                variant=is_superuser,
+            )
             resource.rows = filter_db_list(
                 db_list=resource.rows,
                 db_name_regex=query_engine.instance.show_db_name_regex,
@@ -69,14 +76,35 @@ def list_instance_resources(
                 is_match_regex=False,
             )
         elif resource_type == "schema" and db_name:
-            resource = query_engine.get_all_schemas(db_name=db_name)
+            resource = get_instance_metadata(
+                instance,
+                resource_type,
+                lambda: query_engine.get_all_schemas(db_name=db_name),
+                db_name=db_name,
+                variant=is_superuser,
+            )
         elif resource_type == "table" and db_name:
-            resource = query_engine.get_all_tables(
-                db_name=db_name, schema_name=schema_name
+            resource = get_instance_metadata(
+                instance,
+                resource_type,
+                lambda: query_engine.get_all_tables(
+                    db_name=db_name, schema_name=schema_name
+                ),
+                db_name=db_name,
+                schema_name=schema_name,
+                variant=is_superuser,
             )
         elif resource_type == "column" and db_name and tb_name:
-            resource = query_engine.get_all_columns_by_tb(
-                db_name=db_name, tb_name=tb_name, schema_name=schema_name
+            resource = get_instance_metadata(
+                instance,
+                resource_type,
+                lambda: query_engine.get_all_columns_by_tb(
+                    db_name=db_name, tb_name=tb_name, schema_name=schema_name
+                ),
+                db_name=db_name,
+                schema_name=schema_name,
+                tb_name=tb_name,
+                variant=is_superuser,
             )
         elif resource_type == "server_info":
             try:
@@ -101,6 +129,18 @@ def list_instance_resources(
     return result
 
 
+def describe_table_cached(instance, query_engine, db_name, tb_name, schema_name=""):
+    """获取表结构, 结果缓存在实例元数据缓存中"""
+    return get_instance_metadata(
+        instance,
+        "describe",
+        lambda: query_engine.describe_table(db_name, tb_name, schema_name=schema_name),
+        db_name=db_name,
+        schema_name=schema_name or "",
+        tb_name=tb_name,
+    )
+
+
 def describe_table_structure(
     user,
     instance_name,
@@ -122,8 +162,8 @@ def describe_table_structure(
         db_name = query_engine.escape_string(db_name)
         schema_name = query_engine.escape_string(schema_name)
         tb_name = query_engine.escape_string(tb_name)
-        query_result = query_engine.describe_table(
-            db_name, tb_name, schema_name=schema_name
+        query_result = describe_table_cached(
+            instance, query_engine, db_name, tb_name, schema_name=schema_name
         )
         result["data"] = query_result.__dict__
     except Exception as msg:
@@ -6,29 +6,28 @@ import re
 import time
 import traceback
 
+import simplejson as json
+from django.conf import settings
 from django.db import close_old_connections, connection
 
 from common.config import SysConfig
+from common.utils.extend_json_encoder import ExtendJSONEncoderFTime
 from common.utils.timer import FuncTimer
 from sql.engines import get_engine
-from sql.models import Instance, QueryLog
+from sql.models import Instance
 from sql.query_privileges import query_priv_check
+from sql.utils.query_log import record_query_log
 from sql.utils.resource_group import user_instances
 from sql.utils.tasks import add_kill_conn_schedule, del_schedule
 
 logger = logging.getLogger("default")
 
 
-def execute_sql_query(
-    user,
-    instance_name,
-    db_name,
-    sql_content,
-    limit_num,
-    schema_name=None,
-    tb_name=None,
-):
-    """执行 SQL 查询并返回与旧接口一致的响应结构。"""
+def _prepare_sql_query(user, instance_name, db_name, sql_content, limit_num):
+    """
+    查询前的参数、语句和权限校验
+    :return: (result, context)，校验失败时context为None，result中为错误信息
+    """
     result = {"status": 0, "msg": "ok", "data": {}}
 
     try:
@@ -36,33 +35,33 @@ def execute_sql_query(
     except (TypeError, ValueError):
         result["status"] = 1
         result["msg"] = "limit_num 非法"
-        return result
+        return result, None
 
     try:
         instance = user_instances(user).get(instance_name=instance_name)
     except Instance.DoesNotExist:
         result["status"] = 1
         result["msg"] = "你所在组未关联该实例"
-        return result
+        return result, None
 
     if None in [sql_content, db_name, instance_name, limit_num]:
         result["status"] = 1
         result["msg"] = "页面提交参数可能为空"
-        return result
+        return result, None
 
-    priv_check = False
+    config = SysConfig()
+    query_engine = get_engine(instance=instance)
+    context = None
     try:
-        config = SysConfig()
-        query_engine = get_engine(instance=instance)
         query_check_info = query_engine.query_check(db_name=db_name, sql=sql_content)
         if query_check_info.get("bad_query"):
             result["status"] = 1
             result["msg"] = query_check_info.get("msg")
-            return result
+            return result, None
         if query_check_info.get("has_star") and config.get("disable_star") is True:
             result["status"] = 1
             result["msg"] = query_check_info.get("msg")
-            return result
+            return result, None
         sql_content = query_check_info["filtered_sql"]
 
         priv_check_info = query_priv_check(
@@ -71,22 +70,74 @@ def execute_sql_query(
         if priv_check_info["status"] != 0:
             result["status"] = priv_check_info["status"]
             result["msg"] = priv_check_info["msg"]
-            return result
+            return result, None
         limit_num = priv_check_info["data"]["limit_num"]
-        priv_check = priv_check_info["data"]["priv_check"]
 
         limit_num = 0 if re.match(r"^explain", sql_content.lower()) else limit_num
         sql_content = query_engine.filter_sql(sql=sql_content, limit_num=limit_num)
+        context = {
+            "config": config,
+            "instance": instance,
+            "query_engine": query_engine,
+            "sql_content": sql_content,
+            "limit_num": limit_num,
+            "priv_check": priv_check_info["data"]["priv_check"],
+        }
+        return result, context
+    finally:
+        # 严格模式的语法校验保留了连接供随后的查询复用, 未通过校验时释放
+        # redis等引擎未实现close, 无需释放
+        if context is None and hasattr(query_engine, "close"):
+            query_engine.close()
 
-        query_engine.get_connection(db_name=db_name)
-        thread_id = query_engine.thread_id
+
+def _add_kill_schedule(query_engine, instance, db_name, max_execution_time):
+    """获取连接并添加超时kill任务，返回任务名，不支持时返回None"""
+    query_engine.get_connection(db_name=db_name)
+    thread_id = query_engine.thread_id
+    if not thread_id:
+        return None
+    schedule_name = f"query-{time.time()}"
+    run_date = datetime.datetime.now() + datetime.timedelta(seconds=max_execution_time)
+    add_kill_conn_schedule(schedule_name, run_date, instance.id, thread_id)
+    return schedule_name
+
+
+def execute_sql_query(
+    user,
+    instance_name,
+    db_name,
+    sql_content,
+    limit_num,
+    schema_name=None,
+    tb_name=None,
+):
+    """执行 SQL 查询并返回与旧接口一致的响应结构。"""
+    try:
+        result, context = _prepare_sql_query(
+            user, instance_name, db_name, sql_content, limit_num
+        )
+    except Exception as e:
+        logger.error(
+            "查询异常报错，查询语句：%s，错误信息：%s",
+            sql_content,
+            traceback.format_exc(),
+        )
+        return {"status": 1, "msg": f"查询异常报错，错误信息：{e}", "data": {}}
+    if context is None:
+        return result
+
+    config = context["config"]
+    instance = context["instance"]
+    query_engine = context["query_engine"]
+    sql_content = context["sql_content"]
+    limit_num = context["limit_num"]
+    priv_check = context["priv_check"]
+    try:
         max_execution_time = int(config.get("max_execution_time", 60))
-        if thread_id:
-            schedule_name = f"query-{time.time()}"
-            run_date = datetime.datetime.now() + datetime.timedelta(
-                seconds=max_execution_time
-            )
-            add_kill_conn_schedule(schedule_name, run_date, instance.id, thread_id)
+        schedule_name = _add_kill_schedule(
+            query_engine, instance, db_name, max_execution_time
+        )
         with FuncTimer() as timer:
             seconds_behind_master = query_engine.seconds_behind_master
             query_result = query_engine.query(
@@ -98,7 +149,7 @@ def execute_sql_query(
                 max_execution_time=max_execution_time * 1000,
             )
         query_result.query_time = timer.cost
-        if thread_id:
+        if schedule_name:
             del_schedule(schedule_name)
 
         if query_result.error:
@@ -152,7 +203,7 @@ def execute_sql_query(
         else:
             effect_row = 0
 
-        QueryLog.objects.create(
+        record_query_log(
             username=user.username,
             user_display=user.display,
             db_name=db_name,
@@ -173,3 +224,166 @@ def execute_sql_query(
         result["status"] = 1
         result["msg"] = f"查询异常报错，错误信息：{e}"
     return result
+
+
+def stream_sql_query(
+    user,
+    instance_name,
+    db_name,
+    sql_content,
+    limit_num,
+    schema_name=None,
+    tb_name=None,
+    chunk_size=None,
+):
+    """
+    流式执行 SQL 查询，结果分批产出，分批脱敏，避免整个结果集驻留内存
+    :return: (result, events)，校验或执行失败时events为None，result与execute_sql_query结构一致；
+        否则events依次产出 meta、rows（多次）、end 或 error 事件
+    """
+    try:
+        result, context = _prepare_sql_query(
+            user, instance_name, db_name, sql_content, limit_num
+        )
+    except Exception as e:
+        logger.error(
+            "查询异常报错，查询语句：%s，错误信息：%s",
+            sql_content,
+            traceback.format_exc(),
+        )
+        return {"status": 1, "msg": f"查询异常报错，错误信息：{e}", "data": {}}, None
+    if context is None:
+        return result, None
+
+    config = context["config"]
+    instance = context["instance"]
+    query_engine = context["query_engine"]
+    sql_content = context["sql_content"]
+    limit_num = context["limit_num"]
+    chunk_size = int(chunk_size or settings.QUERY_STREAM_CHUNK_SIZE)
+    schedule_name = None
+    try:
+        max_execution_time = int(config.get("max_execution_time", 60))
+        schedule_name = _add_kill_schedule(
+            query_engine, instance, db_name, max_execution_time
+        )
+        with FuncTimer() as timer:
+            seconds_behind_master = query_engine.seconds_behind_master
+            query_result, chunks = query_engine.query_stream(
+                db_name,
+                sql_content,
+                limit_num,
+                chunk_size=chunk_size,
+                schema_name=schema_name,
+                tb_name=tb_name,
+                max_execution_time=max_execution_time * 1000,
+            )
+        query_result.query_time = timer.cost
+        if query_result.error:
+            raise RuntimeError(query_result.error)
+        masker = None
+        if config.get("data_masking"):
+            try:
+                masker = query_engine.stream_masker(db_name, sql_content, query_result)
+            except Exception as msg:
+                logger.error(traceback.format_exc())
+                if config.get("query_check"):
+                    chunks.close()
+                    result["status"] = 1
+                    result["msg"] = f"数据脱敏异常，请联系管理员，错误信息：{msg}"
+                    return result, None
+                logger.warning(
+                    "数据脱敏异常，按照配置放行，查询语句：%s，错误信息：%s",
+                    sql_content,
+                    msg,
+                )
+    except Exception as e:
+        if schedule_name:
+            del_schedule(schedule_name)
+        logger.error(
+            "查询异常报错，查询语句：%s，错误信息：%s",
+            sql_content,
+            traceback.format_exc(),
+        )
+        result["status"] = 1
+        result["msg"] = f"查询异常报错，错误信息：{e}"
+        return result, None
+
+    def events():
+        effect_row = 0
+        error = None
+        try:
+            meta = {
+                k: v
+                for k, v in query_result.__dict__.items()
+                if k not in ("rows", "affected_rows")
+            }
+            meta["seconds_behind_master"] = seconds_behind_master
+            yield {"type": "meta", "status": 0, "msg": "ok", "data": meta}
+            mask_cost = 0
+            with FuncTimer() as timer:
+                for rows in chunks:
+                    if masker:
+                        with FuncTimer() as mask_timer:
+                            rows = masker(rows)
+                        mask_cost += mask_timer.cost
+                    effect_row += len(rows)
+                    yield {"type": "rows", "rows": rows}
+            query_result.query_time = round(query_result.query_time + timer.cost, 4)
+            query_result.mask_time = round(mask_cost, 4) if masker else ""
+            yield {
+                "type": "end",
+                "data": {
+                    "affected_rows": effect_row,
+                    "query_time": query_result.query_time,
+                    "mask_time": query_result.mask_time,
+                    "is_masked": query_result.is_masked,
+                    "mask_rule_hit": query_result.mask_rule_hit,
+                },
+            }
+        except Exception as e:
+            logger.error(
+                "流式查询异常报错，查询语句：%s，错误信息：%s",
+                sql_content,
+                traceback.format_exc(),
+            )
+            error = str(e)
+            yield {"type": "error", "status": 1, "msg": f"查询异常报错，错误信息：{e}"}
+        finally:
+            chunks.close()
+            if schedule_name:
+                del_schedule(schedule_name)
+            if connection.connection and not connection.is_usable():
+                close_old_connections()
+            record_query_log(
+                username=user.username,
+                user_display=user.display,
+                db_name=db_name,
+                instance_name=instance.instance_name,
+                sqllog=sql_content,
+                effect_row=0 if error else effect_row,
+                cost_time=query_result.query_time,
+                priv_check=context["priv_check"],
+                hit_rule=query_result.mask_rule_hit,
+                masking=query_result.is_masked,
+            )
+
+    return result, events()
+
+
+def encode_ndjson_events(events):
+    """将流式查询事件编码为NDJSON，每个事件一行"""
+    for event in events:
+        try:
+            line = json.dumps(
+                event,
+                use_decimal=False,
+                cls=ExtendJSONEncoderFTime,
+                bigint_as_string=True,
+            )
+        # 虽然能正常返回，但是依然会乱码
+        except UnicodeDecodeError:
+            line = json.dumps(
+                event, default=str, bigint_as_string=True, encoding="latin1"
+            )
+        yield f"{line}\n".encode("utf-8")
@@ -2,23 +2,30 @@
 import MySQLdb
 import simplejson as json
 import datetime
+import time
 import pymysql
 from django.contrib.auth.decorators import permission_required
-from django.db.models import F, Sum, Value as V, Max
+from django.db.models import F, Q, Sum, Value as V, Max
 from django.db.models.functions import Concat
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.cache import cache_page
 from pyecharts.charts import Line
 from pyecharts import options as opts
+from django_q.tasks import async_task
 from common.utils.chart_dao import ChartDao
+from common.utils.permission import superuser_required
 from sql.engines import get_engine
 
 from sql.utils.resource_group import user_instances
+from sql.utils.search_index import slow_query_search
+from sql.utils.slow_query_rollup import get_slow_query_rollup_config
+from sql.utils.tasks import add_slow_query_rollup_schedule
 from common.utils.extend_json_encoder import ExtendJSONEncoder
 from .models import (
     Instance,
     SlowQuery,
     SlowQueryHistory,
+    SlowQueryDailyRollup,
     AliyunRdsConfig,
     RedisSlowQuery,
     RedisSlowQueryHistory,
@@ -117,6 +124,9 @@ def slowquery_review(request):
         result = query_engine.slowquery_review(
             start_time, end_time, db_name, limit, offset
         )
+    elif get_slow_query_rollup_config()["enabled"]:
+        # ============ MySQL 本地实例, 读取慢日志天汇总 ============
+        result = slowquery_review_from_rollup(request, instance_info)
     else:
         # ============ MySQL 本地实例 ============
         limit = offset + limit
@@ -129,14 +139,18 @@ def slowquery_review(request):
             end_time, "%Y-%m-%d"
         ) + datetime.timedelta(days=1)
         filter_kwargs = {"slowqueryhistory__db_max": db_name} if db_name else {}
+        # 使用搜索索引时不再对SQL指纹做模糊匹配
+        search_filter = slow_query_search(search)
+        if search_filter is None:
+            search_filter = Q(fingerprint__icontains=search)
         # 获取慢查数据
         slowsql_obj = (
             SlowQuery.objects.filter(
+                search_filter,
                 slowqueryhistory__hostname_max=(
                     instance_info.host + ":" + str(instance_info.port)
                 ),
                 slowqueryhistory__ts_min__range=(start_time, end_time),
-                fingerprint__icontains=search,
                 **filter_kwargs,
             )
             .annotate(SQLText=Max("fingerprint"), SQLId=F("checksum"))
@@ -187,6 +201,93 @@ def slowquery_review(request):
     )
 
 
+def slowquery_review_from_rollup(request, instance_info):
+    """从慢日志天汇总中获取慢日志统计, 查询量只和时间段内的SQL种类数相关"""
+    start_time = request.POST.get("StartTime")
+    end_time = request.POST.get("EndTime")
+    db_name = request.POST.get("db_name")
+    limit = int(request.POST.get("limit"))
+    offset = int(request.POST.get("offset"))
+    search = request.POST.get("search")
+    sortName = str(request.POST.get("sortName"))
+    sortOrder = str(request.POST.get("sortOrder")).lower()
+    end_time = datetime.datetime.strptime(end_time, "%Y-%m-%d") + datetime.timedelta(
+        days=1
+    )
+    rollup_obj = SlowQueryDailyRollup.objects.filter(
+        hostname=instance_info.host + ":" + str(instance_info.port),
+        ts__gte=start_time,
+        ts__lt=end_time,
+    )
+    if db_name:
+        rollup_obj = rollup_obj.filter(db_name=db_name)
+    if search:
+        search_filter = slow_query_search(search)
+        if search_filter is None:
+            search_filter = Q(
+                checksum__in=SlowQuery.objects.filter(
+                    fingerprint__icontains=search
+                ).values("checksum")
+            )
+        rollup_obj = rollup_obj.filter(search_filter)
+    slowsql_obj = (
+        rollup_obj.values(SQLId=F("checksum"))
+        .annotate(
+            CreateTime=Max("ts_max"),
+            DBName=Max("db_name"),  # 数据库
+            QueryTimeAvg=Sum("query_time_sum") / Sum("ts_cnt"),  # 平均执行时长
+            MySQLTotalExecutionCounts=Sum("ts_cnt"),  # 执行总次数
+            MySQLTotalExecutionTimes=Sum("query_time_sum"),  # 执行总时长
+            ParseTotalRowCounts=Sum("rows_examined_sum"),  # 扫描总行数
+            ReturnTotalRowCounts=Sum("rows_sent_sum"),  # 返回总行数
+            ParseRowAvg=Sum("rows_examined_sum") / Sum("ts_cnt"),  # 平均扫描行数
+            ReturnRowAvg=Sum("rows_sent_sum") / Sum("ts_cnt"),  # 平均返回行数
+        )
+        .order_by()
+    )
+    slow_sql_count = slowsql_obj.count()
+    slow_sql_list = list(
+        slowsql_obj.order_by("-" + sortName if "desc".__eq__(sortOrder) else sortName)[
+            offset : offset + limit
+        ]
+    )
+    # 只查询当前页的SQL指纹
+    fingerprints = dict(
+        SlowQuery.objects.filter(
+            checksum__in=[row["SQLId"] for row in slow_sql_list]
+        ).values_list("checksum", "fingerprint")
+    )
+    sql_slow_log = []
+    for SlowLog in slow_sql_list:
+        SlowLog["SQLText"] = fingerprints.get(SlowLog["SQLId"], "")
+        SlowLog["QueryTimeAvg"] = round(SlowLog["QueryTimeAvg"], 6)
+        SlowLog["MySQLTotalExecutionTimes"] = round(
+            SlowLog["MySQLTotalExecutionTimes"], 6
+        )
+        SlowLog["ParseRowAvg"] = int(SlowLog["ParseRowAvg"])
+        SlowLog["ReturnRowAvg"] = int(SlowLog["ReturnRowAvg"])
+        sql_slow_log.append(SlowLog)
+    return {"total": slow_sql_count, "rows": sql_slow_log}
+
+
+@superuser_required
+def slowquery_rollup(request):
+    """主动触发慢日志汇总，同时写入schedule定期汇总"""
+    config = get_slow_query_rollup_config()
+    if not config["enabled"]:
+        return JsonResponse({"status": 1, "msg": "未开启慢日志汇总"})
+    try:
+        add_slow_query_rollup_schedule(int(config["interval"]))
+        async_task(
+            "sql.utils.slow_query_rollup.rollup_slow_query_history",
+            task_name=f"slow-query-rollup-{time.time()}",
+            timeout=-1,
+        )
+        return JsonResponse({"status": 0, "msg": "触发汇总成功"})
+    except Exception as e:
+        return JsonResponse({"status": 1, "msg": f"触发汇总异常:{e}"})
+
+
 # 获取SQL慢日志明细
 @permission_required("sql.menu_slowquery", raise_exception=True)
 def slowquery_review_history(request):
@@ -18,7 +18,6 @@ from common.config import SysConfig
 from common.utils.const import WorkflowStatus, WorkflowType, WorkflowAction
 from common.utils.extend_json_encoder import ExtendJSONEncoder
 from sql.engines import get_engine
-from sql.engines.models import ReviewResult, ReviewSet
 from sql.notify import notify_for_audit, EventType, notify_for_execute
 from sql.utils.resource_group import user_groups
 from sql.utils.sql_review import (
@@ -29,8 +28,15 @@ from sql.utils.sql_review import (
     can_view,
     can_rollback,
 )
+from sql.utils.execute_progress import get_execute_progress_config, wait_progress
 from sql.utils.tasks import add_sql_schedule, del_schedule
 from sql.utils.workflow_audit import Audit, get_auditor, AuditException
+from sql.utils.workflow_detail import detail_page, load_detail_rows
+from sql.utils.workflow_scheduler import (
+    get_workflow_scheduler_config,
+    queue_position,
+    submit_workflow_execution,
+)
 from .models import SqlWorkflow, WorkflowAudit
 
 logger = logging.getLogger("default")
@@ -122,6 +128,9 @@ def _sql_workflow_list(request):
         "group_name",
         "syntax_type",
         "export_format",
+        "sqlworkflowcontent__warning_count",
+        "sqlworkflowcontent__error_count",
+        "sqlworkflowcontent__affected_rows",
     )
 
     # QuerySet 序列化
@@ -135,51 +144,27 @@ def _sql_workflow_list(request):
 
 
 def detail_content(request):
-    """获取工单内容"""
+    """
+    获取工单内容
+    传入limit时按offset、limit分页返回, 支持按errlevel[]、stage[]过滤
+    """
     workflow_id = request.GET.get("workflow_id")
     workflow_detail = get_object_or_404(SqlWorkflow, pk=workflow_id)
     if not can_view(request.user, workflow_id):
         raise PermissionDenied
-    if workflow_detail.status in ["workflow_finish", "workflow_exception"]:
-        rows = workflow_detail.sqlworkflowcontent.execute_result
-    else:
-        rows = workflow_detail.sqlworkflowcontent.review_content
-
-    review_result = ReviewSet()
-    if rows:
-        try:
-            # 检验rows能不能正常解析
-            loaded_rows = json.loads(rows)
-            #  兼容旧数据'[[]]'格式，转换为新格式[{}]
-            if isinstance(loaded_rows[-1], list):
-                for r in loaded_rows:
-                    review_result.rows += [ReviewResult(inception_result=r)]
-                rows = review_result.json()
-        except IndexError:
-            review_result.rows += [
-                ReviewResult(
-                    id=1,
-                    sql=workflow_detail.sqlworkflowcontent.sql_content,
-                    errormessage="Json decode failed."
-                    "执行结果Json解析失败, 请联系管理员",
-                )
-            ]
-            rows = review_result.json()
-        except json.decoder.JSONDecodeError:
-            review_result.rows += [
-                ReviewResult(
-                    id=1,
-                    sql=workflow_detail.sqlworkflowcontent.sql_content,
-                    # 迫于无法单元测试这里加上英文报错信息
-                    errormessage="Json decode failed."
-                    "执行结果Json解析失败, 请联系管理员",
-                )
-            ]
-            rows = review_result.json()
+    limit = request.GET.get("limit")
+    if limit is None:
+        rows = load_detail_rows(workflow_detail)
+        result = {"total": len(rows), "rows": rows}
     else:
-        rows = workflow_detail.sqlworkflowcontent.review_content
-
-    result = {"rows": json.loads(rows)}
+        total, rows = detail_page(
+            workflow_detail,
+            offset=int(request.GET.get("offset", 0)),
+            limit=int(limit),
+            errlevels=request.GET.getlist("errlevel[]"),
+            stages=request.GET.getlist("stage[]"),
+        )
+        result = {"total": total, "rows": rows}
     return HttpResponse(json.dumps(result), content_type="application/json")
 
 
@@ -312,6 +297,14 @@ def execute(request):
             "errMsg": "不在可执行时间范围内，如果需要修改执行时间请重新提交工单!"
         }
         return render(request, "error.html", context)
+    # 管理员可以指定执行优先级
+    try:
+        priority = int(request.POST.get("priority") or 0)
+    except ValueError:
+        context = {"errMsg": "priority参数必须为整数"}
+        return render(request, "error.html", context, status=400)
+    if not request.user.is_superuser:
+        priority = 0
     # 获取审核信息
     audit_id = Audit.detail_by_workflow_id(
         workflow_id=workflow_id, workflow_type=WorkflowType.SQL_REVIEW
@@ -328,14 +321,17 @@ def execute(request):
         schedule_name = f"sqlreview-timing-{workflow_id}"
         del_schedule(schedule_name)
         # 加入执行队列
-        async_task(
-            "sql.utils.execute_sql.execute",
-            workflow_id,
-            request.user,
-            hook="sql.utils.execute_sql.execute_callback",
-            timeout=-1,
-            task_name=f"sqlreview-execute-{workflow_id}",
-        )
+        if get_workflow_scheduler_config()["enabled"]:
+            submit_workflow_execution(workflow_id, request.user, priority=priority)
+        else:
+            async_task(
+                "sql.utils.execute_sql.execute",
+                workflow_id,
+                request.user,
+                hook="sql.utils.execute_sql.execute_callback",
+                timeout=-1,
+                task_name=f"sqlreview-execute-{workflow_id}",
+            )
         # 增加工单日志
         Audit.add_log(
             audit_id=audit_id,
@@ -509,9 +505,33 @@ def get_workflow_status(request):
     workflow_id = int(workflow_id)
     workflow_detail = get_object_or_404(SqlWorkflow, pk=workflow_id)
     result = {"status": workflow_detail.status, "msg": "", "data": ""}
+    if workflow_detail.status in ["workflow_queuing", "workflow_timingtask"]:
+        result["data"] = {"queue_position": queue_position(workflow_id)}
     return JsonResponse(result)
 
 
+def execute_progress(request):
+    """
+    长轮询获取执行中工单的进度
+    传入已获取的进度版本version, 进度更新或超时后返回, 工单执行结束时返回最终状态
+    未开启执行进度或引擎未上报进度时立即返回
+    """
+    workflow_id = int(request.GET.get("workflow_id", 0))
+    version = int(request.GET.get("version", 0))
+    get_object_or_404(SqlWorkflow, pk=workflow_id)
+    if not can_view(request.user, workflow_id):
+        raise PermissionDenied
+    timeout = None if get_execute_progress_config()["enabled"] else 0
+    progress = wait_progress(workflow_id, version, timeout=timeout)
+    if progress is None:
+        # 引擎未上报进度或进度已过期，返回工单当前状态
+        progress = {
+            "status": SqlWorkflow.objects.get(id=workflow_id).status,
+            "version": version,
+        }
+    return JsonResponse({"status": 0, "msg": "", "data": progress})
+
+
 def osc_control(request):
     """用于mysql控制osc执行"""
     workflow_id = request.POST.get("workflow_id")
@@ -1,4 +1,11 @@
+import base64
 import logging
+import os
+import posixpath
+import uuid
+from contextlib import contextmanager
+
+from azure.storage.blob import BlobBlock
 from django.core.files.storage import FileSystemStorage
 from storages.backends.s3boto3 import S3Boto3Storage
 from storages.backends.azure_storage import AzureStorage
@@ -9,6 +16,42 @@ import json
 logger = logging.getLogger("default")
 
 
+class AzureBlockWriter:
+    """Azure Blob分块写入, 缓冲达到block_size时上传一个块, 关闭时提交块列表"""
+
+    def __init__(self, blob_client, block_size=4 * 1024 * 1024):
+        self.blob_client = blob_client
+        self.block_size = block_size
+        self._buffer = bytearray()
+        self._blocks = []
+
+    def write(self, data):
+        self._buffer.extend(data)
+        if len(self._buffer) >= self.block_size:
+            self._stage_block()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _stage_block(self):
+        if not self._buffer:
+            return
+        block_id = base64.b64encode(uuid.uuid4().hex.encode()).decode()
+        self.blob_client.stage_block(block_id, bytes(self._buffer))
+        self._blocks.append(BlobBlock(block_id=block_id))
+        self._buffer.clear()
+
+    def close(self):
+        self._stage_block()
+        self.blob_client.commit_block_list(self._blocks)
+
+    def abort(self):
+        # 未提交的块会由Azure自动清理
+        self._buffer.clear()
+        self._blocks = []
+
+
 class DynamicStorage:
     """动态存储适配器，根据配置选择实际存储后端"""
 
@@ -170,6 +213,51 @@ class DynamicStorage:
 
         return AzureStorage(**azure_params)
 
+    @contextmanager
+    def open_writer(self, name):
+        """
+        以流的方式写入文件, 不经过本地临时文件, 写入异常时删除已写入的部分
+        本地和SFTP直接写入目标路径, S3使用分片上传, Azure分块上传后提交
+        :param name: 文件名
+        :return: 支持write的二进制文件对象
+        """
+        writer = self._open_writer(name)
+        try:
+            yield writer
+        except BaseException:
+            try:
+                if hasattr(writer, "abort"):
+                    writer.abort()
+                else:
+                    writer.close()
+                    self.delete(name)
+            except Exception as e:
+                logger.warning(f"清理未写入完成的文件{name}失败：{e}")
+            raise
+        writer.close()
+
+    def _open_writer(self, name):
+        if self.storage_type == "local":
+            path = self.storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return open(path, "wb")
+        if self.storage_type == "sftp":
+            path = self.storage._remote_path(name)
+            dirname = posixpath.dirname(path)
+            if not self.storage._path_exists(dirname):
+                self.storage._mkdir(dirname)
+            f = self.storage.sftp.open(path, "wb")
+            # 不等待每次写入的确认，提高写入速度
+            f.set_pipelined(True)
+            return f
+        if self.storage_type == "azure":
+            blob_client = self.storage.client.get_blob_client(
+                self.storage._get_valid_path(name)
+            )
+            return AzureBlockWriter(blob_client)
+        # S3File写入时按AWS_S3_FILE_BUFFER_SIZE分片上传
+        return self.storage.open(name, "wb")
+
     def check_connection(self):
         """测试存储连接是否有效，返回 (状态, 错误信息)"""
         # 本地存储默认连接有效，无需测试
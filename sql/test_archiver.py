@@ -3,7 +3,7 @@ from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.auth.models import Permission
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from pytest_django.asserts import assertTemplateUsed
 
 from common.config import SysConfig
@@ -14,6 +14,7 @@ from sql.models import (
     Instance,
     ResourceGroup,
     ArchiveConfig,
+    ArchiveLog,
     WorkflowAudit,
     WorkflowAuditSetting,
 )
@@ -193,6 +194,49 @@ class TestArchiver(TestCase):
             {"data": {}, "msg": "新建审批流失败, 请联系管理员", "status": 1},
         )
 
+    def test_archive_apply_invalid_priority(self):
+        """
+        测试申请归档实例数据，优先级不是整数
+        :return:
+        """
+        data = {
+            "title": "title",
+            "group_name": self.res_group.group_name,
+            "src_instance_name": self.ins.instance_name,
+            "src_db_name": "src_db_name",
+            "src_table_name": "src_table_name",
+            "mode": "purge",
+            "condition": "1=1",
+            "no_delete": "false",
+            "priority": "high",
+        }
+        self.client.force_login(self.superuser)
+        r = self.client.post(path="/archive/apply/", data=data)
+        self.assertDictEqual(
+            json.loads(r.content),
+            {"status": 1, "msg": "优先级必须为整数！", "data": {}},
+        )
+
+    @patch("sql.archiver.submit_archive_tasks")
+    def test_archive_once(self, _submit):
+        """
+        测试单次立即调用归档任务
+        :return:
+        """
+        self.client.force_login(self.superuser)
+        r = self.client.get(path="/archive/once/")
+        self.assertEqual(json.loads(r.content)["msg"], "归档任务id不正确！")
+        r = self.client.get(path="/archive/once/", data={"archive_id": "abc"})
+        self.assertEqual(json.loads(r.content)["msg"], "归档任务id不正确！")
+        r = self.client.get(path="/archive/once/", data={"archive_id": 999999})
+        self.assertEqual(json.loads(r.content)["msg"], "归档任务不存在！")
+        _submit.assert_not_called()
+        r = self.client.get(
+            path="/archive/once/", data={"archive_id": self.archive_apply.id}
+        )
+        self.assertEqual(json.loads(r.content)["status"], 0)
+        _submit.assert_called_once_with([str(self.archive_apply.id)])
+
     @patch("sql.archiver.async_task")
     def test_archive_apply(self, _async_task):
         """
@@ -289,6 +333,28 @@ class TestArchiver(TestCase):
         with self.assertRaises(Exception):
             archive(self.archive_apply.id)
 
+    @override_settings(ARCHIVER_ENGINE="native")
+    @patch("sql.archiver.NativeArchiver")
+    def test_native_archive(self, _archiver):
+        """
+        测试原生归档记录归档日志
+        :return:
+        """
+        archiver = _archiver.return_value
+        archiver.select_cnt = 10
+        archiver.insert_cnt = 10
+        archiver.delete_cnt = 9
+        archiver.command = "native-archiver"
+        archiver.statistics = "SELECT 10"
+        self.archive_apply.mode = "dest"
+        self.archive_apply.no_delete = False
+        self.archive_apply.save()
+        with self.assertRaises(Exception):
+            archive(self.archive_apply.id)
+        archive_log = ArchiveLog.objects.get(archive=self.archive_apply)
+        self.assertFalse(archive_log.success)
+        self.assertEqual(archive_log.error_info, "删除和写入数量不一致:10!=9")
+
     @patch("sql.archiver.async_task")
     def test_archive_log(self, _async_task):
         """
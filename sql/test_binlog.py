@@ -773,6 +773,107 @@ def test_my2sql_extra_options(
     assert args_passed["file-per-table"] is True
 
 
+@patch("sql.binlog.submit_binlog_store_sync")
+@patch("sql.binlog.async_task")
+@patch("sql.binlog.BinlogStore")
+def test_my2sql_from_store(
+    mock_store_cls,
+    mock_async_task,
+    mock_submit_sync,
+    client_with_super_user,
+    db_instance,
+    settings,
+):
+    """启用binlog解析结果存储时从存储分页读取"""
+    settings.BINLOG_STORE = {"enabled": True}
+    mock_store = MagicMock()
+    mock_store.pending_files.return_value = []
+    mock_store.query.return_value = ([{"sql": "INSERT INTO t1 VALUES(1);"}], 100)
+    mock_store_cls.return_value = mock_store
+
+    data = {
+        "instance_name": db_instance.instance_name,
+        "save_sql": "true",
+        "rollback": "false",
+        "num": "30",
+        "offset": "30",
+        "threads": "4",
+        "start_file": "mysql-bin.000001",
+        "start_pos": "",
+        "end_file": "mysql-bin.000002",
+        "end_pos": "",
+        "stop_time": "",
+        "start_time": "",
+        "only_schemas": ["db1"],
+        "sql_type[]": ["INSERT"],
+        "extra_info": "false",
+        "ignore_primary_key": "false",
+        "full_columns": "false",
+        "no_db_prefix": "false",
+        "file_per_table": "false",
+    }
+    r = client_with_super_user.post("/binlog/my2sql/", data=data)
+    result = json.loads(r.content)
+    assert result["status"] == 0
+    assert result["total"] == 100
+    assert result["data"] == [{"sql": "INSERT INTO t1 VALUES(1);"}]
+    # 范围内的binlog已解析时直接读取存储
+    mock_store.sync.assert_not_called()
+    mock_submit_sync.assert_not_called()
+    assert "parsing" not in result
+    query_kwargs = mock_store.query.call_args.kwargs
+    assert query_kwargs["offset"] == 30
+    assert query_kwargs["limit"] == 30
+    assert query_kwargs["schemas"] == ["db1"]
+    assert query_kwargs["sql_types"] == ["INSERT"]
+    mock_async_task.assert_called_once()
+    assert mock_async_task.call_args.kwargs["filters"]["stop_file"] == (
+        "mysql-bin.000002"
+    )
+
+
+@patch("sql.binlog.submit_binlog_store_sync")
+@patch("sql.binlog.BinlogStore")
+def test_my2sql_from_store_parsing(
+    mock_store_cls, mock_submit_sync, client_with_super_user, db_instance, settings
+):
+    """存储中未解析完的binlog提交后台解析，先返回已解析的结果"""
+    settings.BINLOG_STORE = {"enabled": True}
+    mock_store = MagicMock()
+    mock_store.pending_files.return_value = ["mysql-bin.000002"]
+    mock_store.query.return_value = ([{"sql": "INSERT INTO t1 VALUES(1);"}], 1)
+    mock_store_cls.return_value = mock_store
+
+    data = {
+        "instance_name": db_instance.instance_name,
+        "save_sql": "false",
+        "rollback": "false",
+        "num": "30",
+        "threads": "4",
+        "start_file": "mysql-bin.000001",
+        "start_pos": "",
+        "end_file": "mysql-bin.000002",
+        "end_pos": "",
+        "stop_time": "",
+        "start_time": "",
+        "extra_info": "false",
+        "ignore_primary_key": "false",
+        "full_columns": "false",
+        "no_db_prefix": "false",
+        "file_per_table": "false",
+    }
+    r = client_with_super_user.post("/binlog/my2sql/", data=data)
+    result = json.loads(r.content)
+    assert result["status"] == 0
+    assert result["parsing"] == ["mysql-bin.000002"]
+    assert result["data"] == [{"sql": "INSERT INTO t1 VALUES(1);"}]
+    mock_store.sync.assert_not_called()
+    assert mock_submit_sync.call_args.args[2:] == (
+        "mysql-bin.000001",
+        "mysql-bin.000002",
+    )
+
+
 @pytest.mark.django_db(transaction=True)
 def test_my2sql_no_permission(db_instance):
     """无权限用户访问被拒"""
@@ -809,7 +910,10 @@ def test_my2sql_file_success(mock_makedirs, mock_my2sql_cls, db_instance, settin
     }
 
     result = my2sql_file(args, user)
-    assert result == (user, os.path.join("/tmp/archery_test", "downloads/my2sql/"))
+    assert result == (
+        user,
+        os.path.join("/tmp/archery_test", "downloads/my2sql/", str(db_instance.id)),
+    )
     # 验证参数中 instance 被弹出
     call_args = mock_my2sql.generate_args2cmd.call_args[0][0]
     assert "instance" not in call_args
@@ -866,3 +970,45 @@ def test_my2sql_file_execute_cmd_called(
 
     my2sql_file(args, user)
     mock_my2sql.execute_cmd.assert_called_once_with(["my2sql", "-output-dir", "/tmp"])
+
+
+# ====================== my2sql_output 测试 ======================
+
+
+def test_my2sql_output(client_with_super_user, db_instance, settings, tmp_path):
+    """分页浏览实例保存的解析结果并返回总数"""
+    settings.BASE_DIR = str(tmp_path)
+    output_dir = tmp_path / "downloads" / "my2sql" / str(db_instance.id)
+    output_dir.mkdir(parents=True)
+    (output_dir / "forward.1.sql").write_text(
+        "INSERT INTO t1 VALUES(1)\nDELETE FROM t1 WHERE id=1\nINSERT INTO t2 VALUES(1)\n",
+        encoding="utf-8",
+    )
+    # 其他实例的文件不读取
+    other_dir = tmp_path / "downloads" / "my2sql" / str(db_instance.id + 1)
+    other_dir.mkdir(parents=True)
+    (other_dir / "forward.1.sql").write_text(
+        "INSERT INTO t3 VALUES(1)\n", encoding="utf-8"
+    )
+    r = client_with_super_user.post(
+        "/binlog/my2sql_output/",
+        data={
+            "instance_name": db_instance.instance_name,
+            "offset": 1,
+            "limit": 1,
+            "sql_type[]": ["insert"],
+        },
+    )
+    result = json.loads(r.content)
+    assert result["status"] == 0
+    assert result["total"] == 2
+    assert result["data"] == [{"sql": "INSERT INTO t2 VALUES(1);"}]
+
+
+def test_my2sql_output_instance_not_exist(client_with_super_user, db):
+    """实例不存在或无权限时不读取文件"""
+    r = client_with_super_user.post(
+        "/binlog/my2sql_output/", data={"instance_name": "not_exist"}
+    )
+    result = json.loads(r.content)
+    assert result["status"] == 1
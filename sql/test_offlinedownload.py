@@ -1,4 +1,4 @@
-from unittest.mock import patch, MagicMock, Mock, mock_open
+from unittest.mock import patch, MagicMock, Mock
 from django.test import TestCase, Client
 from django.conf import settings
 from django.http import HttpRequest
@@ -12,13 +12,18 @@ import simplejson as json
 import pandas as pd
 import csv
 import xml.etree.ElementTree as ET
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+from common.utils.testing import LOCMEM_CACHES
 from sql.models import SqlWorkflow, SqlWorkflowContent, Instance, Config, AuditEntry
 from sql.offlinedownload import (
     OffLineDownLoad,
     StorageFileResponse,
+    parallel_export_to_storage,
     get_single_export_statement,
     save_to_format_file,
+    stream_to_format_file,
     save_csv,
     save_json,
     save_xml,
@@ -260,6 +265,8 @@ class TestOfflineDownload(TestCase):
             "bad_query": False,
             "filtered_sql": "SELECT * FROM test_table",
         }
+        mock_engine.filter_sql.return_value = "SELECT * FROM test_table LIMIT 10001;"
+        mock_engine.estimate_rows.return_value = None
         mock_engine.query.return_value = mock_result_set
         mock_get_engine.return_value = mock_engine
 
@@ -274,12 +281,80 @@ class TestOfflineDownload(TestCase):
         self.assertEqual(result.warning_count, 0)
         self.assertEqual(result.rows[0].stagestatus, "行数统计完成")
         self.assertEqual(result.rows[0].affected_rows, 500)
+        mock_engine.query.assert_called_once_with(
+            db_name="test_db",
+            sql="SELECT COUNT(*) FROM (SELECT * FROM test_table LIMIT 10001) t",
+            max_execution_time=10000,
+        )
+
+    @patch("sql.offlinedownload.get_engine")
+    def test_pre_count_check_exact_count(self, mock_get_engine):
+        """
+        测试pre_count_check方法 - 准确统计行数时执行完整的COUNT
+        """
+        mock_engine = MagicMock()
+        mock_engine.query_check.return_value = {
+            "bad_query": False,
+            "filtered_sql": "SELECT * FROM test_table",
+        }
+        mock_engine.query.return_value = ResultSet(rows=[(500,)])
+        mock_get_engine.return_value = mock_engine
+        self.workflow.sql_content = "SELECT * FROM test_table"
+
+        result = OffLineDownLoad().pre_count_check(self.workflow, exact_count=True)
+
+        self.assertEqual(result.error_count, 0)
+        self.assertEqual(result.rows[0].affected_rows, 500)
+        mock_engine.estimate_rows.assert_not_called()
         mock_engine.query.assert_called_once_with(
             db_name="test_db",
             sql="SELECT COUNT(*) FROM (SELECT * FROM test_table) t",
             max_execution_time=60000,
         )
 
+    @patch("sql.offlinedownload.get_engine")
+    def test_pre_count_check_estimate(self, mock_get_engine):
+        """
+        测试pre_count_check方法 - 执行计划预估行数未超过阈值时不再查询
+        """
+        mock_engine = MagicMock()
+        mock_engine.query_check.return_value = {
+            "bad_query": False,
+            "filtered_sql": "SELECT * FROM test_table",
+        }
+        mock_engine.estimate_rows.return_value = 800
+        mock_get_engine.return_value = mock_engine
+        self.workflow.sql_content = "SELECT * FROM test_table"
+
+        result = OffLineDownLoad().pre_count_check(self.workflow)
+
+        self.assertEqual(result.error_count, 0)
+        self.assertEqual(result.rows[0].stagestatus, "行数预估完成")
+        self.assertEqual(result.rows[0].affected_rows, 800)
+        mock_engine.query.assert_not_called()
+
+    @patch("sql.offlinedownload.get_engine")
+    def test_pre_count_check_estimate_over_limit_probe(self, mock_get_engine):
+        """
+        测试pre_count_check方法 - 预估行数超过阈值时按限量探测的结果判断
+        """
+        mock_engine = MagicMock()
+        mock_engine.query_check.return_value = {
+            "bad_query": False,
+            "filtered_sql": "SELECT * FROM test_table",
+        }
+        mock_engine.estimate_rows.return_value = 50000
+        mock_engine.filter_sql.return_value = "SELECT * FROM test_table LIMIT 10001"
+        mock_engine.query.return_value = ResultSet(rows=[(300,)])
+        mock_get_engine.return_value = mock_engine
+        self.workflow.sql_content = "SELECT * FROM test_table"
+
+        result = OffLineDownLoad().pre_count_check(self.workflow)
+
+        self.assertEqual(result.error_count, 0)
+        self.assertEqual(result.rows[0].affected_rows, 300)
+        mock_engine.query.assert_called_once()
+
     @patch("sql.offlinedownload.get_engine")
     def test_pre_count_check_over_limit(self, mock_get_engine):
         """
@@ -443,10 +518,9 @@ class TestOfflineDownload(TestCase):
 
     @patch("sql.offlinedownload.get_engine")
     @patch("sql.offlinedownload.DynamicStorage")
-    @patch("sql.offlinedownload.save_to_format_file")
-    @patch("builtins.open", new_callable=mock_open)
+    @patch("sql.offlinedownload.stream_to_format_file")
     def test_execute_offline_download_success(
-        self, mock_open_file, mock_save_format, mock_storage, mock_get_engine
+        self, mock_stream_format, mock_storage, mock_get_engine
     ):
         """
         测试execute_offline_download方法 - 成功执行
@@ -454,23 +528,23 @@ class TestOfflineDownload(TestCase):
 
         # 模拟依赖
         mock_engine = MagicMock()
-        mock_result_set = MagicMock()
-        mock_result_set.error = None
-        mock_result_set.column_list = ["id", "name"]
-        mock_result_set.rows = [(1, "test1"), (2, "test2")]
-        mock_result_set.affected_rows = 2
-        mock_engine.query.return_value = mock_result_set
+        mock_result_set = ResultSet(column_list=["id", "name"])
+        mock_engine.query_stream.return_value = (
+            mock_result_set,
+            iter([[(1, "test1"), (2, "test2")], [(3, "test3")]]),
+        )
         mock_get_engine.return_value = mock_engine
 
-        mock_save_format.return_value = "test_file.zip"
+        def consume(format_type, result, workflow, columns, storage, column_types):
+            self.assertEqual(columns, ["id", "name"])
+            self.assertEqual(len(list(result)), 3)
+            return "test_file.zip"
+
+        mock_stream_format.side_effect = consume
 
         mock_storage_instance = MagicMock()
         mock_storage.return_value = mock_storage_instance
 
-        # 模拟文件打开
-        mock_file = MagicMock()
-        mock_open_file.return_value = mock_file
-
         # 执行测试
         offline_download = OffLineDownLoad()
         result = offline_download.execute_offline_download(self.workflow)
@@ -479,6 +553,9 @@ class TestOfflineDownload(TestCase):
         self.assertEqual(result.error, None)
         self.assertEqual(result.rows[0].stagestatus, "执行正常")
         self.assertIn("test_file.zip", result.rows[0].errormessage)
+        self.assertEqual(result.rows[0].affected_rows, 3)
+        mock_engine.query.assert_not_called()
+        mock_storage_instance.close.assert_called_once()
 
         # 验证workflow已更新
         updated_workflow = SqlWorkflow.objects.get(id=self.workflow.id)
@@ -493,9 +570,9 @@ class TestOfflineDownload(TestCase):
 
         # 模拟数据库查询错误
         mock_engine = MagicMock()
-        mock_result_set = MagicMock()
+        mock_result_set = ResultSet()
         mock_result_set.error = "Database error"
-        mock_engine.query.return_value = mock_result_set
+        mock_engine.query_stream.return_value = (mock_result_set, iter(()))
         mock_get_engine.return_value = mock_engine
 
         # 模拟DynamicStorage
@@ -511,6 +588,56 @@ class TestOfflineDownload(TestCase):
         self.assertEqual(result.rows[0].stagestatus, "异常终止")
         self.assertEqual(result.rows[0].errormessage, "Database error")
 
+    @patch("sql.offlinedownload.get_engine")
+    def test_execute_offline_download_stream_error_removes_file(self, mock_get_engine):
+        """
+        测试execute_offline_download方法 - 读取中途失败时删除未写完的文件并关闭游标
+        """
+        local_path = tempfile.mkdtemp()
+        Config.objects.create(item="local_path", value=local_path)
+
+        def chunks():
+            yield [(1, "test1")]
+            raise Exception("Lost connection")
+
+        row_chunks = chunks()
+        mock_engine = MagicMock()
+        mock_engine.query_stream.return_value = (
+            ResultSet(column_list=["id", "name"]),
+            row_chunks,
+        )
+        mock_get_engine.return_value = mock_engine
+
+        try:
+            result = OffLineDownLoad().execute_offline_download(self.workflow)
+            self.assertEqual(result.rows[0].errormessage, "Lost connection")
+            self.assertEqual(os.listdir(local_path), [])
+        finally:
+            shutil.rmtree(local_path)
+
+    @patch("sql.offlinedownload.get_engine")
+    def test_execute_offline_download_over_max_rows(self, mock_get_engine):
+        """
+        测试execute_offline_download方法 - 执行时行数超过阈值则停止导出并删除文件
+        """
+        local_path = tempfile.mkdtemp()
+        Config.objects.create(item="local_path", value=local_path)
+        Config.objects.create(item="max_export_rows", value="2")
+        mock_engine = MagicMock()
+        mock_engine.query_stream.return_value = (
+            ResultSet(column_list=["id", "name"]),
+            iter([[(1, "test1"), (2, "test2")], [(3, "test3")]]),
+        )
+        mock_get_engine.return_value = mock_engine
+
+        try:
+            result = OffLineDownLoad().execute_offline_download(self.workflow)
+            self.assertEqual(result.rows[0].stagestatus, "异常终止")
+            self.assertIn("超过阈值(2)", result.rows[0].errormessage)
+            self.assertEqual(os.listdir(local_path), [])
+        finally:
+            shutil.rmtree(local_path)
+
     def test_save_csv(self):
         """
         测试save_csv方法
@@ -706,8 +833,8 @@ class TestOfflineDownload(TestCase):
 
         os.unlink(temp_file.name)
 
-    @patch("sql.offlinedownload.pd.DataFrame")
-    def test_save_xlsx_large_file(self, mock_dataframe):
+    @patch("sql.offlinedownload.EXCEL_MAX_ROWS", 2)
+    def test_save_xlsx_large_file(self):
         """
         测试save_xlsx方法处理超过Excel行数限制的情况
         """
@@ -716,13 +843,8 @@ class TestOfflineDownload(TestCase):
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
         temp_file.close()
 
-        # 模拟pd.DataFrame.to_excel抛出异常
-        mock_dataframe.return_value.to_excel.side_effect = ValueError(
-            "Excel max rows exceeded"
-        )
-
-        # 测试数据（不需要实际生成大量数据）
-        result = [(1, "test1")]
+        # 测试数据（表头加两行超过模拟的行数限制）
+        result = [(1, "test1"), (2, "test2")]
         columns = ["id", "name"]
 
         # 执行测试并验证异常
@@ -855,6 +977,140 @@ class TestOfflineDownload(TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_save_to_format_file_columnar(self):
+        """
+        测试save_to_format_file方法 - Parquet和Arrow格式保留列类型且不再压缩为zip
+        """
+        temp_dir = tempfile.mkdtemp()
+        result = [
+            (1, "test1", datetime(2024, 1, 1, 12, 0, 0), None),
+            (2, None, datetime(2024, 1, 2, 12, 0, 0), date(2024, 1, 2)),
+        ]
+        columns = ["id", "name", "created_at", "id"]
+        column_types = ["LONG", "VAR_STRING", "DATETIME", "DATE"]
+
+        try:
+            for format_type in ["parquet", "arrow"]:
+                file_name = save_to_format_file(
+                    format_type,
+                    result,
+                    self.workflow,
+                    columns,
+                    temp_dir,
+                    column_types=column_types,
+                )
+                self.assertTrue(file_name.endswith(f".{format_type}"))
+                file_path = os.path.join(temp_dir, file_name)
+                if format_type == "parquet":
+                    table = pq.read_table(file_path)
+                else:
+                    table = pa.ipc.open_file(file_path).read_all()
+                self.assertEqual(table.num_rows, 2)
+                self.assertEqual(
+                    table.column_names, ["id", "name", "created_at", "id_1"]
+                )
+                self.assertEqual(table.schema.field("id").type, pa.int64())
+                self.assertEqual(
+                    table.schema.field("created_at").type, pa.timestamp("us")
+                )
+                self.assertEqual(table.schema.field("id_1").type, pa.date32())
+                self.assertEqual(table.column("name").to_pylist(), ["test1", None])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    @patch("sql.offlinedownload.get_engine")
+    def test_parallel_export_to_storage(self, mock_get_engine):
+        """
+        测试parallel_export_to_storage方法 - 分片按顺序写入压缩包，跳过空分片
+        """
+        chunk_rows = {
+            "chunk1": [[(1, "test1")], [(2, "test2")]],
+            "chunk2": [],
+            "chunk3": [[(3, "test3")]],
+        }
+
+        def query_stream(db_name, sql, **kwargs):
+            return ResultSet(column_list=["id", "name"]), iter(chunk_rows[sql])
+
+        mock_get_engine.return_value.query_stream.side_effect = query_stream
+        local_path = tempfile.mkdtemp()
+        storage = DynamicStorage(
+            config_dict={"storage_type": "local", "local_path": local_path}
+        )
+
+        try:
+            with self.settings(CACHES=LOCMEM_CACHES):
+                zip_file_name, rows = parallel_export_to_storage(
+                    self.instance,
+                    self.workflow,
+                    ["chunk1", "chunk2", "chunk3"],
+                    storage,
+                )
+            self.assertEqual(rows, 3)
+            with zipfile.ZipFile(os.path.join(local_path, zip_file_name)) as zipf:
+                file_list = zipf.namelist()
+                self.assertEqual(len(file_list), 2)
+                self.assertTrue(file_list[0].endswith(".part00001.csv"))
+                self.assertEqual(
+                    zipf.read(file_list[1]).decode("utf-8").splitlines(),
+                    ['"id","name"', '"3","test3"'],
+                )
+        finally:
+            shutil.rmtree(local_path)
+
+    @patch("sql.offlinedownload.get_engine")
+    def test_parallel_export_to_storage_over_max_rows(self, mock_get_engine):
+        """
+        测试parallel_export_to_storage方法 - 分片累计行数超过阈值时停止导出
+        """
+        mock_get_engine.return_value.query_stream.side_effect = (
+            lambda db_name, sql, **kwargs: (
+                ResultSet(column_list=["id"]),
+                iter([[(1,), (2,)]]),
+            )
+        )
+        local_path = tempfile.mkdtemp()
+        storage = DynamicStorage(
+            config_dict={"storage_type": "local", "local_path": local_path}
+        )
+
+        try:
+            with self.settings(CACHES=LOCMEM_CACHES):
+                with self.assertRaisesMessage(Exception, "超过阈值(3)"):
+                    parallel_export_to_storage(
+                        self.instance,
+                        self.workflow,
+                        ["chunk1", "chunk2", "chunk3"],
+                        storage,
+                        max_rows=3,
+                    )
+            self.assertEqual(os.listdir(local_path), [])
+        finally:
+            shutil.rmtree(local_path)
+
+    def test_stream_to_format_file(self):
+        """
+        测试stream_to_format_file方法 - 结果直接写入存储中的压缩文件
+        """
+        local_path = tempfile.mkdtemp()
+        storage = DynamicStorage(
+            config_dict={"storage_type": "local", "local_path": local_path}
+        )
+        rows = ((i, f"test{i}") for i in range(1000))
+
+        try:
+            zip_file_name = stream_to_format_file(
+                "csv", rows, self.workflow, ["id", "name"], storage
+            )
+            with zipfile.ZipFile(os.path.join(local_path, zip_file_name)) as zipf:
+                file_list = zipf.namelist()
+                self.assertEqual(len(file_list), 1)
+                content = zipf.read(file_list[0]).decode("utf-8").splitlines()
+            self.assertEqual(len(content), 1001)
+            self.assertEqual(content[1], '"0","test0"')
+        finally:
+            shutil.rmtree(local_path)
+
     def test_save_to_format_file_unsupported(self):
         """
         测试save_to_format_file方法 - 不支持的格式
@@ -885,12 +1141,8 @@ class TestOfflineDownload(TestCase):
 
         # 模拟依赖
         mock_engine = MagicMock()
-        mock_result_set = MagicMock()
-        mock_result_set.error = None
-        mock_result_set.column_list = ["id", "name"]
-        mock_result_set.rows = []
-        mock_result_set.affected_rows = 0
-        mock_engine.query.return_value = mock_result_set
+        mock_result_set = ResultSet(column_list=["id", "name"])
+        mock_engine.query_stream.return_value = (mock_result_set, iter(()))
         mock_get_engine.return_value = mock_engine
 
         # 执行测试
@@ -4,12 +4,13 @@ from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.auth.models import Permission
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from pytest_django.asserts import assertRedirects
 
 import sql.query_privileges
 from common.config import SysConfig
 from common.utils.const import WorkflowAction, WorkflowStatus
+from common.utils.testing import LOCMEM_CACHES
 from sql.models import (
     Instance,
     InstanceTag,
@@ -483,6 +484,83 @@ class TestQueryPrivilegesCheck(TestCase):
         )
         self.assertEqual(r, 1)
 
+    @override_settings(
+        CACHES=LOCMEM_CACHES,
+        QUERY_PRIV_CACHE_TTL=60,
+    )
+    def test_priv_snapshot_cached_and_invalidated(self):
+        """
+        测试权限快照一次加载后内存查找，授权变更后快照失效
+        :return:
+        """
+        priv = QueryPrivileges.objects.create(
+            user_name=self.user.username,
+            instance=self.slave,
+            db_name=self.db_name,
+            table_name="tb1",
+            valid_date=date.today() + timedelta(days=1),
+            limit_num=10,
+            priv_type=2,
+        )
+        # 首次加载查询一次，之后的库表校验和limit计算不再查库
+        with self.assertNumQueries(1):
+            snapshot = sql.query_privileges._priv_snapshot(self.user, self.slave)
+            self.assertFalse(
+                sql.query_privileges._db_priv(
+                    self.user, self.slave, self.db_name, snapshot=snapshot
+                )
+            )
+            self.assertEqual(
+                sql.query_privileges._priv_limit(
+                    self.user, self.slave, self.db_name, "tb1", snapshot=snapshot
+                ),
+                10,
+            )
+        with self.assertNumQueries(0):
+            sql.query_privileges._priv_snapshot(self.user, self.slave)
+        # 回收权限后快照失效
+        QueryPrivileges.objects.filter(pk=priv.pk).update(is_deleted=1)
+        sql.query_privileges.invalidate_priv_snapshot(self.user.username)
+        self.assertFalse(
+            sql.query_privileges._tb_priv(self.user, self.slave, self.db_name, "tb1")
+        )
+        # 新增权限通过信号使快照失效
+        QueryPrivileges.objects.create(
+            user_name=self.user.username,
+            instance=self.slave,
+            db_name="*",
+            valid_date=date.today() + timedelta(days=1),
+            limit_num=20,
+            priv_type=1,
+        )
+        self.assertEqual(
+            sql.query_privileges._db_priv(self.user, self.slave, self.db_name), 20
+        )
+
+    def test_snapshot_limit_expired(self):
+        """
+        测试快照缓存期间到期的权限不再生效
+        :return:
+        """
+        snapshot = [
+            (1, "db1", "", 10, date.today() - timedelta(days=1)),
+            (1, "*", "", 20, date.today()),
+            (2, "db1", "tb1", 30, date.today()),
+        ]
+        self.assertEqual(
+            sql.query_privileges._snapshot_limit(snapshot, 1, ["db1", "*"]), 20
+        )
+        self.assertEqual(
+            sql.query_privileges._snapshot_limit(snapshot, 2, ["db1"], "tb1"), 30
+        )
+        self.assertFalse(
+            sql.query_privileges._snapshot_limit(snapshot, 2, ["db1"], "tb2")
+        )
+        # 库表名不区分大小写
+        self.assertEqual(
+            sql.query_privileges._snapshot_limit(snapshot, 2, ["DB1"], "Tb1"), 30
+        )
+
     @patch("sql.engines.goinception.GoInceptionEngine.query_print")
     def test_table_ref(self, _query_print):
         """
@@ -652,6 +730,31 @@ class TestQueryPrivilegesCheck(TestCase):
             },
         )
 
+    @override_settings(MYSQL_QUERY_CHECK_MODE="fast")
+    @patch("sql.engines.mysql.MysqlEngine.explain_check")
+    @patch("sql.query_privileges._table_ref")
+    def test_query_priv_check_table_ref_Exception_fast_mode(
+        self, __table_ref, _explain_check
+    ):
+        """
+        测试用户权限校验，查询校验为fast模式时，语句无法解析返回explain的语法错误信息
+        :return:
+        """
+        __table_ref.side_effect = RuntimeError("语法错误")
+        _explain_check.return_value = "(1064, 'You have an error in your SQL syntax')"
+        r = sql.query_privileges.query_priv_check(
+            user=self.user,
+            instance=self.slave,
+            db_name=self.db_name,
+            sql_content="select * form archery.sql_users;",
+            limit_num=100,
+        )
+        self.assertEqual(r["status"], 1)
+        self.assertEqual(r["msg"], "(1064, 'You have an error in your SQL syntax')")
+        _explain_check.assert_called_once_with(
+            self.db_name, "select * form archery.sql_users;"
+        )
+
     @patch("sql.query_privileges._db_priv", return_value=False)
     def test_query_priv_check_with_pgsql_db_priv(self, __db_priv):
         """
@@ -314,13 +314,15 @@ def test_execute_sql_query_instance_not_found(monkeypatch):
 
 @pytest.mark.django_db
 def test_execute_sql_query_bad_query_rejected(monkeypatch):
+    closed = []
     fake_engine = SimpleNamespace(
         query_check=lambda **kwargs: {
             "bad_query": True,
             "msg": "bad",
             "filtered_sql": "select 1",
             "has_star": False,
-        }
+        },
+        close=lambda: closed.append(True),
     )
     monkeypatch.setattr(
         sqlquery_service,
@@ -342,17 +344,20 @@ def test_execute_sql_query_bad_query_rejected(monkeypatch):
 
     assert result["status"] == 1
     assert result["msg"] == "bad"
+    assert closed == [True]
 
 
 @pytest.mark.django_db
 def test_execute_sql_query_priv_check_failed(monkeypatch):
+    closed = []
     fake_engine = SimpleNamespace(
         query_check=lambda **kwargs: {
             "bad_query": False,
             "msg": "",
             "filtered_sql": "select 1",
             "has_star": False,
-        }
+        },
+        close=lambda: closed.append(True),
     )
     monkeypatch.setattr(
         sqlquery_service,
@@ -379,6 +384,8 @@ def test_execute_sql_query_priv_check_failed(monkeypatch):
 
     assert result["status"] == 2
     assert result["msg"] == "no priv"
+    # 严格模式语法校验保留的连接在未通过权限校验时释放
+    assert closed == [True]
 
 
 @pytest.mark.django_db
@@ -422,8 +429,8 @@ def test_execute_sql_query_success_and_querylog_created(monkeypatch):
         },
     )
     monkeypatch.setattr(
-        sqlquery_service.QueryLog.objects,
-        "create",
+        sqlquery_service,
+        "record_query_log",
         lambda **kwargs: created.update(kwargs),
     )
     monkeypatch.setattr(sqlquery_service.connection, "connection", None)
@@ -442,3 +449,122 @@ def test_execute_sql_query_success_and_querylog_created(monkeypatch):
     assert result["data"]["seconds_behind_master"] == 0
     assert created["instance_name"] == "ins"
     assert created["effect_row"] == 5
+
+
+def _patch_stream_query(monkeypatch, fake_engine, config=None):
+    monkeypatch.setattr(
+        sqlquery_service,
+        "user_instances",
+        lambda user: SimpleNamespace(
+            get=lambda **kwargs: SimpleNamespace(id=1, instance_name="ins")
+        ),
+    )
+    monkeypatch.setattr(
+        sqlquery_service,
+        "SysConfig",
+        lambda: _FakeConfig(config or {"disable_star": False}),
+    )
+    monkeypatch.setattr(sqlquery_service, "get_engine", lambda instance: fake_engine)
+    monkeypatch.setattr(
+        sqlquery_service,
+        "query_priv_check",
+        lambda *args, **kwargs: {
+            "status": 0,
+            "msg": "ok",
+            "data": {"limit_num": 10, "priv_check": True},
+        },
+    )
+    created = {}
+    monkeypatch.setattr(
+        sqlquery_service,
+        "record_query_log",
+        lambda **kwargs: created.update(kwargs),
+    )
+    monkeypatch.setattr(sqlquery_service.connection, "connection", None)
+    return created
+
+
+def _fake_stream_engine(chunks):
+    from sql.engines.models import ResultSet
+
+    return SimpleNamespace(
+        query_check=lambda **kwargs: {
+            "bad_query": False,
+            "msg": "",
+            "filtered_sql": "select 1",
+            "has_star": False,
+        },
+        filter_sql=lambda **kwargs: "select 1 limit 10",
+        get_connection=lambda **kwargs: None,
+        query_stream=lambda *args, **kwargs: (
+            ResultSet(full_sql="select 1", column_list=["col"]),
+            (chunk for chunk in chunks),
+        ),
+        stream_masker=lambda *args, **kwargs: lambda rows: [["*"] for _ in rows],
+        thread_id=None,
+        seconds_behind_master=0,
+        close=lambda: None,
+    )
+
+
+@pytest.mark.django_db
+def test_stream_sql_query_masks_each_chunk_and_logs(monkeypatch):
+    fake_engine = _fake_stream_engine([[[1], [2]], [[3]]])
+    created = _patch_stream_query(
+        monkeypatch, fake_engine, {"disable_star": False, "data_masking": True}
+    )
+
+    result, events = sqlquery_service.stream_sql_query(
+        user=SimpleNamespace(username="u", display="U"),
+        instance_name="ins",
+        db_name="db",
+        sql_content="select 1",
+        limit_num=10,
+    )
+    events = list(events)
+
+    assert result["status"] == 0
+    assert [e["type"] for e in events] == ["meta", "rows", "rows", "end"]
+    assert events[0]["data"]["column_list"] == ["col"]
+    assert "rows" not in events[0]["data"]
+    assert events[1]["rows"] == [["*"], ["*"]]
+    assert events[3]["data"]["affected_rows"] == 3
+    assert created["effect_row"] == 3
+
+
+@pytest.mark.django_db
+def test_stream_sql_query_priv_check_failed(monkeypatch):
+    closed = []
+    fake_engine = _fake_stream_engine([])
+    fake_engine.close = lambda: closed.append(True)
+    _patch_stream_query(monkeypatch, fake_engine)
+    monkeypatch.setattr(
+        sqlquery_service,
+        "query_priv_check",
+        lambda *args, **kwargs: {"status": 2, "msg": "no priv", "data": {}},
+    )
+
+    result, events = sqlquery_service.stream_sql_query(
+        user=SimpleNamespace(username="u", display="U"),
+        instance_name="ins",
+        db_name="db",
+        sql_content="select 1",
+        limit_num=10,
+    )
+
+    assert events is None
+    assert result["status"] == 2
+    assert closed == [True]
+
+
+def test_encode_ndjson_events():
+    lines = list(
+        sqlquery_service.encode_ndjson_events(
+            [{"type": "rows", "rows": [[1, "a"]]}, {"type": "end", "data": {}}]
+        )
+    )
+
+    assert lines == [
+        b'{"type": "rows", "rows": [[1, "a"]]}\n',
+        b'{"type": "end", "data": {}}\n',
+    ]
@@ -4,9 +4,15 @@ from datetime import datetime
 from unittest.mock import patch, MagicMock
 
 from django.contrib.auth.models import Permission
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 
-from sql.models import Instance, ResourceGroup, Users, AliyunRdsConfig
+from sql.models import (
+    Instance,
+    ResourceGroup,
+    Users,
+    AliyunRdsConfig,
+    SlowQueryDailyRollup,
+)
 
 
 class TestSlowQueryReview(TestCase):
@@ -118,6 +124,47 @@ class TestSlowQueryReview(TestCase):
         self.assertEqual(len(resp["rows"]), 1)
         self.assertEqual(resp["rows"][0]["SQLId"], "abc123")
 
+    @override_settings(SLOW_QUERY_ROLLUP={"enabled": True})
+    @patch("sql.slowlog.SlowQuery.objects")
+    def test_mysql_local_rollup(self, mock_slow_query_objects):
+        """开启慢日志汇总后从天汇总中统计"""
+        mock_slow_query_objects.filter.return_value.values_list.return_value = [
+            ("abc123", "SELECT * FROM t")
+        ]
+        for day, db_name in ((1, "test_db"), (2, "test_db"), (3, "other_db")):
+            SlowQueryDailyRollup.objects.create(
+                hostname="127.0.0.1:3306",
+                checksum_id="abc123",
+                db_name=db_name,
+                user_name="root",
+                ts=datetime(2024, 1, day),
+                ts_max=datetime(2024, 1, day, 10),
+                ts_cnt=2,
+                query_time_sum=3,
+                rows_examined_sum=20,
+                rows_sent_sum=2,
+            )
+        data = {
+            "instance_name": self.instance.instance_name,
+            "StartTime": "2024-01-01",
+            "EndTime": "2024-01-02",
+            "db_name": "test_db",
+            "limit": 10,
+            "offset": 0,
+            "search": "",
+            "sortName": "MySQLTotalExecutionCounts",
+            "sortOrder": "desc",
+        }
+        r = self.client.post("/slowquery/review/", data=data)
+        SlowQueryDailyRollup.objects.all().delete()
+        resp = json.loads(r.content)
+        self.assertEqual(resp["total"], 1)
+        row = resp["rows"][0]
+        self.assertEqual(row["SQLText"], "SELECT * FROM t")
+        self.assertEqual(row["MySQLTotalExecutionCounts"], 4)
+        self.assertEqual(row["QueryTimeAvg"], 1.5)
+        self.assertEqual(row["ParseRowAvg"], 10)
+
     @patch("sql.slowlog.get_engine")
     @patch("sql.slowlog.AliyunRdsConfig.objects")
     def test_aliyun_rds(self, mock_rds_config_objects, mock_get_engine):
@@ -306,6 +353,35 @@ class TestSlowQueryReviewHistory(TestCase):
         self.assertEqual(len(resp["rows"]), 1)
         self.assertEqual(resp["rows"][0]["DBName"], "test_db")
 
+    @override_settings(SLOW_QUERY_ROLLUP={"enabled": True})
+    @patch("sql.slowlog.SlowQueryHistory.objects")
+    def test_mysql_local_ignores_rollup(self, mock_slow_query_history_objects):
+        """开启慢日志汇总后慢查明细仍读取原始记录"""
+        mock_qs = MagicMock()
+        mock_slow_query_history_objects.filter.return_value = mock_qs
+        mock_qs.annotate.return_value = mock_qs
+        mock_qs.count.return_value = 0
+        mock_qs.order_by.return_value = mock_qs
+        mock_qs.__getitem__.return_value = mock_qs
+        mock_qs.values.return_value = []
+
+        data = {
+            "instance_name": self.instance.instance_name,
+            "StartTime": "2024-01-01",
+            "EndTime": "2024-01-02",
+            "db_name": "",
+            "SQLId": "abc123",
+            "limit": 10,
+            "offset": 0,
+            "search": "",
+            "sortName": "ExecutionStartTime",
+            "sortOrder": "desc",
+        }
+        r = self.client.post("/slowquery/review_history/", data=data)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(r.content)["total"], 0)
+        mock_slow_query_history_objects.filter.assert_called_once()
+
     @patch("sql.slowlog.get_engine")
     @patch("sql.slowlog.AliyunRdsConfig.objects")
     def test_aliyun_rds(self, mock_rds_config_objects, mock_get_engine):
@@ -346,3 +346,69 @@ class TestDynamicStorage(unittest.TestCase):
                 self.assertEqual(call_args["secret_key"], "")
             else:
                 self.assertEqual(call_args["account_key"], "")
+
+    def test_open_writer_s3c(self):
+        """测试 S3 流式写入使用分片上传的文件对象"""
+        with patch.object(DynamicStorage, "_init_storage") as mock_init:
+            mock_storage = MagicMock()
+            mock_init.return_value = mock_storage
+            storage = DynamicStorage(config_dict=self.s3c_config)
+            with storage.open_writer("test.zip") as f:
+                f.write(b"data")
+            mock_storage.open.assert_called_once_with("test.zip", "wb")
+            mock_storage.open.return_value.close.assert_called_once()
+
+    def test_open_writer_azure_blocks(self):
+        """测试 Azure 流式写入按块上传并在结束时提交"""
+        with patch.object(DynamicStorage, "_init_storage") as mock_init:
+            mock_storage = MagicMock()
+            mock_init.return_value = mock_storage
+            blob_client = mock_storage.client.get_blob_client.return_value
+            storage = DynamicStorage(config_dict=self.azure_config)
+            with storage.open_writer("test.zip") as f:
+                f.block_size = 4
+                f.write(b"12345")
+                f.write(b"67")
+            self.assertEqual(blob_client.stage_block.call_count, 2)
+            blocks = blob_client.commit_block_list.call_args[0][0]
+            self.assertEqual(len(blocks), 2)
+
+    def test_open_writer_exception_cleanup(self):
+        """测试流式写入异常时删除未写完的文件"""
+        with patch.object(DynamicStorage, "_init_storage") as mock_init:
+            mock_storage = MagicMock()
+            # S3File没有abort方法，关闭后删除文件
+            mock_storage.open.return_value = MagicMock(spec=["write", "close"])
+            mock_init.return_value = mock_storage
+            storage = DynamicStorage(config_dict=self.s3c_config)
+            with self.assertRaises(RuntimeError):
+                with storage.open_writer("test.zip") as f:
+                    raise RuntimeError("query failed")
+            mock_storage.open.return_value.close.assert_called_once()
+            mock_storage.delete.assert_called_once_with("test.zip")
+
+        with patch.object(DynamicStorage, "_init_storage") as mock_init:
+            mock_storage = MagicMock()
+            mock_init.return_value = mock_storage
+            blob_client = mock_storage.client.get_blob_client.return_value
+            storage = DynamicStorage(config_dict=self.azure_config)
+            with self.assertRaises(RuntimeError):
+                with storage.open_writer("test.zip") as f:
+                    f.write(b"data")
+                    raise RuntimeError("query failed")
+            blob_client.commit_block_list.assert_not_called()
+
+    def test_open_writer_exception_abort(self):
+        """测试流式写入异常时写入对象支持abort则放弃写入，不再关闭和删除文件"""
+        with patch.object(DynamicStorage, "_init_storage") as mock_init:
+            mock_storage = MagicMock()
+            mock_init.return_value = mock_storage
+            writer = mock_storage.open.return_value
+            storage = DynamicStorage(config_dict=self.s3c_config)
+            with self.assertRaises(RuntimeError):
+                with storage.open_writer("test.zip") as f:
+                    f.write(b"data")
+                    raise RuntimeError("query failed")
+            writer.abort.assert_called_once()
+            writer.close.assert_not_called()
+            mock_storage.delete.assert_not_called()
@@ -9,8 +9,10 @@ from django.test import Client, TestCase, TransactionTestCase
 
 from common.config import SysConfig
 from common.utils.const import WorkflowStatus, WorkflowType, WorkflowAction
+from common.utils.testing import LOCMEM_CACHES
 from sql.binlog import my2sql_file
 from sql.engines.models import ResultSet
+from sql.utils.execute_progress import finish_progress
 from sql.utils.execute_sql import execute_callback
 from sql.query import kill_query_conn
 from sql.models import (
@@ -982,6 +984,40 @@ class TestWorkflowView(TransactionTestCase):
         self.wf2.refresh_from_db()
         self.assertEqual("workflow_finish", self.wf2.status)
 
+    @patch("sql.utils.workflow_scheduler.async_task")
+    @patch("sql.sql_workflow.on_correct_time_period", return_value=True)
+    @patch("sql.sql_workflow.Audit.add_log")
+    @patch("sql.sql_workflow.Audit.detail_by_workflow_id")
+    @patch("sql.sql_workflow.can_execute", return_value=True)
+    def test_workflow_execute_scheduler(self, _can_execute, _, _1, _2, _async_task):
+        """测试开启执行调度后工单进入执行队列"""
+        c = Client()
+        c.force_login(self.superuser1)
+        with self.settings(
+            CACHES=LOCMEM_CACHES,
+            WORKFLOW_SCHEDULER={"enabled": True, "instance_limit": 1},
+        ):
+            r = c.post("/execute/", data={"workflow_id": self.wf2.id, "mode": "auto"})
+            self.assertRedirects(
+                r, "/detail/{}/".format(self.wf2.id), fetch_redirect_response=False
+            )
+            _async_task.assert_called_once()
+            self.assertEqual(
+                _async_task.call_args.kwargs["hook"],
+                "sql.utils.workflow_scheduler.workflow_execution_finished",
+            )
+            # 同一实例已有工单在执行，后提交的工单排队
+            c.post("/execute/", data={"workflow_id": self.wf1.id, "mode": "auto"})
+            _async_task.assert_called_once()
+            r = c.post("/getWorkflowStatus/", {"workflow_id": self.wf1.id})
+            self.assertEqual(r.json()["data"], {"queue_position": 1})
+            # 优先级不是整数时返回400
+            r = c.post(
+                "/execute/",
+                data={"workflow_id": self.wf1.id, "mode": "auto", "priority": "high"},
+            )
+            self.assertEqual(r.status_code, 400)
+
     @patch("sql.sql_workflow.Audit.add_log")
     @patch("sql.notify.auto_notify")
     @patch("sql.utils.workflow_audit.AuditV2.operate")
@@ -1015,6 +1051,41 @@ class TestWorkflowView(TransactionTestCase):
         self.wf2.refresh_from_db()
         self.assertEqual("workflow_abort", self.wf2.status)
 
+    def test_detail_content(self):
+        """测试工单详情分页"""
+        c = Client()
+        c.force_login(self.superuser1)
+        r = c.get("/sqlworkflow/detail_content/", {"workflow_id": self.wf1.id})
+        self.assertEqual(
+            r.json(), {"total": 1, "rows": [{"id": 1, "sql": "some_content"}]}
+        )
+        r = c.get(
+            "/sqlworkflow/detail_content/",
+            {"workflow_id": self.wf1.id, "offset": 0, "limit": 10, "errlevel[]": [2]},
+        )
+        self.assertEqual(r.json(), {"total": 0, "rows": []})
+
+    def test_execute_progress(self):
+        """测试长轮询获取执行进度"""
+        c = Client()
+        c.force_login(self.u1)
+        with self.settings(
+            CACHES=LOCMEM_CACHES,
+            EXECUTE_PROGRESS={"poll_timeout": 0},
+        ):
+            r = c.get("/sqlworkflow/progress/", {"workflow_id": self.wf1.id})
+            self.assertEqual(
+                r.json()["data"], {"status": "workflow_finish", "version": 0}
+            )
+            finish_progress(self.wf1.id, "workflow_finish")
+            r = c.get("/sqlworkflow/progress/", {"workflow_id": self.wf1.id})
+            self.assertEqual(r.json()["data"]["status"], "workflow_finish")
+            self.assertGreater(r.json()["data"]["version"], 0)
+            # 无权查看
+            c.force_login(self.u2)
+            r = c.get("/sqlworkflow/progress/", {"workflow_id": self.wf1.id})
+            self.assertEqual(r.status_code, 403)
+
     @patch("sql.sql_workflow.get_engine")
     def test_osc_control(self, _get_engine):
         """测试MySQL工单osc控制"""
@@ -87,6 +87,7 @@ urlpatterns = [
     path("sqlworkflow/detail_content/", sql_workflow.detail_content),
     path("sqlworkflow/backup_sql/", sql_workflow.backup_sql),
     path("getWorkflowStatus/", sql_workflow.get_workflow_status),
+    path("sqlworkflow/progress/", sql_workflow.execute_progress),
     path("del_sqlcronjob/", tasks.del_schedule),
     path("inception/osc_control/", sql_workflow.osc_control),
     path("sql_analyze/generate/", sql_analyze.generate),
@@ -137,6 +138,7 @@ urlpatterns = [
     path("param/edit/", instance.param_edit),
     path("param/compare/", instance.param_compare),
     path("query/querylog_audit/", query.querylog_audit),
+    path("query/search_index/", query.search_index),
     path("query/generate_sql/", query.generate_sql),
     path("check/openai/", query.check_openai),
     path("query/explain/", sql.sql_optimize.explain),
@@ -147,9 +149,11 @@ urlpatterns = [
     path("query/privaudit/", sql.query_privileges.query_priv_audit),
     path("binlog/list/", binlog.binlog_list),
     path("binlog/my2sql/", binlog.my2sql),
+    path("binlog/my2sql_output/", binlog.my2sql_output),
     path("binlog/del_log/", binlog.del_binlog),
     path("slowquery/review/", slowlog.slowquery_review),
     path("slowquery/review_history/", slowlog.slowquery_review_history),
+    path("slowquery/rollup/", slowlog.slowquery_rollup),
     path("slowquery/optimize_sqladvisor/", sql.sql_optimize.optimize_sqladvisor),
     path("slowquery/optimize_sqltuning/", sql.sql_optimize.optimize_sqltuning),
     path("slowquery/optimize_soar/", sql.sql_optimize.optimize_soar),
@@ -0,0 +1,99 @@
+# -*- coding: UTF-8 -*-
+"""
+数据归档任务调度
+归档任务先进入待执行队列, 按优先级和最近归档时间排序后在并发上限内提交到django-q,
+任务结束后通过hook释放槽位并继续调度, 同一实例和全局的并发数受限,
+并为SQL工单执行等其他任务保留worker, 避免长时间运行的归档占满worker
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db.models import F
+from django_q.tasks import async_task
+
+from common.utils.settings_config import get_settings_config
+from sql.models import ArchiveConfig
+from sql.utils.task_scheduler import dispatch, expire_running, release, scheduler_lock
+
+DEFAULT_ARCHIVE_SCHEDULER_CONFIG = {
+    # 同一源实例同时运行的归档任务数
+    "instance_limit": 1,
+    # 同时运行的归档任务总数，0表示使用 worker数-保留的worker数
+    "max_running": 0,
+    # 为SQL工单执行等任务保留的worker数
+    "reserved_workers": 2,
+    # 运行中的任务超过该时间未结束时不再占用槽位，用于worker异常退出未执行hook的情况，秒
+    "running_timeout": 86400,
+}
+
+PENDING_KEY = "archive_scheduler:pending"
+RUNNING_KEY = "archive_scheduler:running"
+LOCK_KEY = "archive_scheduler:lock"
+
+
+def get_archive_scheduler_config():
+    """读取归档调度配置, 未配置的项使用默认值"""
+    return get_settings_config("ARCHIVE_SCHEDULER", DEFAULT_ARCHIVE_SCHEDULER_CONFIG)
+
+
+def _lock():
+    return scheduler_lock(LOCK_KEY, "获取归档调度锁超时")
+
+
+def submit_archive_tasks(archive_ids):
+    """
+    将归档任务加入待执行队列并调度
+    :param archive_ids: 归档配置id列表
+    :return: 本次提交到django-q的归档配置id列表
+    """
+    with _lock():
+        pending = cache.get(PENDING_KEY) or []
+        for archive_id in archive_ids:
+            if int(archive_id) not in pending:
+                pending.append(int(archive_id))
+        cache.set(PENDING_KEY, pending, None)
+        return _dispatch()
+
+
+def dispatch_archive_tasks():
+    """在并发上限内提交待执行的归档任务"""
+    with _lock():
+        return _dispatch()
+
+
+def archive_task_finished(task):
+    """django-q任务结束的hook, 释放槽位并继续调度"""
+    with _lock():
+        release(RUNNING_KEY, int(task.args[0]))
+        _dispatch()
+
+
+def _submit(archive_id, item):
+    async_task(
+        "sql.archiver.archive",
+        archive_id,
+        hook="sql.utils.archive_scheduler.archive_task_finished",
+        group=f'archive-{time.strftime("%Y-%m-%d %H:%M:%S ")}',
+        timeout=-1,
+        task_name=f"archive-{archive_id}",
+    )
+
+
+def _dispatch():
+    config = get_archive_scheduler_config()
+    pending = cache.get(PENDING_KEY) or []
+    running = cache.get(RUNNING_KEY) or {}
+    expire_running(running, config, label="归档任务")
+    # 按优先级从高到低，同优先级最久未归档的优先，已删除的任务移出队列
+    archive_cnf_list = ArchiveConfig.objects.filter(id__in=pending).order_by(
+        "-priority", F("last_archive_time").asc(nulls_first=True), "id"
+    )
+    candidates = [
+        (archive.id, archive.id, {"instance_id": archive.src_instance_id})
+        for archive in archive_cnf_list
+    ]
+    dispatched, pending = dispatch(candidates, running, config, _submit)
+    cache.set(PENDING_KEY, pending, None)
+    cache.set(RUNNING_KEY, running, None)
+    return dispatched
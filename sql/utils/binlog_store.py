@@ -0,0 +1,442 @@
+# -*- coding: UTF-8 -*-
+"""
+binlog解析结果存储
+按binlog文件分段调用my2sql解析, 解析结果连同位点、时间、库表、语句类型写入实例的sqlite索引文件,
+预览、分页和下载文件都从存储中读取, 已解析的文件不再重复解析,
+仍在写入的最新binlog文件只增量解析上次解析位点之后的部分
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import simplejson as json
+from django.conf import settings
+from django.core.cache import cache
+from django_q.tasks import async_task
+
+from common.utils.cache_lock import cache_lock
+from common.utils.settings_config import get_settings_config
+from sql.engines import get_engine
+from sql.plugins.my2sql import My2SQL
+
+logger = logging.getLogger("default")
+
+DEFAULT_BINLOG_STORE_CONFIG = {
+    "enabled": False,
+    # 存储目录，每个实例一个子目录
+    "path": "",
+    # 同一binlog文件解析加锁的最长时间，秒
+    "lock_timeout": 600,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    binlog_file TEXT PRIMARY KEY,
+    parsed_pos INTEGER NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0,
+    update_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    binlog_file TEXT NOT NULL,
+    start_pos INTEGER NOT NULL,
+    stop_pos INTEGER NOT NULL,
+    event_time TEXT NOT NULL DEFAULT '',
+    db_name TEXT NOT NULL DEFAULT '',
+    table_name TEXT NOT NULL DEFAULT '',
+    sql_type TEXT NOT NULL,
+    extra_info TEXT NOT NULL DEFAULT '',
+    sql TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_pos ON events (binlog_file, start_pos);
+CREATE INDEX IF NOT EXISTS idx_events_time ON events (event_time);
+CREATE INDEX IF NOT EXISTS idx_events_table ON events (db_name, table_name);
+CREATE INDEX IF NOT EXISTS idx_events_type ON events (sql_type);
+"""
+
+EXTRA_INFO_RE = re.compile(r"(\w+)=(\S+)")
+
+# 回滚语句与原始事件的类型对应关系, UPDATE的回滚语句仍为UPDATE
+ROLLBACK_SQL_TYPES = {"INSERT": "DELETE", "DELETE": "INSERT"}
+
+
+def get_binlog_store_config():
+    """读取binlog存储配置, 未配置的项使用默认值"""
+    config = get_settings_config("BINLOG_STORE", DEFAULT_BINLOG_STORE_CONFIG)
+    if not config["path"]:
+        config["path"] = os.path.join(settings.BASE_DIR, "downloads/binlog_store")
+    return config
+
+
+def parse_extra_info(extra_info):
+    """
+    解析my2sql的extraInfo注释
+    # datetime=2020-07-16_10:44:09 database=db table=t binlog=mysql-bin.000001 startpos=4 stoppos=120
+    """
+    info = dict(EXTRA_INFO_RE.findall(extra_info or ""))
+    return {
+        "event_time": info.get("datetime", "").replace("_", " "),
+        "db_name": info.get("database", ""),
+        "table_name": info.get("table", ""),
+        "binlog_file": info.get("binlog", ""),
+        "start_pos": int(info.get("startpos", 0) or 0),
+        "stop_pos": int(info.get("stoppos", 0) or 0),
+    }
+
+
+class BinlogStore:
+    """
+    实例binlog解析结果的存储
+    解析选项影响生成的SQL, 不同选项的结果分别存储, 库表和语句类型等过滤在读取时进行
+    """
+
+    def __init__(
+        self,
+        instance,
+        work_type="2sql",
+        full_columns=False,
+        ignore_primary_key=False,
+        no_db_prefix=False,
+        threads=4,
+    ):
+        self.instance = instance
+        self.work_type = work_type
+        self.threads = threads
+        self.options = {
+            "work-type": work_type,
+            "full-columns": full_columns,
+            "ignore-primaryKey-forInsert": ignore_primary_key,
+            "do-not-add-prifixDb": no_db_prefix,
+        }
+        self.config = get_binlog_store_config()
+        digest = hashlib.sha1(
+            json.dumps(self.options, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        self.digest = digest
+        self.path = os.path.join(
+            self.config["path"], str(instance.id), f"{digest}.sqlite3"
+        )
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def file_lock(self, binlog_file):
+        """同一binlog文件同时只有一个进程解析"""
+        timeout = self.config["lock_timeout"]
+        return cache_lock(
+            f"binlog_store:{self.instance.id}:{self.digest}:{binlog_file}",
+            timeout,
+            wait=timeout,
+            message=f"等待{binlog_file}解析超时",
+        )
+
+    def binlog_files(self):
+        """实例当前的binlog文件列表 [(文件名, 大小)]"""
+        query_engine = get_engine(instance=self.instance)
+        query_result = query_engine.query("information_schema", "show binary logs;")
+        if query_result.error:
+            raise Exception(query_result.error)
+        return [(row[0], int(row[1])) for row in query_result.rows]
+
+    def binlog_range(self, start_file, stop_file=""):
+        """
+        范围内的binlog文件
+        :return: (实例当前的binlog文件名列表, 范围内的[(文件名, 大小, 是否已写完)])
+        """
+        binlogs = self.binlog_files()
+        names = [name for name, _ in binlogs]
+        if start_file not in names:
+            raise Exception(f"binlog文件{start_file}不存在")
+        if stop_file and stop_file not in names:
+            raise Exception(f"binlog文件{stop_file}不存在")
+        start = names.index(start_file)
+        stop = names.index(stop_file) if stop_file else len(names) - 1
+        return names, [
+            (name, size, index < len(names) - 1)
+            for index, (name, size) in enumerate(binlogs)
+            if start <= index <= stop
+        ]
+
+    def sync(self, start_file, stop_file=""):
+        """
+        确保范围内的binlog文件已解析到存储中
+        已经不在实例上的binlog文件的解析结果会被清理
+        """
+        names, binlogs = self.binlog_range(start_file, stop_file)
+        self.prune(names)
+        for name, size, complete in binlogs:
+            self.sync_file(name, size, complete=complete)
+
+    def pending_files(self, start_file, stop_file=""):
+        """范围内尚未解析到当前大小的binlog文件"""
+        _, binlogs = self.binlog_range(start_file, stop_file)
+        conn = self.connect()
+        try:
+            segments = dict(
+                conn.execute(
+                    "SELECT binlog_file, CASE WHEN complete THEN -1 ELSE parsed_pos END "
+                    "FROM segments"
+                ).fetchall()
+            )
+        finally:
+            conn.close()
+        return [
+            name
+            for name, size, _ in binlogs
+            if name not in segments or 0 <= segments[name] < size
+        ]
+
+    def sync_file(self, binlog_file, size, complete):
+        """解析单个binlog文件, 已解析的部分不再解析"""
+        with self.file_lock(binlog_file):
+            conn = self.connect()
+            try:
+                segment = conn.execute(
+                    "SELECT parsed_pos, complete FROM segments WHERE binlog_file = ?",
+                    (binlog_file,),
+                ).fetchone()
+                if segment and (segment[1] or segment[0] >= size):
+                    return
+                start_pos = segment[0] if segment else 4
+                # 解析结果和解析位点在同一事务中提交
+                with conn:
+                    if start_pos < size:
+                        self.parse(conn, binlog_file, start_pos, size)
+                    conn.execute(
+                        "REPLACE INTO segments (binlog_file, parsed_pos, complete, update_time) "
+                        "VALUES (?, ?, ?, ?)",
+                        (binlog_file, size, int(complete), time.time()),
+                    )
+            finally:
+                conn.close()
+
+    def parse(self, conn, binlog_file, start_pos, stop_pos):
+        """调用my2sql解析binlog文件的指定位点范围, 结果写入存储, 由调用方提交事务"""
+        my2sql = My2SQL()
+        username, password = self.instance.get_username_password()
+        output_dir = tempfile.mkdtemp(prefix="my2sql_store_")
+        args = {
+            "host": self.instance.host,
+            "user": username,
+            "password": password,
+            "port": self.instance.port,
+            "start-file": binlog_file,
+            "start-pos": start_pos,
+            "stop-file": binlog_file,
+            "stop-pos": stop_pos,
+            "threads": self.threads,
+            "add-extraInfo": True,
+            "output-dir": output_dir,
+            **self.options,
+        }
+        try:
+            args_check_result = my2sql.check_args(args)
+            if args_check_result["status"] == 1:
+                raise Exception(args_check_result["msg"])
+            p = my2sql.execute_cmd(my2sql.generate_args2cmd(args))
+            _, stderr = p.communicate()
+            if p.returncode:
+                raise Exception(stderr or f"my2sql退出码{p.returncode}")
+            count = self.ingest(conn, output_dir, binlog_file)
+            logger.debug(
+                f"binlog {binlog_file} {start_pos}-{stop_pos} 解析完成，{count}条SQL"
+            )
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def ingest(self, conn, output_dir, binlog_file):
+        """
+        读取my2sql输出目录中的SQL文件写入存储
+        语句类型记录原始事件的类型, 与my2sql的--sql过滤一致, 回滚语句的INSERT、DELETE互换
+        """
+        # 避免循环引用
+        from sql.binlog import parse_my2sql_output_line
+
+        count = 0
+        for root, _, files in os.walk(output_dir):
+            for file_name in sorted(files):
+                if not file_name.endswith(".sql") or file_name.startswith("."):
+                    continue
+                current_extra_info = ""
+                with open(os.path.join(root, file_name), encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        row_info, current_extra_info = parse_my2sql_output_line(
+                            line, current_extra_info
+                        )
+                        if not row_info:
+                            continue
+                        info = parse_extra_info(current_extra_info)
+                        sql_type = row_info["sql"][0:6].upper()
+                        if self.work_type == "rollback":
+                            sql_type = ROLLBACK_SQL_TYPES.get(sql_type, sql_type)
+                        conn.execute(
+                            "INSERT INTO events (binlog_file, start_pos, stop_pos, event_time, "
+                            "db_name, table_name, sql_type, extra_info, sql) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (
+                                info["binlog_file"] or binlog_file,
+                                info["start_pos"],
+                                info["stop_pos"],
+                                info["event_time"],
+                                info["db_name"],
+                                info["table_name"],
+                                sql_type,
+                                current_extra_info,
+                                row_info["sql"],
+                            ),
+                        )
+                        count += 1
+        return count
+
+    def prune(self, binlog_names):
+        """清理实例上已不存在的binlog文件的解析结果"""
+        conn = self.connect()
+        try:
+            stored = [
+                row[0] for row in conn.execute("SELECT binlog_file FROM segments")
+            ]
+            removed = [name for name in stored if name not in binlog_names]
+            if not removed:
+                return
+            with conn:
+                for name in removed:
+                    conn.execute("DELETE FROM events WHERE binlog_file = ?", (name,))
+                    conn.execute("DELETE FROM segments WHERE binlog_file = ?", (name,))
+        finally:
+            conn.close()
+
+    def _where(
+        self,
+        start_file,
+        start_pos=None,
+        stop_file="",
+        stop_pos=None,
+        start_time="",
+        stop_time="",
+        schemas=None,
+        tables=None,
+        sql_types=None,
+    ):
+        conditions = ["(binlog_file > ? OR (binlog_file = ? AND start_pos >= ?))"]
+        params = [start_file, start_file, start_pos or 0]
+        if stop_file:
+            if stop_pos:
+                conditions.append(
+                    "(binlog_file < ? OR (binlog_file = ? AND stop_pos <= ?))"
+                )
+                params += [stop_file, stop_file, stop_pos]
+            else:
+                conditions.append("binlog_file <= ?")
+                params.append(stop_file)
+        if start_time:
+            conditions.append("event_time >= ?")
+            params.append(start_time)
+        if stop_time:
+            conditions.append("event_time < ?")
+            params.append(stop_time)
+        for column, values in (
+            ("db_name", schemas),
+            ("table_name", tables),
+            ("sql_type", [i.upper() for i in sql_types or []]),
+        ):
+            if values:
+                conditions.append(f"{column} IN ({', '.join(['?'] * len(values))})")
+                params += list(values)
+        return " AND ".join(conditions), params
+
+    @property
+    def order_by(self):
+        """按位点排序, 回滚语句按事件位点倒序, 同一事件内保持my2sql的输出顺序"""
+        if self.work_type == "rollback":
+            return "binlog_file DESC, start_pos DESC, id"
+        return "binlog_file, start_pos, id"
+
+    def query(self, offset=0, limit=30, extra_info=False, **filters):
+        """
+        按位点顺序分页读取解析结果, 回滚语句按位点倒序
+        :return: (行列表, 总行数)
+        """
+        where, params = self._where(**filters)
+        conn = self.connect()
+        try:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM events WHERE {where}", params
+            ).fetchone()[0]
+            cursor = conn.execute(
+                f"SELECT sql, extra_info FROM events WHERE {where} "
+                f"ORDER BY {self.order_by} LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            )
+            rows = []
+            for sql, info in cursor:
+                row_info = {"sql": sql}
+                if extra_info and info:
+                    row_info["extra_info"] = info
+                rows.append(row_info)
+        finally:
+            conn.close()
+        return rows, total
+
+    def export(self, file_path, extra_info=False, **filters):
+        """将解析结果写入文件, 返回写入的行数"""
+        where, params = self._where(**filters)
+        conn = self.connect()
+        count = 0
+        try:
+            cursor = conn.execute(
+                f"SELECT sql, extra_info FROM events WHERE {where} "
+                f"ORDER BY {self.order_by}",
+                params,
+            )
+            with open(file_path, "w", encoding="utf-8") as f:
+                for sql, info in cursor:
+                    if extra_info and info:
+                        f.write(f"{info}\n")
+                    f.write(f"{sql}\n")
+                    count += 1
+        finally:
+            conn.close()
+        return count
+
+
+def submit_binlog_store_sync(instance, options, start_file, stop_file=""):
+    """
+    提交后台解析范围内binlog文件的任务, 相同范围的解析任务未结束时不重复提交
+    :return: 是否提交了新的任务
+    """
+    store = BinlogStore(instance, **options)
+    key = f"binlog_store_sync:{instance.id}:{store.digest}:{start_file}:{stop_file}"
+    if not cache.add(key, 1, store.config["lock_timeout"]):
+        return False
+    async_task(
+        sync_binlog_store,
+        instance,
+        options,
+        start_file,
+        stop_file,
+        key,
+        timeout=-1,
+        task_name=f"binlog-store-sync-{instance.id}-{start_file}",
+    )
+    return True
+
+
+def sync_binlog_store(instance, options, start_file, stop_file, key=None):
+    """后台解析范围内的binlog文件"""
+    try:
+        BinlogStore(instance, **options).sync(start_file, stop_file)
+    finally:
+        if key:
+            cache.delete(key)
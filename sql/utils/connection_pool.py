@@ -0,0 +1,187 @@
+# -*- coding: UTF-8 -*-
+"""
+进程内的实例连接池, 供各个engine复用与目标实例之间的连接,
+避免每次查询都重新进行TCP/TLS/认证握手
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from common.utils.settings_config import get_settings_config
+from sql.models import Instance
+
+logger = logging.getLogger("default")
+
+DEFAULT_POOL_CONFIG = {
+    "enabled": False,
+    "max_size": 5,
+    "idle_timeout": 300,
+}
+
+
+def get_pool_config():
+    """读取连接池配置, 未配置的项使用默认值"""
+    return get_settings_config("ENGINE_CONNECTION_POOL", DEFAULT_POOL_CONFIG)
+
+
+def instance_fingerprint(instance):
+    """实例连接信息指纹, 实例配置变更后指纹随之变化, 旧连接不再复用"""
+    user, password = instance.get_username_password()
+    raw = "|".join(
+        str(i)
+        for i in (
+            instance.db_type,
+            instance.host,
+            instance.port,
+            user,
+            password,
+            instance.charset,
+            instance.db_name,
+            instance.service_name,
+            instance.sid,
+            instance.is_ssl,
+            instance.tunnel_id,
+            instance.update_time,
+        )
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ConnectionPool:
+    """
+    单个实例单个库的连接池
+    连接数有上限, 空闲超时后关闭, 借出时做健康检查
+    """
+
+    def __init__(self, max_size=5, idle_timeout=300, fingerprint=""):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.fingerprint = fingerprint
+        # 空闲连接, 元素为 (conn, 归还时间)
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug(f"关闭连接池连接失败：{e}")
+
+    def _reap(self, now):
+        """关闭空闲超时的连接, 调用方需持有锁"""
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def acquire(self, connect, ping=None):
+        """
+        借出连接, 无可用空闲连接时调用connect新建
+        :param connect: 新建连接的函数
+        :param ping: 健康检查函数, 接收连接, 返回bool
+        :return:
+        """
+        while True:
+            with self._lock:
+                expired = self._reap(time.monotonic())
+                conn = self._idle.pop()[0] if self._idle else None
+            for i in expired:
+                self._close(i)
+            if conn is None:
+                return connect()
+            if ping is None:
+                return conn
+            try:
+                if ping(conn):
+                    return conn
+            except Exception as e:
+                logger.debug(f"连接池连接健康检查失败：{e}")
+            self._close(conn)
+
+    def release(self, conn):
+        """归还连接, 超出容量时直接关闭"""
+        try:
+            conn.rollback()
+        except Exception:
+            self._close(conn)
+            return
+        with self._lock:
+            expired = self._reap(time.monotonic())
+            if len(self._idle) < self.max_size:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+        for i in expired:
+            self._close(i)
+        if conn is not None:
+            self._close(conn)
+
+    def clear(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle = [i[0] for i in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._close(conn)
+
+    @property
+    def size(self):
+        return len(self._idle)
+
+
+class PoolRegistry:
+    """进程内所有连接池的注册表, 以 (engine, 实例id, 库名) 为key"""
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, engine_name, instance, db_name=None):
+        config = get_pool_config()
+        fingerprint = instance_fingerprint(instance)
+        key = (engine_name, instance.id, db_name or "")
+        stale = None
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool and pool.fingerprint != fingerprint:
+                stale, pool = pool, None
+            if pool is None:
+                pool = ConnectionPool(
+                    max_size=int(config["max_size"]),
+                    idle_timeout=int(config["idle_timeout"]),
+                    fingerprint=fingerprint,
+                )
+                self._pools[key] = pool
+        if stale:
+            stale.clear()
+        return pool
+
+    def invalidate(self, instance_id):
+        """实例变更或删除后, 关闭该实例下所有连接池"""
+        with self._lock:
+            keys = [key for key in self._pools if key[1] == instance_id]
+            pools = [self._pools.pop(key) for key in keys]
+        for pool in pools:
+            pool.clear()
+
+    def clear(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.clear()
+
+
+pool_registry = PoolRegistry()
+
+
+@receiver(post_save, sender=Instance)
+@receiver(post_delete, sender=Instance)
+def invalidate_instance_pool(sender, instance, **kwargs):
+    pool_registry.invalidate(instance.id)
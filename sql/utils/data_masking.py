@@ -1,8 +1,10 @@
 # -*- coding:utf-8 -*-
+import hashlib
 import logging
-import math
 
 import sqlparse
+from django.conf import settings
+from django.core.cache import cache
 from django.forms import model_to_dict
 from sqlparse.tokens import Keyword
 import pandas as pd
@@ -18,64 +20,22 @@ logger = logging.getLogger("default")
 def data_masking(instance, db_name, sql, sql_result):
     """脱敏数据"""
     try:
-        keywords_count = {}
-        # 解析查询语句，判断UNION需要单独处理
-        p = sqlparse.parse(sql)[0]
-        for token in p.tokens:
-            if token.ttype is Keyword and token.value.upper() in ["UNION", "UNION ALL"]:
-                keywords_count["UNION"] = keywords_count.get("UNION", 0) + 1
-        if instance.db_type == "mongo":
-            select_list = [
-                {
-                    "index": index,
-                    "field": field,
-                    "type": "varchar",
-                    "table": "*",
-                    "schema": db_name,
-                    "alias": field,
-                }
-                for index, field in enumerate(sql_result.column_list)
-            ]
-        else:
-            # 通过goInception获取select list
-            inception_engine = GoInceptionEngine()
-            select_list = inception_engine.query_data_masking(
-                instance=instance, db_name=db_name, sql=sql
-            )
-        # 如果UNION存在，那么调用去重函数
-        select_list = (
-            del_repeat(select_list, keywords_count) if keywords_count else select_list
-        )
         # 分析语法树获取命中脱敏规则的列数据
-        hit_columns = analyze_query_tree(select_list, instance)
+        hit_columns = masking_hit_columns(
+            instance, db_name, sql, sql_result.column_list
+        )
         sql_result.mask_rule_hit = True if hit_columns else False
         # 对命中规则列hit_columns的数据进行脱敏
-        masking_rules = {
-            i.rule_type: model_to_dict(i) for i in DataMaskingRules.objects.all()
-        }
         if hit_columns and sql_result.rows:
-            rows = list(sql_result.rows)
-            for column in hit_columns:
-                index, rule_type = column["index"], column["rule_type"]
-                masking_rule = masking_rules.get(rule_type)
-                # 如果是默认的三段式通用脱敏规则，数据库没有查询结果，则创建一个对象。
-                if not masking_rule and rule_type == 100:
-                    masking_rule_obj, created = DataMaskingRules.objects.get_or_create(
-                        rule_type=100,
-                        rule_regex="^([\\s\\S]{0,}?)([\\s\\S]{0,}?)([\\s\\S]{0,}?)$",
-                        hide_group=2,
-                        rule_desc="三段式通用脱敏规则：内部实现，正则暂不支持修改，隐藏组支持修改。",
+            column_maskers = {}
+            try:
+                compile_column_maskers(hit_columns, column_maskers)
+            finally:
+                # 规则解析中途异常时，已解析的列仍然脱敏
+                if column_maskers:
+                    sql_result.rows = mask_columns(
+                        sql_result.rows, column_maskers, list
                     )
-                    if created:
-                        masking_rule = model_to_dict(masking_rule_obj)
-                        masking_rules[rule_type] = masking_rule  # 更新字典
-                        masking_rule = masking_rules.get(rule_type)
-                if not masking_rule:
-                    continue
-                for idx, item in enumerate(rows):
-                    rows[idx] = list(item)
-                    rows[idx][index] = regex(masking_rule, rows[idx][index])
-                sql_result.rows = rows
             # 脱敏结果
             sql_result.is_masked = True
     except Exception as msg:
@@ -85,6 +45,119 @@ def data_masking(instance, db_name, sql, sql_result):
     return sql_result
 
 
+def masking_hit_columns(instance, db_name, sql, column_list):
+    """解析查询语句，返回命中脱敏规则的列信息"""
+    keywords_count = {}
+    # 解析查询语句，判断UNION需要单独处理
+    p = sqlparse.parse(sql)[0]
+    for token in p.tokens:
+        if token.ttype is Keyword and token.value.upper() in ["UNION", "UNION ALL"]:
+            keywords_count["UNION"] = keywords_count.get("UNION", 0) + 1
+    if instance.db_type == "mongo":
+        select_list = [
+            {
+                "index": index,
+                "field": field,
+                "type": "varchar",
+                "table": "*",
+                "schema": db_name,
+                "alias": field,
+            }
+            for index, field in enumerate(column_list)
+        ]
+    else:
+        # 通过goInception获取select list
+        select_list = query_select_list(instance, db_name, sql)
+    # 如果UNION存在，那么调用去重函数
+    select_list = (
+        del_repeat(select_list, keywords_count) if keywords_count else select_list
+    )
+    return analyze_query_tree(select_list, instance)
+
+
+def compile_column_maskers(hit_columns, column_maskers):
+    """将命中列的脱敏规则编译为 {列索引: [脱敏函数, ...]} 写入column_maskers
+    column_maskers由调用方传入，解析中途异常时已写入的列仍可使用
+    """
+    masking_rules = {
+        i.rule_type: model_to_dict(i) for i in DataMaskingRules.objects.all()
+    }
+    compiled_rules = {}
+    for column in hit_columns:
+        index, rule_type = column["index"], column["rule_type"]
+        masking_rule = masking_rules.get(rule_type)
+        # 如果是默认的三段式通用脱敏规则，数据库没有查询结果，则创建一个对象。
+        if not masking_rule and rule_type == 100:
+            masking_rule_obj, created = DataMaskingRules.objects.get_or_create(
+                rule_type=100,
+                rule_regex="^([\\s\\S]{0,}?)([\\s\\S]{0,}?)([\\s\\S]{0,}?)$",
+                hide_group=2,
+                rule_desc="三段式通用脱敏规则：内部实现，正则暂不支持修改，隐藏组支持修改。",
+            )
+            if created:
+                masking_rule = model_to_dict(masking_rule_obj)
+                masking_rules[rule_type] = masking_rule  # 更新字典
+                masking_rule = masking_rules.get(rule_type)
+        if not masking_rule:
+            continue
+        # 每条规则只编译一次，同一列命中多次时按顺序依次脱敏
+        if rule_type not in compiled_rules:
+            compiled_rules[rule_type] = compile_regex_masker(masking_rule)
+        column_maskers.setdefault(index, []).append(compiled_rules[rule_type])
+    return column_maskers
+
+
+def _select_list_version_key(instance_id):
+    return f"masking_select_list_version:{instance_id}"
+
+
+def _select_list_cache_key(instance, db_name, sql):
+    """select list缓存key, 由实例、库名和去除注释、空白后的SQL指纹组成"""
+    normalized_sql = " ".join(sqlparse.format(sql, strip_comments=True).split())
+    fingerprint = hashlib.sha1(normalized_sql.encode("utf-8")).hexdigest()
+    version = cache.get(_select_list_version_key(instance.id)) or 0
+    # 实例配置修改后update_time变化, 旧缓存自然失效
+    update_time = instance.update_time.timestamp() if instance.update_time else 0
+    return f"masking_select_list:{instance.id}:{version}:{update_time}:{db_name}:{fingerprint}"
+
+
+def query_select_list(instance, db_name, sql):
+    """通过goInception获取select list, 相同SQL的解析结果会缓存DATA_MASKING_CACHE_TTL秒"""
+    ttl = getattr(settings, "DATA_MASKING_CACHE_TTL", 0)
+    cache_key = None
+    if ttl > 0:
+        try:
+            cache_key = _select_list_cache_key(instance, db_name, sql)
+            select_list = cache.get(cache_key)
+            if select_list is not None:
+                return select_list
+        except Exception as e:
+            logger.warning(f"读取脱敏select list缓存失败，错误信息：{e}")
+            cache_key = None
+    inception_engine = GoInceptionEngine()
+    select_list = inception_engine.query_data_masking(
+        instance=instance, db_name=db_name, sql=sql
+    )
+    if cache_key:
+        try:
+            cache.set(cache_key, select_list, timeout=ttl)
+        except Exception as e:
+            logger.warning(f"写入脱敏select list缓存失败，错误信息：{e}")
+    return select_list
+
+
+def invalidate_select_list_cache(instance_id):
+    """实例结构变更后使该实例的select list缓存全部失效"""
+    version_key = _select_list_version_key(instance_id)
+    try:
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, 1, timeout=None)
+    except Exception as e:
+        logger.warning(f"清理脱敏select list缓存失败，错误信息：{e}")
+
+
 def del_repeat(select_list, keywords_count):
     """输入的 data 是inception_engine.query_data_masking的list结果
     去重前
@@ -152,50 +225,87 @@ def analyze_query_tree(select_list, instance):
     return hit_columns
 
 
-def regex(masking_rule, value):
-    """利用正则表达式脱敏数据"""
-    # 如果为null或none或空字符串，则不脱敏直接返回。
-    if not value:
-        return value
-    rule_regex = masking_rule["rule_regex"]
+def mask_columns(rows, column_maskers, row_type=tuple):
+    """按列对结果集脱敏，每列一次性处理，返回row_type类型行组成的list
+    :param rows: 结果集行
+    :param column_maskers: {列索引: [脱敏函数, ...]}，同一列的函数按顺序依次执行
+    :param row_type: 返回行的类型
+    """
+    columns = [list(c) for c in zip(*rows)]
+    if len(columns) == 0:
+        return [row_type(row) for row in rows]
+    for index, maskers in column_maskers.items():
+        values = columns[index]
+        for masker in maskers:
+            values = [masker(value) for value in values]
+        columns[index] = values
+    return [row_type(row) for row in zip(*columns)]
 
-    rule_type = masking_rule["rule_type"]
-    # 系统通用规则正则表达式。 这是动态的。
-    if rule_type == 100 and isinstance(value, str):
-        value_average = math.floor(len(value) / 3)
-        value_remainder = len(value) % 3
-        value_average_1 = str(value_average)
-        value_average_2 = str(value_average + (1 if value_remainder > 0 else 0))
-        value_average_3 = str(value_average + (1 if value_remainder > 1 else 0))
-        # value_len_str=str(value_len if value_len >= 1 else 1)
-        rule_regex = (
-            "^([\\s\\S]{"
-            + value_average_1
-            + ",}?)([\\s\\S]{"
-            + value_average_2
-            + ",}?)([\\s\\S]{"
-            + value_average_3
-            + ",}?)$"
-        )
 
+def _three_part_mask(value, hide_group):
+    """三段式通用脱敏，按长度将字符串均分为三段，与规则100动态生成的正则结果一致"""
+    value_average, value_remainder = divmod(len(value), 3)
+    first = value_average
+    second = first + value_average + (1 if value_remainder > 0 else 0)
+    groups = (value[:first], value[first:second], value[second:])
+    masking_str = ""
+    for i, group in enumerate(groups):
+        if i == hide_group - 1:
+            group = "*" * len(group)
+        masking_str = masking_str + group
+    return masking_str
+
+
+def compile_regex_masker(masking_rule):
+    """预编译脱敏规则，返回对单个值脱敏的函数，结果与regex一致"""
+    rule_type = masking_rule["rule_type"]
     hide_group = masking_rule["hide_group"]
-    # 正则匹配必须分组，隐藏的组会使用****代替
-    try:
-        p = re.compile(rule_regex, re.I)
-        m = p.search(str(value))
-        masking_str = ""
-        if m is None:
+    compiled = []
+
+    def masker(value):
+        # 如果为null或none或空字符串，则不脱敏直接返回。
+        if not value:
+            return value
+        # 系统通用规则，按值的长度动态分组，无需逐个生成正则
+        if rule_type == 100 and isinstance(value, str):
+            return _three_part_mask(value, hide_group)
+        # 正则匹配必须分组，隐藏的组会使用****代替
+        try:
+            if not compiled:
+                compiled.append(re.compile(masking_rule["rule_regex"], re.I))
+            m = compiled[0].search(str(value))
+            masking_str = ""
+            if m is None:
+                return value
+            for i in range(m.lastindex):
+                if i == hide_group - 1:
+                    # 长度不对外隐藏，还原长度。
+                    group = "*" * len(m.group(i + 1))
+                else:
+                    group = m.group(i + 1)
+                masking_str = masking_str + group
+            return masking_str
+        except AttributeError:
             return value
-        for i in range(m.lastindex):
-            if i == hide_group - 1:
-                # 长度不对外隐藏，还原长度。
-                group = "*" * len(m.group(i + 1))
-            else:
-                group = m.group(i + 1)
-            masking_str = masking_str + group
-        return masking_str
-    except AttributeError:
-        return value
+
+    return masker
+
+
+def regex(masking_rule, value):
+    """利用正则表达式脱敏数据"""
+    return compile_regex_masker(masking_rule)(value)
+
+
+def compile_sub_masker(rule_regex, hide_group, flags):
+    """预编译替换型脱敏规则，返回对单个值脱敏的函数，隐藏的组替换为****"""
+    compiled_r = re.compile(rule_regex, flags)
+    replace_pattern = r""
+    for i in range(1, compiled_r.groups + 1):
+        if i == int(hide_group):
+            replace_pattern += r"****"
+        else:
+            replace_pattern += r"\{}".format(i)
+    return lambda value: compiled_r.sub(replace_pattern, str(value))
 
 
 def brute_mask(instance, sql_result):
@@ -212,27 +322,41 @@ def brute_mask(instance, sql_result):
         .distinct()
     )
     masking_rules = DataMaskingRules.objects.filter(rule_type__in=rule_types)
-    for reg in masking_rules:
-        compiled_r = re.compile(reg.rule_regex, re.I)
-        replace_pattern = r""
+    maskers = [
+        compile_sub_masker(reg.rule_regex, reg.hide_group, re.I)
+        for reg in masking_rules
+    ]
+    if maskers:
         rows = list(sql_result.rows)
-        for i in range(1, compiled_r.groups + 1):
-            if i == int(reg.hide_group):
-                replace_pattern += r"****"
-            else:
-                replace_pattern += r"\{}".format(i)
-        for i in range(len(sql_result.rows)):
-            temp_value_list = []
-            for j in range(len(sql_result.rows[i])):
-                # 进行正则替换
-                temp_value_list += [
-                    compiled_r.sub(replace_pattern, str(sql_result.rows[i][j]))
-                ]
-            rows[i] = tuple(temp_value_list)
-        sql_result.rows = rows
+        width = max((len(row) for row in rows), default=0)
+        sql_result.rows = mask_columns(rows, {index: maskers for index in range(width)})
     return sql_result
 
 
+def _alias_columns(sql_result, sql_result_column_list):
+    """解析原SQL中的别名字段，返回 [(字段名, 别名索引)]，遇到无法解析的字段即停止"""
+    alias_columns = []
+    try:
+        for _c in sql_result_column_list:
+            alias_column_regex = r'"?([^\s"]+)"?\s+(as\s+)?"?({})[",\s+]?'.format(
+                re.escape(_c)
+            )
+            alias_column_r = re.compile(alias_column_regex, re.I)
+            # 解析原SQL查询别名字段
+            search_data = re.search(alias_column_r, sql_result.full_sql)
+            # 字段名
+            _column_name = search_data.group(1).lower()
+            s_column_name = re.sub(r'^"?\w+"?\."?|\.|"$', "", _column_name)
+            # 别名
+            alias_name = search_data.group(3).lower()
+            alias_columns.append(
+                (s_column_name, sql_result_column_list.index(alias_name))
+            )
+    except:
+        pass
+    return alias_columns
+
+
 def simple_column_mask(instance, sql_result):
     """输入的是一个resultset
     sql_result.full_sql
@@ -245,7 +369,17 @@ def simple_column_mask(instance, sql_result):
     # 转换sql输出字段名为小写, 适配oracle脱敏
     sql_result_column_list = [c.lower() for c in sql_result.column_list]
     if masking_columns:
+        column_maskers = {}
         try:
+            # 脱敏规则和别名解析只做一次，不随字段循环重复查询
+            masking_rules = {
+                rule.rule_type: rule
+                for rule in DataMaskingRules.objects.filter(
+                    rule_type__in={mc.rule_type for mc in masking_columns}
+                )
+            }
+            compiled_rules = {}
+            alias_columns = _alias_columns(sql_result, sql_result_column_list)
             for mc in masking_columns:
                 # 脱敏规则字段名
                 column_name = mc.column_name.lower()
@@ -255,54 +389,34 @@ def simple_column_mask(instance, sql_result):
                     _masking_column_index.append(
                         sql_result_column_list.index(column_name)
                     )
-                # 别名字段脱敏处理
-                try:
-                    for _c in sql_result_column_list:
-                        alias_column_regex = (
-                            r'"?([^\s"]+)"?\s+(as\s+)?"?({})[",\s+]?'.format(
-                                re.escape(_c)
-                            )
-                        )
-                        alias_column_r = re.compile(alias_column_regex, re.I)
-                        # 解析原SQL查询别名字段
-                        search_data = re.search(alias_column_r, sql_result.full_sql)
-                        # 字段名
-                        _column_name = search_data.group(1).lower()
-                        s_column_name = re.sub(r'^"?\w+"?\."?|\.|"$', "", _column_name)
-                        # 别名
-                        alias_name = search_data.group(3).lower()
-                        # 如果字段名匹配脱敏配置字段,对此字段进行脱敏处理
-                        if s_column_name == column_name:
-                            _masking_column_index.append(
-                                sql_result_column_list.index(alias_name)
-                            )
-                except:
-                    pass
+                # 别名字段脱敏处理, 如果字段名匹配脱敏配置字段,对此字段进行脱敏处理
+                _masking_column_index.extend(
+                    index
+                    for s_column_name, index in alias_columns
+                    if s_column_name == column_name
+                )
 
                 for masking_column_index in _masking_column_index:
                     # 脱敏规则
-                    masking_rule = DataMaskingRules.objects.get(rule_type=mc.rule_type)
-                    # 脱敏后替换字符串
-                    compiled_r = re.compile(masking_rule.rule_regex, re.I | re.S)
-                    replace_pattern = r""
-                    for i in range(1, compiled_r.groups + 1):
-                        if i == int(masking_rule.hide_group):
-                            replace_pattern += r"****"
-                        else:
-                            replace_pattern += r"\{}".format(i)
-
-                    rows = list(sql_result.rows)
-                    for i in range(len(sql_result.rows)):
-                        temp_value_list = []
-                        for j in range(len(sql_result.rows[i])):
-                            column_data = sql_result.rows[i][j]
-                            if j == masking_column_index:
-                                column_data = compiled_r.sub(
-                                    replace_pattern, str(sql_result.rows[i][j])
-                                )
-                            temp_value_list += [column_data]
-                        rows[i] = tuple(temp_value_list)
-                    sql_result.rows = rows
+                    if mc.rule_type not in masking_rules:
+                        raise DataMaskingRules.DoesNotExist(
+                            "DataMaskingRules matching query does not exist."
+                        )
+                    if mc.rule_type not in compiled_rules:
+                        masking_rule = masking_rules[mc.rule_type]
+                        compiled_rules[mc.rule_type] = compile_sub_masker(
+                            masking_rule.rule_regex,
+                            masking_rule.hide_group,
+                            re.I | re.S,
+                        )
+                    column_maskers.setdefault(masking_column_index, []).append(
+                        compiled_rules[mc.rule_type]
+                    )
+        except Exception as e:
+            sql_result.error = str(e)
+        try:
+            if column_maskers:
+                sql_result.rows = mask_columns(sql_result.rows, column_maskers)
         except Exception as e:
             sql_result.error = str(e)
 
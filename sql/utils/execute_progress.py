@@ -0,0 +1,169 @@
+# -*- coding: UTF-8 -*-
+"""
+SQL工单执行进度
+引擎执行过程中把已执行语句数、影响行数、当前语句、预计剩余时间写入缓存,
+详情页通过长轮询获取, 进度没有变化时请求在服务端等待, 查看执行中工单的用户再多也不会查询数据库,
+等待中的请求会占用web worker, 同时等待的请求数超过上限时不再等待, 由客户端间隔一段时间后重新获取
+"""
+
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+from common.utils.settings_config import get_settings_config
+
+DEFAULT_EXECUTE_PROGRESS_CONFIG = {
+    # 开启后引擎执行时上报进度, goInception按批执行DML工单
+    "enabled": False,
+    # goInception每批执行的语句数
+    "batch_size": 1000,
+    # 进度写入缓存的最小间隔，秒
+    "publish_interval": 1,
+    # 长轮询的最长等待时间，秒
+    "poll_timeout": 10,
+    # 同时在服务端等待的长轮询请求数上限，需小于web worker数，超过时立即返回
+    "max_waiting": 2,
+}
+
+PROGRESS_CACHE_KEY = "workflow_progress:{workflow_id}"
+WAITING_CACHE_KEY = "workflow_progress:waiting"
+PROGRESS_CACHE_TIMEOUT = 60 * 60 * 24
+# 长轮询检查缓存的间隔，秒
+POLL_INTERVAL = 0.5
+# 当前语句展示的最大长度
+CURRENT_SQL_MAX_LENGTH = 200
+
+
+def get_execute_progress_config():
+    """读取执行进度配置, 未配置的项使用默认值"""
+    return get_settings_config("EXECUTE_PROGRESS", DEFAULT_EXECUTE_PROGRESS_CONFIG)
+
+
+class ExecuteProgress:
+    """工单执行进度, 由执行工单的引擎创建并更新"""
+
+    def __init__(self, workflow_id, total):
+        self.workflow_id = workflow_id
+        self.total = total
+        self.done = 0
+        self.affected_rows = 0
+        self.current_sql = ""
+        self.start_time = time.time()
+        self.publish_interval = float(get_execute_progress_config()["publish_interval"])
+        self._published_at = 0
+
+    def start(self):
+        self.publish()
+
+    def advance(self, count=1, affected_rows=0, current_sql=""):
+        """完成count条语句, 超过上报间隔时写入缓存"""
+        self.done = min(self.done + count, self.total)
+        self.affected_rows += int(affected_rows or 0)
+        self.current_sql = current_sql[:CURRENT_SQL_MAX_LENGTH]
+        if (
+            self.done >= self.total
+            or time.time() - self._published_at >= self.publish_interval
+        ):
+            self.publish()
+
+    def publish(self, status="workflow_executing"):
+        now = time.time()
+        elapsed = now - self.start_time
+        if self.done >= self.total:
+            eta = 0
+        elif self.done:
+            eta = round(elapsed / self.done * (self.total - self.done), 1)
+        else:
+            eta = None
+        cache.set(
+            PROGRESS_CACHE_KEY.format(workflow_id=self.workflow_id),
+            {
+                "status": status,
+                "done": self.done,
+                "total": self.total,
+                "affected_rows": self.affected_rows,
+                "current_sql": self.current_sql,
+                "elapsed": round(elapsed, 1),
+                "eta": eta,
+                # 毫秒时间戳作为版本号, 长轮询返回比客户端版本更新的进度
+                "version": int(now * 1000),
+            },
+            PROGRESS_CACHE_TIMEOUT,
+        )
+        self._published_at = now
+
+
+def get_progress(workflow_id):
+    """获取工单执行进度, 没有进度时返回None"""
+    return cache.get(PROGRESS_CACHE_KEY.format(workflow_id=workflow_id))
+
+
+def finish_progress(workflow_id, status):
+    """工单执行结束后更新进度中的工单状态, 通知等待中的长轮询, 未上报进度的引擎同样写入"""
+    progress = get_progress(workflow_id) or {
+        "done": 0,
+        "total": 0,
+        "affected_rows": 0,
+        "current_sql": "",
+        "elapsed": 0,
+    }
+    progress["status"] = status
+    progress["eta"] = 0
+    progress["version"] = int(time.time() * 1000)
+    cache.set(
+        PROGRESS_CACHE_KEY.format(workflow_id=workflow_id),
+        progress,
+        PROGRESS_CACHE_TIMEOUT,
+    )
+
+
+@contextmanager
+def waiting_slot(max_waiting, timeout):
+    """
+    占用一个长轮询等待名额, 计数记录在缓存中, 在多个web进程间生效
+    :return: 是否获取到名额
+    """
+    cache.add(WAITING_CACHE_KEY, 0, timeout)
+    try:
+        waiting = cache.incr(WAITING_CACHE_KEY)
+    except ValueError:
+        # 计数刚好过期
+        waiting = 1
+        cache.set(WAITING_CACHE_KEY, waiting, timeout)
+    try:
+        yield waiting <= max_waiting
+    finally:
+        try:
+            cache.decr(WAITING_CACHE_KEY)
+        except ValueError:
+            pass
+
+
+def wait_progress(workflow_id, version=0, timeout=None):
+    """
+    长轮询等待进度更新
+    没有进度的工单和同时等待的请求数达到上限时不等待, 直接返回当前进度
+    :param version: 客户端已获取的进度版本
+    :return: 比version新的进度, 超时未更新时返回当前进度, 没有进度时返回None
+    """
+    progress = get_progress(workflow_id)
+    if progress is None or progress["version"] > version:
+        return progress
+    config = get_execute_progress_config()
+    if timeout is None:
+        timeout = float(config["poll_timeout"])
+    if timeout <= 0:
+        return progress
+    # 计数的过期时间大于等待时间, 进程异常退出未释放的名额在过期后恢复
+    with waiting_slot(int(config["max_waiting"]), int(timeout) * 4 + 1) as acquired:
+        if not acquired:
+            return progress
+        deadline = time.time() + timeout
+        while True:
+            time.sleep(POLL_INTERVAL)
+            progress = get_progress(workflow_id)
+            if progress is None or progress["version"] > version:
+                return progress
+            if time.time() >= deadline:
+                return progress
@@ -3,15 +3,19 @@ import logging
 import traceback
 
 from django.db import close_old_connections, connection, transaction
-from django_redis import get_redis_connection
 from common.utils.const import WorkflowStatus, WorkflowType
 from common.config import SysConfig
 from sql.engines.models import ReviewResult, ReviewSet
 from sql.models import SqlWorkflow
 from sql.notify import notify_for_execute, EventType
 from sql.utils.workflow_audit import Audit
+from sql.utils.execute_progress import finish_progress
+from sql.utils.workflow_detail import clear_statement_index
 from sql.engines import get_engine
 from sql.offlinedownload import OffLineDownLoad
+from sql.utils.data_masking import invalidate_select_list_cache
+from sql.utils.metadata_cache import invalidate_instance_metadata
+from sql.utils.sql_utils import extract_tables
 
 logger = logging.getLogger("default")
 
@@ -97,6 +101,8 @@ def execute_callback(task):
         )
         workflow.sqlworkflowcontent.execute_result = {f"{e}"}
         workflow.sqlworkflowcontent.save()
+    clear_statement_index(workflow_id)
+    finish_progress(workflow_id, workflow.status)
     # 增加工单日志
     audit_id = Audit.detail_by_workflow_id(
         workflow_id=workflow_id, workflow_type=WorkflowType.SQL_REVIEW
@@ -110,14 +116,11 @@ def execute_callback(task):
         operator_display="系统",
     )
 
-    # DDL工单结束后清空实例资源缓存
+    # DDL工单结束后清空涉及库的实例资源缓存和脱敏select list缓存
     if workflow.syntax_type == 1:
-        try:
-            r = get_redis_connection("default")
-            for key in r.scan_iter(match="*insRes*", count=2000):
-                r.delete(key)
-        except NotImplementedError:
-            logger.debug("当前缓存后端不支持Redis扫描，跳过实例资源缓存清理")
+        invalidate_select_list_cache(workflow.instance_id)
+        for db_name in _ddl_db_names(workflow):
+            invalidate_instance_metadata(workflow.instance_id, db_name)
 
     # 开启了Execute阶段通知参数才发送消息通知
     sys_config = SysConfig()
@@ -128,3 +131,15 @@ def execute_callback(task):
     )
     if is_notified:
         notify_for_execute(workflow)
+
+
+def _ddl_db_names(workflow):
+    """DDL工单涉及的库, 包含工单所选库和语句中显式指定的库"""
+    db_names = {workflow.db_name}
+    try:
+        for table in extract_tables(workflow.sqlworkflowcontent.sql_content):
+            if table["schema"]:
+                db_names.add(table["schema"].strip("`"))
+    except Exception as e:
+        logger.debug(f"解析DDL工单涉及的库失败，错误信息：{e}")
+    return db_names
@@ -0,0 +1,105 @@
+# -*- coding: UTF-8 -*-
+"""
+实例元数据缓存, 缓存库、schema、表、字段列表和表结构
+以实例、库为层级维护版本号, DDL后仅失效对应实例或库下的缓存, 不依赖Redis的键扫描
+"""
+
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger("default")
+
+
+def _version_key(instance_id, db_name=None):
+    if db_name is None:
+        return f"ins_meta_version:{instance_id}"
+    return f"ins_meta_version:{instance_id}:{db_name}"
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def _cache_key(instance, resource_type, db_name, schema_name, tb_name, variant):
+    """缓存key由实例版本、库版本和资源路径组成, 库名为空时使用库列表的版本号"""
+    versions = cache.get_many(
+        [_version_key(instance.id), _version_key(instance.id, db_name)]
+    )
+    # 实例配置修改后update_time变化, 旧缓存自然失效
+    update_time = instance.update_time.timestamp() if instance.update_time else 0
+    path = "|".join(
+        str(i)
+        for i in (
+            resource_type,
+            db_name,
+            versions.get(_version_key(instance.id, db_name), 0),
+            schema_name,
+            tb_name,
+            variant,
+        )
+    )
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+    instance_version = versions.get(_version_key(instance.id), 0)
+    return f"ins_meta:{instance.id}:{instance_version}:{update_time}:{digest}"
+
+
+def get_instance_metadata(
+    instance,
+    resource_type,
+    loader,
+    db_name="",
+    schema_name="",
+    tb_name="",
+    variant="",
+):
+    """
+    获取实例元数据, 未命中缓存时调用loader加载, 仅缓存无错误的结果
+    :param instance: 实例对象
+    :param resource_type: 资源类型, database、schema、table、column、describe
+    :param loader: 无参函数, 返回ResultSet
+    :param variant: 影响结果的其他条件, 如是否超级管理员
+    :return: ResultSet
+    """
+    ttl = getattr(settings, "INSTANCE_METADATA_CACHE_TTL", 0)
+    cache_key = None
+    if ttl > 0:
+        try:
+            cache_key = _cache_key(
+                instance, resource_type, db_name, schema_name, tb_name, variant
+            )
+            resource = cache.get(cache_key)
+            if resource is not None:
+                return resource
+        except Exception as e:
+            logger.warning(f"读取实例元数据缓存失败，错误信息：{e}")
+            cache_key = None
+    resource = loader()
+    if cache_key and not resource.error:
+        try:
+            cache.set(cache_key, resource, timeout=ttl)
+        except Exception as e:
+            logger.warning(f"写入实例元数据缓存失败，错误信息：{e}")
+    return resource
+
+
+def invalidate_instance_metadata(instance_id, db_name=None):
+    """
+    失效实例元数据缓存
+    :param instance_id: 实例id
+    :param db_name: 库名, 为空时失效整个实例, 否则仅失效该库下的缓存和实例的库列表
+    """
+    try:
+        if db_name is None:
+            _bump(_version_key(instance_id))
+        else:
+            _bump(_version_key(instance_id, db_name))
+            # 库的创建、删除影响库列表
+            _bump(_version_key(instance_id, ""))
+    except Exception as e:
+        logger.warning(f"清理实例元数据缓存失败，错误信息：{e}")
@@ -0,0 +1,192 @@
+# -*- coding: UTF-8 -*-
+"""
+my2sql输出文件的分页读取
+首次读取时扫描一遍输出目录下的SQL文件, 每隔一定条数记录一次文件位置建立稀疏索引,
+之后任意一页只需定位到最近的索引点读取, 索引按过滤条件分别保存在输出目录中,
+文件变化后自动重建
+"""
+
+import hashlib
+import mmap
+import os
+import re
+
+import simplejson as json
+
+# 每隔多少条SQL记录一个索引点
+INDEX_INTERVAL = 1000
+
+TABLE_RE = re.compile(
+    r"^(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|DELETE\s+FROM|UPDATE)\s+"
+    r"(?:`?(?P<db>[^`\s.]+)`?\.)?`?(?P<table>[^`\s(]+)`?",
+    re.I,
+)
+EXTRA_TABLE_RE = re.compile(r"\bdatabase=(?P<db>\S*)\s+table=(?P<table>\S*)")
+
+
+def sql_table(sql, extra_info=""):
+    """SQL语句对应的(库名, 表名), SQL中未带库名时使用extraInfo中的库名"""
+    db_name, table_name = "", ""
+    match = TABLE_RE.match(sql)
+    if match:
+        db_name, table_name = match.group("db") or "", match.group("table")
+    match = EXTRA_TABLE_RE.search(extra_info or "")
+    if match and match.group("table") in ("", table_name):
+        db_name = db_name or match.group("db")
+    elif match and not table_name:
+        db_name, table_name = match.group("db"), match.group("table")
+    return db_name, table_name
+
+
+class My2sqlOutputReader:
+    """
+    my2sql输出目录的分页读取
+    :param output_dir: my2sql的输出目录
+    :param tables: 表名过滤, 支持 表名 或 库名.表名
+    :param sql_types: 语句类型过滤, INSERT、DELETE、UPDATE
+    """
+
+    def __init__(self, output_dir, tables=None, sql_types=None):
+        self.output_dir = output_dir
+        self.tables = {t for t in tables or [] if t}
+        self.sql_types = {t.upper() for t in sql_types or [] if t}
+        self._index = None
+
+    @property
+    def files(self):
+        """按my2sql的输出顺序排列的SQL文件"""
+        files = []
+        for root, _, names in os.walk(self.output_dir):
+            for file_name in sorted(names):
+                if not file_name.endswith(".sql") or file_name.startswith("."):
+                    continue
+                files.append(os.path.join(root, file_name))
+        return files
+
+    def _match(self, sql, extra_info):
+        if self.sql_types and sql[0:6].upper() not in self.sql_types:
+            return False
+        if self.tables:
+            db_name, table_name = sql_table(sql, extra_info)
+            if table_name not in self.tables and (
+                f"{db_name}.{table_name}" not in self.tables
+            ):
+                return False
+        return True
+
+    @staticmethod
+    def _lines(mm, pos=0):
+        """从mmap的pos位置开始逐行读取, 返回(行起始位置, 行内容)"""
+        size = mm.size()
+        while pos < size:
+            end = mm.find(b"\n", pos)
+            if end == -1:
+                end = size
+            yield pos, mm[pos:end].decode("utf-8", "replace")
+            pos = end + 1
+
+    def _iter_rows(self, files, start=None):
+        """
+        从索引点开始读取匹配过滤条件的SQL
+        :param start: 索引点 [文件序号, 行位置, extraInfo]
+        :return: (文件序号, 行位置, 当前extraInfo, 行信息)
+        """
+        # 避免循环引用
+        from sql.binlog import parse_my2sql_output_line
+
+        file_index, pos, current_extra_info = start or (0, 0, "")
+        for index in range(file_index, len(files)):
+            if os.path.getsize(files[index]) == 0:
+                continue
+            with open(files[index], "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mm:
+                for line_pos, line in self._lines(
+                    mm, pos if index == file_index else 0
+                ):
+                    extra_info_before = current_extra_info
+                    row_info, current_extra_info = parse_my2sql_output_line(
+                        line, current_extra_info
+                    )
+                    if row_info and self._match(row_info["sql"], current_extra_info):
+                        yield index, line_pos, extra_info_before, row_info
+
+    def _index_path(self):
+        key = json.dumps([sorted(self.tables), sorted(self.sql_types)])
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.output_dir, f".my2sql_index_{digest}.json")
+
+    @property
+    def index(self):
+        """
+        稀疏索引 {"files": 文件签名, "total": 总条数, "points": [[文件序号, 行位置, extraInfo], ...]}
+        第n个索引点是第 n*INDEX_INTERVAL 条SQL的位置
+        """
+        if self._index is not None:
+            return self._index
+        files = self.files
+        signature = [
+            [
+                os.path.relpath(f, self.output_dir),
+                os.path.getsize(f),
+                os.path.getmtime(f),
+            ]
+            for f in files
+        ]
+        index_path = self._index_path()
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, encoding="utf-8") as f:
+                    index = json.load(f)
+                if index["files"] == signature and index["interval"] == INDEX_INTERVAL:
+                    self._index = index
+                    return index
+            except (ValueError, KeyError, OSError):
+                pass
+        points = []
+        total = 0
+        for file_index, line_pos, extra_info, _ in self._iter_rows(files):
+            if total % INDEX_INTERVAL == 0:
+                points.append([file_index, line_pos, extra_info])
+            total += 1
+        index = {
+            "files": signature,
+            "interval": INDEX_INTERVAL,
+            "total": total,
+            "points": points,
+        }
+        try:
+            with open(index_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+        except OSError:
+            # 输出目录不可写时只在内存中使用
+            pass
+        self._index = index
+        return index
+
+    @property
+    def total(self):
+        """匹配过滤条件的SQL总数"""
+        return self.index["total"]
+
+    def read(self, offset=0, limit=30):
+        """读取第offset条开始的limit条SQL, 第一个索引点之前的数据直接从头读取, 不需要建立索引"""
+        if limit <= 0:
+            return []
+        files = self.files
+        point, skip = None, offset
+        if offset >= INDEX_INTERVAL:
+            points = self.index["points"]
+            if offset // INDEX_INTERVAL >= len(points):
+                return []
+            point = points[offset // INDEX_INTERVAL]
+            skip = offset % INDEX_INTERVAL
+        rows = []
+        for _, _, _, row_info in self._iter_rows(files, point):
+            if skip:
+                skip -= 1
+                continue
+            rows.append(row_info)
+            if len(rows) >= limit:
+                break
+        return rows
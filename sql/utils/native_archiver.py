@@ -0,0 +1,393 @@
+# -*- coding: UTF-8 -*-
+"""
+进程内的MySQL数据归档, 替代pt-archiver子进程
+按主键键集分页逐批读取源表, 批量写入目标表或文件后按主键删除源数据,
+根据从库延迟调整批次大小, 每批完成后记录断点, 中断的归档从断点继续
+"""
+
+import datetime
+import logging
+import os
+import time
+
+import simplejson as json
+from django.conf import settings
+
+from common.utils.settings_config import get_settings_config
+from sql.engines import get_engine
+from sql.engines.mysql import MysqlForkType
+from sql.models import ArchiveConfig, Instance
+
+logger = logging.getLogger("default")
+
+DEFAULT_NATIVE_ARCHIVER_CONFIG = {
+    # 初始批次大小
+    "batch_size": 1000,
+    "min_batch_size": 100,
+    "max_batch_size": 10000,
+    # 从库延迟超过该值时减小批次并等待延迟恢复，秒，0表示不检查延迟
+    "max_lag": 10,
+    # 等待从库延迟恢复时的检查间隔，秒
+    "lag_check_interval": 1,
+    # 额外需要检查延迟的实例名，源实例的从库如已在Archery中注册会自动检查
+    "lag_instances": [],
+}
+
+
+def get_native_archiver_config():
+    """读取归档配置, 未配置的项使用默认值"""
+    return get_settings_config("ARCHIVER_NATIVE", DEFAULT_NATIVE_ARCHIVER_CONFIG)
+
+
+def quote_name(name):
+    return "`{}`".format(name.replace("`", "``"))
+
+
+def _file_value(value):
+    """与pt-archiver --file 的输出格式保持一致, NULL输出为\\N, 转义制表符、换行和反斜杠"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        value = int(value)
+    elif isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return str(value)
+
+
+def replica_instances(src_engine, names):
+    """源实例在Archery中注册的从库和按实例名指定的实例"""
+    instances = {}
+    for instance in Instance.objects.filter(instance_name__in=names):
+        instances[instance.id] = instance
+    if (
+        src_engine.server_fork_type != MysqlForkType.MARIADB
+        and src_engine.server_version >= (8, 0, 22)
+    ):
+        sql = "show replicas"
+    else:
+        sql = "show slave hosts"
+    replicas = src_engine.query(sql=sql, close_conn=False)
+    if not replicas.error:
+        column_list = [c.lower() for c in replicas.column_list]
+        for row in replicas.rows:
+            replica = dict(zip(column_list, row))
+            if not replica.get("host"):
+                continue
+            for instance in Instance.objects.filter(
+                db_type="mysql", host=replica["host"], port=replica.get("port")
+            ):
+                instances[instance.id] = instance
+    return list(instances.values())
+
+
+def max_replica_lag(engines):
+    """从库的最大延迟, 无法获取时返回None"""
+    lags = []
+    for engine in engines:
+        try:
+            lag = engine.seconds_behind_master
+        except Exception as e:
+            logger.warning(f"获取实例{engine.instance_name}的延迟失败，错误信息：{e}")
+            continue
+        if lag is not None:
+            lags.append(int(lag))
+    return max(lags) if lags else None
+
+
+class NativeArchiver:
+    """
+    归档单个配置的数据
+    源表需有主键, 每批数据写入目标并提交后才删除源数据,
+    中断后重跑时目标表中可能已有上一批写入的数据, 写入目标表前在同一事务中按主键删除目标表中的这批数据,
+    写入的行数与查询的行数不一致时停止归档, 不删除源数据
+    """
+
+    def __init__(self, archive_info, config=None):
+        self.archive_info = archive_info
+        self.config = config or get_native_archiver_config()
+        self.mode = archive_info.mode
+        self.delete = self.mode == "purge" or not archive_info.no_delete
+        self.select_cnt = 0
+        self.insert_cnt = 0
+        self.delete_cnt = 0
+        self.batch_cnt = 0
+        self.lag_wait = 0
+        self.batch_size = int(self.config["batch_size"])
+        self.resumed_from = None
+        self._lag_engines = None
+
+    @property
+    def file_path(self):
+        output_directory = os.path.join(settings.BASE_DIR, "downloads/archiver")
+        os.makedirs(output_directory, exist_ok=True)
+        archive_info = self.archive_info
+        return (
+            f"{output_directory}/{archive_info.src_instance.instance_name}-"
+            f"{archive_info.src_db_name}-{archive_info.src_table_name}.txt"
+        )
+
+    @property
+    def command(self):
+        """记录到归档日志的执行参数"""
+        archive_info = self.archive_info
+        cmd = (
+            f"native-archiver source={archive_info.src_instance.instance_name}."
+            f"{archive_info.src_db_name}.{archive_info.src_table_name} "
+            f"mode={self.mode} delete={self.delete} "
+            f"batch_size={self.config['batch_size']} max_lag={self.config['max_lag']} "
+            f"sleep={archive_info.sleep}"
+        )
+        if self.mode == "dest":
+            cmd += (
+                f" dest={archive_info.dest_instance.instance_name}."
+                f"{archive_info.dest_db_name}.{archive_info.dest_table_name}"
+            )
+        return cmd
+
+    @property
+    def statistics(self):
+        lines = [
+            f"SELECT {self.select_cnt}",
+            f"INSERT {self.insert_cnt}",
+            f"DELETE {self.delete_cnt}",
+            f"BATCH {self.batch_cnt}",
+            f"BATCH_SIZE {self.batch_size}",
+            f"LAG_WAIT {self.lag_wait}",
+        ]
+        if self.resumed_from is not None:
+            lines.append(
+                f"RESUME_FROM {json.dumps(self.resumed_from, default=_json_default)}"
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def _engine(instance):
+        engine = get_engine(instance=instance)
+        # 归档在长事务中逐批提交，不使用连接池中的连接
+        engine.pool_enabled = False
+        return engine
+
+    def load_checkpoint(self):
+        """读取断点, 归档条件或模式变化后断点失效"""
+        raw = self.archive_info.checkpoint
+        if not raw:
+            return None
+        try:
+            checkpoint = json.loads(raw)
+        except ValueError:
+            return None
+        if (
+            checkpoint.get("condition") != self.archive_info.condition
+            or checkpoint.get("mode") != self.mode
+        ):
+            return None
+        return checkpoint.get("key")
+
+    def save_checkpoint(self, key):
+        """每批提交后记录断点, 归档完成后清空"""
+        checkpoint = ""
+        if key is not None:
+            checkpoint = json.dumps(
+                {
+                    "condition": self.archive_info.condition,
+                    "mode": self.mode,
+                    "key": list(key),
+                },
+                default=_json_default,
+            )
+        self.archive_info.checkpoint = checkpoint
+        ArchiveConfig(id=self.archive_info.id, checkpoint=checkpoint).save(
+            update_fields=["checkpoint"]
+        )
+
+    def lag_engines(self, src_engine):
+        """需要检查延迟的实例: 源实例在Archery中注册的从库和配置的实例"""
+        if self._lag_engines is None:
+            self._lag_engines = [
+                self._engine(i)
+                for i in replica_instances(
+                    src_engine, self.config.get("lag_instances") or []
+                )
+            ]
+        return self._lag_engines
+
+    def replica_lag(self, src_engine):
+        """从库的最大延迟, 无法获取时返回None"""
+        return max_replica_lag(self.lag_engines(src_engine))
+
+    def throttle(self, src_engine):
+        """延迟超过阈值时批次减半并等待延迟恢复, 延迟较低时逐步增大批次"""
+        max_lag = self.config["max_lag"]
+        if not max_lag:
+            return
+        lag = self.replica_lag(src_engine)
+        if lag is None:
+            return
+        if lag > max_lag:
+            self.batch_size = max(
+                int(self.config["min_batch_size"]), self.batch_size // 2
+            )
+            while lag is not None and lag > max_lag:
+                logger.info(
+                    f"归档{self.archive_info.id}从库延迟{lag}秒，超过{max_lag}秒，等待延迟恢复"
+                )
+                time.sleep(self.config["lag_check_interval"])
+                self.lag_wait += 1
+                lag = self.replica_lag(src_engine)
+        elif lag <= max_lag / 2:
+            self.batch_size = min(
+                int(self.config["max_batch_size"]),
+                max(self.batch_size + 1, int(self.batch_size * 1.5)),
+            )
+
+    def select_sql(self, key_columns, resume):
+        archive_info = self.archive_info
+        condition = archive_info.condition.replace("%", "%%")
+        keys = ", ".join(quote_name(c) for c in key_columns)
+        where = f"({condition})"
+        if resume:
+            placeholders = ", ".join(["%s"] * len(key_columns))
+            where += f" AND ({keys}) > ({placeholders})"
+        return (
+            f"SELECT * FROM {quote_name(archive_info.src_db_name)}."
+            f"{quote_name(archive_info.src_table_name)} FORCE INDEX(PRIMARY) "
+            f"WHERE {where} ORDER BY {keys} LIMIT %s"
+        )
+
+    def delete_sql(self, key_columns, count, dest=False):
+        """按主键删除源表的数据, dest为True时删除目标表的数据"""
+        archive_info = self.archive_info
+        if dest:
+            db_name, table_name = (
+                archive_info.dest_db_name,
+                archive_info.dest_table_name,
+            )
+        else:
+            db_name, table_name = archive_info.src_db_name, archive_info.src_table_name
+        table = f"{quote_name(db_name)}.{quote_name(table_name)}"
+        if len(key_columns) == 1:
+            placeholders = ", ".join(["%s"] * count)
+            return f"DELETE FROM {table} WHERE {quote_name(key_columns[0])} IN ({placeholders})"
+        keys = ", ".join(quote_name(c) for c in key_columns)
+        row = f"({', '.join(['%s'] * len(key_columns))})"
+        return f"DELETE FROM {table} WHERE ({keys}) IN ({', '.join([row] * count)})"
+
+    def insert_sql(self, columns):
+        archive_info = self.archive_info
+        return (
+            f"INSERT INTO {quote_name(archive_info.dest_db_name)}."
+            f"{quote_name(archive_info.dest_table_name)} "
+            f"({', '.join(quote_name(c) for c in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+
+    def run(self):
+        """执行归档, 异常时已提交的批次保留, 断点停留在最后一个提交的批次"""
+        archive_info = self.archive_info
+        src_engine = self._engine(archive_info.src_instance)
+        dest_engine = None
+        dest_conn = None
+        output = None
+        try:
+            key_columns = src_engine.get_primary_key(
+                archive_info.src_db_name, archive_info.src_table_name
+            )
+            if not key_columns:
+                raise Exception(
+                    f"源表{archive_info.src_db_name}.{archive_info.src_table_name}没有主键，不支持原生归档"
+                )
+            src_conn = src_engine.get_connection(archive_info.src_db_name)
+            src_cursor = src_conn.cursor()
+            if self.mode == "dest":
+                dest_engine = self._engine(archive_info.dest_instance)
+                dest_conn = dest_engine.get_connection(archive_info.dest_db_name)
+                dest_cursor = dest_conn.cursor()
+            elif self.mode == "file":
+                output = open(self.file_path, "a", encoding="utf-8")
+
+            last_key = self.load_checkpoint()
+            self.resumed_from = last_key
+            while True:
+                params = list(last_key or []) + [self.batch_size]
+                src_cursor.execute(self.select_sql(key_columns, last_key), params)
+                rows = src_cursor.fetchall()
+                if not rows:
+                    # 结束只读事务的快照
+                    src_conn.commit()
+                    break
+                columns = [d[0] for d in src_cursor.description]
+                key_index = [columns.index(c) for c in key_columns]
+                keys = [tuple(row[i] for i in key_index) for row in rows]
+                self.select_cnt += len(rows)
+
+                key_params = [v for key in keys for v in key]
+                if self.mode == "dest":
+                    # 中断重跑时目标表中可能已有这批数据，先删除再写入
+                    dest_cursor.execute(
+                        self.delete_sql(key_columns, len(keys), dest=True), key_params
+                    )
+                    # executemany会合并为单条多行INSERT
+                    dest_cursor.executemany(self.insert_sql(columns), rows)
+                    inserted = dest_cursor.rowcount
+                    if inserted != len(rows):
+                        raise Exception(
+                            f"目标表写入{inserted}行，与查询的{len(rows)}行不一致，停止归档"
+                        )
+                    self.insert_cnt += inserted
+                    dest_conn.commit()
+                elif self.mode == "file":
+                    for row in rows:
+                        output.write("\t".join(_file_value(v) for v in row) + "\n")
+                    output.flush()
+                    os.fsync(output.fileno())
+
+                if self.delete:
+                    self.delete_cnt += src_cursor.execute(
+                        self.delete_sql(key_columns, len(keys)), key_params
+                    )
+                src_conn.commit()
+
+                last_key = keys[-1]
+                self.batch_cnt += 1
+                self.save_checkpoint(last_key)
+                logger.debug(
+                    f"归档{archive_info.id}第{self.batch_cnt}批完成，"
+                    f"已查询{self.select_cnt}行，批次大小{self.batch_size}"
+                )
+                if len(rows) < self.batch_size:
+                    break
+                if archive_info.sleep:
+                    time.sleep(archive_info.sleep)
+                self.throttle(src_engine)
+            self.save_checkpoint(None)
+        except Exception:
+            for conn in (src_engine.conn, dest_conn):
+                if conn:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+            raise
+        finally:
+            if output:
+                output.close()
+            src_engine.close()
+            if dest_engine:
+                dest_engine.close()
+            for engine in self._lag_engines or []:
+                engine.close()
+        return self
@@ -0,0 +1,301 @@
+# -*- coding: UTF-8 -*-
+"""
+MySQL工单原生执行
+只包含DML且不需要备份的工单不经过goInception, 直接连接实例按批次执行,
+每批语句在一次请求中以多语句方式发送并在同一事务中提交, 逐条记录影响行数,
+根据从库延迟和实例Threads_running调整每批的语句数, 负载过高时等待恢复
+"""
+
+import logging
+import time
+import traceback
+
+from common.utils.settings_config import get_settings_config
+from sql.engines import get_engine
+from sql.engines.goinception import CHUNK_SAFE_RE, LEADING_COMMENTS_RE
+from sql.engines.models import ReviewResult, ReviewSet
+from sql.utils.execute_progress import ExecuteProgress, get_execute_progress_config
+from sql.utils.native_archiver import max_replica_lag, replica_instances
+from sql.utils.sql_utils import split_mysql_statements
+
+logger = logging.getLogger("default")
+
+DEFAULT_NATIVE_EXECUTE_CONFIG = {
+    # 开启后不需要备份的DML工单使用原生执行
+    "enabled": False,
+    # 初始每批提交的语句数
+    "commit_size": 500,
+    "min_commit_size": 50,
+    "max_commit_size": 5000,
+    # 每批语句的最大长度，需小于实例的max_allowed_packet，字节
+    "max_batch_bytes": 4 * 1024 * 1024,
+    # 从库延迟超过该值时减小批次并等待延迟恢复，秒，0表示不检查延迟
+    "max_lag": 10,
+    # 实例Threads_running超过该值时减小批次并等待，0表示不检查
+    "max_threads_running": 32,
+    # 检查延迟和负载的最小间隔，也是等待恢复时的检查间隔，秒
+    "check_interval": 1,
+    # 额外需要检查延迟的实例名，实例的从库如已在Archery中注册会自动检查
+    "lag_instances": [],
+}
+
+# mysql_set_server_option 开启多语句的选项值
+MYSQL_OPTION_MULTI_STATEMENTS_ON = 0
+
+
+def get_native_execute_config():
+    """读取原生执行配置, 未配置的项使用默认值"""
+    return get_settings_config("MYSQL_NATIVE_EXECUTE", DEFAULT_NATIVE_EXECUTE_CONFIG)
+
+
+def native_statements(workflow, config=None):
+    """
+    判断工单能否原生执行并拆分语句
+    回滚语句依赖goInception的备份, 需要备份的工单和包含DML以外语句的工单不使用原生执行
+    :return: 语句列表, 不能原生执行时返回None
+    """
+    config = config or get_native_execute_config()
+    if not config["enabled"] or workflow.is_backup:
+        return None
+    statements = []
+    for statement in split_mysql_statements(workflow.sqlworkflowcontent.sql_content):
+        body = LEADING_COMMENTS_RE.sub("", statement, count=1)
+        if not body:
+            continue
+        if not CHUNK_SAFE_RE.match(body):
+            return None
+        statements.append(statement)
+    return statements or None
+
+
+class NativeExecutor:
+    """
+    按批次执行工单语句
+    每批在一个事务中提交, 语句报错时回滚当前批次并停止执行, 之前批次的修改已提交
+    """
+
+    def __init__(self, workflow, statements, config=None):
+        self.workflow = workflow
+        self.statements = statements
+        self.config = config or get_native_execute_config()
+        self.commit_size = int(self.config["commit_size"])
+        self.batch_cnt = 0
+        self.throttle_wait = 0
+        self.engine = self._engine(workflow.instance)
+        self._lag_engines = None
+        self._checked_at = 0
+
+    @staticmethod
+    def _engine(instance):
+        engine = get_engine(instance=instance)
+        # 在长事务中按批提交并开启了多语句，不使用连接池中的连接
+        engine.pool_enabled = False
+        return engine
+
+    def lag_engines(self):
+        if self._lag_engines is None:
+            self._lag_engines = [
+                self._engine(i)
+                for i in replica_instances(
+                    self.engine, self.config.get("lag_instances") or []
+                )
+            ]
+        return self._lag_engines
+
+    def replica_lag(self):
+        """从库的最大延迟, 无法获取时返回None"""
+        return max_replica_lag(self.lag_engines())
+
+    @staticmethod
+    def threads_running(cursor):
+        cursor.execute("show global status like 'Threads_running'")
+        row = cursor.fetchone()
+        return int(row[1]) if row else None
+
+    def overloaded(self, cursor):
+        """从库延迟或实例负载超过阈值时返回原因"""
+        max_lag = int(self.config["max_lag"])
+        if max_lag:
+            lag = self.replica_lag()
+            if lag is not None and lag > max_lag:
+                return f"从库延迟{lag}秒，超过{max_lag}秒"
+        max_threads = int(self.config["max_threads_running"])
+        if max_threads:
+            threads = self.threads_running(cursor)
+            if threads is not None and threads > max_threads:
+                return f"Threads_running为{threads}，超过{max_threads}"
+        return None
+
+    def throttle(self, cursor):
+        """超过阈值时批次减半并等待恢复, 负载正常时逐步增大批次"""
+        interval = float(self.config["check_interval"])
+        if time.time() - self._checked_at < interval:
+            return
+        reason = self.overloaded(cursor)
+        if reason:
+            self.commit_size = max(
+                int(self.config["min_commit_size"]), self.commit_size // 2
+            )
+            while reason:
+                logger.info(f"工单{self.workflow.id}{reason}，等待恢复后继续执行")
+                time.sleep(interval)
+                self.throttle_wait += 1
+                reason = self.overloaded(cursor)
+        else:
+            self.commit_size = min(
+                int(self.config["max_commit_size"]),
+                max(self.commit_size + 1, int(self.commit_size * 1.5)),
+            )
+        self._checked_at = time.time()
+
+    def next_batch(self, pos):
+        """从pos开始取一批语句, 不超过批次语句数和最大长度, 至少包含一条"""
+        max_bytes = int(self.config["max_batch_bytes"])
+        batch, size = [], 0
+        for statement in self.statements[pos : pos + self.commit_size]:
+            size += len(statement.encode("utf-8")) + 2
+            if batch and size > max_bytes:
+                break
+            batch.append(statement)
+        return batch
+
+    @staticmethod
+    def execute_batch(cursor, batch, rowcounts):
+        """以多语句方式执行一批语句, 逐条记录影响行数, 报错语句为rowcounts的下一条"""
+        cursor.execute(";\n".join(batch))
+        rowcounts.append(cursor.rowcount)
+        while cursor.nextset():
+            rowcounts.append(cursor.rowcount)
+
+    def execute(self):
+        result = ReviewSet(full_sql=self.workflow.sqlworkflowcontent.sql_content)
+        progress = None
+        if get_execute_progress_config()["enabled"]:
+            progress = ExecuteProgress(self.workflow.id, len(self.statements))
+            progress.start()
+        pos = 0
+        try:
+            conn = self.engine.get_connection(db_name=self.workflow.db_name)
+            conn.set_server_option(MYSQL_OPTION_MULTI_STATEMENTS_ON)
+            cursor = conn.cursor()
+            while pos < len(self.statements):
+                self.throttle(cursor)
+                batch = self.next_batch(pos)
+                rowcounts = []
+                start = time.time()
+                try:
+                    self.execute_batch(cursor, batch, rowcounts)
+                    conn.commit()
+                except Exception as e:
+                    logger.warning(
+                        f"工单{self.workflow.id}原生执行报错，错误信息：{traceback.format_exc()}"
+                    )
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                    self._failed_rows(result, batch, rowcounts, e)
+                    pos += len(batch)
+                    break
+                # 多语句一次返回, 单条语句的耗时取本批的平均值
+                cost = round((time.time() - start) / len(batch), 4)
+                for statement, affected_rows in zip(batch, rowcounts):
+                    result.rows.append(
+                        ReviewResult(
+                            id=len(result.rows) + 1,
+                            stage="Executed",
+                            errlevel=0,
+                            stagestatus="Execute Successfully",
+                            errormessage="None",
+                            sql=statement,
+                            affected_rows=affected_rows,
+                            actual_affected_rows=affected_rows,
+                            execute_time=cost,
+                        )
+                    )
+                self.batch_cnt += 1
+                pos += len(batch)
+                if progress:
+                    progress.advance(
+                        count=len(batch),
+                        affected_rows=sum(rowcounts),
+                        current_sql=batch[-1],
+                    )
+        except Exception as e:
+            # 连接实例或开启多语句失败
+            logger.warning(
+                f"工单{self.workflow.id}原生执行异常，错误信息：{traceback.format_exc()}"
+            )
+            result.error = str(e)
+            result.rows.append(
+                ReviewResult(
+                    id=len(result.rows) + 1,
+                    stage="Execute failed",
+                    errlevel=2,
+                    stagestatus="异常终止",
+                    errormessage=f"异常信息：{e}",
+                    sql=self.statements[pos] if pos < len(self.statements) else "",
+                )
+            )
+            pos += 1
+        finally:
+            self.engine.close()
+            for engine in self._lag_engines or []:
+                engine.close()
+        # 报错语句后面的语句标记为未执行
+        for statement in self.statements[pos:]:
+            result.rows.append(
+                ReviewResult(
+                    id=len(result.rows) + 1,
+                    stage="CHECKED",
+                    errlevel=0,
+                    stagestatus="Audit completed",
+                    errormessage="前序语句失败, 未执行",
+                    sql=statement,
+                )
+            )
+        if progress:
+            progress.publish()
+        logger.info(
+            f"工单{self.workflow.id}原生执行结束，批次数{self.batch_cnt}，"
+            f"等待恢复{self.throttle_wait}次"
+        )
+        return result
+
+    def _failed_rows(self, result, batch, rowcounts, error):
+        """报错批次的结果: 报错语句之前的已回滚, 报错语句记录错误, 之后的未执行"""
+        result.error = str(error)
+        failed = len(rowcounts)
+        for statement in batch[:failed]:
+            result.rows.append(
+                ReviewResult(
+                    id=len(result.rows) + 1,
+                    stage="Executed",
+                    errlevel=1,
+                    stagestatus="Execute Rollback",
+                    errormessage="同批次语句执行失败, 已回滚",
+                    sql=statement,
+                )
+            )
+        result.rows.append(
+            ReviewResult(
+                id=len(result.rows) + 1,
+                stage="Execute failed",
+                errlevel=2,
+                stagestatus="Execute Failed",
+                errormessage=f"异常信息：{error}",
+                # 语句都执行成功时为提交失败
+                sql=batch[failed] if failed < len(batch) else "commit",
+            )
+        )
+        for statement in batch[failed + 1 :]:
+            result.rows.append(
+                ReviewResult(
+                    id=len(result.rows) + 1,
+                    stage="CHECKED",
+                    errlevel=0,
+                    stagestatus="Audit completed",
+                    errormessage="前序语句失败, 未执行",
+                    sql=statement,
+                )
+            )
@@ -0,0 +1,210 @@
+# -*- coding: UTF-8 -*-
+"""
+离线导出的并行分片
+将单表查询按整数主键范围拆分为多个分片, 由多个连接并发读取, 按实例限制并发数
+各分片在不同连接上执行, 不是同一个一致性快照
+"""
+
+import logging
+import re
+import time
+from contextlib import contextmanager
+
+import sqlparse
+from django.core.cache import cache
+from sqlparse.tokens import DML, Keyword
+
+from common.utils.settings_config import get_settings_config
+
+logger = logging.getLogger("default")
+
+DEFAULT_PARALLEL_EXPORT_CONFIG = {
+    "enabled": False,
+    # 单个导出任务的并发数
+    "workers": 4,
+    # 同一实例上所有导出任务的并发上限，跨进程生效
+    "instance_limit": 4,
+    # 每个分片的主键跨度
+    "chunk_size": 100000,
+    # 单个导出任务的最大分片数，主键范围稀疏时按该值增大分片跨度
+    "max_chunks": 1000,
+    # 分片占用并发槽位的最长时间，进程异常退出后槽位在超时后释放，秒
+    "slot_timeout": 3600,
+    # 等待并发槽位的最长时间，超时后导出失败，秒，0表示一直等待
+    "slot_wait_timeout": 600,
+}
+
+# 包含这些关键字的查询拆分后结果会变化，不做拆分
+UNSPLITTABLE_KEYWORDS = {
+    "GROUP BY",
+    "ORDER BY",
+    "LIMIT",
+    "HAVING",
+    "UNION",
+    "UNION ALL",
+    "DISTINCT",
+    "JOIN",
+    "INNER JOIN",
+    "LEFT JOIN",
+    "RIGHT JOIN",
+    "CROSS JOIN",
+    "STRAIGHT_JOIN",
+    "LEFT OUTER JOIN",
+    "RIGHT OUTER JOIN",
+    "NATURAL JOIN",
+    "INTO",
+    "WINDOW",
+    "OVER",
+}
+
+SIMPLE_SELECT_RE = re.compile(
+    r"^\s*select\s+(?P<columns>.+?)\s+from\s+(?P<table>(?:`[^`]+`|\w+)(?:\.(?:`[^`]+`|\w+))?)"
+    r"(?:\s+(?:as\s+)?(?P<alias>(?!where\b)\w+))?"
+    r"(?:\s+where\s+(?P<where>.+?))?\s*;?\s*$",
+    re.I | re.S,
+)
+
+AGGREGATE_RE = re.compile(
+    r"\b(count|sum|avg|min|max|group_concat|std\w*|var\w*|bit_and|bit_or|bit_xor"
+    r"|json_arrayagg|json_objectagg)\s*\(",
+    re.I,
+)
+
+
+def get_parallel_export_config():
+    """读取并行导出配置, 未配置的项使用默认值"""
+    return get_settings_config("OFFLINE_EXPORT_PARALLEL", DEFAULT_PARALLEL_EXPORT_CONFIG)
+
+
+def _unquote(name):
+    return name.strip("`")
+
+
+def parse_single_table_select(sql):
+    """
+    解析可以按主键范围拆分的单表查询
+    :return: dict, 包含columns、schema、table、alias、where, 不支持拆分时返回None
+    """
+    sql = sqlparse.format(sql, strip_comments=True).strip()
+    statements = sqlparse.parse(sql)
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        return None
+    select_count = 0
+    for token in statements[0].flatten():
+        if token.ttype is DML:
+            if token.normalized != "SELECT":
+                return None
+            select_count += 1
+        elif token.ttype in Keyword and token.normalized in UNSPLITTABLE_KEYWORDS:
+            return None
+    # 子查询
+    if select_count != 1:
+        return None
+    match = SIMPLE_SELECT_RE.match(sql)
+    if not match or AGGREGATE_RE.search(match.group("columns")):
+        return None
+    table = match.group("table")
+    schema = None
+    parts = re.findall(r"`[^`]+`|\w+", table)
+    if len(parts) == 2:
+        schema, table = parts
+    return {
+        "columns": match.group("columns"),
+        "schema": _unquote(schema) if schema else None,
+        "table": _unquote(table),
+        "table_ref": match.group("table"),
+        "alias": match.group("alias"),
+        "where": match.group("where"),
+    }
+
+
+def _chunk_sql(parsed, key, start, end):
+    """生成主键范围 [start, end) 的分片查询"""
+    alias = f" {parsed['alias']}" if parsed["alias"] else ""
+    qualifier = parsed["alias"] or parsed["table_ref"]
+    conditions = [f"{qualifier}.`{key}` >= {start}", f"{qualifier}.`{key}` < {end}"]
+    if parsed["where"]:
+        conditions.insert(0, f"({parsed['where']})")
+    return (
+        f"SELECT {parsed['columns']} FROM {parsed['table_ref']}{alias} "
+        f"WHERE {' AND '.join(conditions)}"
+    )
+
+
+def plan_parallel_export(engine, db_name, sql, max_execution_time=0):
+    """
+    生成并行导出的分片查询
+    :param engine: 实例的engine, 需实现get_split_key
+    :return: 按主键顺序排列的分片查询列表, 不适合并行导出时返回None
+    """
+    config = get_parallel_export_config()
+    if not config["enabled"] or int(config["workers"]) <= 1:
+        return None
+    parsed = parse_single_table_select(sql)
+    if not parsed:
+        return None
+    key = engine.get_split_key(parsed["schema"] or db_name, parsed["table"])
+    if not key:
+        return None
+    alias = f" {parsed['alias']}" if parsed["alias"] else ""
+    where = f" WHERE {parsed['where']}" if parsed["where"] else ""
+    qualifier = parsed["alias"] or parsed["table_ref"]
+    range_result = engine.query(
+        db_name=db_name,
+        sql=f"SELECT MIN({qualifier}.`{key}`), MAX({qualifier}.`{key}`) "
+        f"FROM {parsed['table_ref']}{alias}{where}",
+        max_execution_time=max_execution_time,
+    )
+    if range_result.error or not range_result.rows:
+        return None
+    low, high = range_result.rows[0]
+    if low is None or high is None:
+        return None
+    chunk_size = int(config["chunk_size"])
+    span = high - low + 1
+    if span <= chunk_size:
+        return None
+    # 主键范围很大时限制分片数，避免生成过多的分片查询
+    max_chunks = int(config["max_chunks"])
+    if max_chunks > 0:
+        chunk_size = max(chunk_size, -(-span // max_chunks))
+    return [
+        _chunk_sql(parsed, key, start, min(start + chunk_size, high + 1))
+        for start in range(low, high + 1, chunk_size)
+    ]
+
+
+@contextmanager
+def instance_slot(instance_id, limit, timeout, wait_timeout=0, interval=0.5):
+    """
+    占用实例的一个导出并发槽位, 槽位全部被占用时等待, 超过wait_timeout秒未获取到时报错
+    槽位记录在缓存中, 同一实例的并发上限在多个进程间生效
+    """
+    deadline = time.time() + wait_timeout if wait_timeout > 0 else None
+    acquired = None
+    while acquired is None:
+        try:
+            for i in range(limit):
+                key = f"offline_export_slot:{instance_id}:{i}"
+                if cache.add(key, 1, timeout):
+                    acquired = key
+                    break
+        except Exception as e:
+            # 缓存不可用时不限制并发
+            logger.warning(f"获取导出并发槽位失败，错误信息：{e}")
+            acquired = ""
+        if acquired is None:
+            if deadline is not None and time.time() > deadline:
+                raise Exception(
+                    f"等待实例导出并发槽位超过{wait_timeout}秒，"
+                    f"同一实例正在执行的导出分片过多，请稍后重试"
+                )
+            time.sleep(interval)
+    try:
+        yield
+    finally:
+        if acquired:
+            try:
+                cache.delete(acquired)
+            except Exception as e:
+                logger.warning(f"释放导出并发槽位失败，错误信息：{e}")
@@ -0,0 +1,221 @@
+# -*- coding: UTF-8 -*-
+"""
+在线查询日志的写入, 支持同步写入、进程内缓冲批量写入和django-q异步写入,
+避免元数据库写入阻塞查询请求
+"""
+
+import atexit
+import logging
+import threading
+import time
+import traceback
+from collections import deque
+
+from django.core.cache import cache
+from django.db import close_old_connections, connections
+from django_q.tasks import async_task
+
+from common.utils.settings_config import get_settings_config
+from sql.models import QueryLog
+
+logger = logging.getLogger("default")
+
+DEFAULT_QUERY_LOG_CONFIG = {
+    # sync：同步写入；buffer：进程内缓冲，按数量或时间批量写入；async：通过django-q异步写入
+    "mode": "sync",
+    "batch_size": 100,
+    "flush_interval": 2,
+    # 缓冲区最多保留的记录数，超出后丢弃最早的记录，进程异常退出时缓冲区内的记录会丢失
+    "max_pending": 10000,
+    # 记录入队后超过该秒数才写入视为延迟写入
+    "late_threshold": 10,
+}
+
+
+def get_query_log_config():
+    """读取查询日志写入配置, 未配置的项使用默认值"""
+    return get_settings_config("QUERY_LOG", DEFAULT_QUERY_LOG_CONFIG)
+
+
+def _incr_metric(name, delta):
+    """累加查询日志写入指标, 写入缓存供各进程汇总查看"""
+    if delta <= 0:
+        return
+    key = f"query_log_metric:{name}"
+    try:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.set(key, delta, None)
+    except Exception as e:
+        logger.debug(f"更新查询日志指标失败：{e}")
+
+
+def query_log_metrics():
+    """获取查询日志写入指标, 在/api/debug中展示, dropped为丢弃的记录数, late为延迟写入的记录数"""
+    metrics = {}
+    for name in ("dropped", "late"):
+        try:
+            metrics[name] = cache.get(f"query_log_metric:{name}", 0)
+        except Exception:
+            metrics[name] = None
+    return metrics
+
+
+def save_query_logs(records):
+    """批量写入查询日志, 供缓冲刷新和django-q任务调用"""
+    QueryLog.objects.bulk_create([QueryLog(**record) for record in records])
+
+
+class QueryLogBuffer:
+    """
+    进程内查询日志缓冲区
+    达到batch_size或距上次写入超过flush_interval时由后台线程批量写入
+    """
+
+    def __init__(self, batch_size=100, flush_interval=2, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # 元素为 (记录, 入队时间)
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def size(self):
+        return len(self._pending)
+
+    def _append(self, items):
+        """加入缓冲区, 超出上限时丢弃最早的记录, 返回丢弃数量, 调用方需持有锁"""
+        self._pending.extend(items)
+        dropped = 0
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft()
+            dropped += 1
+        return dropped
+
+    def add(self, record):
+        with self._lock:
+            dropped = self._append([(record, time.monotonic())])
+            full = len(self._pending) >= self.batch_size
+        if dropped:
+            logger.warning(f"查询日志缓冲区已满，丢弃{dropped}条记录")
+            _incr_metric("dropped", dropped)
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def flush(self, late_threshold=None):
+        """写入缓冲区内全部记录, 写入失败的记录放回缓冲区等待下次写入"""
+        with self._flush_lock:
+            with self._lock:
+                items = list(self._pending)
+                self._pending.clear()
+            if not items:
+                return 0
+            saved = 0
+            try:
+                while saved < len(items):
+                    batch = items[saved : saved + self.batch_size]
+                    save_query_logs([record for record, _ in batch])
+                    saved += len(batch)
+            except Exception:
+                logger.error(f"批量写入查询日志失败：{traceback.format_exc()}")
+                failed = items[saved:]
+                with self._lock:
+                    # 失败的记录放回队首，保持写入顺序
+                    pending = list(self._pending)
+                    self._pending.clear()
+                    dropped = self._append(failed + pending)
+                if dropped:
+                    _incr_metric("dropped", dropped)
+                return saved
+        if late_threshold is None:
+            late_threshold = get_query_log_config()["late_threshold"]
+        now = time.monotonic()
+        late = sum(1 for _, enqueue_at in items if now - enqueue_at > late_threshold)
+        if late:
+            logger.warning(f"{late}条查询日志延迟写入，超过{late_threshold}秒")
+            _incr_metric("late", late)
+        return len(items)
+
+    def _ensure_thread(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="query-log-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                logger.error(f"查询日志后台写入异常：{traceback.format_exc()}")
+            finally:
+                # 后台线程的数据库连接不复用，避免长时间空闲后失效
+                connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_query_log_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = get_query_log_config()
+                _buffer = QueryLogBuffer(
+                    batch_size=int(config["batch_size"]),
+                    flush_interval=float(config["flush_interval"]),
+                    max_pending=int(config["max_pending"]),
+                )
+    return _buffer
+
+
+@atexit.register
+def flush_query_log_buffer():
+    """进程退出时写入缓冲区内剩余记录"""
+    if _buffer is not None and _buffer.size:
+        try:
+            _buffer.flush()
+        except Exception:
+            logger.error(f"进程退出时写入查询日志失败：{traceback.format_exc()}")
+
+
+def record_query_log(**fields):
+    """
+    记录在线查询日志, 按QUERY_LOG配置同步写入、缓冲批量写入或异步写入
+    缓冲和异步模式下create_time为实际写入时间, 与查询时间最多相差flush_interval秒
+    """
+    mode = get_query_log_config()["mode"]
+    if mode == "buffer":
+        get_query_log_buffer().add(fields)
+        return
+    if mode == "async":
+        try:
+            async_task(
+                "sql.utils.query_log.save_query_logs",
+                [fields],
+                task_name="query-log",
+                timeout=60,
+            )
+            return
+        except Exception:
+            # 任务队列不可用时同步写入，避免丢失日志
+            logger.warning(
+                f"查询日志异步写入失败，改为同步写入：{traceback.format_exc()}"
+            )
+    QueryLog.objects.create(**fields)
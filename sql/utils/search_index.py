@@ -0,0 +1,220 @@
+# -*- coding: UTF-8 -*-
+"""
+查询日志和慢日志的搜索索引
+SQL文本按单词分词写入索引表, 搜索时每个关键词按前缀匹配分词, 多个关键词同时满足,
+不再对大文本字段做前后模糊匹配的全表扫描, 搜索耗时只和命中的数据量相关,
+包含中文等没有空格分隔的文本的单词额外写入每个后缀, 可以匹配其中任意一段
+查询日志按id增量建立索引, 尚未建立索引的新日志仍使用模糊匹配
+"""
+
+import logging
+import re
+import time
+
+from django.db import connection, transaction
+from django.db.models import Max, Q
+
+from common.utils.cache_lock import cache_lock
+from common.utils.settings_config import get_settings_config
+from sql.models import QueryLog, QueryLogToken, SlowQuery, SlowQueryToken
+
+logger = logging.getLogger("default")
+
+DEFAULT_SEARCH_INDEX_CONFIG = {
+    # 开启后查询日志和慢日志的搜索使用索引
+    "enabled": False,
+    # 每批建立索引的记录数
+    "batch_size": 5000,
+    # 定时更新索引的间隔，分钟
+    "interval": 5,
+}
+
+LOCK_KEY = "search_index:lock"
+
+# 分词最大长度，超过的部分截断，搜索时关键词同样截断
+TOKEN_MAX_LENGTH = 32
+WORD_RE = re.compile(r"\w+")
+CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+def get_search_index_config():
+    """读取搜索索引配置, 未配置的项使用默认值"""
+    return get_settings_config("SEARCH_INDEX", DEFAULT_SEARCH_INDEX_CONFIG)
+
+
+def tokenize(*texts):
+    """
+    文本分词
+    单词整体及下划线分隔的各部分作为分词, 包含中文等字符的单词的每个后缀也作为分词
+    :return: 去重后的分词集合
+    """
+    tokens = set()
+    for text in texts:
+        for word in WORD_RE.findall((text or "").lower()):
+            tokens.add(word[:TOKEN_MAX_LENGTH])
+            if "_" in word:
+                tokens.update(p[:TOKEN_MAX_LENGTH] for p in word.split("_") if p)
+            if CJK_RE.search(word):
+                tokens.update(
+                    word[i : i + TOKEN_MAX_LENGTH] for i in range(1, len(word))
+                )
+    return tokens
+
+
+def search_terms(search):
+    """搜索关键词, 关键词较长时截断为分词长度"""
+    return sorted({t[:TOKEN_MAX_LENGTH] for t in WORD_RE.findall(search.lower())})
+
+
+def _indexed_query_log_id():
+    """已建立索引的最大查询日志id, 增量建立索引从该id之后开始"""
+    return QueryLogToken.objects.aggregate(last_id=Max("query_log_id"))["last_id"] or 0
+
+
+def _query_log_tokens(rows):
+    return [
+        QueryLogToken(token=token, query_log_id=row["id"])
+        for row in rows
+        for token in tokenize(row["sqllog"], row["user_display"], row["alias"])
+    ]
+
+
+def index_query_logs(batch_size):
+    """
+    为新增的查询日志建立索引
+    :return: 建立索引的查询日志条数
+    """
+    last_id = _indexed_query_log_id()
+    total = 0
+    while True:
+        rows = list(
+            QueryLog.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values("id", "sqllog", "user_display", "alias")[:batch_size]
+        )
+        if not rows:
+            break
+        QueryLogToken.objects.bulk_create(
+            _query_log_tokens(rows), batch_size=1000, ignore_conflicts=True
+        )
+        last_id = rows[-1]["id"]
+        total += len(rows)
+        if len(rows) < batch_size:
+            break
+    return total
+
+
+def reindex_query_log(query_log_id):
+    """
+    查询日志的语句标识修改后重建索引
+    尚未建立索引的日志不处理, 否则会提前推进增量索引的位置, 跳过中间的日志
+    """
+    if not get_search_index_config()["enabled"]:
+        return
+    if int(query_log_id) > _indexed_query_log_id():
+        return
+    rows = QueryLog.objects.filter(id=query_log_id).values(
+        "id", "sqllog", "user_display", "alias"
+    )
+    with transaction.atomic():
+        QueryLogToken.objects.filter(query_log_id=query_log_id).delete()
+        QueryLogToken.objects.bulk_create(
+            _query_log_tokens(rows), ignore_conflicts=True
+        )
+
+
+def index_slow_queries(batch_size):
+    """
+    为尚未建立索引的慢日志指纹建立索引
+    :return: 建立索引的指纹数
+    """
+    total = 0
+    while True:
+        rows = list(
+            SlowQuery.objects.exclude(
+                checksum__in=SlowQueryToken.objects.values("checksum")
+            ).values("checksum", "fingerprint")[:batch_size]
+        )
+        if not rows:
+            break
+        SlowQueryToken.objects.bulk_create(
+            [
+                SlowQueryToken(token=token, checksum_id=row["checksum"])
+                for row in rows
+                for token in tokenize(row["fingerprint"]) or {""}
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        total += len(rows)
+        if len(rows) < batch_size:
+            break
+    return total
+
+
+def _slow_query_table_exists():
+    """慢日志表不由Django管理, 未导入慢日志时表不存在"""
+    return SlowQuery._meta.db_table in connection.introspection.table_names()
+
+
+def build_search_index():
+    """增量更新查询日志和慢日志的搜索索引, 用于定时任务, 慢日志表不存在时只更新查询日志"""
+    batch_size = int(get_search_index_config()["batch_size"])
+    start = time.time()
+    # 同一时间只允许一个索引任务运行
+    with cache_lock(LOCK_KEY, 600, message="搜索索引任务正在运行"):
+        query_logs = index_query_logs(batch_size)
+        slow_queries = (
+            index_slow_queries(batch_size) if _slow_query_table_exists() else 0
+        )
+    logger.debug(
+        f"搜索索引更新完成，查询日志{query_logs}条，慢日志{slow_queries}条，"
+        f"耗时{time.time() - start:.2f}秒"
+    )
+    return query_logs, slow_queries
+
+
+def query_log_search(search):
+    """
+    查询日志的搜索条件, 未开启索引或没有可分词的关键词时使用模糊匹配
+    :return: Q对象
+    """
+    contains = (
+        Q(sqllog__icontains=search)
+        | Q(user_display__icontains=search)
+        | Q(alias__icontains=search)
+    )
+    terms = search_terms(search or "")
+    if not terms or not get_search_index_config()["enabled"]:
+        return contains
+    indexed = Q()
+    for term in terms:
+        indexed &= Q(
+            id__in=QueryLogToken.objects.filter(token__startswith=term).values(
+                "query_log_id"
+            )
+        )
+    last_id = _indexed_query_log_id()
+    # 尚未建立索引的新日志
+    return indexed | (Q(id__gt=last_id) & contains)
+
+
+def slow_query_search(search, field="checksum"):
+    """
+    慢日志指纹的搜索条件
+    :param field: 被过滤模型中慢日志checksum对应的字段
+    :return: Q对象, 未开启索引或没有可分词的关键词时返回None, 由调用方使用模糊匹配
+    """
+    terms = search_terms(search or "")
+    if not terms or not get_search_index_config()["enabled"]:
+        return None
+    indexed = Q()
+    for term in terms:
+        indexed &= Q(
+            **{
+                f"{field}__in": SlowQueryToken.objects.filter(
+                    token__startswith=term
+                ).values("checksum")
+            }
+        )
+    return indexed
@@ -0,0 +1,156 @@
+# -*- coding: UTF-8 -*-
+"""
+慢日志汇总
+pt-query-digest写入慢日志明细后, 按 (实例, checksum, 库, 用户) 增量汇总为小时和天两个粒度,
+慢日志统计和趋势图读取汇总表, 查询耗时不再随明细数据量增长,
+已汇总的位置通过小时汇总中的最大明细id记录,
+多个pt-query-digest同时写入时, 较小的明细id可能晚于较大的id提交, 在汇总之后才提交的这部分明细不会被汇总
+"""
+
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Max
+
+from common.utils.cache_lock import cache_lock
+from common.utils.settings_config import get_settings_config
+from sql.models import SlowQueryHistory, SlowQueryHourlyRollup, SlowQueryDailyRollup
+
+logger = logging.getLogger("default")
+
+DEFAULT_SLOW_QUERY_ROLLUP_CONFIG = {
+    # 开启后慢日志统计和趋势图从汇总表读取
+    "enabled": False,
+    # 每批汇总的明细条数
+    "batch_size": 5000,
+    # 定时汇总的间隔，分钟
+    "interval": 5,
+}
+
+LOCK_KEY = "slow_query_rollup:lock"
+
+# 累加的字段
+SUM_FIELDS = ("ts_cnt", "query_time_sum", "rows_examined_sum", "rows_sent_sum")
+# 取最大值的字段
+MAX_FIELDS = ("ts_max", "query_time_max", "query_time_pct_95")
+
+
+def get_slow_query_rollup_config():
+    """读取慢日志汇总配置, 未配置的项使用默认值"""
+    return get_settings_config("SLOW_QUERY_ROLLUP", DEFAULT_SLOW_QUERY_ROLLUP_CONFIG)
+
+
+def _merge(rollup, values):
+    for field in SUM_FIELDS:
+        rollup[field] += values[field] or 0
+    for field in MAX_FIELDS:
+        if values[field] is not None and (
+            rollup[field] is None or values[field] > rollup[field]
+        ):
+            rollup[field] = values[field]
+
+
+def _empty_rollup():
+    """汇总表的执行时长字段不允许为空, 明细中没有执行时长时记为0, ts_max由明细的非空字段填充"""
+    rollup = {field: 0 for field in SUM_FIELDS + MAX_FIELDS}
+    rollup["ts_max"] = None
+    return rollup
+
+
+def _save(model, buckets, **extra):
+    """将本批汇总结果合并到汇总表"""
+    for (hostname, checksum, db_name, user_name, ts), values in buckets.items():
+        obj = (
+            model.objects.select_for_update()
+            .filter(
+                hostname=hostname,
+                checksum_id=checksum,
+                db_name=db_name,
+                user_name=user_name,
+                ts=ts,
+            )
+            .first()
+        )
+        if obj is None:
+            obj = model(
+                hostname=hostname,
+                checksum_id=checksum,
+                db_name=db_name,
+                user_name=user_name,
+                ts=ts,
+                **_empty_rollup(),
+            )
+        rollup = {f: getattr(obj, f) for f in SUM_FIELDS + MAX_FIELDS}
+        _merge(rollup, values)
+        for field, value in dict(rollup, **extra).items():
+            setattr(obj, field, value)
+        obj.save()
+
+
+def rollup_batch(batch_size):
+    """
+    汇总一批未汇总的明细
+    :return: 本批汇总的明细条数
+    """
+    last_id = (
+        SlowQueryHourlyRollup.objects.aggregate(last_id=Max("last_history_id"))[
+            "last_id"
+        ]
+        or 0
+    )
+    rows = list(
+        SlowQueryHistory.objects.filter(id__gt=last_id)
+        .order_by("id")
+        .values(
+            "id",
+            "hostname_max",
+            "checksum_id",
+            "db_max",
+            "user_max",
+            "ts_min",
+            "ts_max",
+            "ts_cnt",
+            "query_time_sum",
+            "query_time_max",
+            "query_time_pct_95",
+            "rows_examined_sum",
+            "rows_sent_sum",
+        )[:batch_size]
+    )
+    if not rows:
+        return 0
+    hourly, daily = {}, {}
+    for row in rows:
+        hour = row["ts_min"].replace(minute=0, second=0, microsecond=0)
+        key = (
+            row["hostname_max"],
+            row["checksum_id"],
+            row["db_max"] or "",
+            row["user_max"] or "",
+        )
+        _merge(hourly.setdefault(key + (hour,), _empty_rollup()), row)
+        _merge(daily.setdefault(key + (hour.replace(hour=0),), _empty_rollup()), row)
+    with transaction.atomic():
+        _save(SlowQueryHourlyRollup, hourly, last_history_id=rows[-1]["id"])
+        _save(SlowQueryDailyRollup, daily)
+    return len(rows)
+
+
+def rollup_slow_query_history():
+    """
+    增量汇总全部未汇总的慢日志明细, 用于定时任务
+    :return: 汇总的明细条数
+    """
+    batch_size = int(get_slow_query_rollup_config()["batch_size"])
+    total = 0
+    start = time.time()
+    # 同一时间只允许一个汇总任务运行, 避免重复汇总
+    with cache_lock(LOCK_KEY, 600, message="慢日志汇总任务正在运行"):
+        while True:
+            count = rollup_batch(batch_size)
+            total += count
+            if count < batch_size:
+                break
+    logger.debug(f"慢日志汇总完成，明细{total}条，耗时{time.time() - start:.2f}秒")
+    return total
@@ -85,6 +85,44 @@ def remove_comments(sql, db_type="mysql"):
     return regex.sub(_replacer, sql).strip()
 
 
+# 字符串、标识符、注释整体匹配，其中的分号不作为语句分隔符
+MYSQL_SPLIT_RE = re.compile(
+    r"'(?:[^'\\]|\\.|'')*'"
+    r'|"(?:[^"\\]|\\.|"")*"'
+    r"|`[^`]*`"
+    r"|/\*.*?\*/"
+    r"|(?:--\s|#)[^\n]*"
+    r"|;"
+    r"|[^'\"`/;#-]+"
+    r"|.",
+    re.DOTALL,
+)
+
+
+def split_mysql_statements(sql):
+    """
+    按分号拆分MySQL语句，不使用sqlparse解析，适用于大量语句的场景
+    不支持delimiter，包含delimiter的存储过程等会被拆散，由调用方判断是否可用
+    :param sql:
+    :return: 去除首尾空白和结尾分号的语句列表
+    """
+    statements = []
+    current = []
+    for match in MYSQL_SPLIT_RE.finditer(sql):
+        token = match.group()
+        if token == ";":
+            statement = "".join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(token)
+    statement = "".join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
 def extract_tables(sql):
     """
     获取sql语句中的库、表名
@@ -8,7 +8,17 @@
 
 from sshtunnel import SSHTunnelForwarder
 from paramiko import RSAKey
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from sql.models import Tunnel
+import hashlib
 import io
+import logging
+import threading
+import time
+
+logger = logging.getLogger("default")
 
 
 class SSHConnection(object):
@@ -57,7 +67,16 @@ class SSHConnection(object):
         self.server.start()
 
     def __del__(self):
-        self.server.close()
+        self.close()
+
+    def close(self):
+        if hasattr(self, "server"):
+            self.server.close()
+
+    @property
+    def is_active(self):
+        """隧道是否可用"""
+        return self.server.is_active
 
     def get_ssh(self):
         """
@@ -66,3 +85,179 @@ class SSHConnection(object):
         :return:
         """
         return "127.0.0.1", self.server.local_bind_port
+
+
+class _TunnelEntry(object):
+    def __init__(self, connection, fingerprint):
+        self.connection = connection
+        self.fingerprint = fingerprint
+        self.refs = 0
+        self.last_used = time.monotonic()
+        self.retired = False
+
+
+class TunnelLease(object):
+    """
+    共享隧道的一次引用，释放或被回收时引用计数减一
+    """
+
+    def __init__(self, manager, key, entry):
+        self._manager = manager
+        self._key = key
+        self._entry = entry
+        self._released = False
+
+    def get_ssh(self):
+        return self._entry.connection.get_ssh()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._manager.release(self._key, self._entry)
+
+    def __del__(self):
+        self.release()
+
+
+class TunnelManager(object):
+    """
+    进程内共享的ssh隧道注册表，以 (隧道id, 远端地址, 远端端口) 为key复用已建立的隧道，
+    引用计数为0且空闲超时的隧道会被回收，已断开的隧道在下次获取时重建
+    """
+
+    def __init__(self, idle_timeout=None):
+        self._idle_timeout = idle_timeout
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def idle_timeout(self):
+        if self._idle_timeout is not None:
+            return self._idle_timeout
+        return getattr(settings, "SSH_TUNNEL_IDLE_TIMEOUT", 300)
+
+    @staticmethod
+    def _fingerprint(tunnel):
+        raw = "|".join(
+            str(i)
+            for i in (
+                tunnel.host,
+                tunnel.port,
+                tunnel.user,
+                tunnel.password,
+                tunnel.pkey,
+                tunnel.pkey_password,
+                tunnel.update_time,
+            )
+        )
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _is_active(entry):
+        try:
+            return entry.connection.is_active
+        except Exception:
+            return False
+
+    def _reap(self):
+        """回收空闲超时的隧道，调用方需持有锁，返回需要关闭的隧道"""
+        now = time.monotonic()
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if entry.refs <= 0 and now - entry.last_used > self.idle_timeout
+        ]
+        closing = []
+        for key in expired:
+            entry = self._entries.pop(key)
+            entry.retired = True
+            closing.append(entry.connection)
+        return closing
+
+    @staticmethod
+    def _close(connections):
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception as e:
+                logger.debug(f"关闭ssh隧道失败：{e}")
+
+    def acquire(self, tunnel, host, port):
+        """获取到 host:port 的隧道引用，返回TunnelLease"""
+        key = (tunnel.id, host, int(port))
+        fingerprint = self._fingerprint(tunnel)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # 同一个key的隧道串行建立，不同key之间互不阻塞
+        with key_lock:
+            closing = []
+            with self._lock:
+                closing.extend(self._reap())
+                entry = self._entries.get(key)
+                if entry and (
+                    entry.fingerprint != fingerprint or not self._is_active(entry)
+                ):
+                    self._entries.pop(key)
+                    entry.retired = True
+                    if entry.refs <= 0:
+                        closing.append(entry.connection)
+                    entry = None
+            self._close(closing)
+            if entry is None:
+                connection = SSHConnection(
+                    host,
+                    port,
+                    tunnel.host,
+                    tunnel.port,
+                    tunnel.user,
+                    tunnel.password,
+                    tunnel.pkey,
+                    tunnel.pkey_password,
+                )
+                entry = _TunnelEntry(connection, fingerprint)
+                with self._lock:
+                    self._entries[key] = entry
+            with self._lock:
+                entry.refs += 1
+                entry.last_used = time.monotonic()
+        return TunnelLease(self, key, entry)
+
+    def release(self, key, entry):
+        with self._lock:
+            entry.refs -= 1
+            entry.last_used = time.monotonic()
+            closing = self._reap()
+            # 已被替换的隧道在最后一个引用释放后关闭
+            if entry.retired and entry.refs <= 0:
+                closing.append(entry.connection)
+        self._close(closing)
+
+    def invalidate(self, tunnel_id):
+        """隧道配置变更或删除后关闭相关的空闲隧道"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == tunnel_id]
+            closing = []
+            for key in keys:
+                entry = self._entries.pop(key)
+                entry.retired = True
+                if entry.refs <= 0:
+                    closing.append(entry.connection)
+        self._close(closing)
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.retired = True
+        self._close([entry.connection for entry in entries if entry.refs <= 0])
+
+
+tunnel_manager = TunnelManager()
+
+
+@receiver(post_save, sender=Tunnel)
+@receiver(post_delete, sender=Tunnel)
+def invalidate_tunnel(sender, instance, **kwargs):
+    tunnel_manager.invalidate(instance.id)
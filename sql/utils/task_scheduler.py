@@ -0,0 +1,96 @@
+# -*- coding: UTF-8 -*-
+"""
+基于缓存的任务调度
+待执行队列和运行中的任务保存在缓存中, 调度时按顺序在全局和同一实例等维度的并发上限内提交到django-q,
+任务结束后由hook释放槽位并继续调度, 用于数据归档和SQL工单执行
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common.utils.cache_lock import cache_lock
+
+logger = logging.getLogger("default")
+
+
+def scheduler_lock(key, message):
+    """调度过程加锁, 避免多个进程同时调度时超出并发上限"""
+    return cache_lock(key, 30, wait=30, interval=0.1, message=message)
+
+
+def max_running(config):
+    """
+    全局并发上限, 至少为1
+    未配置max_running时, 使用独立集群为该集群的worker数, 否则为 worker数-保留的worker数
+    """
+    if int(config["max_running"]) > 0:
+        return int(config["max_running"])
+    workers = int(settings.Q_CLUSTER.get("workers") or 4)
+    if config.get("cluster"):
+        alt_clusters = settings.Q_CLUSTER.get("ALT_CLUSTERS") or {}
+        cluster_workers = (alt_clusters.get(config["cluster"]) or {}).get("workers")
+        return max(1, int(cluster_workers or workers))
+    return max(1, workers - int(config["reserved_workers"]))
+
+
+def expire_running(running, config, finished=(), label="任务"):
+    """运行中的任务里已结束或运行超时的任务不再占用槽位, 用于worker异常退出未执行hook的情况"""
+    now = time.time()
+    for task_id, info in list(running.items()):
+        if task_id in finished:
+            logger.warning(f"{label}{task_id}已执行结束，释放调度槽位")
+            running.pop(task_id)
+        elif now - info["start"] > config["running_timeout"]:
+            logger.warning(f"{label}{task_id}运行超时，不再占用调度槽位")
+            running.pop(task_id)
+
+
+def has_slot(config, running, slot):
+    """同一实例和同一资源组的并发数是否未达上限, group_limit未配置或为0时不限制资源组"""
+    instance_running = [
+        i for i in running.values() if i["instance_id"] == slot["instance_id"]
+    ]
+    if len(instance_running) >= int(config["instance_limit"]):
+        return False
+    group_limit = int(config.get("group_limit") or 0)
+    if group_limit > 0:
+        group_running = [
+            i for i in running.values() if i["group_id"] == slot["group_id"]
+        ]
+        if len(group_running) >= group_limit:
+            return False
+    return True
+
+
+def dispatch(candidates, running, config, submit):
+    """
+    在并发上限内按顺序提交任务, 已在运行的任务不重复提交
+    :param candidates: 按调度顺序排列的 [(任务id, 队列项, 槽位信息)], 已删除或不可执行的任务不包含在内
+    :param running: 运行中的任务 {任务id: 槽位信息}, 提交的任务加入其中
+    :param submit: submit(任务id, 队列项) 提交任务到django-q
+    :return: (本次提交的任务id列表, 仍需排队的队列项列表)
+    """
+    limit = max_running(config)
+    now = time.time()
+    dispatched = []
+    remaining = []
+    for task_id, item, slot in candidates:
+        if task_id in running:
+            continue
+        if len(running) >= limit or not has_slot(config, running, slot):
+            remaining.append(item)
+            continue
+        submit(task_id, item)
+        running[task_id] = dict(slot, start=now)
+        dispatched.append(task_id)
+    return dispatched, remaining
+
+
+def release(running_key, task_id):
+    """任务结束后释放槽位, 由调用方加锁"""
+    running = cache.get(running_key) or {}
+    running.pop(task_id, None)
+    cache.set(running_key, running, None)
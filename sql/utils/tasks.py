@@ -5,22 +5,36 @@ from django.conf import settings
 
 import logging
 
+from sql.utils.workflow_scheduler import get_workflow_scheduler_config
+
 logger = logging.getLogger("default")
 
 
 def add_sql_schedule(name, run_date, workflow_id):
     """添加/修改sql定时任务"""
     del_schedule(name)
-    schedule(
-        "sql.utils.execute_sql.execute",
-        workflow_id,
-        hook="sql.utils.execute_sql.execute_callback",
-        name=name,
-        schedule_type="O",
-        next_run=run_date,
-        repeats=1,
-        timeout=-1,
-    )
+    if get_workflow_scheduler_config()["enabled"]:
+        # 到时间后进入执行队列, 由调度提交执行
+        schedule(
+            "sql.utils.workflow_scheduler.submit_workflow_execution",
+            workflow_id,
+            name=name,
+            schedule_type="O",
+            next_run=run_date,
+            repeats=1,
+            timeout=-1,
+        )
+    else:
+        schedule(
+            "sql.utils.execute_sql.execute",
+            workflow_id,
+            hook="sql.utils.execute_sql.execute_callback",
+            name=name,
+            schedule_type="O",
+            next_run=run_date,
+            repeats=1,
+            timeout=-1,
+        )
     logger.debug(f"添加SQL定时执行任务：{name} 执行时间：{run_date}")
 
 
@@ -53,6 +67,46 @@ def add_sync_ding_user_schedule():
     )
 
 
+def add_slow_query_rollup_schedule(interval):
+    """添加慢日志汇总定时任务"""
+    del_schedule(name="慢日志汇总")
+    schedule(
+        "sql.utils.slow_query_rollup.rollup_slow_query_history",
+        name="慢日志汇总",
+        schedule_type="I",
+        minutes=interval,
+        repeats=-1,
+        timeout=-1,
+    )
+
+
+def add_search_index_schedule(interval):
+    """添加搜索索引更新定时任务"""
+    del_schedule(name="搜索索引更新")
+    schedule(
+        "sql.utils.search_index.build_search_index",
+        name="搜索索引更新",
+        schedule_type="I",
+        minutes=interval,
+        repeats=-1,
+        timeout=-1,
+    )
+
+
+def add_workflow_dispatch_schedule(interval):
+    """添加工单执行调度定时任务, 已存在时不重复添加"""
+    if task_info("工单执行调度"):
+        return
+    schedule(
+        "sql.utils.workflow_scheduler.dispatch_workflow_executions",
+        name="工单执行调度",
+        schedule_type="I",
+        minutes=interval,
+        repeats=-1,
+        timeout=-1,
+    )
+
+
 def del_schedule(name):
     """删除schedule"""
     try:
@@ -0,0 +1,92 @@
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.models import ArchiveConfig, Instance, ResourceGroup
+from sql.utils.archive_scheduler import (
+    RUNNING_KEY,
+    PENDING_KEY,
+    archive_task_finished,
+    submit_archive_tasks,
+)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    ARCHIVE_SCHEDULER={"instance_limit": 1, "max_running": 2},
+)
+@patch("sql.utils.archive_scheduler.async_task")
+class TestArchiveScheduler(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ins1 = Instance.objects.create(
+            instance_name="ins1",
+            type="master",
+            db_type="mysql",
+            host="host1",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+        self.ins2 = Instance.objects.create(
+            instance_name="ins2",
+            type="master",
+            db_type="mysql",
+            host="host2",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+        self.res_group = ResourceGroup.objects.create(group_id=1, group_name="g1")
+
+    def tearDown(self):
+        ArchiveConfig.objects.all().delete()
+        self.res_group.delete()
+        self.ins1.delete()
+        self.ins2.delete()
+        cache.clear()
+
+    def _archive(self, instance, priority=0):
+        return ArchiveConfig.objects.create(
+            title="title",
+            resource_group=self.res_group,
+            src_instance=instance,
+            src_db_name="db1",
+            src_table_name="t1",
+            condition="1=1",
+            mode="purge",
+            no_delete=False,
+            priority=priority,
+        )
+
+    def test_instance_limit_and_priority(self, _async_task):
+        low = self._archive(self.ins1)
+        high = self._archive(self.ins1, priority=10)
+        other = self._archive(self.ins2)
+
+        dispatched = submit_archive_tasks([low.id, high.id, other.id])
+
+        self.assertEqual(dispatched, [high.id, other.id])
+        self.assertEqual(cache.get(PENDING_KEY), [low.id])
+        self.assertEqual(_async_task.call_count, 2)
+
+        archive_task_finished(Mock(args=(high.id,)))
+        self.assertEqual(cache.get(PENDING_KEY), [])
+        self.assertEqual(set(cache.get(RUNNING_KEY)), {low.id, other.id})
+
+    def test_max_running(self, _async_task):
+        archives = [self._archive(self.ins1), self._archive(self.ins2)]
+        with override_settings(ARCHIVE_SCHEDULER={"instance_limit": 2}):
+            with override_settings(Q_CLUSTER={"workers": 3}):
+                # 3个worker保留2个，只能同时运行1个归档
+                dispatched = submit_archive_tasks([a.id for a in archives])
+        self.assertEqual(dispatched, [archives[0].id])
+
+    def test_skip_running(self, _async_task):
+        archive = self._archive(self.ins1)
+        submit_archive_tasks([archive.id])
+        self.assertEqual(submit_archive_tasks([archive.id]), [])
+        self.assertEqual(cache.get(PENDING_KEY), [])
+        _async_task.assert_called_once()
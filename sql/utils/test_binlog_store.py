@@ -0,0 +1,202 @@
+# -*- coding: UTF-8 -*-
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.engines.models import ResultSet
+from sql.utils.binlog_store import (
+    BinlogStore,
+    parse_extra_info,
+    submit_binlog_store_sync,
+)
+
+OUTPUT = {
+    "mysql-bin.000001": [
+        "# datetime=2024-01-01_00:00:01 database=db1 table=t1 binlog=mysql-bin.000001 startpos=100 stoppos=200",
+        "INSERT INTO `db1`.`t1` VALUES(1)",
+        "INSERT INTO `db1`.`t1` VALUES(2)",
+        "# datetime=2024-01-01_00:00:02 database=db1 table=t2 binlog=mysql-bin.000001 startpos=200 stoppos=300",
+        "DELETE FROM `db1`.`t2` WHERE `id`=1",
+    ],
+    "mysql-bin.000002": [
+        "# datetime=2024-01-01_00:00:03 database=db2 table=t1 binlog=mysql-bin.000002 startpos=100 stoppos=200",
+        "UPDATE `db2`.`t1` SET `a`=1 WHERE `id`=1",
+    ],
+}
+
+
+@pytest.fixture
+def store_settings(settings, tmp_path):
+    settings.CACHES = LOCMEM_CACHES
+    settings.BINLOG_STORE = {"enabled": True, "path": str(tmp_path)}
+    return settings
+
+
+def _fake_my2sql(calls):
+    """模拟my2sql, 将对应binlog文件的解析结果写入输出目录"""
+    my2sql = MagicMock()
+    my2sql.check_args.return_value = {"status": 0, "msg": "ok", "data": {}}
+    my2sql.generate_args2cmd.side_effect = lambda args: args
+
+    def execute_cmd(args):
+        calls.append((args["start-file"], args["start-pos"], args["stop-pos"]))
+        with open(os.path.join(args["output-dir"], "forward.1.sql"), "w") as f:
+            f.write("\n".join(OUTPUT[args["start-file"]]) + "\n")
+        process = MagicMock()
+        process.communicate.return_value = ("", "")
+        process.returncode = 0
+        return process
+
+    my2sql.execute_cmd.side_effect = execute_cmd
+    return my2sql
+
+
+def _binlogs(*files):
+    engine = MagicMock()
+    engine.query.return_value = ResultSet(rows=list(files))
+    return engine
+
+
+def test_parse_extra_info():
+    info = parse_extra_info(OUTPUT["mysql-bin.000001"][0])
+    assert info == {
+        "event_time": "2024-01-01 00:00:01",
+        "db_name": "db1",
+        "table_name": "t1",
+        "binlog_file": "mysql-bin.000001",
+        "start_pos": 100,
+        "stop_pos": 200,
+    }
+
+
+@patch("sql.utils.binlog_store.get_engine")
+@patch("sql.utils.binlog_store.My2SQL")
+def test_sync_reuses_parsed_files(_my2sql, _get_engine, store_settings):
+    calls = []
+    _my2sql.return_value = _fake_my2sql(calls)
+    _get_engine.return_value = _binlogs(
+        ("mysql-bin.000001", 1000), ("mysql-bin.000002", 500)
+    )
+    instance = MagicMock(id=1)
+    instance.get_username_password.return_value = ("user", "password")
+    store = BinlogStore(instance)
+
+    store.sync("mysql-bin.000001")
+    store.sync("mysql-bin.000001")
+    assert calls == [("mysql-bin.000001", 4, 1000), ("mysql-bin.000002", 4, 500)]
+
+    # 最新的binlog文件增长后只解析新增的部分
+    calls.clear()
+    OUTPUT["mysql-bin.000002"], output = [], OUTPUT["mysql-bin.000002"]
+    _get_engine.return_value = _binlogs(
+        ("mysql-bin.000001", 1000), ("mysql-bin.000002", 800)
+    )
+    store.sync("mysql-bin.000001", "mysql-bin.000002")
+    OUTPUT["mysql-bin.000002"] = output
+    assert calls == [("mysql-bin.000002", 500, 800)]
+
+
+@patch("sql.utils.binlog_store.get_engine")
+@patch("sql.utils.binlog_store.My2SQL")
+def test_query(_my2sql, _get_engine, store_settings):
+    _my2sql.return_value = _fake_my2sql([])
+    _get_engine.return_value = _binlogs(
+        ("mysql-bin.000001", 1000), ("mysql-bin.000002", 500)
+    )
+    instance = MagicMock(id=1)
+    instance.get_username_password.return_value = ("user", "password")
+    store = BinlogStore(instance)
+    store.sync("mysql-bin.000001")
+
+    rows, total = store.query(offset=1, limit=2, start_file="mysql-bin.000001")
+    assert total == 4
+    assert [r["sql"] for r in rows] == [
+        "INSERT INTO `db1`.`t1` VALUES(2);",
+        "DELETE FROM `db1`.`t2` WHERE `id`=1;",
+    ]
+
+    rows, total = store.query(
+        start_file="mysql-bin.000001", tables=["t1"], sql_types=["update"]
+    )
+    assert total == 1
+    assert rows == [{"sql": "UPDATE `db2`.`t1` SET `a`=1 WHERE `id`=1;"}]
+
+    rows, total = store.query(
+        start_file="mysql-bin.000001",
+        start_pos=200,
+        stop_file="mysql-bin.000001",
+        stop_pos=300,
+        extra_info=True,
+    )
+    assert total == 1
+    assert rows[0]["extra_info"].startswith("# datetime=2024-01-01_00:00:02")
+
+    rows, total = store.query(
+        start_file="mysql-bin.000001", start_time="2024-01-01 00:00:02"
+    )
+    assert total == 2
+
+    file_path = os.path.join(store_settings.BINLOG_STORE["path"], "export.sql")
+    assert store.export(file_path, start_file="mysql-bin.000002") == 1
+    with open(file_path) as f:
+        assert f.read() == "UPDATE `db2`.`t1` SET `a`=1 WHERE `id`=1;\n"
+
+
+@patch("sql.utils.binlog_store.get_engine")
+@patch("sql.utils.binlog_store.My2SQL")
+def test_query_rollback_sql_type(_my2sql, _get_engine, store_settings):
+    """回滚语句按原始事件的类型过滤"""
+    _my2sql.return_value = _fake_my2sql([])
+    _get_engine.return_value = _binlogs(
+        ("mysql-bin.000001", 1000), ("mysql-bin.000002", 500)
+    )
+    instance = MagicMock(id=1)
+    instance.get_username_password.return_value = ("user", "password")
+    store = BinlogStore(instance, work_type="rollback")
+    store.sync("mysql-bin.000001")
+
+    # 回滚INSERT语句对应原始的DELETE事件
+    rows, total = store.query(start_file="mysql-bin.000001", sql_types=["delete"])
+    assert total == 2
+    assert [r["sql"] for r in rows] == [
+        "INSERT INTO `db1`.`t1` VALUES(1);",
+        "INSERT INTO `db1`.`t1` VALUES(2);",
+    ]
+
+    rows, total = store.query(start_file="mysql-bin.000001", sql_types=["insert"])
+    assert rows == [{"sql": "DELETE FROM `db1`.`t2` WHERE `id`=1;"}]
+
+    rows, total = store.query(start_file="mysql-bin.000001", sql_types=["update"])
+    assert rows == [{"sql": "UPDATE `db2`.`t1` SET `a`=1 WHERE `id`=1;"}]
+
+
+@patch("sql.utils.binlog_store.get_engine")
+@patch("sql.utils.binlog_store.My2SQL")
+def test_pending_files(_my2sql, _get_engine, store_settings):
+    calls = []
+    _my2sql.return_value = _fake_my2sql(calls)
+    _get_engine.return_value = _binlogs(
+        ("mysql-bin.000001", 1000), ("mysql-bin.000002", 500)
+    )
+    instance = MagicMock(id=1)
+    instance.get_username_password.return_value = ("user", "password")
+    store = BinlogStore(instance)
+    assert store.pending_files("mysql-bin.000001") == [
+        "mysql-bin.000001",
+        "mysql-bin.000002",
+    ]
+    store.sync("mysql-bin.000001", "mysql-bin.000001")
+    assert store.pending_files("mysql-bin.000001") == ["mysql-bin.000002"]
+    assert store.pending_files("mysql-bin.000001", "mysql-bin.000001") == []
+    assert calls == [("mysql-bin.000001", 4, 1000)]
+
+
+@patch("sql.utils.binlog_store.async_task")
+def test_submit_sync_dedup(_async_task, store_settings):
+    instance = MagicMock(id=1)
+    assert submit_binlog_store_sync(instance, {}, "mysql-bin.000001")
+    # 相同范围的解析任务未结束时不重复提交
+    assert not submit_binlog_store_sync(instance, {}, "mysql-bin.000001")
+    _async_task.assert_called_once()
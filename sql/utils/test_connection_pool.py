@@ -0,0 +1,132 @@
+from unittest.mock import patch, Mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from sql.engines.mysql import MysqlEngine
+from sql.models import Instance
+from sql.utils.connection_pool import ConnectionPool, PoolRegistry, pool_registry
+
+
+class TestConnectionPool(SimpleTestCase):
+    def test_release_and_reuse(self):
+        pool = ConnectionPool(max_size=2, idle_timeout=60)
+        conn = Mock()
+        pool.release(conn)
+        self.assertEqual(pool.size, 1)
+        connect = Mock()
+        self.assertIs(pool.acquire(connect), conn)
+        connect.assert_not_called()
+        conn.rollback.assert_called_once()
+
+    def test_release_over_max_size(self):
+        pool = ConnectionPool(max_size=1, idle_timeout=60)
+        conn1, conn2 = Mock(), Mock()
+        pool.release(conn1)
+        pool.release(conn2)
+        self.assertEqual(pool.size, 1)
+        conn2.close.assert_called_once()
+
+    def test_acquire_discard_unhealthy(self):
+        pool = ConnectionPool(max_size=2, idle_timeout=60)
+        conn = Mock()
+        pool.release(conn)
+        connect = Mock(return_value="new_conn")
+        ping = Mock(side_effect=RuntimeError("gone away"))
+        self.assertEqual(pool.acquire(connect, ping), "new_conn")
+        conn.close.assert_called_once()
+
+    @patch("sql.utils.connection_pool.time.monotonic")
+    def test_idle_timeout(self, _monotonic):
+        _monotonic.return_value = 100
+        pool = ConnectionPool(max_size=2, idle_timeout=60)
+        conn = Mock()
+        pool.release(conn)
+        _monotonic.return_value = 200
+        self.assertEqual(pool.acquire(Mock(return_value="new_conn")), "new_conn")
+        conn.close.assert_called_once()
+
+    def test_release_broken_connection(self):
+        pool = ConnectionPool(max_size=2, idle_timeout=60)
+        conn = Mock()
+        conn.rollback.side_effect = RuntimeError("broken")
+        pool.release(conn)
+        self.assertEqual(pool.size, 0)
+        conn.close.assert_called_once()
+
+
+class TestPoolRegistry(TestCase):
+    def setUp(self):
+        self.ins = Instance.objects.create(
+            instance_name="some_ins",
+            type="slave",
+            db_type="mysql",
+            host="some_host",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+
+    def tearDown(self):
+        self.ins.delete()
+        pool_registry.clear()
+
+    def test_get_pool_reuse(self):
+        registry = PoolRegistry()
+        pool = registry.get_pool("MySQL", self.ins, "db")
+        self.assertIs(registry.get_pool("MySQL", self.ins, "db"), pool)
+        self.assertIsNot(registry.get_pool("MySQL", self.ins, "other_db"), pool)
+
+    def test_get_pool_instance_changed(self):
+        registry = PoolRegistry()
+        pool = registry.get_pool("MySQL", self.ins, "db")
+        conn = Mock()
+        pool.release(conn)
+        self.ins.host = "other_host"
+        new_pool = registry.get_pool("MySQL", self.ins, "db")
+        self.assertIsNot(new_pool, pool)
+        conn.close.assert_called_once()
+
+    def test_invalidate_on_instance_save(self):
+        pool = pool_registry.get_pool("MySQL", self.ins, "db")
+        conn = Mock()
+        pool.release(conn)
+        self.ins.save()
+        conn.close.assert_called_once()
+        self.assertIsNot(pool_registry.get_pool("MySQL", self.ins, "db"), pool)
+
+    @override_settings(ENGINE_CONNECTION_POOL={"enabled": True})
+    @patch("MySQLdb.connect")
+    def test_mysql_engine_reuse_connection(self, _connect):
+        engine = MysqlEngine(instance=self.ins)
+        engine.query(sql="select 1")
+        engine.query(sql="select 1")
+        _connect.assert_called_once()
+        _connect.return_value.close.assert_not_called()
+        _connect.return_value.ping.assert_called_once()
+
+    @patch("MySQLdb.connect")
+    def test_mysql_engine_pool_disabled(self, _connect):
+        engine = MysqlEngine(instance=self.ins)
+        engine.query(sql="select 1")
+        engine.query(sql="select 1")
+        self.assertEqual(_connect.call_count, 2)
+
+    @patch("MySQLdb.connect")
+    def test_mysql_ping_reset_session(self, _connect):
+        engine = MysqlEngine(instance=self.ins)
+        conn = Mock()
+        self.assertTrue(engine.ping_connection(conn))
+        conn.reset_connection.assert_called_once()
+        conn.set_character_set.assert_called_once_with("utf8mb4")
+
+        # 驱动不支持COM_RESET_CONNECTION时重新认证到原来的库
+        conn = Mock(
+            spec=["ping", "cursor", "change_user", "set_character_set", "autocommit"]
+        )
+        conn.cursor.return_value.fetchone.return_value = ("some_db",)
+        self.assertTrue(engine.ping_connection(conn))
+        conn.change_user.assert_called_once_with("ins_user", "some_str", "some_db")
+
+        # 无法重置会话的连接不复用
+        conn = Mock(spec=["ping", "cursor", "set_character_set", "autocommit"])
+        self.assertFalse(engine.ping_connection(conn))
@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.utils.execute_progress import (
+    WAITING_CACHE_KEY,
+    ExecuteProgress,
+    finish_progress,
+    get_progress,
+    wait_progress,
+)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, EXECUTE_PROGRESS={"enabled": True, "publish_interval": 60}
+)
+class TestExecuteProgress(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_progress(self):
+        progress = ExecuteProgress(1, total=10)
+        progress.start()
+        self.assertEqual(get_progress(1)["done"], 0)
+        self.assertIsNone(get_progress(1)["eta"])
+        # 未超过上报间隔不写入缓存
+        progress.advance(count=4, affected_rows=8, current_sql="update t set a=1")
+        self.assertEqual(get_progress(1)["done"], 0)
+        progress.publish()
+        data = get_progress(1)
+        self.assertEqual(
+            (data["done"], data["affected_rows"], data["current_sql"]),
+            (4, 8, "update t set a=1"),
+        )
+        self.assertIsNotNone(data["eta"])
+        # 全部完成时立即写入
+        progress.advance(count=6, affected_rows=2)
+        data = get_progress(1)
+        self.assertEqual(
+            (data["done"], data["affected_rows"], data["eta"]), (10, 10, 0)
+        )
+        finish_progress(1, "workflow_finish")
+        self.assertEqual(get_progress(1)["status"], "workflow_finish")
+        self.assertEqual(get_progress(1)["done"], 10)
+
+    def test_finish_without_progress(self):
+        finish_progress(2, "workflow_exception")
+        self.assertEqual(get_progress(2)["status"], "workflow_exception")
+
+    @patch("sql.utils.execute_progress.time.sleep")
+    def test_wait_progress(self, _sleep):
+        # 没有进度时不等待
+        self.assertIsNone(wait_progress(3, 0, timeout=10))
+        _sleep.assert_not_called()
+        progress = ExecuteProgress(3, total=1)
+        progress.start()
+        version = get_progress(3)["version"]
+        self.assertEqual(wait_progress(3, 0, timeout=0)["version"], version)
+        # 没有更新时等待到超时返回当前进度
+        self.assertEqual(wait_progress(3, version, timeout=0)["version"], version)
+        _sleep.side_effect = lambda _: finish_progress(3, "workflow_finish")
+        self.assertEqual(
+            wait_progress(3, version, timeout=10)["status"], "workflow_finish"
+        )
+
+    @patch("sql.utils.execute_progress.time.sleep")
+    def test_wait_progress_max_waiting(self, _sleep):
+        progress = ExecuteProgress(4, total=1)
+        progress.start()
+        version = get_progress(4)["version"]
+        # 同时等待的请求数达到上限时直接返回当前进度
+        cache.set(WAITING_CACHE_KEY, 2)
+        with self.settings(EXECUTE_PROGRESS={"enabled": True, "max_waiting": 2}):
+            self.assertEqual(wait_progress(4, version, timeout=10)["version"], version)
+        _sleep.assert_not_called()
+        self.assertEqual(cache.get(WAITING_CACHE_KEY), 2)
@@ -0,0 +1,84 @@
+from unittest.mock import Mock
+
+from django.test import TestCase, override_settings
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.engines.models import ResultSet
+from sql.models import Instance
+from sql.utils.metadata_cache import (
+    get_instance_metadata,
+    invalidate_instance_metadata,
+)
+
+
+def _loader(rows):
+    return Mock(return_value=ResultSet(rows=rows))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, INSTANCE_METADATA_CACHE_TTL=300)
+class TestInstanceMetadataCache(TestCase):
+    def setUp(self):
+        self.ins = Instance.objects.create(
+            instance_name="some_ins",
+            type="slave",
+            db_type="mysql",
+            host="some_host",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+
+    def tearDown(self):
+        self.ins.delete()
+
+    def test_cache_hit(self):
+        loader = _loader(["t1"])
+        for _ in range(2):
+            resource = get_instance_metadata(self.ins, "table", loader, db_name="db1")
+        self.assertEqual(resource.rows, ["t1"])
+        loader.assert_called_once()
+
+    def test_invalidate_db(self):
+        db1_loader = _loader(["t1"])
+        db2_loader = _loader(["t2"])
+        get_instance_metadata(self.ins, "table", db1_loader, db_name="db1")
+        get_instance_metadata(self.ins, "table", db2_loader, db_name="db2")
+        invalidate_instance_metadata(self.ins.id, "db1")
+        get_instance_metadata(self.ins, "table", db1_loader, db_name="db1")
+        get_instance_metadata(self.ins, "table", db2_loader, db_name="db2")
+        self.assertEqual(db1_loader.call_count, 2)
+        self.assertEqual(db2_loader.call_count, 1)
+
+    def test_invalidate_db_refresh_database_list(self):
+        loader = _loader(["db1"])
+        get_instance_metadata(self.ins, "database", loader)
+        invalidate_instance_metadata(self.ins.id, "db1")
+        get_instance_metadata(self.ins, "database", loader)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_invalidate_instance(self):
+        loader = _loader(["t1"])
+        get_instance_metadata(self.ins, "table", loader, db_name="db1")
+        invalidate_instance_metadata(self.ins.id)
+        get_instance_metadata(self.ins, "table", loader, db_name="db1")
+        self.assertEqual(loader.call_count, 2)
+
+    def test_variant(self):
+        loader = _loader(["db1"])
+        get_instance_metadata(self.ins, "database", loader, variant=True)
+        get_instance_metadata(self.ins, "database", loader, variant=False)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_error_not_cached(self):
+        loader = Mock(return_value=ResultSet(rows=[]))
+        loader.return_value.error = "some error"
+        get_instance_metadata(self.ins, "table", loader, db_name="db1")
+        get_instance_metadata(self.ins, "table", loader, db_name="db1")
+        self.assertEqual(loader.call_count, 2)
+
+    @override_settings(INSTANCE_METADATA_CACHE_TTL=0)
+    def test_cache_disabled(self):
+        loader = _loader(["t1"])
+        get_instance_metadata(self.ins, "table", loader, db_name="db1")
+        get_instance_metadata(self.ins, "table", loader, db_name="db1")
+        self.assertEqual(loader.call_count, 2)
@@ -0,0 +1,73 @@
+# -*- coding: UTF-8 -*-
+import glob
+import os
+
+import pytest
+
+from sql.utils import my2sql_reader
+from sql.utils.my2sql_reader import My2sqlOutputReader, sql_table
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    """两个文件共10条SQL, 每3条记录一个索引点"""
+    monkeypatch.setattr(my2sql_reader, "INDEX_INTERVAL", 3)
+    lines = ["# datetime=2024-01-01_00:00:00 database=db1 table=t1"]
+    lines += [f"INSERT INTO `db1`.`t1` VALUES({i})" for i in range(4)]
+    lines += ["# datetime=2024-01-01_00:00:01 database=db1 table=t2"]
+    lines += [f"DELETE FROM `db1`.`t2` WHERE `id`={i}" for i in range(2)]
+    (tmp_path / "forward.1.sql").write_text("\n".join(lines) + "\n")
+    lines = [f"UPDATE `db2`.`t1` SET `a`={i} WHERE `id`=1;" for i in range(4)]
+    (tmp_path / "forward.2.sql").write_text("\n".join(lines))
+    return str(tmp_path)
+
+
+def test_sql_table():
+    assert sql_table("INSERT INTO `db1`.`t1` VALUES(1)") == ("db1", "t1")
+    assert sql_table("DELETE FROM t2 WHERE id=1") == ("", "t2")
+    assert sql_table("UPDATE t3 SET a=1", "# database=db3 table=t3") == ("db3", "t3")
+
+
+def test_read_pages(output_dir):
+    reader = My2sqlOutputReader(output_dir)
+    assert reader.total == 10
+    rows = reader.read(offset=3, limit=4)
+    assert [r["sql"] for r in rows] == [
+        "INSERT INTO `db1`.`t1` VALUES(3);",
+        "DELETE FROM `db1`.`t2` WHERE `id`=0;",
+        "DELETE FROM `db1`.`t2` WHERE `id`=1;",
+        "UPDATE `db2`.`t1` SET `a`=0 WHERE `id`=1;",
+    ]
+    # 从索引点开始读取时沿用之前的extraInfo
+    assert rows[1]["extra_info"].endswith("table=t2")
+    assert rows[3]["extra_info"].endswith("table=t2")
+    assert reader.read(offset=9, limit=4) == [
+        {
+            "sql": "UPDATE `db2`.`t1` SET `a`=3 WHERE `id`=1;",
+            "extra_info": "# datetime=2024-01-01_00:00:01 database=db1 table=t2",
+        }
+    ]
+    assert reader.read(offset=10) == []
+
+
+def test_filters(output_dir):
+    reader = My2sqlOutputReader(output_dir, tables=["t1"], sql_types=["update"])
+    assert reader.total == 4
+    assert [r["sql"] for r in reader.read(offset=2)] == [
+        "UPDATE `db2`.`t1` SET `a`=2 WHERE `id`=1;",
+        "UPDATE `db2`.`t1` SET `a`=3 WHERE `id`=1;",
+    ]
+    assert My2sqlOutputReader(output_dir, tables=["db1.t1"]).total == 4
+    assert My2sqlOutputReader(output_dir, sql_types=["DELETE"]).total == 2
+
+
+def test_index_reuse(output_dir):
+    assert My2sqlOutputReader(output_dir).total == 10
+    assert len(glob.glob(os.path.join(output_dir, ".my2sql_index_*.json"))) == 1
+
+    # 文件变化后重建索引
+    with open(os.path.join(output_dir, "forward.2.sql"), "a") as f:
+        f.write("\nUPDATE `db2`.`t1` SET `a`=4 WHERE `id`=1;\n")
+    reader = My2sqlOutputReader(output_dir)
+    assert reader.total == 11
+    assert reader.read(offset=10)[0]["sql"].endswith("`a`=4 WHERE `id`=1;")
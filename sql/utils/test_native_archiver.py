@@ -0,0 +1,173 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+
+from sql.models import ArchiveConfig, Instance, ResourceGroup
+from sql.utils.native_archiver import NativeArchiver
+
+CONFIG = {
+    "batch_size": 10,
+    "min_batch_size": 5,
+    "max_batch_size": 40,
+    "max_lag": 10,
+    "lag_check_interval": 0,
+    "lag_instances": [],
+}
+
+
+class FakeTable:
+    """模拟按主键排序的单主键表, 处理归档发出的键集查询和按主键删除"""
+
+    def __init__(self, ids):
+        self.rows = {i: (i, f"name{i}") for i in ids}
+        self.fail_delete_at = None
+        self.deletes = 0
+
+    def cursor(self):
+        table = self
+        cursor = MagicMock()
+        cursor.description = (("id",), ("name",))
+
+        def execute(sql, params):
+            if sql.startswith("SELECT"):
+                *last_key, limit = params
+                ids = sorted(i for i in table.rows if not last_key or i > last_key[0])
+                cursor.result = [table.rows[i] for i in ids[:limit]]
+                return len(cursor.result)
+            table.deletes += 1
+            if table.fail_delete_at == table.deletes:
+                raise Exception("lock wait timeout")
+            for i in params:
+                table.rows.pop(i)
+            return len(params)
+
+        cursor.execute.side_effect = execute
+        cursor.fetchall.side_effect = lambda: cursor.result
+        return cursor
+
+
+class TestNativeArchiver(TestCase):
+    def setUp(self):
+        self.ins = Instance.objects.create(
+            instance_name="some_ins",
+            type="master",
+            db_type="mysql",
+            host="some_host",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+        self.res_group = ResourceGroup.objects.create(group_id=1, group_name="g1")
+        self.archive_info = ArchiveConfig.objects.create(
+            title="title",
+            resource_group=self.res_group,
+            src_instance=self.ins,
+            src_db_name="db1",
+            src_table_name="t1",
+            dest_instance=self.ins,
+            dest_db_name="db2",
+            dest_table_name="t2",
+            condition="1=1",
+            mode="purge",
+            no_delete=False,
+            sleep=0,
+        )
+        self.table = FakeTable(range(1, 26))
+        self.src_engine = MagicMock()
+        self.src_engine.get_primary_key.return_value = ["id"]
+        self.src_conn = MagicMock()
+        self.src_conn.cursor.side_effect = self.table.cursor
+        self.src_engine.get_connection.return_value = self.src_conn
+        self.dest_engine = MagicMock()
+        self.dest_cursor = (
+            self.dest_engine.get_connection.return_value.cursor.return_value
+        )
+        self.dest_cursor.executemany.side_effect = lambda sql, rows: setattr(
+            self.dest_cursor, "rowcount", len(rows)
+        )
+
+    def tearDown(self):
+        self.archive_info.delete()
+        self.res_group.delete()
+        self.ins.delete()
+
+    def _run(self, config=None):
+        archiver = NativeArchiver(self.archive_info, config=config or dict(CONFIG))
+        with patch(
+            "sql.utils.native_archiver.get_engine",
+            side_effect=[self.src_engine, self.dest_engine],
+        ), patch.object(NativeArchiver, "replica_lag", return_value=None):
+            archiver.run()
+        return archiver
+
+    def test_purge(self):
+        archiver = self._run()
+        self.assertEqual(archiver.select_cnt, 25)
+        self.assertEqual(archiver.delete_cnt, 25)
+        self.assertEqual(archiver.batch_cnt, 3)
+        self.assertEqual(self.table.rows, {})
+        self.archive_info.refresh_from_db()
+        self.assertEqual(self.archive_info.checkpoint, "")
+        self.src_engine.close.assert_called_once()
+
+    def test_dest_no_delete(self):
+        self.archive_info.mode = "dest"
+        self.archive_info.no_delete = True
+        archiver = self._run()
+        self.assertEqual(archiver.insert_cnt, 25)
+        self.assertEqual(archiver.delete_cnt, 0)
+        self.assertEqual(len(self.table.rows), 25)
+        sql, rows = self.dest_cursor.executemany.call_args_list[0].args
+        self.assertEqual(sql, "INSERT INTO `db2`.`t2` (`id`, `name`) VALUES (%s, %s)")
+        self.assertEqual(len(rows), 10)
+        # 写入前删除目标表中这批主键的数据
+        sql, params = self.dest_cursor.execute.call_args_list[0].args
+        self.assertTrue(sql.startswith("DELETE FROM `db2`.`t2` WHERE `id` IN"))
+        self.assertEqual(params, list(range(1, 11)))
+
+    def test_dest_insert_mismatch(self):
+        """目标表写入行数与查询行数不一致时不删除源数据"""
+        self.archive_info.mode = "dest"
+        self.dest_cursor.executemany.side_effect = lambda sql, rows: setattr(
+            self.dest_cursor, "rowcount", len(rows) - 1
+        )
+        with self.assertRaises(Exception):
+            self._run()
+        self.assertEqual(len(self.table.rows), 25)
+        self.dest_engine.get_connection.return_value.rollback.assert_called_once()
+        self.dest_engine.get_connection.return_value.commit.assert_not_called()
+
+    def test_checkpoint_resume(self):
+        self.table.fail_delete_at = 2
+        with self.assertRaises(Exception):
+            self._run()
+        self.archive_info.refresh_from_db()
+        self.assertIn('"key": [10]', self.archive_info.checkpoint)
+        self.assertEqual(min(self.table.rows), 11)
+
+        self.table.fail_delete_at = None
+        self.table.rows[3] = (3, "name3")
+        archiver = self._run()
+        self.assertEqual(archiver.resumed_from, [10])
+        self.assertEqual(archiver.select_cnt, 15)
+        # 断点之前的数据不再处理
+        self.assertEqual(list(self.table.rows), [3])
+
+    def test_checkpoint_condition_changed(self):
+        self.archive_info.checkpoint = (
+            '{"condition": "id < 10", "mode": "purge", "key": [10]}'
+        )
+        self.assertIsNone(NativeArchiver(self.archive_info, CONFIG).load_checkpoint())
+
+    def test_throttle(self):
+        archiver = NativeArchiver(self.archive_info, config=dict(CONFIG))
+        with patch.object(
+            NativeArchiver, "replica_lag", side_effect=[30, 20, 3]
+        ), patch("sql.utils.native_archiver.time.sleep"):
+            archiver.throttle(self.src_engine)
+        self.assertEqual(archiver.batch_size, 5)
+        self.assertEqual(archiver.lag_wait, 2)
+        with patch.object(NativeArchiver, "replica_lag", return_value=1):
+            archiver.throttle(self.src_engine)
+            archiver.throttle(self.src_engine)
+        self.assertEqual(archiver.batch_size, 10)
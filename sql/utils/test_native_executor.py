@@ -0,0 +1,154 @@
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+
+from sql.models import Instance, SqlWorkflow, SqlWorkflowContent
+from sql.utils.native_executor import NativeExecutor, native_statements
+
+CONFIG = {
+    "enabled": True,
+    "commit_size": 4,
+    "min_commit_size": 2,
+    "max_commit_size": 4,
+    "max_batch_bytes": 1024,
+    "max_lag": 10,
+    "max_threads_running": 0,
+    "check_interval": 0,
+    "lag_instances": [],
+}
+
+
+class FakeCursor:
+    """模拟开启多语句的游标, 语句包含fail时报错, 影响行数为语句序号"""
+
+    def __init__(self):
+        self.batches = []
+        self.pending = []
+        self.rowcount = 0
+
+    def execute(self, sql):
+        self.batches.append(sql)
+        self.pending = sql.split(";\n")
+        self.nextset()
+
+    def nextset(self):
+        if not self.pending:
+            return None
+        statement = self.pending.pop(0)
+        if "fail" in statement:
+            self.pending = []
+            raise Exception("Duplicate entry")
+        self.rowcount = int(statement.rsplit("=", 1)[-1])
+        return 1
+
+
+class TestNativeExecutor(TestCase):
+    def setUp(self):
+        self.ins = Instance.objects.create(
+            instance_name="some_ins",
+            type="master",
+            db_type="mysql",
+            host="some_host",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+        self.wf = SqlWorkflow.objects.create(
+            workflow_name="some_name",
+            group_id=1,
+            group_name="g1",
+            engineer_display="",
+            audit_auth_groups="some_audit_group",
+            create_time=datetime.now(),
+            status="workflow_executing",
+            is_backup=False,
+            instance=self.ins,
+            db_name="some_db",
+            syntax_type=2,
+        )
+        self.statements = [f"update t set c=1 where id={i}" for i in range(1, 11)]
+        SqlWorkflowContent.objects.create(
+            workflow=self.wf, sql_content=";\n".join(self.statements) + ";"
+        )
+        self.cursor = FakeCursor()
+        self.engine = MagicMock()
+        self.engine.get_connection.return_value.cursor.return_value = self.cursor
+
+    def tearDown(self):
+        SqlWorkflowContent.objects.all().delete()
+        SqlWorkflow.objects.all().delete()
+        self.ins.delete()
+
+    def _execute(self, statements, config=None):
+        with patch("sql.utils.native_executor.get_engine", return_value=self.engine):
+            executor = NativeExecutor(self.wf, statements, config or dict(CONFIG))
+        with patch.object(NativeExecutor, "replica_lag", return_value=None):
+            return executor, executor.execute()
+
+    def test_native_statements(self):
+        self.assertIsNone(native_statements(self.wf, dict(CONFIG, enabled=False)))
+        self.assertEqual(native_statements(self.wf, dict(CONFIG)), self.statements)
+        # 需要备份或包含DDL的工单使用goInception执行
+        self.wf.is_backup = True
+        self.assertIsNone(native_statements(self.wf, dict(CONFIG)))
+        self.wf.is_backup = False
+        self.wf.sqlworkflowcontent.sql_content = "alter table t add c int;"
+        self.assertIsNone(native_statements(self.wf, dict(CONFIG)))
+
+    def test_execute(self):
+        executor, result = self._execute(self.statements)
+        self.assertIsNone(result.error)
+        self.assertEqual(executor.batch_cnt, 3)
+        self.assertEqual(len(self.cursor.batches), 3)
+        self.assertEqual([r.affected_rows for r in result.rows], list(range(1, 11)))
+        self.assertEqual([r.id for r in result.rows], list(range(1, 11)))
+        self.assertEqual({r.stagestatus for r in result.rows}, {"Execute Successfully"})
+        self.engine.get_connection.return_value.set_server_option.assert_called_once()
+        self.assertEqual(self.engine.get_connection.return_value.commit.call_count, 3)
+        self.engine.close.assert_called_once()
+
+    def test_execute_failed(self):
+        statements = list(self.statements)
+        statements[5] = "insert into t values (fail)"
+        _, result = self._execute(statements)
+        self.assertEqual(result.error, "Duplicate entry")
+        conn = self.engine.get_connection.return_value
+        conn.rollback.assert_called_once()
+        self.assertEqual(conn.commit.call_count, 1)
+        self.assertEqual(
+            [r.stagestatus for r in result.rows],
+            ["Execute Successfully"] * 4
+            + ["Execute Rollback", "Execute Failed"]
+            + ["Audit completed"] * 4,
+        )
+        self.assertEqual(result.rows[5].errlevel, 2)
+        self.assertEqual(len(self.cursor.batches), 2)
+
+    def test_batch_bytes(self):
+        config = dict(CONFIG, max_batch_bytes=70)
+        executor, result = self._execute(self.statements, config)
+        # 每批最多两条语句
+        self.assertEqual(executor.batch_cnt, 5)
+        self.assertEqual(len(result.rows), 10)
+
+    def test_throttle(self):
+        with patch("sql.utils.native_executor.get_engine", return_value=self.engine):
+            executor = NativeExecutor(self.wf, self.statements, dict(CONFIG))
+        with patch.object(
+            NativeExecutor, "replica_lag", side_effect=[30, 20, 3]
+        ), patch("sql.utils.native_executor.time.sleep"):
+            executor.throttle(self.cursor)
+        self.assertEqual(executor.commit_size, 2)
+        self.assertEqual(executor.throttle_wait, 2)
+
+        config = dict(CONFIG, max_lag=0, max_threads_running=40)
+        with patch("sql.utils.native_executor.get_engine", return_value=self.engine):
+            executor = NativeExecutor(self.wf, self.statements, config)
+        with patch.object(
+            NativeExecutor, "threads_running", side_effect=[50, 10, 10]
+        ), patch("sql.utils.native_executor.time.sleep"):
+            executor.throttle(self.cursor)
+            self.assertEqual(executor.throttle_wait, 1)
+            executor.throttle(self.cursor)
+        self.assertEqual(executor.commit_size, 3)
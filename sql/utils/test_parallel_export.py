@@ -0,0 +1,120 @@
+from unittest.mock import MagicMock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.engines.models import ResultSet
+from sql.utils.parallel_export import (
+    instance_slot,
+    parse_single_table_select,
+    plan_parallel_export,
+)
+
+PARALLEL_EXPORT = {"enabled": True, "workers": 4, "chunk_size": 100}
+
+
+class TestParseSingleTableSelect(SimpleTestCase):
+    def test_simple_select(self):
+        parsed = parse_single_table_select(
+            "SELECT id, name FROM db1.`users` u WHERE u.status = 1;"
+        )
+        self.assertEqual(parsed["schema"], "db1")
+        self.assertEqual(parsed["table"], "users")
+        self.assertEqual(parsed["alias"], "u")
+        self.assertEqual(parsed["where"], "u.status = 1")
+
+    def test_keyword_in_string(self):
+        parsed = parse_single_table_select("select * from t where a = 'order by'")
+        self.assertEqual(parsed["where"], "a = 'order by'")
+
+    def test_unsplittable(self):
+        for sql in [
+            "select count(*) from t",
+            "select * from t order by id",
+            "select * from t limit 10",
+            "select a, count(*) from t group by a",
+            "select distinct a from t",
+            "select * from a join b on a.id = b.id",
+            "select * from a, b",
+            "select * from t where id in (select id from u)",
+            "select * from t union select * from u",
+            "update t set a = 1",
+        ]:
+            with self.subTest(sql=sql):
+                self.assertIsNone(parse_single_table_select(sql))
+
+
+class TestPlanParallelExport(SimpleTestCase):
+    def _engine(self, low, high, key="id"):
+        engine = MagicMock()
+        engine.get_split_key.return_value = key
+        engine.query.return_value = ResultSet(rows=[(low, high)])
+        return engine
+
+    @override_settings(OFFLINE_EXPORT_PARALLEL=PARALLEL_EXPORT)
+    def test_plan(self):
+        engine = self._engine(1, 250)
+        sqls = plan_parallel_export(engine, "db1", "select * from t where a = 1")
+        self.assertEqual(
+            sqls,
+            [
+                "SELECT * FROM t WHERE (a = 1) AND t.`id` >= 1 AND t.`id` < 101",
+                "SELECT * FROM t WHERE (a = 1) AND t.`id` >= 101 AND t.`id` < 201",
+                "SELECT * FROM t WHERE (a = 1) AND t.`id` >= 201 AND t.`id` < 251",
+            ],
+        )
+        engine.get_split_key.assert_called_once_with("db1", "t")
+
+    @override_settings(OFFLINE_EXPORT_PARALLEL=dict(PARALLEL_EXPORT, max_chunks=2))
+    def test_plan_max_chunks(self):
+        """主键范围稀疏时按最大分片数增大分片跨度"""
+        engine = self._engine(1, 10000000)
+        sqls = plan_parallel_export(engine, "db1", "select * from t")
+        self.assertEqual(
+            sqls,
+            [
+                "SELECT * FROM t WHERE t.`id` >= 1 AND t.`id` < 5000001",
+                "SELECT * FROM t WHERE t.`id` >= 5000001 AND t.`id` < 10000001",
+            ],
+        )
+
+    @override_settings(OFFLINE_EXPORT_PARALLEL=PARALLEL_EXPORT)
+    def test_small_range(self):
+        engine = self._engine(1, 100)
+        self.assertIsNone(plan_parallel_export(engine, "db1", "select * from t"))
+
+    @override_settings(OFFLINE_EXPORT_PARALLEL=PARALLEL_EXPORT)
+    def test_no_split_key(self):
+        engine = self._engine(1, 1000, key=None)
+        self.assertIsNone(plan_parallel_export(engine, "db1", "select * from t"))
+        engine.query.assert_not_called()
+
+    @override_settings(OFFLINE_EXPORT_PARALLEL=PARALLEL_EXPORT)
+    def test_empty_table(self):
+        engine = self._engine(None, None)
+        self.assertIsNone(plan_parallel_export(engine, "db1", "select * from t"))
+
+    @override_settings(OFFLINE_EXPORT_PARALLEL={"enabled": False})
+    def test_disabled(self):
+        engine = self._engine(1, 1000)
+        self.assertIsNone(plan_parallel_export(engine, "db1", "select * from t"))
+        engine.get_split_key.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestInstanceSlot(SimpleTestCase):
+    def test_slot_acquire_release(self):
+        with instance_slot(1, 2, 60):
+            with instance_slot(1, 2, 60):
+                self.assertTrue(cache.get("offline_export_slot:1:0"))
+                self.assertTrue(cache.get("offline_export_slot:1:1"))
+        self.assertIsNone(cache.get("offline_export_slot:1:0"))
+        self.assertIsNone(cache.get("offline_export_slot:1:1"))
+
+    def test_slot_wait_timeout(self):
+        with instance_slot(1, 1, 60):
+            with self.assertRaises(Exception):
+                with instance_slot(1, 1, 60, wait_timeout=0.1, interval=0.05):
+                    pass
+        self.assertIsNone(cache.get("offline_export_slot:1:0"))
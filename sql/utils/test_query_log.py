@@ -0,0 +1,84 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.models import QueryLog
+from sql.utils.query_log import QueryLogBuffer, query_log_metrics, record_query_log
+
+
+def _record(i=0):
+    return dict(
+        username="some_user",
+        user_display="some_user",
+        db_name="some_db",
+        instance_name="some_ins",
+        sqllog=f"select {i}",
+        effect_row=1,
+        cost_time="0.01",
+        priv_check=True,
+        hit_rule=False,
+        masking=False,
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestQueryLogBuffer(TestCase):
+    def tearDown(self):
+        QueryLog.objects.all().delete()
+
+    @patch.object(QueryLogBuffer, "_ensure_thread")
+    def test_flush_bulk_create(self, _ensure_thread):
+        buffer = QueryLogBuffer(batch_size=2, flush_interval=60)
+        for i in range(3):
+            buffer.add(_record(i))
+        with self.assertNumQueries(2):
+            self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(buffer.size, 0)
+        self.assertEqual(
+            list(QueryLog.objects.order_by("id").values_list("sqllog", flat=True)),
+            ["select 0", "select 1", "select 2"],
+        )
+
+    @patch.object(QueryLogBuffer, "_ensure_thread")
+    def test_add_over_max_pending(self, _ensure_thread):
+        before = query_log_metrics()["dropped"]
+        buffer = QueryLogBuffer(batch_size=10, flush_interval=60, max_pending=2)
+        for i in range(3):
+            buffer.add(_record(i))
+        self.assertEqual(buffer.size, 2)
+        self.assertEqual(query_log_metrics()["dropped"], before + 1)
+
+    @patch("sql.utils.query_log.save_query_logs", side_effect=RuntimeError("db"))
+    @patch.object(QueryLogBuffer, "_ensure_thread")
+    def test_flush_failed_requeue(self, _ensure_thread, _save_query_logs):
+        buffer = QueryLogBuffer(batch_size=10, flush_interval=60)
+        buffer.add(_record())
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.size, 1)
+
+    @patch.object(QueryLogBuffer, "_ensure_thread")
+    def test_flush_late_metric(self, _ensure_thread):
+        before = query_log_metrics()["late"]
+        buffer = QueryLogBuffer(batch_size=10, flush_interval=60)
+        buffer.add(_record())
+        buffer.flush(late_threshold=-1)
+        self.assertEqual(query_log_metrics()["late"], before + 1)
+
+    def test_record_query_log_sync(self):
+        record_query_log(**_record())
+        self.assertEqual(QueryLog.objects.count(), 1)
+
+    @override_settings(QUERY_LOG={"mode": "buffer"})
+    @patch("sql.utils.query_log.get_query_log_buffer")
+    def test_record_query_log_buffer(self, _get_query_log_buffer):
+        record_query_log(**_record())
+        _get_query_log_buffer.return_value.add.assert_called_once_with(_record())
+        self.assertEqual(QueryLog.objects.count(), 0)
+
+    @override_settings(QUERY_LOG={"mode": "async"})
+    @patch("sql.utils.query_log.async_task")
+    def test_record_query_log_async(self, _async_task):
+        record_query_log(**_record())
+        _async_task.assert_called_once()
+        self.assertEqual(QueryLog.objects.count(), 0)
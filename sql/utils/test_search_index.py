@@ -0,0 +1,148 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.models import QueryLog, QueryLogToken, SlowQuery, SlowQueryToken
+from sql.utils.search_index import (
+    build_search_index,
+    query_log_search,
+    reindex_query_log,
+    slow_query_search,
+    tokenize,
+)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SEARCH_INDEX={"enabled": True})
+class TestSearchIndex(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.logs = [
+            self._log("select * from order_items where id = 1", "张三"),
+            self._log("select count(*) from users", "李四", alias="统计用户数"),
+        ]
+
+    def tearDown(self):
+        QueryLog.objects.all().delete()
+        QueryLogToken.objects.all().delete()
+
+    @staticmethod
+    def _log(sqllog, user_display, alias=""):
+        return QueryLog.objects.create(
+            instance_name="some_ins",
+            db_name="some_db",
+            sqllog=sqllog,
+            effect_row=1,
+            username="user",
+            user_display=user_display,
+            alias=alias,
+        )
+
+    def _search(self, search):
+        return list(
+            QueryLog.objects.filter(query_log_search(search))
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("SELECT * FROM order_items", "统计用户"),
+            {
+                "select",
+                "from",
+                "order_items",
+                "order",
+                "items",
+                "统计用户",
+                "计用户",
+                "用户",
+                "户",
+            },
+        )
+
+    def test_search(self):
+        build_search_index()
+        self.assertEqual(QueryLogToken.objects.filter(token="select").count(), 2)
+        self.assertEqual(self._search("ORDER"), [self.logs[0].id])
+        self.assertEqual(self._search("select users"), [self.logs[1].id])
+        self.assertEqual(self._search("用户"), [self.logs[1].id])
+        self.assertEqual(self._search("not_exists"), [])
+
+        # 尚未建立索引的新日志使用模糊匹配
+        new_log = self._log("select * from users", "王五")
+        self.assertEqual(self._search("users"), [self.logs[1].id, new_log.id])
+        build_search_index()
+        self.assertEqual(self._search("王五"), [new_log.id])
+
+    def test_reindex(self):
+        build_search_index()
+        QueryLog.objects.filter(id=self.logs[0].id).update(alias="订单明细")
+        reindex_query_log(self.logs[0].id)
+        self.assertEqual(self._search("明细"), [self.logs[0].id])
+
+    def test_reindex_not_indexed(self):
+        """尚未建立索引的日志修改后不提前建立索引, 不影响增量索引的位置"""
+        QueryLogToken.objects.bulk_create(
+            [QueryLogToken(token="select", query_log_id=self.logs[0].id)]
+        )
+        new_log = self._log("select * from orders", "王五")
+        reindex_query_log(new_log.id)
+        self.assertFalse(QueryLogToken.objects.filter(query_log_id=new_log.id))
+        build_search_index()
+        self.assertEqual(self._search("李四"), [self.logs[1].id])
+        self.assertEqual(self._search("orders"), [new_log.id])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SEARCH_INDEX={"enabled": True})
+class TestSlowQuerySearchIndex(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        # 慢查询建表
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS mysql_slow_query_review (
+                        checksum TEXT PRIMARY KEY,
+                        fingerprint TEXT,
+                        sample TEXT,
+                        first_seen TEXT,
+                        last_seen TEXT,
+                        reviewed_by TEXT,
+                        reviewed_on TEXT,
+                        comments TEXT
+                    )
+                    """)
+            else:
+                with open("src/init_sql/mysql_slow_query_review.sql") as fp:
+                    content = fp.read()
+                    cursor.execute(content)
+
+    def tearDown(self):
+        SlowQueryToken.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS mysql_slow_query_review")
+            cursor.execute("DROP TABLE IF EXISTS mysql_slow_query_review_history")
+
+    def test_search(self):
+        SlowQuery.objects.create(
+            checksum="c1", fingerprint="select * from order_items where id = ?"
+        )
+        SlowQuery.objects.create(
+            checksum="c2", fingerprint="select count(*) from users"
+        )
+        self.assertEqual(build_search_index(), (0, 2))
+        self.assertEqual(
+            list(
+                SlowQuery.objects.filter(slow_query_search("items")).values_list(
+                    "checksum", flat=True
+                )
+            ),
+            ["c1"],
+        )
+
+    def test_table_not_exists(self):
+        """慢日志表不存在时只更新查询日志的索引"""
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE mysql_slow_query_review")
+        self.assertEqual(build_search_index(), (0, 0))
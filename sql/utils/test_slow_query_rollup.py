@@ -0,0 +1,92 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.models import SlowQueryDailyRollup, SlowQueryHourlyRollup
+from sql.utils.slow_query_rollup import rollup_slow_query_history
+
+
+def _history(id, ts_min, db="db1", cnt=1, query_time=1.0, pct_95=1.0):
+    return {
+        "id": id,
+        "hostname_max": "127.0.0.1:3306",
+        "checksum_id": "abc",
+        "db_max": db,
+        "user_max": "root",
+        "ts_min": ts_min,
+        "ts_max": ts_min,
+        "ts_cnt": cnt,
+        "query_time_sum": query_time,
+        "query_time_max": query_time,
+        "query_time_pct_95": pct_95,
+        "rows_examined_sum": 10,
+        "rows_sent_sum": 1,
+    }
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SLOW_QUERY_ROLLUP={"batch_size": 2})
+@patch("sql.utils.slow_query_rollup.SlowQueryHistory.objects")
+class TestSlowQueryRollup(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        SlowQueryHourlyRollup.objects.all().delete()
+        SlowQueryDailyRollup.objects.all().delete()
+
+    def _mock_history(self, mock_objects, rows):
+        def values(*args):
+            last_id = mock_objects.filter.call_args.kwargs["id__gt"]
+            return [r for r in rows if r["id"] > last_id]
+
+        mock_objects.filter.return_value.order_by.return_value.values.side_effect = (
+            values
+        )
+
+    def test_rollup(self, mock_objects):
+        rows = [
+            _history(1, datetime(2024, 1, 1, 10, 5), cnt=2, query_time=4.0),
+            _history(2, datetime(2024, 1, 1, 10, 30), pct_95=3.0),
+            _history(3, datetime(2024, 1, 1, 11, 0)),
+        ]
+        self._mock_history(mock_objects, rows)
+        self.assertEqual(rollup_slow_query_history(), 3)
+
+        hourly = SlowQueryHourlyRollup.objects.order_by("ts")
+        self.assertEqual(
+            [(r.ts.hour, r.ts_cnt, r.query_time_sum) for r in hourly],
+            [(10, 3, 5.0), (11, 1, 1.0)],
+        )
+        self.assertEqual(hourly[0].query_time_pct_95, 3.0)
+        daily = SlowQueryDailyRollup.objects.get()
+        self.assertEqual(daily.ts, datetime(2024, 1, 1))
+        self.assertEqual(daily.ts_cnt, 4)
+        self.assertEqual(daily.ts_max, datetime(2024, 1, 1, 11, 0))
+        self.assertEqual(daily.rows_examined_sum, 30)
+
+        # 只汇总新增的明细
+        rows.append(_history(4, datetime(2024, 1, 1, 11, 10), db=None))
+        self.assertEqual(rollup_slow_query_history(), 1)
+        self.assertEqual(mock_objects.filter.call_args.kwargs, {"id__gt": 3})
+        self.assertEqual(SlowQueryDailyRollup.objects.count(), 2)
+        self.assertEqual(
+            SlowQueryDailyRollup.objects.get(db_name="").ts_cnt,
+            1,
+        )
+
+    def test_rollup_empty_query_time(self, mock_objects):
+        """明细没有执行时长时汇总记为0"""
+        self._mock_history(
+            mock_objects,
+            [_history(1, datetime(2024, 1, 1, 10, 5), query_time=None, pct_95=None)],
+        )
+        self.assertEqual(rollup_slow_query_history(), 1)
+        hourly = SlowQueryHourlyRollup.objects.get()
+        self.assertEqual(
+            (hourly.query_time_sum, hourly.query_time_max, hourly.query_time_pct_95),
+            (0, 0, 0),
+        )
+        self.assertEqual(hourly.last_history_id, 1)
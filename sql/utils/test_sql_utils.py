@@ -451,3 +451,24 @@ create table user(
         self.assertEqual(
             not_match_result, ["no_match"]
         )  # 仅 no_match 不符合 "_db$" 规则
+
+    def test_split_mysql_statements(self):
+        """
+        测试按分号拆分语句，字符串、标识符、注释中的分号不拆分
+        :return:
+        """
+        sql = (
+            "insert into t values(1, 'a;b');\n"
+            'update `t;1` set c = "x\\";" where id = 1 -- 注释;\n'
+            ";/* 注释; */delete from t where id = 2;;\n"
+            "insert into t values(2)"
+        )
+        self.assertEqual(
+            split_mysql_statements(sql),
+            [
+                "insert into t values(1, 'a;b')",
+                'update `t;1` set c = "x\\";" where id = 1 -- 注释;',
+                "/* 注释; */delete from t where id = 2",
+                "insert into t values(2)",
+            ],
+        )
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+from unittest.mock import patch, Mock
+
+from django.test import SimpleTestCase
+
+from sql.utils.ssh_tunnel import TunnelManager
+
+
+class TestTunnelManager(SimpleTestCase):
+    def setUp(self):
+        self.tunnel = SimpleNamespace(
+            id=1,
+            host="tunnel_host",
+            port=22,
+            user="user",
+            password="password",
+            pkey=None,
+            pkey_password=None,
+            update_time=None,
+        )
+        self.manager = TunnelManager(idle_timeout=60)
+
+    def tearDown(self):
+        self.manager.close_all()
+
+    @patch("sql.utils.ssh_tunnel.SSHConnection")
+    def test_acquire_reuse(self, _conn):
+        _conn.return_value.get_ssh.return_value = ("127.0.0.1", 10022)
+        lease1 = self.manager.acquire(self.tunnel, "db_host", 3306)
+        lease2 = self.manager.acquire(self.tunnel, "db_host", 3306)
+        _conn.assert_called_once()
+        self.assertEqual(lease2.get_ssh(), ("127.0.0.1", 10022))
+        lease1.release()
+        lease2.release()
+        _conn.return_value.close.assert_not_called()
+
+    @patch("sql.utils.ssh_tunnel.SSHConnection")
+    def test_acquire_different_remote(self, _conn):
+        self.manager.acquire(self.tunnel, "db_host", 3306)
+        self.manager.acquire(self.tunnel, "db_host", 3307)
+        self.assertEqual(_conn.call_count, 2)
+
+    @patch("sql.utils.ssh_tunnel.SSHConnection")
+    def test_reconnect_dead_tunnel(self, _conn):
+        dead, alive = Mock(is_active=False), Mock(is_active=True)
+        _conn.side_effect = [dead, alive]
+        self.manager.acquire(self.tunnel, "db_host", 3306).release()
+        lease = self.manager.acquire(self.tunnel, "db_host", 3306)
+        dead.close.assert_called_once()
+        self.assertIs(lease._entry.connection, alive)
+
+    @patch("sql.utils.ssh_tunnel.time.monotonic")
+    @patch("sql.utils.ssh_tunnel.SSHConnection")
+    def test_reap_idle_tunnel(self, _conn, _monotonic):
+        first, second = Mock(is_active=True), Mock(is_active=True)
+        _conn.side_effect = [first, second]
+        _monotonic.return_value = 100
+        self.manager.acquire(self.tunnel, "db_host", 3306).release()
+        _monotonic.return_value = 200
+        self.manager.acquire(self.tunnel, "other_host", 3306)
+        first.close.assert_called_once()
+
+    @patch("sql.utils.ssh_tunnel.SSHConnection")
+    def test_close_retired_tunnel_after_release(self, _conn):
+        lease = self.manager.acquire(self.tunnel, "db_host", 3306)
+        self.manager.invalidate(self.tunnel.id)
+        _conn.return_value.close.assert_not_called()
+        lease.release()
+        _conn.return_value.close.assert_called_once()
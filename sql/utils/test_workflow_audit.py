@@ -975,3 +975,30 @@ class TestAuditExtra(TestCase):
             Audit.change_settings(
                 group_id=99999, workflow_type=1, audit_auth_groups="1,2"
             )
+
+
+def test_review_summary(sql_workflow):
+    """优先使用汇总字段, 未汇总的历史数据解析审核内容"""
+    sql_workflow, workflow_content = sql_workflow
+    workflow_content.review_content = json.dumps(
+        [
+            {"errlevel": 1, "affected_rows": 10},
+            {"errlevel": 2, "affected_rows": 5},
+            {"errlevel": 0},
+        ]
+    )
+    workflow_content.save()
+    audit = AuditV2(workflow=sql_workflow)
+    assert audit.review_summary() == {
+        "warning_count": 1,
+        "error_count": 1,
+        "affected_rows": 15,
+    }
+    assert audit.all_affected_rows == 15
+    workflow_content.warning_count = 0
+    workflow_content.error_count = 0
+    workflow_content.affected_rows = 100
+    workflow_content.save()
+    audit = AuditV2(workflow=SqlWorkflow.objects.get(id=sql_workflow.id))
+    assert audit.all_affected_rows == 100
+    assert audit.is_auto_reject() is False
@@ -0,0 +1,131 @@
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.models import Instance, SqlWorkflow, SqlWorkflowContent
+from sql.utils.workflow_detail import (
+    build_statement_index,
+    clear_statement_index,
+    detail_page,
+    get_statement_index,
+)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestWorkflowDetail(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ins = Instance.objects.create(
+            instance_name="some_ins",
+            type="master",
+            db_type="mysql",
+            host="some_host",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+        self.wf = SqlWorkflow.objects.create(
+            workflow_name="some_name",
+            group_id=1,
+            group_name="g1",
+            engineer_display="",
+            audit_auth_groups="some_audit_group",
+            create_time=datetime.now(),
+            status="workflow_manreviewing",
+            is_backup=True,
+            instance=self.ins,
+            db_name="some_db",
+            syntax_type=2,
+        )
+        self.rows = [
+            {
+                "id": i,
+                "stage": "CHECKED",
+                "errlevel": 1 if i % 10 == 0 else 0,
+                "sql": f"insert into t values ({i}, '中文')",
+                "affected_rows": 1,
+            }
+            for i in range(1, 1001)
+        ]
+        SqlWorkflowContent.objects.create(
+            workflow=self.wf,
+            sql_content="some_sql",
+            review_content=json.dumps(self.rows),
+        )
+
+    def tearDown(self):
+        SqlWorkflowContent.objects.all().delete()
+        SqlWorkflow.objects.all().delete()
+        Instance.objects.all().delete()
+
+    def test_build_statement_index(self):
+        text = json.dumps(self.rows[:3])
+        index = build_statement_index(text)
+        self.assertEqual(
+            [json.loads(text[s:e]) for s, e in zip(index["starts"], index["ends"])],
+            self.rows[:3],
+        )
+        self.assertEqual(list(index["errlevel"]), [0, 0, 0])
+        self.assertEqual(index["errlevel_values"], ["0"])
+        self.assertEqual(len(build_statement_index("[]")["starts"]), 0)
+        # 旧数据格式和无法解析的内容不建立索引
+        self.assertIsNone(build_statement_index('[["1", "CHECKED"]]'))
+        self.assertIsNone(build_statement_index("not json"))
+
+    def test_detail_page(self):
+        total, rows = detail_page(self.wf, offset=500, limit=20)
+        self.assertEqual(total, 1000)
+        self.assertEqual(rows, self.rows[500:520])
+        # 按errlevel过滤
+        total, rows = detail_page(self.wf, offset=10, limit=5, errlevels=["1"])
+        self.assertEqual(total, 100)
+        self.assertEqual([r["id"] for r in rows], [110, 120, 130, 140, 150])
+        total, rows = detail_page(self.wf, offset=0, limit=5, stages=["EXECUTED"])
+        self.assertEqual((total, rows), (0, []))
+
+    def test_index_cached(self):
+        get_statement_index(self.wf.id, "review_content")
+        with patch("sql.utils.workflow_detail.build_statement_index") as _build:
+            total, _ = detail_page(self.wf, offset=0, limit=10)
+            _build.assert_not_called()
+        self.assertEqual(total, 1000)
+        # 内容修改后清除索引
+        SqlWorkflowContent.objects.filter(workflow=self.wf).update(
+            review_content=json.dumps(self.rows[:5])
+        )
+        clear_statement_index(self.wf.id)
+        total, rows = detail_page(self.wf, offset=0, limit=10)
+        self.assertEqual((total, rows), (5, self.rows[:5]))
+
+    @override_settings(WORKFLOW_CONTENT_COMPRESSION={"enabled": True, "min_size": 1})
+    def test_detail_page_compressed(self):
+        SqlWorkflowContent.objects.filter(workflow=self.wf).update(
+            review_content=json.dumps(self.rows)
+        )
+        total, rows = detail_page(self.wf, offset=990, limit=20)
+        self.assertEqual((total, rows), (1000, self.rows[990:]))
+
+    def test_execute_result_fallback(self):
+        """执行结束但没有执行结果时展示审核内容, 旧数据格式解析后分页"""
+        SqlWorkflow.objects.filter(id=self.wf.id).update(status="workflow_finish")
+        self.wf.refresh_from_db()
+        total, rows = detail_page(self.wf, offset=0, limit=2)
+        self.assertEqual((total, rows), (1000, self.rows[:2]))
+        SqlWorkflowContent.objects.filter(workflow=self.wf).update(
+            execute_result=json.dumps(
+                [
+                    [1, "EXECUTED", 0, "Execute Successfully", "", "select 1", 0]
+                    + [""] * 4,
+                    [2, "EXECUTED", 2, "Execute failed", "error", "select 2", 0]
+                    + [""] * 4,
+                ]
+            )
+        )
+        self.wf.refresh_from_db()
+        total, rows = detail_page(self.wf, offset=0, limit=10, errlevels=["2"])
+        self.assertEqual(total, 1)
+        self.assertEqual(rows[0]["sql"], "select 2")
@@ -0,0 +1,165 @@
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django_q.models import Schedule, Task
+
+from common.utils.testing import LOCMEM_CACHES
+from sql.models import Instance, SqlWorkflow
+from sql.utils.workflow_scheduler import (
+    PENDING_KEY,
+    RUNNING_KEY,
+    dispatch_workflow_executions,
+    queue_position,
+    submit_workflow_execution,
+    workflow_execution_finished,
+)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    WORKFLOW_SCHEDULER={"enabled": True, "instance_limit": 1, "max_running": 3},
+)
+@patch("sql.utils.execute_sql.execute_callback")
+@patch("sql.utils.workflow_scheduler.async_task")
+class TestWorkflowScheduler(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ins1 = Instance.objects.create(
+            instance_name="ins1",
+            type="master",
+            db_type="mysql",
+            host="host1",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+        self.ins2 = Instance.objects.create(
+            instance_name="ins2",
+            type="master",
+            db_type="mysql",
+            host="host2",
+            port=3306,
+            user="ins_user",
+            password="some_str",
+        )
+
+    def tearDown(self):
+        Task.objects.all().delete()
+        Schedule.objects.all().delete()
+        SqlWorkflow.objects.all().delete()
+        self.ins1.delete()
+        self.ins2.delete()
+        cache.clear()
+
+    def _workflow(self, instance, group_id=1, status="workflow_queuing"):
+        return SqlWorkflow.objects.create(
+            workflow_name="some_name",
+            group_id=group_id,
+            group_name="g1",
+            engineer_display="",
+            audit_auth_groups="some_audit_group",
+            create_time=datetime.now(),
+            status=status,
+            is_backup=True,
+            instance=instance,
+            db_name="some_db",
+            syntax_type=2,
+        )
+
+    def test_instance_limit(self, _async_task, _execute_callback):
+        first = self._workflow(self.ins1)
+        second = self._workflow(self.ins1)
+        other = self._workflow(self.ins2)
+
+        self.assertEqual(submit_workflow_execution(first.id), [first.id])
+        self.assertEqual(submit_workflow_execution(second.id), [])
+        self.assertEqual(submit_workflow_execution(other.id), [other.id])
+        self.assertEqual(queue_position(second.id), 1)
+        self.assertIsNone(queue_position(first.id))
+
+        task = Mock(args=(first.id,))
+        workflow_execution_finished(task)
+        _execute_callback.assert_called_once_with(task)
+        self.assertEqual(cache.get(PENDING_KEY), [])
+        self.assertEqual(set(cache.get(RUNNING_KEY)), {second.id, other.id})
+        self.assertEqual(_async_task.call_count, 3)
+
+    def test_group_limit_and_priority(self, _async_task, _execute_callback):
+        with override_settings(
+            WORKFLOW_SCHEDULER={
+                "enabled": True,
+                "instance_limit": 2,
+                "group_limit": 1,
+                "max_running": 3,
+                "ordering": "priority",
+            }
+        ):
+            running = self._workflow(self.ins1)
+            low = self._workflow(self.ins1)
+            high = self._workflow(self.ins2)
+            submit_workflow_execution(running.id)
+            submit_workflow_execution(low.id)
+            submit_workflow_execution(high.id, priority=10)
+            # 同一资源组只能执行一个工单，高优先级的排在前面
+            self.assertEqual(queue_position(high.id), 1)
+            self.assertEqual(queue_position(low.id), 2)
+
+            workflow_execution_finished(Mock(args=(running.id,)))
+            self.assertEqual(list(cache.get(RUNNING_KEY)), [high.id])
+            self.assertEqual(queue_position(low.id), 1)
+
+    def test_max_running_and_cluster(self, _async_task, _execute_callback):
+        workflows = [self._workflow(self.ins1), self._workflow(self.ins2)]
+        with override_settings(
+            WORKFLOW_SCHEDULER={"enabled": True, "cluster": "archery-execute"},
+            Q_CLUSTER={
+                "workers": 4,
+                "ALT_CLUSTERS": {"archery-execute": {"workers": 1}},
+            },
+        ):
+            # 执行集群只有1个worker，只能同时执行1个工单
+            dispatched = [submit_workflow_execution(w.id) for w in workflows]
+        self.assertEqual(dispatched, [[workflows[0].id], []])
+        self.assertEqual(_async_task.call_args.kwargs["cluster"], "archery-execute")
+
+    def test_drop_cancelled(self, _async_task, _execute_callback):
+        running = self._workflow(self.ins1)
+        cancelled = self._workflow(self.ins1)
+        submit_workflow_execution(running.id)
+        submit_workflow_execution(cancelled.id)
+        SqlWorkflow.objects.filter(id=cancelled.id).update(status="workflow_abort")
+
+        workflow_execution_finished(Mock(args=(running.id,)))
+        self.assertEqual(cache.get(PENDING_KEY), [])
+        self.assertEqual(cache.get(RUNNING_KEY), {})
+        _async_task.assert_called_once()
+
+    def test_reconcile_finished(self, _async_task, _execute_callback):
+        """hook未执行时, 已执行结束的工单在调度时释放槽位"""
+        first = self._workflow(self.ins1)
+        second = self._workflow(self.ins1)
+        third = self._workflow(self.ins1)
+        submit_workflow_execution(first.id)
+        submit_workflow_execution(second.id)
+        submit_workflow_execution(third.id)
+        self.assertTrue(Schedule.objects.filter(name="工单执行调度").exists())
+        self.assertEqual(dispatch_workflow_executions(), [])
+
+        # 工单状态已不是执行中
+        SqlWorkflow.objects.filter(id=first.id).update(status="workflow_exception")
+        self.assertEqual(dispatch_workflow_executions(), [second.id])
+
+        # django-q任务已结束
+        SqlWorkflow.objects.filter(id=second.id).update(status="workflow_executing")
+        Task.objects.create(
+            id="task1",
+            name=f"sqlreview-execute-{second.id}",
+            func="sql.utils.execute_sql.execute",
+            started=datetime.now(),
+            stopped=datetime.now(),
+            success=False,
+        )
+        self.assertEqual(dispatch_workflow_executions(), [third.id])
+        self.assertEqual(list(cache.get(RUNNING_KEY)), [third.id])
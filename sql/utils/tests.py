@@ -12,10 +12,11 @@ from unittest.mock import patch, MagicMock
 
 from django.conf import settings
 from django.contrib.auth.models import Permission, Group
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django_q.models import Schedule
 
 from common.config import SysConfig
+from common.utils.testing import LOCMEM_CACHES
 from sql.engines.models import ReviewResult, ReviewSet
 from sql.models import (
     Users,
@@ -38,7 +39,15 @@ from sql.utils.sql_review import (
 from sql.utils.sql_utils import *
 from sql.utils.execute_sql import execute, execute_callback
 from sql.utils.tasks import add_sql_schedule, del_schedule, task_info
-from sql.utils.data_masking import data_masking, brute_mask, simple_column_mask
+from sql.utils.data_masking import (
+    data_masking,
+    brute_mask,
+    simple_column_mask,
+    query_select_list,
+    invalidate_select_list_cache,
+    compile_regex_masker,
+    mask_columns,
+)
 
 User = Users
 __author__ = "hhyo"
@@ -1073,6 +1082,73 @@ class TestDataMasking(TestCase):
             print("test_data_masking_union_support_keyword", r.rows)
             self.assertEqual(r.rows, mask_result_rows)
 
+    @override_settings(
+        DATA_MASKING_CACHE_TTL=60,
+        CACHES=LOCMEM_CACHES,
+    )
+    @patch("sql.utils.data_masking.GoInceptionEngine")
+    def test_query_select_list_cache(self, _inception):
+        """相同SQL指纹命中缓存, DDL后失效"""
+        select_list = [{"index": 0, "field": "phone", "table": "users"}]
+        _inception.return_value.query_data_masking.return_value = select_list
+        r1 = query_select_list(self.ins, "archery", "select phone from users;")
+        r2 = query_select_list(
+            self.ins, "archery", "select   phone\n from users; -- comment"
+        )
+        self.assertEqual(r1, select_list)
+        self.assertEqual(r2, select_list)
+        _inception.return_value.query_data_masking.assert_called_once()
+        query_select_list(self.ins, "other_db", "select phone from users;")
+        self.assertEqual(_inception.return_value.query_data_masking.call_count, 2)
+        invalidate_select_list_cache(self.ins.id)
+        query_select_list(self.ins, "archery", "select phone from users;")
+        self.assertEqual(_inception.return_value.query_data_masking.call_count, 3)
+
+    @override_settings(DATA_MASKING_CACHE_TTL=0)
+    @patch("sql.utils.data_masking.GoInceptionEngine")
+    def test_query_select_list_cache_disabled(self, _inception):
+        _inception.return_value.query_data_masking.return_value = []
+        query_select_list(self.ins, "archery", "select phone from users;")
+        query_select_list(self.ins, "archery", "select phone from users;")
+        self.assertEqual(_inception.return_value.query_data_masking.call_count, 2)
+
+    def test_compile_regex_masker_default_rule(self):
+        """三段式通用规则按长度三等分, 余数依次分给第二、三段, 隐藏中间段"""
+        masking_rule = {
+            "rule_type": 100,
+            "rule_regex": "^([\\s\\S]{0,}?)([\\s\\S]{0,}?)([\\s\\S]{0,}?)$",
+            "hide_group": 2,
+        }
+        masker = compile_regex_masker(masking_rule)
+        expected = {
+            "a": "*",
+            "ab": "*b",
+            "abc": "a*c",
+            "abcd": "a**d",
+            "abcde": "a**de",
+            "中文手机号码": "中文**号码",
+            "x\ny\n": "x**\n",
+            "": "",
+        }
+        for value, masked in expected.items():
+            self.assertEqual(masker(value), masked)
+        self.assertEqual(masker("18888888888"), "188****8888")
+        self.assertEqual(masker(12345), "12345")
+
+    def test_mask_columns(self):
+        rows = (("a1", "b1", "c1"), ("a2", "b2", "c2"))
+        upper = lambda v: v.upper()
+        twice = lambda v: v * 2
+        self.assertEqual(
+            mask_columns(rows, {0: [upper], 2: [upper, twice]}),
+            [("A1", "b1", "C1C1"), ("A2", "b2", "C2C2")],
+        )
+        self.assertEqual(
+            mask_columns(rows, {1: [upper]}, list),
+            [["a1", "B1", "c1"], ["a2", "B2", "c2"]],
+        )
+        self.assertEqual(mask_columns((), {0: [upper]}), [])
+
     def test_brute_mask(self):
         sql = """select * from users;"""
         rows = (("18888888888",), ("18888888889",), ("18888888810",))
@@ -12,7 +12,7 @@ from django.contrib.auth.models import Group
 from django.utils import timezone
 from django.conf import settings
 
-from sql.engines.models import ReviewResult
+from sql.engines.models import ReviewResult, ReviewSet
 from sql.utils.resource_group import user_groups, auth_group_users
 from common.utils.const import WorkflowStatus, WorkflowType, WorkflowAction
 from sql.models import (
@@ -206,14 +206,8 @@ class AuditV2:
         auto_review_wrong = self.sys_config.get(
             "auto_review_wrong", ""
         )  # 1表示出现警告就驳回，2和空表示出现错误才驳回
-        review_content = self.workflow.sqlworkflowcontent.review_content or "[]"
-        warning_count, error_count = 0, 0
-        for r in json.loads(review_content):
-            err_level = ReviewResult(**r).errlevel
-            if err_level == 1:
-                warning_count += 1
-            if err_level == 2:
-                error_count += 1
+        summary = self.review_summary()
+        warning_count, error_count = summary["warning_count"], summary["error_count"]
         if any(
             [
                 warning_count > 0 and auto_review_wrong == "1",
@@ -245,6 +239,13 @@ class AuditV2:
         ).exists():
             return False
 
+        # 影响行数加测, 总语句影响行数超过指定数量则需要人工审核
+        if self.all_affected_rows > int(
+            self.sys_config.get("auto_review_max_update_rows", 50)
+        ):
+            # 影响行数超规模, 需要人工审核
+            return False
+
         # 获取正则表达式
         auto_review_regex = self.sys_config.get(
             "auto_review_regex",
@@ -262,24 +263,31 @@ class AuditV2:
             if p.match(sql):
                 # 匹配成功, 代表需要人工复核
                 return False
-        # 影响行数加测, 总语句影响行数超过指定数量则需要人工审核
-        if self.all_affected_rows > int(
-            self.sys_config.get("auto_review_max_update_rows", 50)
-        ):
-            # 影响行数超规模, 需要人工审核
-            return False
         return True
 
+    def review_summary(self) -> dict:
+        """
+        获取工单审核结果汇总, 优先使用提交时写入的汇总字段, 历史数据解析审核内容
+        :return: {"warning_count": 0, "error_count": 0, "affected_rows": 0}
+        """
+        workflow_content = self.workflow.sqlworkflowcontent
+        if None not in (
+            workflow_content.warning_count,
+            workflow_content.error_count,
+            workflow_content.affected_rows,
+        ):
+            return {
+                "warning_count": workflow_content.warning_count,
+                "error_count": workflow_content.error_count,
+                "affected_rows": workflow_content.affected_rows,
+            }
+        review_content = workflow_content.review_content or "[]"
+        return ReviewSet(rows=json.loads(review_content)).summary()
+
     @property
     def all_affected_rows(self) -> int:
         """获取工单所有影响行"""
-        all_affected_rows = 0
-        review_content = self.workflow.sqlworkflowcontent.review_content
-        for review_row in json.loads(review_content):
-            review_result = ReviewResult(**review_row)
-            all_affected_rows += int(review_result.affected_rows)
-
-        return all_affected_rows
+        return self.review_summary()["affected_rows"]
 
     def generate_audit_setting(self) -> AuditSetting:
         if self.workflow_type in [WorkflowType.SQL_REVIEW, WorkflowType.QUERY]:
@@ -0,0 +1,247 @@
+# -*- coding: UTF-8 -*-
+"""
+SQL工单详情分页
+首次打开工单详情时解析一次审核内容或执行结果, 记录每条语句在JSON文本中的位置和过滤用的
+errlevel、stage, 索引保存在缓存中, 审核内容提交后不再修改, 执行结果写入时清除索引,
+分页时只从数据库截取当前页语句所在的文本片段, 打开大工单和小工单的开销基本相同,
+压缩存储的内容无法截取, 读取完整内容后按位置切片
+"""
+
+import json
+import re
+from array import array
+
+from django.core.cache import cache
+from django.db.models.functions import Substr
+
+from common.utils.compressed_field import COMPRESSED_PREFIX
+from sql.engines.models import ReviewResult, ReviewSet
+from sql.models import SqlWorkflowContent
+
+INDEX_CACHE_KEY = "workflow_detail_index:{workflow_id}:{field}"
+INDEX_CACHE_TIMEOUT = 60 * 60 * 24
+# 相邻语句间隔小于该字符数时合并为一次截取
+RUN_GAP = 4096
+# 每次查询截取的文本片段数
+MAX_SUBSTR_PER_QUERY = 50
+
+WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
+
+def detail_field(workflow):
+    """工单详情展示的字段, 执行结束的工单展示执行结果, 其他展示审核内容"""
+    if workflow.status in ["workflow_finish", "workflow_exception"]:
+        return "execute_result"
+    return "review_content"
+
+
+def build_statement_index(text):
+    """
+    解析JSON数组, 记录每个元素的位置, 使用数组保存以减小缓存的序列化开销,
+    errlevel、stage保存为取值列表中的序号
+    :return: {"starts": array, "ends": array, "errlevel": array, "stage": array,
+              "errlevel_values": [], "stage_values": []}, 不是字典数组时返回None
+    """
+    decoder = json.JSONDecoder()
+    starts, ends = array("q"), array("q")
+    codes = {"errlevel": array("H"), "stage": array("H")}
+    values = {"errlevel": {}, "stage": {}}
+    defaults = {"errlevel": 0, "stage": ""}
+    try:
+        pos = WHITESPACE_RE.match(text, 0).end()
+        if text[pos : pos + 1] != "[":
+            return None
+        pos = WHITESPACE_RE.match(text, pos + 1).end()
+        while text[pos : pos + 1] != "]":
+            row, end = decoder.raw_decode(text, pos)
+            if not isinstance(row, dict):
+                return None
+            starts.append(pos)
+            ends.append(end)
+            for key, default in defaults.items():
+                value = str(row.get(key, default))
+                codes[key].append(values[key].setdefault(value, len(values[key])))
+            pos = WHITESPACE_RE.match(text, end).end()
+            if text[pos : pos + 1] == ",":
+                pos = WHITESPACE_RE.match(text, pos + 1).end()
+            elif text[pos : pos + 1] != "]":
+                return None
+    except (json.JSONDecodeError, OverflowError):
+        return None
+    return {
+        "starts": starts,
+        "ends": ends,
+        "errlevel": codes["errlevel"],
+        "stage": codes["stage"],
+        "errlevel_values": list(values["errlevel"]),
+        "stage_values": list(values["stage"]),
+    }
+
+
+def get_statement_index(workflow_id, field):
+    """获取语句位置索引, 无法建立索引时返回None"""
+    key = INDEX_CACHE_KEY.format(workflow_id=workflow_id, field=field)
+    index = cache.get(key)
+    if index:
+        return index
+    content = (
+        SqlWorkflowContent.objects.filter(workflow_id=workflow_id)
+        .annotate(prefix=Substr(field, 1, len(COMPRESSED_PREFIX)))
+        .values_list(field, "prefix")
+        .first()
+    )
+    if not content or not content[0]:
+        return None
+    index = build_statement_index(content[0])
+    if index is None:
+        return None
+    index["compressed"] = content[1] == COMPRESSED_PREFIX
+    cache.set(key, index, INDEX_CACHE_TIMEOUT)
+    return index
+
+
+def clear_statement_index(workflow_id):
+    """工单内容修改后清除语句位置索引"""
+    cache.delete_many(
+        [
+            INDEX_CACHE_KEY.format(workflow_id=workflow_id, field=field)
+            for field in ("review_content", "execute_result")
+        ]
+    )
+
+
+def filter_statements(index, errlevels=None, stages=None):
+    """按errlevel、stage过滤, 返回语句序号列表"""
+    if not errlevels and not stages:
+        return range(len(index["starts"]))
+    conditions = []
+    for key, selected in (("errlevel", errlevels), ("stage", stages)):
+        if selected:
+            selected = set(selected)
+            conditions.append(
+                (
+                    index[key],
+                    {
+                        code
+                        for code, value in enumerate(index[f"{key}_values"])
+                        if value in selected
+                    },
+                )
+            )
+    return [
+        i
+        for i in range(len(index["starts"]))
+        if all(codes[i] in allowed for codes, allowed in conditions)
+    ]
+
+
+def read_statements(workflow_id, field, index, positions):
+    """按语句序号从数据库截取文本并解析"""
+    starts = [index["starts"][i] for i in positions]
+    ends = [index["ends"][i] for i in positions]
+    if index["compressed"]:
+        text = (
+            SqlWorkflowContent.objects.filter(workflow_id=workflow_id)
+            .values_list(field, flat=True)
+            .first()
+        )
+        return [json.loads(text[s:e]) for s, e in zip(starts, ends)]
+
+    # 相邻的语句合并为一个片段
+    runs = []
+    for s, e in zip(starts, ends):
+        if runs and 0 <= s - runs[-1][1] <= RUN_GAP:
+            runs[-1][1] = e
+        else:
+            runs.append([s, e])
+    texts = []
+    for i in range(0, len(runs), MAX_SUBSTR_PER_QUERY):
+        batch = runs[i : i + MAX_SUBSTR_PER_QUERY]
+        # 数据库的截取位置从1开始
+        annotations = {
+            f"run_{n}": Substr(field, s + 1, e - s) for n, (s, e) in enumerate(batch)
+        }
+        row = (
+            SqlWorkflowContent.objects.filter(workflow_id=workflow_id)
+            .annotate(**annotations)
+            .values(*annotations)
+            .first()
+        )
+        texts += [(s, row[f"run_{n}"]) for n, (s, e) in enumerate(batch)]
+
+    rows = []
+    run_idx = 0
+    for s, e in zip(starts, ends):
+        while not (texts[run_idx][0] <= s < texts[run_idx][0] + len(texts[run_idx][1])):
+            run_idx += 1
+        run_start, text = texts[run_idx]
+        rows.append(json.loads(text[s - run_start : e - run_start]))
+    return rows
+
+
+def load_detail_rows(workflow):
+    """读取并解析工单完整的审核内容或执行结果, 兼容旧数据格式和无法解析的内容"""
+    workflow_content = workflow.sqlworkflowcontent
+    rows = getattr(workflow_content, detail_field(workflow))
+    review_result = ReviewSet()
+    if rows:
+        try:
+            # 检验rows能不能正常解析
+            loaded_rows = json.loads(rows)
+            #  兼容旧数据'[[]]'格式，转换为新格式[{}]
+            if isinstance(loaded_rows[-1], list):
+                for r in loaded_rows:
+                    review_result.rows += [ReviewResult(inception_result=r)]
+                rows = review_result.json()
+        except (IndexError, json.decoder.JSONDecodeError):
+            review_result.rows += [
+                ReviewResult(
+                    id=1,
+                    sql=workflow_content.sql_content,
+                    # 迫于无法单元测试这里加上英文报错信息
+                    errormessage="Json decode failed."
+                    "执行结果Json解析失败, 请联系管理员",
+                )
+            ]
+            rows = review_result.json()
+    else:
+        rows = workflow_content.review_content
+    return json.loads(rows)
+
+
+def detail_page(workflow, offset, limit, errlevels=None, stages=None):
+    """
+    分页获取工单详情的语句
+    :return: (过滤后的总数, 当前页语句)
+    """
+    field = detail_field(workflow)
+    if (
+        field == "execute_result"
+        and not SqlWorkflowContent.objects.filter(workflow_id=workflow.id)
+        .exclude(execute_result="")
+        .exists()
+    ):
+        # 没有执行结果时展示审核内容
+        field = "review_content"
+    index = get_statement_index(workflow.id, field)
+    if index is None:
+        return _detail_page_from_rows(
+            load_detail_rows(workflow), offset, limit, errlevels, stages
+        )
+    positions = filter_statements(index, errlevels, stages)
+    page = positions[offset : offset + limit]
+    return len(positions), read_statements(workflow.id, field, index, page)
+
+
+def _detail_page_from_rows(rows, offset, limit, errlevels=None, stages=None):
+    """无法建立索引的内容解析完整数据后分页"""
+    errlevels = set(errlevels or [])
+    stages = set(stages or [])
+    if errlevels or stages:
+        rows = [
+            r
+            for r in rows
+            if (not errlevels or str(r.get("errlevel", 0)) in errlevels)
+            and (not stages or str(r.get("stage", "")) in stages)
+        ]
+    return len(rows), rows[offset : offset + limit]
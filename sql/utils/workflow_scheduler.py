@@ -0,0 +1,186 @@
+# -*- coding: UTF-8 -*-
+"""
+SQL工单执行调度
+开启后工单执行先进入待执行队列, 按先进先出或优先级排序, 在同一实例、同一资源组和全局的并发上限内提交到django-q,
+任务结束后通过hook释放槽位并继续调度, 排队中的工单可以查看队列位置,
+每次调度时核对运行中的工单, 已结束的工单即使hook未执行也会释放槽位, 定时任务周期性调度避免队列停滞,
+配置独立的django-q集群后工单执行在该集群的worker中运行, 终止连接、消息通知等短任务不会排在长时间执行的工单之后
+"""
+
+import datetime
+import time
+
+from django.core.cache import cache
+from django_q.models import Task
+from django_q.tasks import async_task
+
+from common.utils.settings_config import get_settings_config
+from sql.models import SqlWorkflow
+from sql.utils.task_scheduler import dispatch, expire_running, release, scheduler_lock
+
+DEFAULT_WORKFLOW_SCHEDULER_CONFIG = {
+    # 开启后工单执行经过调度队列
+    "enabled": False,
+    # 同一实例同时执行的工单数
+    "instance_limit": 1,
+    # 同一资源组同时执行的工单数，0表示不限制
+    "group_limit": 0,
+    # 同时执行的工单总数，0表示使用 worker数-保留的worker数
+    "max_running": 0,
+    # 使用默认集群时为终止连接、消息通知等短任务保留的worker数
+    "reserved_workers": 1,
+    # 排序方式，fifo 按进入队列的先后，priority 按优先级从高到低，同优先级先进先出
+    "ordering": "fifo",
+    # 执行工单的django-q集群，需要在Q_CLUSTER的ALT_CLUSTERS中配置，为空使用默认集群
+    "cluster": "",
+    # 运行中的任务超过该时间未结束时不再占用槽位，用于worker异常退出未执行hook的情况，秒
+    "running_timeout": 86400,
+    # 定时调度的间隔，分钟
+    "dispatch_interval": 1,
+}
+
+PENDING_KEY = "workflow_scheduler:pending"
+RUNNING_KEY = "workflow_scheduler:running"
+LOCK_KEY = "workflow_scheduler:lock"
+
+# 可以提交执行的工单状态，其他状态的工单移出队列
+EXECUTABLE_STATUS = ["workflow_queuing", "workflow_timingtask"]
+# 已提交执行的工单状态，其他状态的工单已执行结束，不再占用槽位
+RUNNING_STATUS = ["workflow_queuing", "workflow_timingtask", "workflow_executing"]
+
+
+def get_workflow_scheduler_config():
+    """读取工单执行调度配置, 未配置的项使用默认值"""
+    return get_settings_config("WORKFLOW_SCHEDULER", DEFAULT_WORKFLOW_SCHEDULER_CONFIG)
+
+
+def _lock():
+    return scheduler_lock(LOCK_KEY, "获取工单执行调度锁超时")
+
+
+def submit_workflow_execution(workflow_id, user=None, priority=0):
+    """
+    将工单加入待执行队列并调度, 定时执行的工单到时间后同样调用
+    :return: 本次提交到django-q的工单id列表
+    """
+    from sql.utils.tasks import add_workflow_dispatch_schedule
+
+    workflow_id = int(workflow_id)
+    add_workflow_dispatch_schedule(
+        int(get_workflow_scheduler_config()["dispatch_interval"])
+    )
+    with _lock():
+        pending = cache.get(PENDING_KEY) or []
+        if workflow_id not in [item["workflow_id"] for item in pending]:
+            pending.append(
+                {
+                    "workflow_id": workflow_id,
+                    "user": user,
+                    "priority": int(priority or 0),
+                    "enqueue_time": time.time(),
+                }
+            )
+        cache.set(PENDING_KEY, pending, None)
+        return _dispatch()
+
+
+def dispatch_workflow_executions():
+    """在并发上限内提交待执行的工单, 也用于定时任务"""
+    with _lock():
+        return _dispatch()
+
+
+def workflow_execution_finished(task):
+    """django-q任务结束的hook, 处理执行结果后释放槽位并继续调度"""
+    from sql.utils.execute_sql import execute_callback
+
+    workflow_id = int(task.args[0])
+    try:
+        execute_callback(task)
+    finally:
+        with _lock():
+            release(RUNNING_KEY, workflow_id)
+            _dispatch()
+
+
+def queue_position(workflow_id):
+    """
+    工单在待执行队列中的位置
+    :return: 从1开始的位置, 不在队列中时返回None
+    """
+    pending = _sort_pending(cache.get(PENDING_KEY) or [])
+    for position, item in enumerate(pending, 1):
+        if item["workflow_id"] == int(workflow_id):
+            return position
+    return None
+
+
+def _sort_pending(pending):
+    if get_workflow_scheduler_config()["ordering"] == "priority":
+        return sorted(
+            pending,
+            key=lambda i: (-i["priority"], i["enqueue_time"], i["workflow_id"]),
+        )
+    return sorted(pending, key=lambda i: (i["enqueue_time"], i["workflow_id"]))
+
+
+def _submit(workflow_id, item):
+    config = get_workflow_scheduler_config()
+    task_options = {"cluster": config["cluster"]} if config["cluster"] else {}
+    async_task(
+        "sql.utils.execute_sql.execute",
+        workflow_id,
+        item["user"],
+        hook="sql.utils.workflow_scheduler.workflow_execution_finished",
+        timeout=-1,
+        task_name=f"sqlreview-execute-{workflow_id}",
+        **task_options,
+    )
+
+
+def _dispatch():
+    config = get_workflow_scheduler_config()
+    pending = _sort_pending(cache.get(PENDING_KEY) or [])
+    running = cache.get(RUNNING_KEY) or {}
+    expire_running(running, config, _finished_workflows(running), label="工单")
+    # 槽位信息 {工单id: {"instance_id": 实例id, "group_id": 资源组id}}
+    workflows = {
+        w.pop("id"): w
+        for w in SqlWorkflow.objects.filter(
+            id__in=[item["workflow_id"] for item in pending],
+            status__in=EXECUTABLE_STATUS,
+        ).values("id", "instance_id", "group_id")
+    }
+    # 已取消或已执行的工单移出队列
+    candidates = [
+        (item["workflow_id"], item, workflows[item["workflow_id"]])
+        for item in pending
+        if item["workflow_id"] in workflows
+    ]
+    dispatched, remaining = dispatch(candidates, running, config, _submit)
+    cache.set(PENDING_KEY, remaining, None)
+    cache.set(RUNNING_KEY, running, None)
+    return dispatched
+
+
+def _finished_workflows(running):
+    """
+    运行中的工单里已执行结束的工单, 用于worker异常退出等hook未执行的情况
+    工单状态已不是排队或执行中, 或者django-q中已有提交之后结束的执行任务
+    """
+    if not running:
+        return set()
+    active = set(
+        SqlWorkflow.objects.filter(
+            id__in=list(running), status__in=RUNNING_STATUS
+        ).values_list("id", flat=True)
+    )
+    finished = set(running) - active
+    task_names = {f"sqlreview-execute-{i}": i for i in active}
+    for name, started in Task.objects.filter(name__in=list(task_names)).values_list(
+        "name", "started"
+    ):
+        workflow_id = task_names[name]
+        if started >= datetime.datetime.fromtimestamp(running[workflow_id]["start"]):
+            finished.add(workflow_id)
+    return finished
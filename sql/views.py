@@ -34,6 +34,8 @@ from .models import (
     TwoFactorAuthConfig,
 )
 from sql.utils.workflow_audit import Audit, AuditV2, AuditException
+from sql.utils.execute_progress import get_execute_progress_config
+from sql.utils.workflow_scheduler import queue_position
 from sql.utils.sql_review import (
     can_execute,
     can_timingtask,
@@ -232,7 +234,13 @@ def submit_sql(request):
 
 def detail(request, workflow_id):
     """展示SQL工单详细页面"""
-    workflow_detail = get_object_or_404(SqlWorkflow, pk=workflow_id)
+    # 审核内容和执行结果由detail_content分页获取，这里不加载
+    workflow_detail = get_object_or_404(
+        SqlWorkflow.objects.select_related("sqlworkflowcontent").defer(
+            "sqlworkflowcontent__review_content", "sqlworkflowcontent__execute_result"
+        ),
+        pk=workflow_id,
+    )
     audit_handler = AuditV2(workflow=workflow_detail)
     if not can_view(request.user, workflow_id):
         raise PermissionDenied
@@ -282,6 +290,12 @@ def detail(request, workflow_id):
     else:
         run_date = ""
 
+    # 排队中的工单展示执行队列位置
+    if workflow_detail.status in ["workflow_queuing", "workflow_timingtask"]:
+        position = queue_position(workflow_id)
+    else:
+        position = None
+
     # 添加当前审核人信息
     current_reviewers = []
     for node in review_info.nodes:
@@ -308,6 +322,8 @@ def detail(request, workflow_id):
         "review_info": review_info,
         "manual": manual,
         "run_date": run_date,
+        "queue_position": position,
+        "execute_progress": get_execute_progress_config()["enabled"],
     }
     return render(request, "detail.html", context)
 
@@ -795,7 +811,11 @@ def sqlexport_pre_check(request):
 
     instance.sql_content = sql_content
     instance.selected_db_name = db_name
-    check_result = OffLineDownLoad().pre_count_check(workflow=instance)
+    # 默认按执行计划预估和限量探测统计行数，需要准确行数时再执行完整的COUNT
+    exact_count = request.POST.get("exact_count") in ("true", "1")
+    check_result = OffLineDownLoad().pre_count_check(
+        workflow=instance, exact_count=exact_count
+    )
     result["data"] = {
         "error_count": check_result.error_count,
         "warning_count": check_result.warning_count,
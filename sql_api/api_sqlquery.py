@@ -1,5 +1,6 @@
 import logging
 
+from django.http import StreamingHttpResponse
 from drf_spectacular.utils import extend_schema
 from rest_framework import permissions, serializers, views
 from rest_framework.response import Response
@@ -10,7 +11,11 @@ from sql.services.resource_service import (
     list_instance_resources,
     list_user_accessible_instances,
 )
-from sql.services.sqlquery_service import execute_sql_query
+from sql.services.sqlquery_service import (
+    encode_ndjson_events,
+    execute_sql_query,
+    stream_sql_query,
+)
 
 from .renderers import SimpleJSONRenderer
 from .serializers import (
@@ -87,7 +92,15 @@ class SQLQueryExecuteView(views.APIView):
             return Response({"status": 1, "msg": "无执行查询权限", "data": {}})
         serializer = SqlQueryExecuteSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        data = execute_sql_query(user=request.user, **serializer.validated_data)
+        params = dict(serializer.validated_data)
+        if params.pop("stream", False):
+            data, events = stream_sql_query(user=request.user, **params)
+            if events is not None:
+                return StreamingHttpResponse(
+                    encode_ndjson_events(events), content_type="application/x-ndjson"
+                )
+            return Response(data)
+        data = execute_sql_query(user=request.user, **params)
         return Response(data)
 
 
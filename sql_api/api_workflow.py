@@ -25,10 +25,15 @@ from sql.models import (
 )
 from sql.notify import notify_for_audit, notify_for_execute
 from sql.query_privileges import _query_apply_audit_call_back
+from sql.utils.archive_scheduler import submit_archive_tasks
 from sql.utils.resource_group import user_groups
 from sql.utils.sql_review import can_cancel, can_execute, on_correct_time_period
 from sql.utils.tasks import del_schedule
 from sql.utils.workflow_audit import Audit, get_auditor, AuditException
+from sql.utils.workflow_scheduler import (
+    get_workflow_scheduler_config,
+    submit_workflow_execution,
+)
 from .filters import WorkflowFilter, WorkflowAuditFilter
 from .pagination import CustomizedPagination
 from .serializers import (
@@ -361,14 +366,17 @@ class ExecuteWorkflow(views.APIView):
                 schedule_name = f"sqlreview-timing-{workflow_id}"
                 del_schedule(schedule_name)
                 # 加入执行队列
-                async_task(
-                    "sql.utils.execute_sql.execute",
-                    workflow_id,
-                    user,
-                    hook="sql.utils.execute_sql.execute_callback",
-                    timeout=-1,
-                    task_name=f"sqlreview-execute-{workflow_id}",
-                )
+                if get_workflow_scheduler_config()["enabled"]:
+                    submit_workflow_execution(workflow_id, user)
+                else:
+                    async_task(
+                        "sql.utils.execute_sql.execute",
+                        workflow_id,
+                        user,
+                        hook="sql.utils.execute_sql.execute_callback",
+                        timeout=-1,
+                        task_name=f"sqlreview-execute-{workflow_id}",
+                    )
                 # 增加工单日志
                 Audit.add_log(
                     audit_id=audit_id,
@@ -409,12 +417,7 @@ class ExecuteWorkflow(views.APIView):
                     )
         # 执行数据归档工单
         elif workflow_type == 3:
-            async_task(
-                "sql.archiver.archive",
-                workflow_id,
-                timeout=-1,
-                task_name=f"archive-{workflow_id}",
-            )
+            submit_archive_tasks([workflow_id])
 
         return Response({"msg": "开始执行，执行结果请到工单详情页查看"})
 
@@ -370,6 +370,9 @@ class SqlQueryExecuteSerializer(serializers.Serializer):
     tb_name = serializers.CharField(required=False, allow_blank=True)
     sql_content = serializers.CharField()
     limit_num = serializers.IntegerField(min_value=0, required=False, default=0)
+    stream = serializers.BooleanField(
+        required=False, default=False, help_text="是否以NDJSON流式返回结果"
+    )
 
 
 class SqlQueryLogsQuerySerializer(serializers.Serializer):
@@ -532,6 +535,7 @@ class WorkflowContentSerializer(serializers.ModelSerializer):
             with transaction.atomic():
                 workflow = SqlWorkflow(**workflow_data)
                 validated_data["review_content"] = check_result.json()
+                validated_data.update(check_result.summary())
                 workflow.save()
                 workflow_content = SqlWorkflowContent.objects.create(
                     workflow=workflow, **validated_data
@@ -559,8 +563,17 @@ class WorkflowContentSerializer(serializers.ModelSerializer):
             "sql_content",
             "review_content",
             "execute_result",
+            "warning_count",
+            "error_count",
+            "affected_rows",
         )
-        read_only_fields = ["review_content", "execute_result"]
+        read_only_fields = [
+            "review_content",
+            "execute_result",
+            "warning_count",
+            "error_count",
+            "affected_rows",
+        ]
 
 
 class AuditWorkflowSerializer(serializers.Serializer):
@@ -46,6 +46,7 @@ class InfoTest(TestCase):
         r = self.client.get("/api/debug")
         r_json = r.json()
         self.assertIsInstance(r_json["archery"]["version"], str)
+        self.assertEqual(set(r_json["query_log"]["metrics"]), {"dropped", "late"})
 
 
 class TestUser(APITestCase):
@@ -18,6 +18,7 @@ from common.utils.aes_decryptor import Prpcrypt
 from common.utils.permission import superuser_required
 import archery
 from sql.models import Instance
+from sql.utils.query_log import get_query_log_config, query_log_metrics
 from mirage.tools import Migrator
 
 
@@ -168,6 +169,12 @@ def debug(request):
     except Exception as e:
         backup_info = f"无法连接goInception备份库\n{e}"
 
+    # 查询日志写入配置和丢弃、延迟写入的记录数
+    query_log_info = {
+        "config": get_query_log_config(),
+        "metrics": query_log_metrics(),
+    }
+
     # PACKAGES
     installed_packages_list = sorted(
         [
@@ -198,6 +205,7 @@ def debug(request):
             "goinception_info": full_goinception_info if full else goinception_info,
             "backup_info": backup_info,
         },
+        "query_log": query_log_info,
         "runtime_info": {
             "python_version": platform.python_version(),
             "mysql_info": mysql_info,